@@ -0,0 +1,2 @@
+# benchmarks/__init__.py
+# Скрипты нагрузочного тестирования и бенчмарков
@@ -0,0 +1,103 @@
+# benchmarks/game_record_benchmark.py
+# Микробенчмарк преобразования игр в строки таблицы games: прежнее построение строки из вложенных словарей
+# (как в PgsqlApiClient.add_game до GameRecord) против GameRecord.from_appdetails/from_catalog + as_row,
+# а также память на одну запись: словарь appdetails против GameRecord.
+#
+# Запуск (из корня репозитория):
+#   python -m benchmarks.game_record_benchmark --records 50000
+import argparse
+import json
+import time
+import tracemalloc
+
+from benchmarks.steam_stub import SteamStub, app_id_by_index
+from sources.models import GameRecord
+from sources.utils import parse_steam_date
+
+
+def legacy_row(game_data: tuple) -> list:
+    """Преобразование, которое раньше выполнялось в add_game для каждой строки"""
+    appid, game = game_data
+    release_date = game.get('release_date')
+    if release_date is not None:
+        release_date = parse_steam_date(release_date.get('date'))
+    tags = json.dumps(game.get('tags', {}))
+    categories = [i['description'] for i in game.get('categories', [])]
+    genres = [i['description'] for i in game.get('genres', [])]
+    return [
+        appid, game.get('name'), release_date, game.get('required_age', 0),
+        game.get('short_description'), game.get('header_image'), categories, genres,
+        game.get('positive', 0), game.get('negative', 0), game.get('estimated_owners', ''),
+        game.get('average_playtime_forever', 0), game.get('average_playtime_2weeks', 0),
+        game.get('median_playtime_forever', 0), game.get('median_playtime_2weeks', 0), tags
+    ]
+
+
+def to_catalog(app_id: int, details: dict) -> dict:
+    """Запись в формате дампа каталога games.json"""
+    return {
+        **details,
+        'release_date': details['release_date']['date'],
+        'categories': [item['description'] for item in details['categories']],
+        'genres': [item['description'] for item in details['genres']],
+    }
+
+
+def rows_per_second(convert, items: list, repeat: int) -> float:
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for item in items:
+            convert(item)
+        best = min(best, time.perf_counter() - start)
+    return len(items) / best
+
+
+def bytes_per_record(build, items: list) -> float:
+    """Прирост памяти на одну запись, удерживаемую в списке"""
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    records = [build(item) for item in items]
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del records
+    return (after - before) / len(items)
+
+
+def run(args: argparse.Namespace):
+    stub = SteamStub()
+    details = [(app_id_by_index(i), stub.app_details(app_id_by_index(i))) for i in range(args.records)]
+    catalog = [(app_id, to_catalog(app_id, game)) for app_id, game in details]
+    # Ответы заново декодируются из JSON, чтобы записи не разделяли строки со сгенерированными данными
+    responses = [(app_id, json.dumps(game)) for app_id, game in details]
+
+    results = [
+        ('appdetails', 'dict + add_game',
+         rows_per_second(legacy_row, details, args.repeat),
+         bytes_per_record(lambda item: (item[0], json.loads(item[1])), responses)),
+        ('appdetails', 'GameRecord',
+         rows_per_second(lambda item: GameRecord.from_appdetails(*item).as_row(), details, args.repeat),
+         bytes_per_record(lambda item: GameRecord.from_appdetails(item[0], json.loads(item[1])), responses)),
+        ('catalog', 'GameRecord',
+         rows_per_second(lambda item: GameRecord.from_catalog(*item).as_row(), catalog, args.repeat),
+         None),
+    ]
+
+    print(f"\nЗаписей: {args.records}\n")
+    header = f"{'source':<12}{'mapping':<18}{'rows/s':>12}{'bytes/record':>14}"
+    print(header)
+    print("-" * len(header))
+    for source, mapping, rate, size in results:
+        size = f"{size:>14.0f}" if size is not None else f"{'-':>14}"
+        print(f"{source:<12}{mapping:<18}{rate:>12.0f}{size}")
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Скорость преобразования игр в строки и память на запись")
+    parser.add_argument("--records", type=int, default=50000, help="число игр")
+    parser.add_argument("--repeat", type=int, default=3, help="число повторов замера")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    run(parse_args())
@@ -0,0 +1,195 @@
+# benchmarks/load_test.py
+# Нагрузочный тест обработчиков TelegramBot: синтетические апдейты подаются напрямую в Dispatcher,
+# Steam и Telegram Bot API заменены локальной заглушкой, база - PostgreSQL из docker compose.
+#
+# Запуск (из корня репозитория, при поднятом контейнере postgres):
+#   python -m benchmarks.load_test --users 20 --duration 60 --steam-latency 0.05 --rate-limit-ratio 0.05
+#   python -m benchmarks.load_test --steam-cache steam.sqlite            # записать ответы Steam
+#   python -m benchmarks.load_test --steam-cache steam.sqlite --replay   # повторить без обращений к Steam
+import argparse
+import asyncio
+import logging
+import os
+import random
+import time
+from collections import defaultdict
+
+from benchmarks.steam_stub import SteamStub, StubConfig, app_id_by_index
+
+FIRST_STEAM_ID = 76561198000000000
+
+# Вес команды в смеси запросов
+COMMAND_MIX = {
+    "help": 1,
+    "trends": 1,
+    "recommend": 3,
+    "friends_updates": 3,
+    "similar": 3,
+    "info": 3,
+}
+
+
+def percentile(values: list[float], q: float) -> float:
+    """Перцентиль методом ближайшего ранга, values должен быть отсортирован"""
+    if not values:
+        return 0.0
+    rank = max(int(round(q / 100 * len(values) + 0.5)) - 1, 0)
+    return values[min(rank, len(values) - 1)]
+
+
+class LoadTest:
+    def __init__(self, args: argparse.Namespace):
+        self.args = args
+        self.stub = SteamStub(StubConfig(
+            latency=args.steam_latency,
+            jitter=args.steam_jitter,
+            rate_limit_ratio=args.rate_limit_ratio,
+            friends_per_user=args.friends,
+            games_per_user=args.games,
+            app_pool=args.app_pool,
+            telegram_latency=args.telegram_latency,
+        ))
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.updates_sent = 0
+        self.update_id = 0
+        self.bot = None
+
+    async def setup(self):
+        from aiogram import Bot
+        from aiogram.client.session.aiohttp import AiohttpSession
+        from aiogram.client.telegram import TelegramAPIServer
+
+        url = await self.stub.start()
+
+        os.environ.setdefault("BOT_TOKEN", "123456789:load-test-token")
+        os.environ.setdefault("STEAM_API_KEY", "load-test-key")
+        os.environ.setdefault("DB_HOST", "localhost")
+        os.environ.setdefault("DB_PORT", "5432")
+        os.environ.setdefault("DB_NAME", "steam_data")
+        os.environ.setdefault("DB_USER", "postgres")
+        os.environ.setdefault("DB_PASSWORD", "159753")
+        # Заглушка Telegram не ограничивает частоту, поэтому по умолчанию очередь отправки не должна её ограничивать;
+        # реальные лимиты можно задать через TELEGRAM_GLOBAL_RATE и TELEGRAM_CHAT_RATE
+        os.environ.setdefault("TELEGRAM_GLOBAL_RATE", "1000")
+        os.environ.setdefault("TELEGRAM_CHAT_RATE", "1000")
+        # Запись ответов Steam в файл и воспроизведение без сети (--replay), в том числе записанных от настоящего Steam
+        if self.args.steam_cache:
+            os.environ["STEAM_RESPONSE_CACHE"] = self.args.steam_cache
+            os.environ["STEAM_RESPONSE_REPLAY"] = "1" if self.args.replay else "0"
+
+        from sources.bot import TelegramBot
+
+        self.bot = TelegramBot()
+        self.bot.api_client.base_url = self.stub.base_url
+        self.bot.api_client.store_url = self.stub.store_url
+        self.bot.bot = Bot(
+            token=os.environ["BOT_TOKEN"],
+            session=AiohttpSession(api=TelegramAPIServer.from_base(url)),
+        )
+
+    async def teardown(self):
+        if self.bot is not None:
+            await self.bot.bot.session.close()
+            await self.bot.api_client.session.close()
+            if self.bot.api_client.response_cache is not None:
+                await asyncio.to_thread(self.bot.api_client.response_cache.close)
+        await self.stub.stop()
+
+    def make_update(self, tg_id: int, text: str) -> dict:
+        self.update_id += 1
+        return {
+            "update_id": self.update_id,
+            "message": {
+                "message_id": self.update_id,
+                "date": int(time.time()),
+                "chat": {"id": tg_id, "type": "private"},
+                "from": {"id": tg_id, "is_bot": False, "first_name": "load"},
+                "text": text,
+            },
+        }
+
+    async def send(self, tg_id: int, text: str):
+        self.updates_sent += 1
+        await self.bot.dp.feed_raw_update(self.bot.bot, self.make_update(tg_id, text))
+
+    async def interaction(self, command: str, tg_id: int, *texts: str):
+        """Отправляет шаги одной команды и записывает суммарную задержку"""
+        start = time.perf_counter()
+        try:
+            for text in texts:
+                await self.send(tg_id, text)
+        except Exception:
+            self.errors[command] += 1
+            return
+        self.latencies[command].append(time.perf_counter() - start)
+
+    async def user_session(self, index: int, deadline: float):
+        tg_id = 10_000_000 + index
+        steam_id = FIRST_STEAM_ID + index * 1000
+        rnd = random.Random(index)
+
+        await self.interaction("start", tg_id, "/start")
+        if not self.args.skip_link:
+            await self.interaction("account_update", tg_id, "/account_update", str(steam_id))
+
+        commands, weights = zip(*COMMAND_MIX.items())
+        while time.perf_counter() < deadline:
+            command = rnd.choices(commands, weights)[0]
+            if command in ("similar", "info"):
+                app_id = app_id_by_index(rnd.randrange(self.args.app_pool))
+                await self.interaction(command, tg_id, f"/{command}", str(app_id))
+            else:
+                await self.interaction(command, tg_id, f"/{command}")
+            if self.args.think_time:
+                await asyncio.sleep(rnd.expovariate(1 / self.args.think_time))
+
+    async def run(self):
+        await self.setup()
+        try:
+            start = time.perf_counter()
+            deadline = start + self.args.duration
+            await asyncio.gather(*(self.user_session(i, deadline) for i in range(self.args.users)))
+            elapsed = time.perf_counter() - start
+        finally:
+            await self.teardown()
+        self.report(elapsed)
+
+    def report(self, elapsed: float):
+        print(f"\nПользователей: {self.args.users}, длительность: {elapsed:.1f} с")
+        print(f"Апдейтов: {self.updates_sent}, пропускная способность: {self.updates_sent / elapsed:.2f} updates/s")
+        print(f"Запросы к заглушке: {dict(sorted(self.stub.requests.items()))}\n")
+        header = f"{'command':<16}{'count':>7}{'errors':>8}{'rps':>8}{'p50,ms':>10}{'p95,ms':>10}{'p99,ms':>10}{'max,ms':>10}"
+        print(header)
+        print("-" * len(header))
+        for command in sorted(set(self.latencies) | set(self.errors)):
+            values = sorted(self.latencies[command])
+            print(
+                f"{command:<16}{len(values):>7}{self.errors[command]:>8}{len(values) / elapsed:>8.2f}"
+                f"{percentile(values, 50) * 1000:>10.1f}{percentile(values, 95) * 1000:>10.1f}"
+                f"{percentile(values, 99) * 1000:>10.1f}{(values[-1] if values else 0) * 1000:>10.1f}"
+            )
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Нагрузочный тест обработчиков TelegramBot")
+    parser.add_argument("--users", type=int, default=10, help="число одновременных пользователей")
+    parser.add_argument("--duration", type=float, default=30.0, help="длительность теста, с")
+    parser.add_argument("--think-time", type=float, default=0.0, help="средняя пауза между командами, с")
+    parser.add_argument("--skip-link", action="store_true", help="не привязывать steam id (без ингеста)")
+    parser.add_argument("--steam-latency", type=float, default=0.05, help="задержка ответа Steam, с")
+    parser.add_argument("--steam-jitter", type=float, default=0.02, help="разброс задержки Steam, с")
+    parser.add_argument("--rate-limit-ratio", type=float, default=0.0, help="доля ответов 429 от Steam")
+    parser.add_argument("--telegram-latency", type=float, default=0.0, help="задержка ответа Bot API, с")
+    parser.add_argument("--friends", type=int, default=3, help="друзей у каждого пользователя")
+    parser.add_argument("--games", type=int, default=5, help="игр в библиотеке каждого пользователя")
+    parser.add_argument("--app-pool", type=int, default=200, help="размер синтетического каталога игр")
+    parser.add_argument("--steam-cache", help="файл SQLite для записи ответов Steam")
+    parser.add_argument("--replay", action="store_true", help="отвечать на запросы к Steam только из --steam-cache")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.WARNING)
+    logging.getLogger("aiogram.event").setLevel(logging.WARNING)
+    asyncio.run(LoadTest(parse_args()).run())
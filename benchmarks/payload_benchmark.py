@@ -0,0 +1,84 @@
+# benchmarks/payload_benchmark.py
+# Объём ответов appdetails и время декодирования JSON на 1000 приложений:
+# полный документ против filters=basic,release_date,categories,genres, stdlib json против orjson.
+# Ответы отдаёт локальная заглушка Steam, поэтому сеть и ключ API не нужны.
+#
+# Запуск (из корня репозитория):
+#   python -m benchmarks.payload_benchmark --apps 1000 --repeat 5
+import argparse
+import asyncio
+import json
+import time
+
+import aiohttp
+
+from benchmarks.steam_stub import SteamStub, StubConfig, app_id_by_index
+from sources.steam_api_client import APPDETAILS_FILTERS
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+async def fetch_bodies(stub: SteamStub, app_ids: list[int], filters: str | None) -> list[bytes]:
+    bodies = []
+    async with aiohttp.ClientSession() as session:
+        for app_id in app_ids:
+            params = {'appids': app_id, 'cc': 'us', 'l': 'english'}
+            if filters:
+                params['filters'] = filters
+            async with session.get(f"{stub.store_url}/appdetails", params=params) as response:
+                bodies.append(await response.read())
+    return bodies
+
+
+def decode_time(bodies: list[bytes], loads, repeat: int) -> float:
+    """Лучшее из repeat время декодирования всех ответов, с; тексты декодируются так же, как в aiohttp"""
+    texts = [body.decode('utf-8') for body in bodies]
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for text in texts:
+            loads(text)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+async def run(args: argparse.Namespace):
+    stub = SteamStub(StubConfig(latency=0, jitter=0, dead_app_every=10 ** 9))
+    await stub.start()
+    try:
+        app_ids = [app_id_by_index(i) for i in range(args.apps)]
+        variants = {
+            'full': await fetch_bodies(stub, app_ids, None),
+            'filtered': await fetch_bodies(stub, app_ids, APPDETAILS_FILTERS),
+        }
+    finally:
+        await stub.stop()
+
+    decoders = {'json': json.loads}
+    if orjson is not None:
+        decoders['orjson'] = orjson.loads
+
+    scale = 1000 / args.apps
+    print(f"\nПриложений: {args.apps}, filters={APPDETAILS_FILTERS}, результаты пересчитаны на 1000 приложений\n")
+    header = f"{'payload':<10}{'decoder':<9}{'KB':>10}{'decode,ms':>12}"
+    print(header)
+    print("-" * len(header))
+    for variant, bodies in variants.items():
+        size = sum(len(body) for body in bodies) * scale / 1024
+        for name, loads in decoders.items():
+            elapsed = decode_time(bodies, loads, args.repeat) * scale * 1000
+            print(f"{variant:<10}{name:<9}{size:>10.1f}{elapsed:>12.2f}")
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Объём и время декодирования ответов appdetails")
+    parser.add_argument("--apps", type=int, default=1000, help="число приложений")
+    parser.add_argument("--repeat", type=int, default=5, help="число повторов декодирования")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    asyncio.run(run(parse_args()))
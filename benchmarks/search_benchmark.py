@@ -0,0 +1,119 @@
+# benchmarks/search_benchmark.py
+# Поиск игр по названию (функция search_games, индекс pg_trgm) на синтетическом каталоге:
+# в таблицу games добавляется --games записей, затем замеряются задержки точных, частичных запросов и запросов
+# с опечатками, а также выводится план запроса, чтобы убедиться, что используется GIN-индекс games_name_trgm_idx.
+#
+# Запуск (из корня репозитория, при поднятом контейнере postgres):
+#   python -m benchmarks.search_benchmark --games 150000 --queries 200
+import argparse
+import os
+import random
+import time
+
+from benchmarks.load_test import percentile
+from sources.models import GameRecord
+
+# Синтетические игры получают id выше реальных id Steam, чтобы их можно было удалить после замера
+FIRST_APP_ID = 900_000_000
+INSERT_CHUNK = 5000
+
+ADJECTIVES = ["Dark", "Lost", "Eternal", "Iron", "Silent", "Crimson", "Hidden", "Broken", "Ancient", "Frozen",
+              "Wild", "Last", "Golden", "Shadow", "Savage", "Arcane", "Hollow", "Burning", "Forgotten", "Cosmic"]
+NOUNS = ["Kingdom", "Legends", "Frontier", "Dungeon", "Empire", "Odyssey", "Tactics", "Knight", "Colony", "Tales",
+         "Protocol", "Horizon", "Souls", "Rebellion", "Voyage", "Arena", "Siege", "Chronicles", "Outpost", "Realm"]
+SUFFIXES = ["", "", "", " II", " III", " Remastered", " Online", ": Origins", " Deluxe Edition", " VR"]
+
+
+def game_name(index: int) -> str:
+    rnd = random.Random(index)
+    return (f"{rnd.choice(ADJECTIVES)} {rnd.choice(NOUNS)} of {rnd.choice(ADJECTIVES)} {rnd.choice(NOUNS)}"
+            f"{rnd.choice(SUFFIXES)} {index}")
+
+
+def with_typo(name: str, rnd: random.Random) -> str:
+    """Пропускает одну букву в названии"""
+    position = rnd.randrange(1, len(name) - 1)
+    return name[:position] + name[position + 1:]
+
+
+def like_pattern(query: str) -> str:
+    """Шаблон ILIKE, который строит search_games: подстрока запроса с экранированными \\, % и _"""
+    return '%' + query.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+
+
+def seed(db_client, count: int):
+    for start in range(0, count, INSERT_CHUNK):
+        games = [
+            GameRecord(FIRST_APP_ID + i, game_name(i), positive=random.randint(0, 10000))
+            for i in range(start, min(start + INSERT_CHUNK, count))
+        ]
+        db_client.add_games(games)
+    db_client._execute('analyze', 'games', 'ANALYZE games')
+
+
+def cleanup(db_client):
+    db_client._execute('delete', 'games', 'DELETE FROM games WHERE steam_app_id >= %s', (FIRST_APP_ID,))
+
+
+def run(args: argparse.Namespace):
+    os.environ.setdefault("DB_HOST", "localhost")
+    os.environ.setdefault("DB_PORT", "5432")
+    os.environ.setdefault("DB_NAME", "steam_data")
+    os.environ.setdefault("DB_USER", "postgres")
+    os.environ.setdefault("DB_PASSWORD", "159753")
+
+    from sources.database_api import PgsqlApiClient
+
+    db_client = PgsqlApiClient()
+    rnd = random.Random(args.seed)
+    try:
+        start = time.perf_counter()
+        seed(db_client, args.games)
+        print(f"\nДобавлено игр: {args.games} за {time.perf_counter() - start:.1f} с\n")
+
+        samples = [game_name(rnd.randrange(args.games)) for _ in range(args.queries)]
+        kinds = {
+            'exact': samples,
+            'words': [' '.join(name.split()[:2]) for name in samples],
+            'typo': [with_typo(name, rnd) for name in samples],
+            # Символы шаблона LIKE ищутся как обычные символы, а не как «любая строка» и «любой символ»
+            'special': [f"{name.split()[0]}%_{name.split()[1][:2]}" for name in samples],
+        }
+
+        header = f"{'query':<8}{'p50,ms':>10}{'p95,ms':>10}{'p99,ms':>10}{'found':>8}"
+        print(header)
+        print("-" * len(header))
+        for kind, queries in kinds.items():
+            latencies, found = [], 0
+            for query in queries:
+                start = time.perf_counter()
+                result = db_client.search_games(query, args.limit)
+                latencies.append((time.perf_counter() - start) * 1000)
+                found += bool(result)
+            latencies.sort()
+            print(f"{kind:<8}{percentile(latencies, 50):>10.2f}{percentile(latencies, 95):>10.2f}"
+                  f"{percentile(latencies, 99):>10.2f}{found:>8}")
+
+        plan, _ = db_client._execute(
+            'explain', 'games',
+            "EXPLAIN SELECT steam_app_id FROM games WHERE %s <%% name OR name ILIKE %s",
+            (kinds['special'][0], like_pattern(kinds['special'][0])), fetch=True, readonly=True
+        )
+        print("\n" + "\n".join(row[0] for row in plan))
+    finally:
+        if not args.keep:
+            cleanup(db_client)
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Задержка поиска игр по названию на синтетическом каталоге")
+    parser.add_argument("--games", type=int, default=150000, help="число синтетических игр")
+    parser.add_argument("--queries", type=int, default=200, help="число запросов каждого вида")
+    parser.add_argument("--limit", type=int, default=5, help="число результатов поиска")
+    parser.add_argument("--seed", type=int, default=1, help="seed генератора запросов")
+    parser.add_argument("--keep", action="store_true", help="не удалять синтетические игры после замера")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    run(parse_args())
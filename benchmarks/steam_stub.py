@@ -0,0 +1,318 @@
+# benchmarks/steam_stub.py
+# Локальная заглушка Steam Web API, Steam Store API и Telegram Bot API для нагрузочного тестирования
+import asyncio
+import json
+import random
+import time
+from dataclasses import dataclass
+
+from aiohttp import web
+
+
+@dataclass
+class StubConfig:
+    latency: float = 0.05          # средняя задержка ответа Steam, сек
+    jitter: float = 0.02           # разброс задержки, сек
+    rate_limit_ratio: float = 0.0  # доля ответов 429 Too Many Requests
+    retry_after: int = 1           # значение заголовка Retry-After для 429
+    friends_per_user: int = 3
+    games_per_user: int = 5
+    app_pool: int = 200            # число различных app id в синтетическом каталоге
+    dead_app_every: int = 17       # каждое N-ое приложение отвечает success: false
+    telegram_latency: float = 0.0  # задержка ответа Telegram Bot API, сек
+
+
+STORE_TAGS = {
+    19: "Action", 122: "RPG", 492: "Indie", 9: "Strategy", 21: "Adventure", 597: "Casual", 599: "Simulation",
+    4182: "Singleplayer", 3859: "Multiplayer", 1695: "Open World", 1664: "Puzzle", 1774: "Shooter",
+    1742: "Story Rich", 1716: "Roguelike", 1685: "Co-op",
+}
+STORE_CATEGORIES = {2: "Single-player", 1: "Multi-player"}
+# Поля appdetails, которые возвращает группа filters=basic
+APPDETAILS_BASIC_FIELDS = {
+    "type", "name", "steam_appid", "required_age", "is_free", "detailed_description", "about_the_game",
+    "short_description", "supported_languages", "header_image", "website", "pc_requirements",
+    "mac_requirements", "linux_requirements",
+}
+
+
+def app_id_by_index(index: int) -> int:
+    return 10 + index * 10
+
+
+class SteamStub:
+    """Синтетические ответы Steam и Telegram с настраиваемыми задержками и 429"""
+
+    def __init__(self, config: StubConfig = None, seed: int = 0):
+        self.config = config or StubConfig()
+        self.random = random.Random(seed)
+        self.requests = {}
+        self.app = web.Application()
+        self.app.router.add_get("/ISteamUser/GetFriendList/v1/", self.get_friend_list)
+        self.app.router.add_get("/IPlayerService/GetOwnedGames/v1/", self.get_owned_games)
+        self.app.router.add_get("/ISteamUser/GetPlayerSummaries/v2/", self.get_player_summaries)
+        self.app.router.add_get("/IStoreBrowseService/GetItems/v1/", self.get_store_items)
+        self.app.router.add_get("/IStoreService/GetTagList/v1/", self.get_tag_list)
+        self.app.router.add_get("/IStoreBrowseService/GetStoreCategories/v1/", self.get_store_categories)
+        self.app.router.add_get("/api/appdetails", self.get_appdetails)
+        self.app.router.add_get("/api/featuredcategories", self.get_featured)
+        self.app.router.add_post("/bot{token}/{method}", self.telegram_method)
+        self.runner = None
+        self.url = None
+        self.message_id = 0
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> str:
+        self.runner = web.AppRunner(self.app, access_log=None)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, host, port)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        self.url = f"http://{host}:{port}"
+        return self.url
+
+    async def stop(self):
+        if self.runner is not None:
+            await self.runner.cleanup()
+
+    @property
+    def base_url(self) -> str:
+        return self.url
+
+    @property
+    def store_url(self) -> str:
+        return f"{self.url}/api"
+
+    async def _steam_delay(self, endpoint: str) -> web.Response | None:
+        self.requests[endpoint] = self.requests.get(endpoint, 0) + 1
+        delay = self.config.latency + self.random.uniform(-self.config.jitter, self.config.jitter)
+        await asyncio.sleep(max(delay, 0))
+        if self.random.random() < self.config.rate_limit_ratio:
+            self.requests[f"{endpoint}:429"] = self.requests.get(f"{endpoint}:429", 0) + 1
+            return web.json_response(
+                {}, status=429, headers={"Retry-After": str(self.config.retry_after)}
+            )
+        return None
+
+    def friends_of(self, steam_id: int) -> list[int]:
+        return [steam_id + i for i in range(1, self.config.friends_per_user + 1)]
+
+    def owned_games(self, steam_id: int) -> list[int]:
+        rnd = random.Random(steam_id)
+        indexes = rnd.sample(range(self.config.app_pool), min(self.config.games_per_user, self.config.app_pool))
+        return [app_id_by_index(i) for i in indexes]
+
+    async def get_friend_list(self, request: web.Request) -> web.Response:
+        if (error := await self._steam_delay("GetFriendList")) is not None:
+            return error
+        steam_id = int(request.query["steamid"])
+        friends = [{"steamid": str(i), "relationship": "friend", "friend_since": 0} for i in self.friends_of(steam_id)]
+        return web.json_response({"friendslist": {"friends": friends}})
+
+    async def get_owned_games(self, request: web.Request) -> web.Response:
+        if (error := await self._steam_delay("GetOwnedGames")) is not None:
+            return error
+        steam_id = int(request.query["steamid"])
+        rnd = random.Random(steam_id)
+        games = [{"appid": app_id, "playtime_forever": rnd.randint(0, 5000)} for app_id in self.owned_games(steam_id)]
+        return web.json_response({"response": {"game_count": len(games), "games": games}})
+
+    async def get_player_summaries(self, request: web.Request) -> web.Response:
+        if (error := await self._steam_delay("GetPlayerSummaries")) is not None:
+            return error
+        ids = request.query["steamids"].split(",")[:100]
+        players = [
+            {
+                "steamid": i,
+                "personaname": f"player_{i[-6:]}",
+                "profileurl": f"https://steamcommunity.com/profiles/{i}/",
+                "avatarmedium": f"https://avatars.example.com/{i}_medium.jpg",
+            }
+            for i in ids
+        ]
+        return web.json_response({"response": {"players": players}})
+
+    def app_details(self, app_id: int) -> dict:
+        rnd = random.Random(app_id)
+        genres = rnd.sample(["Action", "RPG", "Indie", "Strategy", "Adventure", "Casual", "Simulation"], 2)
+        tags = {tag: rnd.randint(10, 500) for tag in rnd.sample(
+            ["Singleplayer", "Multiplayer", "Open World", "Puzzle", "Shooter", "Story Rich", "Roguelike", "Co-op"], 4
+        )}
+        return {
+            "type": "game",
+            "name": f"Synthetic Game {app_id}",
+            "steam_appid": app_id,
+            "required_age": 0,
+            "short_description": f"Synthetic description for app {app_id}",
+            "header_image": f"https://cdn.example.com/apps/{app_id}/header.jpg",
+            "release_date": {"coming_soon": False, "date": "Aug 21, 2012"},
+            "categories": [{"id": 2, "description": "Single-player"}],
+            "genres": [{"id": str(i), "description": g} for i, g in enumerate(genres)],
+            "tags": tags,
+            "positive": rnd.randint(0, 10000),
+            "negative": rnd.randint(0, 1000),
+        }
+
+    def is_dead(self, app_id: int) -> bool:
+        return (app_id // 10) % self.config.dead_app_every == 0
+
+    def store_item(self, app_id: int) -> dict:
+        """Элемент ответа IStoreBrowseService/GetItems с теми же данными, что и app_details"""
+        if self.is_dead(app_id):
+            return {"appid": app_id, "success": 2}
+        details = self.app_details(app_id)
+        tag_ids = {name: tag_id for tag_id, name in STORE_TAGS.items()}
+        tags = [{"tagid": tag_ids[g["description"]], "weight": 1000} for g in details["genres"]]
+        tags += [{"tagid": tag_ids[name], "weight": weight} for name, weight in details["tags"].items()]
+        reviews = details["positive"] + details["negative"]
+        return {
+            "item_type": 0,
+            "id": app_id,
+            "success": 1,
+            "visible": True,
+            "name": details["name"],
+            "appid": app_id,
+            "basic_info": {"short_description": details["short_description"]},
+            "tags": tags,
+            "categories": {"supported_player_categoryids": [2]},
+            "assets": {"asset_url_format": f"steam/apps/{app_id}/${{FILENAME}}", "header": "header.jpg"},
+            "release": {"steam_release_date": 1345507200},
+            "reviews": {"summary_filtered": {
+                "review_count": reviews,
+                "percent_positive": round(details["positive"] * 100 / reviews) if reviews else 0,
+            }},
+            "game_rating": {"required_age": 0},
+        }
+
+    async def get_store_items(self, request: web.Request) -> web.Response:
+        if (error := await self._steam_delay("GetItems")) is not None:
+            return error
+        ids = [item["appid"] for item in json.loads(request.query["input_json"])["ids"]]
+        return web.json_response({"response": {"store_items": [self.store_item(app_id) for app_id in ids]}})
+
+    async def get_tag_list(self, request: web.Request) -> web.Response:
+        if (error := await self._steam_delay("GetTagList")) is not None:
+            return error
+        tags = [{"tagid": tag_id, "name": name} for tag_id, name in STORE_TAGS.items()]
+        return web.json_response({"response": {"version_hash": "stub", "tags": tags}})
+
+    async def get_store_categories(self, request: web.Request) -> web.Response:
+        if (error := await self._steam_delay("GetStoreCategories")) is not None:
+            return error
+        categories = [
+            {"categoryid": category_id, "type": 1, "internal_name": name, "display_name": name}
+            for category_id, name in STORE_CATEGORIES.items()
+        ]
+        return web.json_response({"response": {"categories": categories}})
+
+    def full_app_details(self, app_id: int) -> dict:
+        """Полный документ appdetails: к полям app_details добавляются описания, медиа и цены"""
+        rnd = random.Random(app_id)
+        paragraph = f"<p>Synthetic long description for app {app_id}. " + "Lorem ipsum dolor sit amet. " * 40 + "</p>"
+        details = self.app_details(app_id)
+        details.update({
+            "is_free": False,
+            "detailed_description": paragraph * 6,
+            "about_the_game": paragraph * 6,
+            "supported_languages": "English<strong>*</strong>, French, German, Russian",
+            "website": f"https://example.com/{app_id}",
+            "pc_requirements": {"minimum": "<strong>Minimum:</strong><br><ul>" + "<li>Requirement</li>" * 10 + "</ul>"},
+            "mac_requirements": [],
+            "linux_requirements": [],
+            "developers": ["Stub Studio"],
+            "publishers": ["Stub Publisher"],
+            "price_overview": {"currency": "USD", "initial": 1999, "final": 999, "discount_percent": 50},
+            "packages": [app_id * 10 + i for i in range(3)],
+            "platforms": {"windows": True, "mac": False, "linux": False},
+            "screenshots": [
+                {
+                    "id": i,
+                    "path_thumbnail": f"https://cdn.example.com/apps/{app_id}/ss_{i}.600x338.jpg",
+                    "path_full": f"https://cdn.example.com/apps/{app_id}/ss_{i}.1920x1080.jpg",
+                }
+                for i in range(rnd.randint(8, 16))
+            ],
+            "movies": [
+                {
+                    "id": i,
+                    "name": f"Trailer {i}",
+                    "thumbnail": f"https://cdn.example.com/apps/{app_id}/movie_{i}.jpg",
+                    "webm": {"480": f"https://cdn.example.com/apps/{app_id}/movie480_{i}.webm",
+                             "max": f"https://cdn.example.com/apps/{app_id}/movie_max_{i}.webm"},
+                    "mp4": {"480": f"https://cdn.example.com/apps/{app_id}/movie480_{i}.mp4",
+                            "max": f"https://cdn.example.com/apps/{app_id}/movie_max_{i}.mp4"},
+                    "highlight": True,
+                }
+                for i in range(rnd.randint(1, 4))
+            ],
+            "achievements": {"total": 50, "highlighted": [
+                {"name": f"Achievement {i}", "path": f"https://cdn.example.com/apps/{app_id}/ach_{i}.jpg"}
+                for i in range(10)
+            ]},
+            "support_info": {"url": "", "email": "support@example.com"},
+            "background": f"https://cdn.example.com/apps/{app_id}/page_bg.jpg",
+            "content_descriptors": {"ids": [], "notes": None},
+        })
+        return details
+
+    @staticmethod
+    def filter_app_details(details: dict, filters: str) -> dict:
+        """Оставляет только запрошенные группы полей, как это делает appdetails с параметром filters"""
+        groups = set(filters.split(","))
+        return {
+            key: value for key, value in details.items()
+            if key in groups or ("basic" in groups and key in APPDETAILS_BASIC_FIELDS)
+        }
+
+    async def get_appdetails(self, request: web.Request) -> web.Response:
+        if (error := await self._steam_delay("appdetails")) is not None:
+            return error
+        app_id = int(request.query["appids"])
+        if self.is_dead(app_id):
+            return web.json_response({str(app_id): {"success": False}})
+        details = self.full_app_details(app_id)
+        if request.query.get("filters"):
+            details = self.filter_app_details(details, request.query["filters"])
+        return web.json_response({str(app_id): {"success": True, "data": details}})
+
+    async def get_featured(self, request: web.Request) -> web.Response:
+        if (error := await self._steam_delay("featuredcategories")) is not None:
+            return error
+
+        def items(offset: int) -> list[dict]:
+            return [
+                {"id": app_id_by_index(offset + i), "name": f"Synthetic Game {app_id_by_index(offset + i)}",
+                 "final_price": 999, "discount_percent": 0, "release_date": "Coming soon"}
+                for i in range(10)
+            ]
+
+        return web.json_response({
+            "top_sellers": {"items": items(0)},
+            "new_releases": {"items": items(10)},
+            "coming_soon": {"items": items(20)},
+        })
+
+    async def telegram_method(self, request: web.Request) -> web.Response:
+        """Отвечает на любой метод Bot API так, будто сообщение отправлено"""
+        method = request.match_info["method"]
+        self.requests[f"telegram:{method}"] = self.requests.get(f"telegram:{method}", 0) + 1
+        if self.config.telegram_latency:
+            await asyncio.sleep(self.config.telegram_latency)
+        form = await request.post()
+        chat_id = int(form.get("chat_id", 0))
+        self.message_id += 1
+        result = {
+            "message_id": self.message_id,
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+            "from": {"id": 1, "is_bot": True, "first_name": "stub"},
+        }
+        if method.lower() == "sendphoto":
+            result["photo"] = [{
+                "file_id": f"stub-file-{self.message_id}",
+                "file_unique_id": f"stub-unique-{self.message_id}",
+                "width": 460,
+                "height": 215,
+            }]
+        else:
+            result["text"] = form.get("text", "")
+        return web.json_response({"ok": True, "result": result})
@@ -2,11 +2,13 @@
 import json
 import os
 import sys
-from datetime import datetime
 from dotenv import load_dotenv
 import psycopg2
 from psycopg2.extras import execute_values
 
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from sources.models import GameRecord
+
 def get_db_connection():
     """Создаёт подключение к БД из .env"""
     return psycopg2.connect(
@@ -17,15 +19,6 @@ def get_db_connection():
         password=os.getenv('DB_PASSWORD')
     )
 
-def parse_steam_date(date_str):
-    """Конвертирует Steam дату в формат PostgreSQL"""
-    if not date_str:
-        return None
-    try:
-        return datetime.strptime(date_str, '%b %d, %Y').date()
-    except ValueError:
-        return None
-
 def fill_games_table():
     """Заполняет таблицу games из JSON файла"""
     json_path = os.getenv('GAMES_JSON_PATH', './games.json')
@@ -45,55 +38,21 @@ def fill_games_table():
     try:
         total = len(games_data)
         processed = 0
+        records = (GameRecord.from_catalog(appid, game) for appid, game in games_data.items())
+        query = f"INSERT INTO games ({', '.join(GameRecord.COLUMNS)}) VALUES %s"
         
-        for appid_str, game in games_data.items():
-            appid = int(appid_str)
-            
-            # Парсим дату
-            release_date = parse_steam_date(game.get('release_date'))
-            
-            # Теги как JSON
-            tags = json.dumps(game.get('tags', {}))
-            
-            # Категории и жанры как массивы
-            categories = game.get('categories', [])
-            genres = game.get('genres', [])
-            
-            # Вставляем или обновляем
-            cursor.execute("""
-                INSERT INTO games (
-                    steam_app_id, name, release_date, required_age,
-                    short_description, header_image_url, categories,
-                    genres, positive, negative, estimated_owners,
-                    average_playtime_forever, average_playtime_2weeks,
-                    median_playtime_forever, median_playtime_2weeks,
-                    tags
-                ) VALUES (
-                    %s, %s, %s, %s, %s, %s, %s, %s, %s, %s,
-                    %s, %s, %s, %s, %s, %s
-                )
-            """, (
-                appid,
-                game.get('name'),
-                release_date,
-                game.get('required_age', 0),
-                game.get('short_description'),
-                game.get('header_image'),
-                categories,
-                genres,
-                game.get('positive', 0),
-                game.get('negative', 0),
-                game.get('estimated_owners', ''),
-                game.get('average_playtime_forever', 0),
-                game.get('average_playtime_2weeks', 0),
-                game.get('median_playtime_forever', 0),
-                game.get('median_playtime_2weeks', 0),
-                tags
-            ))
-            
-            processed += 1
-            if processed % 100 == 0:
+        # Вставляем или обновляем пачками по 1000 строк
+        batch = []
+        for record in records:
+            batch.append(record.as_row())
+            if len(batch) == 1000:
+                execute_values(cursor, query, batch, page_size=1000)
+                processed += len(batch)
+                batch = []
                 print(f"Обработано {processed}/{total} игр...")
+        if batch:
+            execute_values(cursor, query, batch, page_size=1000)
+            processed += len(batch)
         
         conn.commit()
         print(f"\nУспешно загружено {processed} игр в базу данных!")
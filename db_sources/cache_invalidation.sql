@@ -0,0 +1,112 @@
+-- Уведомления об изменениях для сброса кэшей во всех процессах бота (sources/cache_invalidation.py).
+-- Каждое изменение отправляет в канал cache_invalidation JSON вида {"kind": ..., "id": ...}.
+-- NOTIFY доставляется только после COMMIT, поэтому слушатель читает из базы уже новые данные,
+-- а одинаковые уведомления одной транзакции PostgreSQL объединяет в одно.
+
+-- Игры добавлены или изменены (add_games): одно уведомление с id игр на запрос, а не на каждую строку.
+-- Полезная нагрузка NOTIFY ограничена 8000 байт, поэтому id отправляются частями по 500.
+-- Смена только file_id обложки (set_game_file_id) не меняет название и отзывы, уведомление не отправляется
+CREATE OR REPLACE FUNCTION notify_games_changed()
+RETURNS TRIGGER AS $$
+DECLARE
+    changed INTEGER[];
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        SELECT array_agg(DISTINCT n.steam_app_id) INTO changed FROM changed_rows n;
+    ELSE
+        SELECT array_agg(DISTINCT n.steam_app_id) INTO changed
+        FROM changed_rows n
+        JOIN previous_rows o ON o.steam_app_id = n.steam_app_id
+        WHERE to_jsonb(n) - 'telegram_file_id' IS DISTINCT FROM to_jsonb(o) - 'telegram_file_id';
+    END IF;
+    FOR i IN 1 .. COALESCE(array_length(changed, 1), 0) BY 500 LOOP
+        PERFORM pg_notify('cache_invalidation', json_build_object('kind', 'games', 'ids', changed[i:i + 499])::text);
+    END LOOP;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS notify_game_changed_trigger ON games;
+DROP FUNCTION IF EXISTS notify_game_changed();
+
+CREATE OR REPLACE TRIGGER notify_games_insert_trigger
+    AFTER INSERT ON games
+    REFERENCING NEW TABLE AS changed_rows
+    FOR EACH STATEMENT
+    EXECUTE FUNCTION notify_games_changed();
+
+CREATE OR REPLACE TRIGGER notify_games_update_trigger
+    AFTER UPDATE ON games
+    REFERENCING OLD TABLE AS previous_rows NEW TABLE AS changed_rows
+    FOR EACH STATEMENT
+    EXECUTE FUNCTION notify_games_changed();
+
+-- Названия и отзывы изменившихся игр для индекса inline-поиска: слушатель читает их одним запросом
+CREATE OR REPLACE FUNCTION get_game_names_many(p_app_ids INTEGER[])
+RETURNS TABLE (steam_app_id INTEGER, name VARCHAR(500), positive INTEGER)
+LANGUAGE sql
+STABLE
+AS $$
+    SELECT g.steam_app_id, g.name, g.positive FROM games g WHERE g.steam_app_id = ANY(p_app_ids);
+$$;
+
+-- Библиотека пользователя изменилась: одно уведомление на пользователя за запрос, а не на каждую игру
+CREATE OR REPLACE FUNCTION notify_library_changed()
+RETURNS TRIGGER AS $$
+BEGIN
+    PERFORM pg_notify('cache_invalidation', json_build_object('kind', 'library', 'id', user_id)::text)
+    FROM (SELECT DISTINCT user_id FROM changed_rows) AS users;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Таблицы переходов нельзя объявить у триггера на несколько событий, поэтому триггеров два
+CREATE OR REPLACE TRIGGER notify_library_insert_trigger
+    AFTER INSERT ON user_games
+    REFERENCING NEW TABLE AS changed_rows
+    FOR EACH STATEMENT
+    EXECUTE FUNCTION notify_library_changed();
+
+CREATE OR REPLACE TRIGGER notify_library_update_trigger
+    AFTER UPDATE ON user_games
+    REFERENCING NEW TABLE AS changed_rows
+    FOR EACH STATEMENT
+    EXECUTE FUNCTION notify_library_changed();
+
+-- Пересчитаны сохранённые рекомендации (refresh_user_recommendations)
+CREATE OR REPLACE FUNCTION notify_recommendations_changed()
+RETURNS TRIGGER AS $$
+BEGIN
+    PERFORM pg_notify('cache_invalidation', json_build_object('kind', 'recommendations', 'id', steam_user_id)::text)
+    FROM (SELECT DISTINCT steam_user_id FROM changed_rows) AS users;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE TRIGGER notify_recommendations_insert_trigger
+    AFTER INSERT ON user_recommendations
+    REFERENCING NEW TABLE AS changed_rows
+    FOR EACH STATEMENT
+    EXECUTE FUNCTION notify_recommendations_changed();
+
+CREATE OR REPLACE TRIGGER notify_recommendations_update_trigger
+    AFTER UPDATE ON user_recommendations
+    REFERENCING NEW TABLE AS changed_rows
+    FOR EACH STATEMENT
+    EXECUTE FUNCTION notify_recommendations_changed();
+
+-- Пользователь бота привязал другой Steam id
+CREATE OR REPLACE FUNCTION notify_bot_user_changed()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP = 'INSERT' OR NEW.steam_id IS DISTINCT FROM OLD.steam_id THEN
+        PERFORM pg_notify('cache_invalidation', json_build_object('kind', 'bot_user', 'id', NEW.tg_id)::text);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE TRIGGER notify_bot_user_changed_trigger
+    AFTER INSERT OR UPDATE OF steam_id ON bot_users
+    FOR EACH ROW
+    EXECUTE FUNCTION notify_bot_user_changed();
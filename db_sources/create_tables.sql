@@ -16,6 +16,7 @@ CREATE TABLE games (
     median_playtime_forever INTEGER DEFAULT 0,
     median_playtime_2weeks INTEGER DEFAULT 0,
     tags JSONB,
+    telegram_file_id TEXT, -- file_id обложки на серверах Telegram, сбрасывается при смене header_image_url
 
     CHECK (positive >= 0),
     CHECK (negative >= 0)
@@ -64,3 +65,72 @@ CREATE TABLE user_games (
     
     UNIQUE (user_id, game_id)
 );
+
+-- Приложения, для которых Steam Store не возвращает данных (негативный кэш)
+CREATE TABLE ignored_apps (
+    steam_app_id INTEGER PRIMARY KEY,
+    reason VARCHAR(50) NOT NULL,
+    checked_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    expires_at TIMESTAMP NOT NULL
+);
+
+-- Игры, о которых пользователь бота уже получил дайджест обновлений друзей
+CREATE TABLE digest_log (
+    tg_id BIGINT NOT NULL
+        REFERENCES bot_users(tg_id) ON DELETE CASCADE,
+    game_id INTEGER NOT NULL
+        REFERENCES games(steam_app_id) ON DELETE CASCADE,
+    sent_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+
+    PRIMARY KEY (tg_id, game_id)
+);
+
+-- Предрассчитанные рекомендации пользователей Steam (обновляются задачей sources/recommendation_job.py)
+CREATE TABLE user_recommendations (
+    steam_user_id BIGINT PRIMARY KEY
+        REFERENCES steam_users(steam_user_id) ON DELETE CASCADE,
+    app_ids INTEGER[] NOT NULL,
+    scores FLOAT[] NOT NULL,
+    computed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Лента обновлений друзей: для каждого пользователя Steam - игры, добавленные его друзьями за последние 14 дней,
+-- с агрегатами по друзьям. Заполняется при записи (триггеры из friend_feed.sql), устаревшие записи удаляет
+-- compact_friend_feed (задача sources/feed_compaction.py)
+CREATE TABLE friend_feed (
+    user_id BIGINT NOT NULL
+        REFERENCES steam_users(steam_user_id) ON DELETE CASCADE,
+    game_id INTEGER NOT NULL
+        REFERENCES games(steam_app_id) ON DELETE CASCADE,
+    friend_count INTEGER NOT NULL,
+    playtime_sum BIGINT NOT NULL DEFAULT 0,
+    -- Самое раннее добавление среди учтённых друзей: если оно вышло за окно, запись пересчитывается при уплотнении
+    first_added TIMESTAMP NOT NULL,
+    last_added TIMESTAMP NOT NULL,
+
+    PRIMARY KEY (user_id, game_id)
+);
+
+-- Первые K записей пользователя в порядке ранжирования читаются по индексу без сортировки
+CREATE INDEX friend_feed_top ON friend_feed (user_id, friend_count DESC, playtime_sum DESC, last_added DESC);
+CREATE INDEX friend_feed_first_added ON friend_feed (first_added);
+
+-- Похожие игры по совместному владению (item-item коллаборативная фильтрация): для каждой игры - до K соседей
+-- с косинусной близостью по библиотекам пользователей. Пересчитывается задачей sources/item_neighbors_job.py
+CREATE TABLE game_neighbors (
+    game_id INTEGER NOT NULL
+        REFERENCES games(steam_app_id) ON DELETE CASCADE,
+    neighbor_id INTEGER NOT NULL
+        REFERENCES games(steam_app_id) ON DELETE CASCADE,
+    score REAL NOT NULL,
+
+    PRIMARY KEY (game_id, neighbor_id)
+);
+
+-- Новый расчёт соседей, записываемый блоками по мере вычисления; в game_neighbors переносится одной транзакцией
+-- (swap_game_neighbors). Таблица промежуточная, поэтому не журналируется
+CREATE UNLOGGED TABLE game_neighbors_staging (
+    game_id INTEGER NOT NULL,
+    neighbor_id INTEGER NOT NULL,
+    score REAL NOT NULL
+);
@@ -7,6 +7,9 @@ DROP TRIGGER IF EXISTS upsert_bot_user_trigger ON bot_users;
 DROP TRIGGER IF EXISTS upsert_game_trigger ON games;
 DROP TRIGGER IF EXISTS upsert_user_game_trigger ON user_games;
 DROP TRIGGER IF EXISTS upsert_friend_trigger ON friends;
+DROP TRIGGER IF EXISTS upsert_ignored_app_trigger ON ignored_apps;
+DROP TRIGGER IF EXISTS reset_game_file_id_trigger ON games;
+DROP TRIGGER IF EXISTS upsert_digest_log_trigger ON digest_log;
 
 -- Удаляем старые функции
 DROP FUNCTION IF EXISTS upsert_steam_user();
@@ -14,6 +17,9 @@ DROP FUNCTION IF EXISTS upsert_bot_user();
 DROP FUNCTION IF EXISTS upsert_game();
 DROP FUNCTION IF EXISTS upsert_user_game();
 DROP FUNCTION IF EXISTS upsert_friend();
+DROP FUNCTION IF EXISTS upsert_ignored_app();
+DROP FUNCTION IF EXISTS reset_game_file_id();
+DROP FUNCTION IF EXISTS upsert_digest_log();
 
 -- Функция для UPSERT в steam_users
 CREATE OR REPLACE FUNCTION upsert_steam_user()
@@ -74,68 +80,23 @@ CREATE TRIGGER upsert_bot_user_trigger
     FOR EACH ROW
     EXECUTE FUNCTION upsert_bot_user();
 
--- Функция для UPSERT в games
-CREATE OR REPLACE FUNCTION upsert_game()
+-- Функция для сброса file_id обложки Telegram при смене header_image_url
+CREATE OR REPLACE FUNCTION reset_game_file_id()
 RETURNS TRIGGER AS $$
 BEGIN
-    -- Пытаемся обновить существующую запись
-    UPDATE games 
-    SET 
-        name = COALESCE(NEW.name, name),
-        release_date = COALESCE(NEW.release_date, release_date),
-        required_age = COALESCE(NEW.required_age, required_age),
-        short_description = COALESCE(NEW.short_description, short_description),
-        header_image_url = COALESCE(NEW.header_image_url, header_image_url),
-        categories = COALESCE(NEW.categories, categories),
-        genres = COALESCE(NEW.genres, genres),
-        positive = COALESCE(NEW.positive, positive),
-        negative = COALESCE(NEW.negative, negative),
-        estimated_owners = COALESCE(NEW.estimated_owners, estimated_owners),
-        average_playtime_forever = COALESCE(NEW.average_playtime_forever, average_playtime_forever),
-        average_playtime_2weeks = COALESCE(NEW.average_playtime_2weeks, average_playtime_2weeks),
-        median_playtime_forever = COALESCE(NEW.median_playtime_forever, median_playtime_forever),
-        median_playtime_2weeks = COALESCE(NEW.median_playtime_2weeks, median_playtime_2weeks),
-        tags = COALESCE(NEW.tags, tags)
-    WHERE steam_app_id = NEW.steam_app_id;
-    
-    IF NOT FOUND THEN
-        RETURN NEW; -- Вставляем новую запись
-    END IF;
-    
-    RETURN NULL; -- Отменяем оригинальную вставку
-END;
-$$ LANGUAGE plpgsql;
-
--- Триггер для games
-CREATE TRIGGER upsert_game_trigger
-    BEFORE INSERT ON games
-    FOR EACH ROW
-    EXECUTE FUNCTION upsert_game();
-
--- Функция для UPSERT в user_games
-CREATE OR REPLACE FUNCTION upsert_user_game()
-RETURNS TRIGGER AS $$
-BEGIN
-    -- Пытаемся обновить существующую запись
-    UPDATE user_games 
-    SET 
-        playtime_total = COALESCE(NEW.playtime_total, playtime_total),
-        added_at = CURRENT_TIMESTAMP
-    WHERE user_id = NEW.user_id AND game_id = NEW.game_id;
-    
-    IF NOT FOUND THEN
-        RETURN NEW; -- Вставляем новую запись
+    IF NEW.header_image_url IS DISTINCT FROM OLD.header_image_url THEN
+        NEW.telegram_file_id := NULL;
     END IF;
     
-    RETURN NULL; -- Отменяем оригинальную вставку
+    RETURN NEW;
 END;
 $$ LANGUAGE plpgsql;
 
--- Триггер для user_games
-CREATE TRIGGER upsert_user_game_trigger
-    BEFORE INSERT ON user_games
+-- Триггер для games (срабатывает и на ON CONFLICT DO UPDATE из add_games)
+CREATE TRIGGER reset_game_file_id_trigger
+    BEFORE UPDATE OF header_image_url ON games
     FOR EACH ROW
-    EXECUTE FUNCTION upsert_user_game();
+    EXECUTE FUNCTION reset_game_file_id();
 
 -- Функция для UPSERT в friends (с проверкой уникальности и порядка)
 CREATE OR REPLACE FUNCTION upsert_friend()
@@ -175,4 +136,51 @@ CREATE TRIGGER upsert_friend_trigger
     FOR EACH ROW
     EXECUTE FUNCTION upsert_friend();
 
+-- Функция для UPSERT в ignored_apps (повторная проверка продлевает срок)
+CREATE OR REPLACE FUNCTION upsert_ignored_app()
+RETURNS TRIGGER AS $$
+BEGIN
+    UPDATE ignored_apps 
+    SET 
+        reason = NEW.reason,
+        checked_at = CURRENT_TIMESTAMP,
+        expires_at = NEW.expires_at
+    WHERE steam_app_id = NEW.steam_app_id;
+    
+    IF NOT FOUND THEN
+        RETURN NEW; -- Вставляем новую запись
+    END IF;
+    
+    RETURN NULL; -- Отменяем оригинальную вставку
+END;
+$$ LANGUAGE plpgsql;
+
+-- Триггер для ignored_apps
+CREATE TRIGGER upsert_ignored_app_trigger
+    BEFORE INSERT ON ignored_apps
+    FOR EACH ROW
+    EXECUTE FUNCTION upsert_ignored_app();
+
+-- Функция для UPSERT в digest_log (повторная отправка обновляет время)
+CREATE OR REPLACE FUNCTION upsert_digest_log()
+RETURNS TRIGGER AS $$
+BEGIN
+    UPDATE digest_log 
+    SET sent_at = COALESCE(NEW.sent_at, CURRENT_TIMESTAMP)
+    WHERE tg_id = NEW.tg_id AND game_id = NEW.game_id;
+    
+    IF NOT FOUND THEN
+        RETURN NEW; -- Вставляем новую запись
+    END IF;
+    
+    RETURN NULL; -- Отменяем оригинальную вставку
+END;
+$$ LANGUAGE plpgsql;
+
+-- Триггер для digest_log
+CREATE TRIGGER upsert_digest_log_trigger
+    BEFORE INSERT ON digest_log
+    FOR EACH ROW
+    EXECUTE FUNCTION upsert_digest_log();
+
 COMMIT;
\ No newline at end of file
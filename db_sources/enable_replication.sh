@@ -0,0 +1,3 @@
+#!/bin/sh
+# Разрешает подключения для потоковой репликации (pg_basebackup и walreceiver реплики)
+echo "host replication all all scram-sha-256" >> "$PGDATA/pg_hba.conf"
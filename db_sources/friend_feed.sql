@@ -0,0 +1,298 @@
+-- Лента обновлений друзей (fan-out on write): когда в библиотеке пользователя появляются игры, они сразу
+-- добавляются в friend_feed всех его друзей, поэтому /friends_updates читает несколько строк по индексу
+-- вместо соединения friends и user_games при каждом запросе.
+-- В шардированном режиме вклад друга записывается на его шард, и части ленты с разных шардов складываются в клиенте.
+
+-- Окно ленты. Запросы с p_days_ago больше окна видят только последние 14 дней, а с меньшим - отбирают записи
+-- по last_added, но число друзей и время игры в них посчитаны за всё окно
+CREATE OR REPLACE FUNCTION friend_feed_window()
+RETURNS INTERVAL
+LANGUAGE sql
+IMMUTABLE
+AS $$
+    SELECT INTERVAL '14 days';
+$$;
+
+-- Новые игры в библиотеках: +1 друг для каждого друга владельца
+CREATE OR REPLACE FUNCTION friend_feed_on_insert()
+RETURNS TRIGGER AS $$
+BEGIN
+    INSERT INTO friend_feed AS ff (user_id, game_id, friend_count, playtime_sum, first_added, last_added)
+    SELECT fr.friend_id, n.game_id, COUNT(*), SUM(n.playtime_total), MIN(n.added_at), MAX(n.added_at)
+    FROM new_rows n
+    CROSS JOIN LATERAL (
+        SELECT f.user2 AS friend_id FROM friends f WHERE f.user1 = n.user_id
+        UNION ALL
+        SELECT f.user1 FROM friends f WHERE f.user2 = n.user_id
+    ) fr
+    WHERE n.added_at >= NOW() - friend_feed_window()
+    GROUP BY fr.friend_id, n.game_id
+    ON CONFLICT (user_id, game_id) DO UPDATE
+    SET
+        friend_count = ff.friend_count + EXCLUDED.friend_count,
+        playtime_sum = ff.playtime_sum + EXCLUDED.playtime_sum,
+        first_added = LEAST(ff.first_added, EXCLUDED.first_added),
+        last_added = GREATEST(ff.last_added, EXCLUDED.last_added);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Повторная синхронизация (INSERT ... ON CONFLICT DO UPDATE обновляет added_at и время игры): друг, уже учтённый в окне,
+-- меняет только время игры и last_added, а вышедший из окна учитывается заново.
+-- Если старая запись ещё не удалена уплотнением, у строки ленты first_added за окном и уплотнение её пересчитает
+CREATE OR REPLACE FUNCTION friend_feed_on_update()
+RETURNS TRIGGER AS $$
+BEGIN
+    WITH changes AS (
+        SELECT
+            n.user_id,
+            n.game_id,
+            (o.added_at >= NOW() - friend_feed_window()) AS old_counted,
+            (n.added_at >= NOW() - friend_feed_window()) AS new_counted,
+            o.playtime_total AS old_playtime,
+            n.playtime_total AS new_playtime,
+            n.added_at
+        FROM new_rows n
+        JOIN old_rows o ON o.id = n.id
+    ),
+    deltas AS (
+        SELECT
+            fr.friend_id,
+            c.game_id,
+            SUM(c.new_counted::INTEGER - c.old_counted::INTEGER) AS friend_delta,
+            SUM(CASE WHEN c.new_counted THEN c.new_playtime ELSE 0 END
+                - CASE WHEN c.old_counted THEN c.old_playtime ELSE 0 END) AS playtime_delta,
+            MIN(c.added_at) FILTER (WHERE c.new_counted) AS first_added,
+            MAX(c.added_at) FILTER (WHERE c.new_counted) AS last_added
+        FROM changes c
+        CROSS JOIN LATERAL (
+            SELECT f.user2 AS friend_id FROM friends f WHERE f.user1 = c.user_id
+            UNION ALL
+            SELECT f.user1 FROM friends f WHERE f.user2 = c.user_id
+        ) fr
+        WHERE c.old_counted OR c.new_counted
+        GROUP BY fr.friend_id, c.game_id
+    )
+    INSERT INTO friend_feed AS ff (user_id, game_id, friend_count, playtime_sum, first_added, last_added)
+    -- NOT NULL проверяется до ON CONFLICT; границы бесконечности не меняют существующую запись в LEAST/GREATEST
+    SELECT d.friend_id, d.game_id, d.friend_delta, d.playtime_delta,
+           COALESCE(d.first_added, 'infinity'), COALESCE(d.last_added, '-infinity')
+    FROM deltas d
+    WHERE d.last_added IS NOT NULL OR EXISTS (
+        SELECT 1 FROM friend_feed e WHERE e.user_id = d.friend_id AND e.game_id = d.game_id
+    )
+    ON CONFLICT (user_id, game_id) DO UPDATE
+    SET
+        friend_count = ff.friend_count + EXCLUDED.friend_count,
+        playtime_sum = ff.playtime_sum + EXCLUDED.playtime_sum,
+        first_added = LEAST(ff.first_added, EXCLUDED.first_added),
+        last_added = GREATEST(ff.last_added, EXCLUDED.last_added);
+
+    DELETE FROM friend_feed ff
+    USING (SELECT DISTINCT n.game_id, n.user_id FROM new_rows n) c
+    WHERE ff.game_id = c.game_id
+      AND ff.friend_count <= 0
+      AND ff.user_id IN (
+          SELECT f.user2 FROM friends f WHERE f.user1 = c.user_id
+          UNION ALL
+          SELECT f.user1 FROM friends f WHERE f.user2 = c.user_id
+      );
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Новая дружба: каждому из двух пользователей добавляются недавние игры другого
+CREATE OR REPLACE FUNCTION friend_feed_on_friend()
+RETURNS TRIGGER AS $$
+BEGIN
+    INSERT INTO friend_feed AS ff (user_id, game_id, friend_count, playtime_sum, first_added, last_added)
+    SELECT e.owner, ug.game_id, COUNT(*), SUM(ug.playtime_total), MIN(ug.added_at), MAX(ug.added_at)
+    FROM (
+        SELECT user1 AS owner, user2 AS friend_id FROM new_edges
+        UNION ALL
+        SELECT user2, user1 FROM new_edges
+    ) e
+    JOIN user_games ug ON ug.user_id = e.friend_id
+    WHERE ug.added_at >= NOW() - friend_feed_window()
+    GROUP BY e.owner, ug.game_id
+    ON CONFLICT (user_id, game_id) DO UPDATE
+    SET
+        friend_count = ff.friend_count + EXCLUDED.friend_count,
+        playtime_sum = ff.playtime_sum + EXCLUDED.playtime_sum,
+        first_added = LEAST(ff.first_added, EXCLUDED.first_added),
+        last_added = GREATEST(ff.last_added, EXCLUDED.last_added);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Удалённая дружба: лента обоих пользователей пересчитывается целиком, такое происходит редко
+CREATE OR REPLACE FUNCTION friend_feed_on_unfriend()
+RETURNS TRIGGER AS $$
+BEGIN
+    PERFORM rebuild_friend_feed(ARRAY(
+        SELECT user1 FROM old_edges
+        UNION
+        SELECT user2 FROM old_edges
+    ));
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE TRIGGER friend_feed_insert_trigger
+    AFTER INSERT ON user_games
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT
+    EXECUTE FUNCTION friend_feed_on_insert();
+
+CREATE OR REPLACE TRIGGER friend_feed_update_trigger
+    AFTER UPDATE ON user_games
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT
+    EXECUTE FUNCTION friend_feed_on_update();
+
+CREATE OR REPLACE TRIGGER friend_feed_friend_trigger
+    AFTER INSERT ON friends
+    REFERENCING NEW TABLE AS new_edges
+    FOR EACH STATEMENT
+    EXECUTE FUNCTION friend_feed_on_friend();
+
+CREATE OR REPLACE TRIGGER friend_feed_unfriend_trigger
+    AFTER DELETE ON friends
+    REFERENCING OLD TABLE AS old_edges
+    FOR EACH STATEMENT
+    EXECUTE FUNCTION friend_feed_on_unfriend();
+
+-- Точный пересчёт ленты пользователей p_user_ids (NULL - всех) по friends и user_games
+CREATE OR REPLACE FUNCTION rebuild_friend_feed(p_user_ids BIGINT[] DEFAULT NULL)
+RETURNS INTEGER
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    rebuilt INTEGER;
+BEGIN
+    DELETE FROM friend_feed ff WHERE p_user_ids IS NULL OR ff.user_id = ANY(p_user_ids);
+
+    INSERT INTO friend_feed (user_id, game_id, friend_count, playtime_sum, first_added, last_added)
+    SELECT e.owner, ug.game_id, COUNT(*), SUM(ug.playtime_total), MIN(ug.added_at), MAX(ug.added_at)
+    FROM (
+        SELECT f.user1 AS owner, f.user2 AS friend_id FROM friends f
+        UNION ALL
+        SELECT f.user2, f.user1 FROM friends f
+    ) e
+    JOIN user_games ug ON ug.user_id = e.friend_id
+    WHERE ug.added_at >= NOW() - friend_feed_window()
+      AND (p_user_ids IS NULL OR e.owner = ANY(p_user_ids))
+    GROUP BY e.owner, ug.game_id;
+
+    GET DIAGNOSTICS rebuilt = ROW_COUNT;
+    RETURN rebuilt;
+END;
+$$;
+
+-- Уплотнение: записи, все друзья которых вышли за окно, удаляются, а записи с частью устаревших друзей
+-- пересчитываются по user_games. Возвращает число удалённых и пересчитанных записей
+CREATE OR REPLACE FUNCTION compact_friend_feed()
+RETURNS TABLE (deleted INTEGER, recomputed INTEGER)
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    cutoff TIMESTAMP := NOW() - friend_feed_window();
+BEGIN
+    DELETE FROM friend_feed ff WHERE ff.first_added < cutoff AND ff.last_added < cutoff;
+    GET DIAGNOSTICS deleted = ROW_COUNT;
+
+    WITH stale AS (
+        SELECT ff.user_id, ff.game_id FROM friend_feed ff WHERE ff.first_added < cutoff
+    ),
+    fresh AS (
+        SELECT s.user_id, s.game_id, agg.*
+        FROM stale s
+        CROSS JOIN LATERAL (
+            SELECT
+                COUNT(*)::INTEGER AS friend_count,
+                COALESCE(SUM(ug.playtime_total), 0) AS playtime_sum,
+                MIN(ug.added_at) AS first_added,
+                MAX(ug.added_at) AS last_added
+            FROM (
+                SELECT f.user2 AS friend_id FROM friends f WHERE f.user1 = s.user_id
+                UNION ALL
+                SELECT f.user1 FROM friends f WHERE f.user2 = s.user_id
+            ) fr
+            JOIN user_games ug ON ug.user_id = fr.friend_id AND ug.game_id = s.game_id
+            WHERE ug.added_at >= cutoff
+        ) agg
+    ),
+    updated AS (
+        UPDATE friend_feed ff
+        SET
+            friend_count = fresh.friend_count,
+            playtime_sum = fresh.playtime_sum,
+            first_added = fresh.first_added,
+            last_added = fresh.last_added
+        FROM fresh
+        WHERE ff.user_id = fresh.user_id AND ff.game_id = fresh.game_id AND fresh.friend_count > 0
+        RETURNING 1
+    ),
+    removed AS (
+        DELETE FROM friend_feed ff
+        USING fresh
+        WHERE ff.user_id = fresh.user_id AND ff.game_id = fresh.game_id AND fresh.friend_count = 0
+        RETURNING 1
+    )
+    SELECT (SELECT COUNT(*) FROM updated) + (SELECT COUNT(*) FROM removed) INTO recomputed;
+
+    RETURN NEXT;
+END;
+$$;
+
+-- Игры, недавно добавленные друзьями пользователя, которых у него нет: первые p_limit записей ленты
+CREATE OR REPLACE FUNCTION get_top_new_friend_games(
+    p_user_id BIGINT,
+    p_limit INTEGER DEFAULT 5,
+    p_days_ago INTEGER DEFAULT 14
+)
+RETURNS TABLE (
+    game_id INTEGER,
+    game_name VARCHAR(500)
+)
+LANGUAGE sql
+STABLE
+AS $$
+    SELECT g.steam_app_id, g.name
+    FROM friend_feed ff
+    JOIN games g ON g.steam_app_id = ff.game_id
+    WHERE ff.user_id = p_user_id
+      AND ff.last_added >= NOW() - (p_days_ago || ' days')::INTERVAL
+      AND NOT EXISTS (
+          SELECT 1 FROM user_games own
+          WHERE own.user_id = p_user_id
+            AND own.game_id = ff.game_id
+      )
+    ORDER BY ff.friend_count DESC, ff.playtime_sum DESC, ff.last_added DESC, ff.game_id
+    LIMIT p_limit;
+$$;
+
+-- Часть ленты пользователя на этом шарде (шардированный режим): вклад друзей, чьи библиотеки хранятся здесь
+CREATE OR REPLACE FUNCTION get_friend_feed_partial(
+    p_user_id BIGINT,
+    p_days_ago INTEGER DEFAULT 14
+)
+RETURNS TABLE (
+    game_id INTEGER,
+    game_name VARCHAR(500),
+    friends_count BIGINT,
+    playtime BIGINT,
+    last_added TIMESTAMP
+)
+LANGUAGE sql
+STABLE
+AS $$
+    SELECT ff.game_id, g.name, ff.friend_count::BIGINT, ff.playtime_sum, ff.last_added
+    FROM friend_feed ff
+    JOIN games g ON g.steam_app_id = ff.game_id
+    WHERE ff.user_id = p_user_id
+      AND ff.last_added >= NOW() - (p_days_ago || ' days')::INTERVAL;
+$$;
+
+-- Заполнение ленты по уже загруженным данным
+SELECT rebuild_friend_feed();
@@ -0,0 +1,82 @@
+-- Дайджест обновлений друзей сразу для всех пользователей бота с привязанным Steam id.
+-- Делает то же, что get_top_new_friend_games, но одним запросом: друзья всех пользователей, их недавние игры
+-- и ранжирование внутри каждого пользователя (row_number), вместо отдельного вызова функции на пользователя.
+-- Игры, уже отправленные пользователю (digest_log), исключаются.
+-- p_partitions/p_partition позволяют разбить пользователей на части по tg_id % p_partitions.
+CREATE OR REPLACE FUNCTION get_friends_digest(
+    p_limit INTEGER DEFAULT 5,
+    p_days_ago INTEGER DEFAULT 14,
+    p_partitions INTEGER DEFAULT 1,
+    p_partition INTEGER DEFAULT 0
+)
+RETURNS TABLE (
+    tg_id BIGINT,
+    game_id INTEGER,
+    game_name VARCHAR(500),
+    friends_count BIGINT
+)
+LANGUAGE plpgsql
+STABLE
+AS $$
+BEGIN
+    RETURN QUERY
+    WITH linked_users AS (
+        SELECT b.tg_id, b.steam_id
+        FROM bot_users b
+        WHERE b.steam_id IS NOT NULL
+          AND b.tg_id % p_partitions = p_partition
+    ),
+    user_friends AS (
+        -- user1 < user2, поэтому каждая дружба встречается ровно в одной из частей
+        SELECT lu.tg_id, lu.steam_id, f.user2 AS friend_id
+        FROM linked_users lu
+        JOIN friends f ON f.user1 = lu.steam_id
+        UNION ALL
+        SELECT lu.tg_id, lu.steam_id, f.user1 AS friend_id
+        FROM linked_users lu
+        JOIN friends f ON f.user2 = lu.steam_id
+    ),
+    candidates AS (
+        SELECT
+            uf.tg_id,
+            ug.game_id,
+            COUNT(DISTINCT uf.friend_id) AS friends_count,
+            SUM(ug.playtime_total) AS playtime,
+            MAX(ug.added_at) AS last_added
+        FROM user_friends uf
+        JOIN user_games ug ON ug.user_id = uf.friend_id
+        WHERE ug.added_at >= NOW() - (p_days_ago || ' days')::INTERVAL
+          AND NOT EXISTS (
+              SELECT 1 FROM user_games own
+              WHERE own.user_id = uf.steam_id
+                AND own.game_id = ug.game_id
+          )
+          AND NOT EXISTS (
+              SELECT 1 FROM digest_log d
+              WHERE d.tg_id = uf.tg_id
+                AND d.game_id = ug.game_id
+          )
+        GROUP BY uf.tg_id, ug.game_id
+    ),
+    ranked AS (
+        SELECT
+            c.tg_id,
+            c.game_id,
+            c.friends_count,
+            ROW_NUMBER() OVER (
+                PARTITION BY c.tg_id
+                ORDER BY c.friends_count DESC, c.playtime DESC, c.last_added DESC, c.game_id
+            ) AS position
+        FROM candidates c
+    )
+    SELECT
+        r.tg_id,
+        r.game_id,
+        g.name,
+        r.friends_count
+    FROM ranked r
+    JOIN games g ON g.steam_app_id = r.game_id
+    WHERE r.position <= p_limit
+    ORDER BY r.tg_id, r.position;
+END;
+$$;
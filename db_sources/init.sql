@@ -6,4 +6,11 @@ CREATE DATABASE steam_data;
 \i create_triggers.sql
 \i friends_updates_function.sql
 \i silimar_games_function.sql
-\i recommendation_function.sql
\ No newline at end of file
+\i recommendation_function.sql
+\i search_games_function.sql
+\i friends_digest_function.sql
+\i user_recommendations_function.sql
+\i shard_functions.sql
+\i cache_invalidation.sql
+\i friend_feed.sql
+\i item_neighbors.sql
\ No newline at end of file
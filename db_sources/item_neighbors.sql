@@ -0,0 +1,81 @@
+-- Рекомендации по соседям игр из game_neighbors (item-item коллаборативная фильтрация).
+-- Соседей считает задача sources/item_neighbors_job.py по матрице «пользователь × игра» из user_games.
+
+-- Пары (пользователь, игра) для построения матрицы; читаются потоком (stream_function)
+CREATE OR REPLACE FUNCTION get_library_pairs()
+RETURNS TABLE (user_id BIGINT, game_id INTEGER)
+LANGUAGE sql
+STABLE
+AS $$
+    SELECT ug.user_id, ug.game_id FROM user_games ug;
+$$;
+
+DROP FUNCTION IF EXISTS replace_game_neighbors(INTEGER[], INTEGER[], REAL[]);
+
+-- Очистка game_neighbors_staging перед новым расчётом (остатки прерванного запуска)
+CREATE OR REPLACE FUNCTION reset_game_neighbors_staging()
+RETURNS VOID
+LANGUAGE sql
+AS $$
+    TRUNCATE game_neighbors_staging;
+$$;
+
+-- Перенос расчёта из game_neighbors_staging в game_neighbors одной транзакцией: до COMMIT запросы читают
+-- предыдущий расчёт. Возвращает число сохранённых пар
+CREATE OR REPLACE FUNCTION swap_game_neighbors()
+RETURNS INTEGER
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    stored INTEGER;
+BEGIN
+    DELETE FROM game_neighbors;
+
+    INSERT INTO game_neighbors (game_id, neighbor_id, score)
+    SELECT n.game_id, n.neighbor_id, n.score
+    FROM game_neighbors_staging n
+    -- Игры, удалённые из каталога после чтения библиотек, пропускаются
+    WHERE EXISTS (SELECT 1 FROM games g WHERE g.steam_app_id = n.game_id)
+      AND EXISTS (SELECT 1 FROM games g WHERE g.steam_app_id = n.neighbor_id);
+
+    GET DIAGNOSTICS stored = ROW_COUNT;
+    TRUNCATE game_neighbors_staging;
+    RETURN stored;
+END;
+$$;
+
+-- Кандидаты - соседи игр из библиотеки пользователя, которых у него нет; оценка - сумма близостей.
+-- Если соседей нет (новый пользователь или игры без совместных владельцев), рекомендации считаются по жанрам
+CREATE OR REPLACE FUNCTION get_neighbor_recommendations(
+    p_steam_user_id BIGINT,
+    p_limit INTEGER DEFAULT 5
+)
+RETURNS TABLE (
+    app_id INTEGER,
+    game_name VARCHAR(500)
+)
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    RETURN QUERY
+    SELECT g.steam_app_id, g.name
+    FROM user_games ug
+    JOIN game_neighbors gn ON gn.game_id = ug.game_id
+    JOIN games g ON g.steam_app_id = gn.neighbor_id
+    WHERE ug.user_id = p_steam_user_id
+      AND NOT EXISTS (
+          SELECT 1 FROM user_games own
+          WHERE own.user_id = p_steam_user_id
+            AND own.game_id = gn.neighbor_id
+      )
+    GROUP BY g.steam_app_id, g.name
+    ORDER BY SUM(gn.score) DESC, g.steam_app_id
+    LIMIT p_limit;
+
+    IF NOT FOUND THEN
+        RETURN QUERY
+        SELECT rec.app_id, rec.game_name
+        FROM recommend_by_user_profile(p_steam_user_id, p_limit) rec;
+    END IF;
+END;
+$$;
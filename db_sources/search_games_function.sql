@@ -0,0 +1,39 @@
+-- Поиск игр по названию: триграммный GIN-индекс и ранжирование по похожести
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+CREATE INDEX IF NOT EXISTS games_name_trgm_idx ON games USING GIN (name gin_trgm_ops);
+
+CREATE OR REPLACE FUNCTION search_games(
+    p_query TEXT,
+    p_limit INTEGER DEFAULT 5
+)
+RETURNS TABLE (
+    app_id INTEGER,
+    game_name VARCHAR(500),
+    score REAL
+)
+LANGUAGE plpgsql
+STABLE
+AS $$
+DECLARE
+    -- \, % и _ в запросе ищутся как обычные символы, а не как символы шаблона LIKE
+    v_pattern TEXT := '%' || replace(replace(replace(p_query, '\', '\\'), '%', '\%'), '_', '\_') || '%';
+BEGIN
+    RETURN QUERY
+    SELECT 
+        g.steam_app_id,
+        g.name,
+        word_similarity(p_query, g.name)
+    FROM games g
+    -- Оба условия проверяются по индексу games_name_trgm_idx:
+    -- <% находит название, содержащее слова, похожие на запрос (опечатки), ILIKE - точную подстроку
+    WHERE p_query <% g.name
+       OR g.name ILIKE v_pattern
+    ORDER BY 
+        lower(g.name) = lower(p_query) DESC, -- точное совпадение названия всегда первое
+        word_similarity(p_query, g.name) DESC,
+        g.positive DESC,                     -- среди одинаково похожих - более популярные
+        length(g.name)
+    LIMIT p_limit;
+END;
+$$;
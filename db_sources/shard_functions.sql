@@ -0,0 +1,26 @@
+-- Функции для шардированного режима (sources/sharding.py): steam_users, user_games и friends распределены
+-- по шардам по хэшу Steam id, поэтому обновления друзей считаются частями на каждом шарде и объединяются в клиенте.
+
+DROP FUNCTION IF EXISTS get_friend_games_partial(BIGINT[], INTEGER);
+
+-- Друзья пользователя; связь хранится на шардах обоих пользователей, поэтому все друзья есть на его шарде
+CREATE OR REPLACE FUNCTION get_friend_ids(p_user_id BIGINT)
+RETURNS TABLE (friend_id BIGINT)
+LANGUAGE sql
+STABLE
+AS $$
+    SELECT f.user2 FROM friends f WHERE f.user1 = p_user_id
+    UNION
+    SELECT f.user1 FROM friends f WHERE f.user2 = p_user_id;
+$$;
+
+-- Друзья сразу нескольких пользователей (сброс кэша обновлений друзей по пачке уведомлений)
+CREATE OR REPLACE FUNCTION get_friend_ids_many(p_user_ids BIGINT[])
+RETURNS TABLE (user_id BIGINT, friend_id BIGINT)
+LANGUAGE sql
+STABLE
+AS $$
+    SELECT f.user1, f.user2 FROM friends f WHERE f.user1 = ANY(p_user_ids)
+    UNION
+    SELECT f.user2, f.user1 FROM friends f WHERE f.user2 = ANY(p_user_ids);
+$$;
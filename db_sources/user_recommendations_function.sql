@@ -0,0 +1,78 @@
+-- Пересчёт рекомендаций для списка пользователей Steam одним запросом (вызывается пакетной задачей).
+-- Для каждого пользователя сохраняется упорядоченный список игр из recommend_by_user_profile;
+-- пустой список тоже сохраняется, чтобы отметить время расчёта.
+CREATE OR REPLACE FUNCTION refresh_user_recommendations(
+    p_user_ids BIGINT[],
+    p_limit INTEGER DEFAULT 20
+)
+RETURNS INTEGER
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    refreshed INTEGER;
+BEGIN
+    INSERT INTO user_recommendations (steam_user_id, app_ids, scores, computed_at)
+    SELECT
+        u.steam_user_id,
+        COALESCE(r.app_ids, '{}'),
+        COALESCE(r.scores, '{}'),
+        CURRENT_TIMESTAMP
+    FROM unnest(p_user_ids) AS u(steam_user_id)
+    CROSS JOIN LATERAL (
+        SELECT
+            array_agg(rec.app_id ORDER BY rec.position) AS app_ids,
+            array_agg(rec.score ORDER BY rec.position) AS scores
+        FROM recommend_by_user_profile(u.steam_user_id, p_limit)
+            WITH ORDINALITY AS rec(app_id, game_name, score, position)
+    ) r
+    ON CONFLICT (steam_user_id) DO UPDATE
+    SET
+        app_ids = EXCLUDED.app_ids,
+        scores = EXCLUDED.scores,
+        computed_at = EXCLUDED.computed_at;
+
+    GET DIAGNOSTICS refreshed = ROW_COUNT;
+    RETURN refreshed;
+END;
+$$;
+
+-- Рекомендации для /recommend: из user_recommendations, если расчёт не старше p_max_age_hours,
+-- иначе - расчёт на лету через recommend_by_user_profile.
+-- Игры, которые пользователь добавил после расчёта, исключаются.
+CREATE OR REPLACE FUNCTION get_user_recommendations(
+    p_steam_user_id BIGINT,
+    p_limit INTEGER DEFAULT 5,
+    p_max_age_hours INTEGER DEFAULT 36
+)
+RETURNS TABLE (
+    app_id INTEGER,
+    game_name VARCHAR(500)
+)
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    IF EXISTS (
+        SELECT 1 FROM user_recommendations ur
+        WHERE ur.steam_user_id = p_steam_user_id
+          AND ur.computed_at >= NOW() - (p_max_age_hours || ' hours')::INTERVAL
+    ) THEN
+        RETURN QUERY
+        SELECT g.steam_app_id, g.name
+        FROM user_recommendations ur
+        CROSS JOIN LATERAL unnest(ur.app_ids) WITH ORDINALITY AS r(game_id, position)
+        JOIN games g ON g.steam_app_id = r.game_id
+        WHERE ur.steam_user_id = p_steam_user_id
+          AND NOT EXISTS (
+              SELECT 1 FROM user_games ug
+              WHERE ug.user_id = p_steam_user_id
+                AND ug.game_id = r.game_id
+          )
+        ORDER BY r.position
+        LIMIT p_limit;
+    ELSE
+        RETURN QUERY
+        SELECT rec.app_id, rec.game_name
+        FROM recommend_by_user_profile(p_steam_user_id, p_limit) rec;
+    END IF;
+END;
+$$;
@@ -14,8 +14,20 @@ async def main():
     except Exception as e:
         bot.logger.error(f"Ошибка: {e}")
     finally:
-        # Закрываем сессию бота
+        # Останавливаем рассылку и очередь отправки, закрываем сессию бота
+        if bot.digest_task is not None:
+            bot.digest_task.cancel()
+        if bot.invalidation_task is not None:
+            bot.invalidation_task.cancel()
+        if bot.replica_probe_task is not None:
+            bot.replica_probe_task.cancel()
+        await bot.sender.close()
+        await bot.cache.close()
+        if bot.api_client.response_cache is not None:
+            await asyncio.to_thread(bot.api_client.response_cache.close)
         await bot.bot.session.close()
+        if bot.metrics_runner is not None:
+            await bot.metrics_runner.cleanup()
 
 if __name__ == "__main__":
     # Запускаем бота
@@ -0,0 +1,110 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Any, Callable
+
+from sources.deadline import remaining
+from sources.metrics import ADMISSION_DECISIONS, ADMISSION_QUEUE_DELAY
+
+logger = logging.getLogger(__name__)
+
+
+class Overloaded(Exception):
+    """База перегружена: запрос не дождался свободного слота или очередь ожидания заполнена"""
+
+    def __init__(self, command: str):
+        super().__init__(f"Запрос {command} отклонён: база данных перегружена")
+        self.command = command
+
+
+class AdmissionController:
+    """Общее для процесса ограничение тяжёлых запросов к базе.
+
+    Одновременно выполняется не больше max_in_flight запросов (в потоках, чтобы не блокировать цикл событий),
+    остальные ждут в очереди по порядку. Запрос отклоняется с Overloaded, если в очереди уже max_queue ожидающих
+    или свободный слот не освободился за max_queue_delay секунд (или за время, оставшееся у команды).
+    Пока все слоты заняты (saturated), вызывающий код может не вставать в очередь, а отдать устаревший результат из кэша.
+    """
+
+    def __init__(self, max_in_flight: int = 2, max_queue: int = 32, max_queue_delay: float = 2.0,
+                 clock: Callable[[], float] = time.monotonic):
+        self.max_in_flight = max_in_flight
+        self.max_queue = max_queue
+        self.max_queue_delay = max_queue_delay
+        self.clock = clock
+        self.in_flight = 0
+        self.waiters: deque = deque()
+
+    @property
+    def waiting(self) -> int:
+        return sum(1 for waiter in self.waiters if not waiter.done())
+
+    @property
+    def saturated(self) -> bool:
+        return self.in_flight >= self.max_in_flight
+
+    async def run(self, command: str, func: Callable[..., Any], *args) -> Any:
+        """Выполняет func(*args) в потоке, когда освободится слот.
+
+        Отмена вызывающей корутины не останавливает поток, поэтому слот освобождается, только когда поток завершится:
+        иначе отменённые по бюджету команды позволили бы выполнять в базе больше max_in_flight запросов.
+        """
+        start = self.clock()
+        await self._acquire(command)
+        ADMISSION_QUEUE_DELAY.observe(self.clock() - start, command=command)
+        ADMISSION_DECISIONS.inc(command=command, decision='admitted')
+        future = asyncio.ensure_future(asyncio.to_thread(func, *args))
+        try:
+            return await asyncio.shield(future)
+        finally:
+            if future.done():
+                self._release()
+            else:
+                future.add_done_callback(self._release_abandoned)
+
+    def _release_abandoned(self, future: asyncio.Future):
+        # Результат отменённой команды никому не нужен, ошибка только извлекается, чтобы asyncio не предупреждал о ней
+        if not future.cancelled():
+            future.exception()
+        self._release()
+
+    async def _acquire(self, command: str):
+        if self.in_flight < self.max_in_flight and not self.waiting:
+            self.in_flight += 1
+            return
+        if self.waiting >= self.max_queue:
+            self._reject(command)
+        # Ждать слота дольше, чем осталось у команды, бессмысленно
+        budget = remaining()
+        delay = self.max_queue_delay if budget is None else max(0.0, min(self.max_queue_delay, budget))
+        waiter = asyncio.get_running_loop().create_future()
+        self.waiters.append(waiter)
+        try:
+            await asyncio.wait_for(waiter, delay)
+        except asyncio.TimeoutError:
+            self._reject(command)
+        except BaseException:
+            # Слот мог быть передан одновременно с отменой ожидания
+            if waiter.done() and not waiter.cancelled():
+                self._release()
+            raise
+        finally:
+            if waiter in self.waiters and waiter.done():
+                self.waiters.remove(waiter)
+
+    def _release(self):
+        # Слот передаётся первому ожидающему, не отказавшемуся от ожидания
+        while self.waiters:
+            waiter = self.waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self.in_flight -= 1
+
+    def _reject(self, command: str):
+        ADMISSION_DECISIONS.inc(command=command, decision='rejected')
+        logger.warning(
+            "Запрос %s отклонён: выполняется %s, ожидают %s", command, self.in_flight, self.waiting
+        )
+        raise Overloaded(command)
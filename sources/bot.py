@@ -1,18 +1,43 @@
 from dotenv import load_dotenv
 import os
+import html
 import logging
 import aiohttp
 import asyncio
+import psycopg2
 from aiogram import Bot, Dispatcher, Router, types, F
+from aiogram.exceptions import TelegramBadRequest
 from aiogram.filters import CommandStart, Command, or_f
 from aiogram.types import ReplyKeyboardMarkup, KeyboardButton, ReplyKeyboardRemove
+from aiogram.types import InlineQueryResultArticle, InputTextMessageContent
 from aiogram.fsm.state import State, StatesGroup
 from aiogram.fsm.context import FSMContext
 
-from sources.database_api import PgsqlApiClient
-from sources.steam_api_client import SteamAPIClient
+from sources.admission import AdmissionController, Overloaded
+from sources.deadline import DeadlineExceeded
+from sources.digest import FriendsDigest
+from sources.steam_api_client import HEADER_IMAGE_URL, SteamAPIClient
+from sources.metrics import (
+    ADMISSION_DECISIONS, ADMISSION_IN_FLIGHT, ADMISSION_WAITING, CACHE_SIZE, DB_CONNECTIONS, INGESTION_QUEUE,
+    TELEGRAM_SEND_QUEUE, start_metrics_server
+)
+from sources.cache import create_cache, parse_ttls
+from sources.cache_invalidation import InvalidationListener
+from sources.middlewares import DeadlineMiddleware, MetricsMiddleware, RequestLimitMiddleware
+from sources.response_cache import create_response_cache
+from sources.search_index import GameNameIndex
+from sources.send_queue import INTERACTIVE, SendScheduler
+from sources.sharding import create_db_client
 from sources.utils import States, is_valid_steamid64 
 
+# Команды с тяжёлыми запросами к базе или Steam, которые ограничивает RequestLimitMiddleware
+EXPENSIVE_HANDLERS = ('cmd_recommend', 'cmd_friends_updtaes', 'cmd_similar_get', 'cmd_show_game_info', 'cmd_get_id')
+
+OVERLOADED_TEXT = "Сервис сейчас перегружен, попробуйте через минуту."
+
+# Бюджеты времени команд в секундах по умолчанию; загрузка профиля (cmd_get_id) не ограничивается
+DEFAULT_COMMAND_BUDGETS = "cmd_recommend=5,cmd_friends_updtaes=5,cmd_similar_get=5,cmd_show_game_info=15,cmd_trends=15"
+
 
 class TelegramBot:
     logging.basicConfig(level=logging.INFO)
@@ -22,13 +47,67 @@ class TelegramBot:
     def __init__(self):
         load_dotenv("params.env")
         BOT_TOKEN = os.getenv("BOT_TOKEN")
-        self.db_client = PgsqlApiClient()
+        self.db_client = create_db_client()
+        # Кэш метаданных игр, трендов и ответов Steam: L1 в процессе и общий для всех обработчиков L2
+        self.cache = create_cache()
         self.api_client = SteamAPIClient(os.getenv("STEAM_API_KEY"))
-        self.api_client.session = aiohttp.ClientSession()
+        self.api_client.request_timeout = float(os.getenv("STEAM_REQUEST_TIMEOUT", 30))
+        self.api_client.session = aiohttp.ClientSession(
+            timeout=aiohttp.ClientTimeout(total=self.api_client.request_timeout)
+        )
+        self.api_client.cache = self.cache
+        self.api_client.response_cache = create_response_cache()
         self.bot = Bot(token=BOT_TOKEN)
         self.dp = Dispatcher()
+        # Все ответы бота проходят через общую очередь с ограничением частоты отправки
+        self.sender = SendScheduler(
+            global_rate=float(os.getenv("TELEGRAM_GLOBAL_RATE", 30)),
+            chat_rate=float(os.getenv("TELEGRAM_CHAT_RATE", 1)),
+        )
+        self.digest = FriendsDigest(self.bot, self.db_client, self.sender)
+        # Период рассылки дайджеста обновлений друзей в часах, 0 - рассылка отключена
+        self.digest_interval = float(os.getenv("DIGEST_INTERVAL_HOURS", 0))
+        self.digest_task = None
+        # Периодическая активная проверка реплик (DB_REPLICA_PROBE_SECONDS)
+        self.replica_probe_task = None
+        # Сброс кэшей по уведомлениям PostgreSQL об изменениях, сделанных другими обработчиками
+        self.invalidation = InvalidationListener(
+            self.db_client.invalidation_sources(), self.invalidate, kinds=self.db_client.invalidation_kinds()
+        )
+        self.invalidation_enabled = os.getenv("CACHE_INVALIDATION", "1") == "1"
+        self.invalidation_task = None
         self.router = Router()
+        self.metrics_port = os.getenv("METRICS_PORT")
+        self.metrics_runner = None
+        # app_id -> (header_image_url, file_id) обложек, уже загруженных на сервера Telegram
+        self.file_ids = {}
+        # Индекс названий игр для inline-поиска, строится при запуске бота
+        self.game_index = GameNameIndex()
+        # app_id -> (steam_app_id, name, positive), ещё не попавшие в индекс; их применяет одна задача в потоке
+        self.game_index_updates = {}
+        self.game_index_task = None
+        self.inline_cache_time = int(os.getenv("INLINE_CACHE_TIME", 300))
+        # Ограничение одновременных тяжёлых запросов к базе всего процесса
+        self.admission = AdmissionController(
+            max_in_flight=int(os.getenv("ADMISSION_MAX_IN_FLIGHT", 2)),
+            max_queue=int(os.getenv("ADMISSION_MAX_QUEUE", 32)),
+            max_queue_delay=float(os.getenv("ADMISSION_MAX_QUEUE_DELAY", 2)),
+        )
+        # Запросы к базе выполняются в потоках: соединений хватает на все допущенные тяжёлые запросы
+        # и ещё одно остаётся для лёгких запросов обработчиков
+        self.db_client.resize_pool(self.admission.max_in_flight + 1)
+        # Бюджеты времени команд, которые ограничивают и запросы к базе и Steam внутри них
+        self.deadlines = DeadlineMiddleware(
+            parse_ttls(os.getenv("COMMAND_BUDGETS", DEFAULT_COMMAND_BUDGETS)), on_timeout=self.reply_timeout
+        )
+        # Повторы тяжёлых команд объединяются, а одновременно у пользователя выполняется не больше N разных
+        self.request_limit = RequestLimitMiddleware(
+            EXPENSIVE_HANDLERS,
+            max_concurrent=int(os.getenv("USER_MAX_CONCURRENT_REQUESTS", 2)),
+            on_reject=self.reject_request
+        )
         self.set_message_handlers()
+        self.register_gauges()
 
     def set_message_handlers(self):
         self.router.message.register(self.cmd_start, CommandStart())
@@ -47,22 +126,125 @@ class TelegramBot:
         self.router.message.register(self.cmd_get_game_id, or_f(Command("info"), (F.text == "Информация по игре")))
         self.router.message.register(self.cmd_show_game_info, States.info_game_id_waiting)
 
+        self.router.inline_query.register(self.inline_search)
+
+        self.router.message.middleware(MetricsMiddleware())
+        self.router.message.middleware(self.deadlines)
+        self.router.message.middleware(self.request_limit)
+        self.router.inline_query.middleware(MetricsMiddleware())
         self.dp.include_router(self.router)
 
+    def register_gauges(self):
+        CACHE_SIZE.set_function(lambda: len(self.users), cache='users')
+        CACHE_SIZE.set_function(lambda: len(self.file_ids), cache='file_ids')
+        CACHE_SIZE.set_function(lambda: len(self.game_index), cache='game_index')
+        CACHE_SIZE.set_function(lambda: len(self.cache), cache='l1')
+        TELEGRAM_SEND_QUEUE.set_function(lambda: self.sender.pending)
+        ADMISSION_IN_FLIGHT.set_function(lambda: self.admission.in_flight)
+        ADMISSION_WAITING.set_function(lambda: self.admission.waiting)
+        DB_CONNECTIONS.set_function(lambda: self.db_client.pool.opened, target='primary')
+        for replica in self.db_client.replicas:
+            DB_CONNECTIONS.set_function(lambda replica=replica: replica.pool.opened, target=replica.name)
+
     async def start(self):
+        if self.metrics_port:
+            self.metrics_runner = await start_metrics_server(int(self.metrics_port))
+        await asyncio.to_thread(self.load_game_index)
+        if self.invalidation_enabled:
+            self.invalidation_task = asyncio.create_task(self.invalidation.run())
+        if self.digest_interval > 0:
+            self.digest_task = asyncio.create_task(self.digest.run_forever(self.digest_interval * 3600))
+        if self.db_client.replicas and self.db_client.replica_probe_seconds > 0:
+            self.replica_probe_task = asyncio.create_task(self.probe_replicas_forever())
         await self.dp.start_polling(self.bot)
 
-    def check_steam_id(self, tg_id : int) -> bool:
+    async def probe_replicas_forever(self):
+        while True:
+            try:
+                await asyncio.to_thread(self.db_client.probe_replicas)
+            except Exception:
+                self.logger.exception("Ошибка при проверке реплик")
+            await asyncio.sleep(self.db_client.replica_probe_seconds)
+
+    def load_game_index(self):
+        index = GameNameIndex()
+        index.build(self.db_client.get_game_names())
+        self.game_index = index
+        self.logger.info("Индекс названий построен: %s игр", len(self.game_index))
+
+    def index_games(self, games):
+        self.update_game_index((game.steam_app_id, game.name, game.positive) for game in games)
+
+    def update_game_index(self, games):
+        """Копит изменения индекса названий (steam_app_id, name, positive) и запускает их применение"""
+        for app_id, name, positive in games:
+            self.game_index_updates[app_id] = (app_id, name, positive)
+        if self.game_index_updates and (self.game_index_task is None or self.game_index_task.done()):
+            self.game_index_task = asyncio.create_task(self.apply_game_index_updates())
+
+    async def apply_game_index_updates(self):
+        """Строит в потоке новый индекс со всеми накопившимися изменениями и подменяет им текущий.
+
+        Изменения, пришедшие во время построения, применяются следующим проходом одной пачкой.
+        """
+        while self.game_index_updates:
+            games, self.game_index_updates = list(self.game_index_updates.values()), {}
+            try:
+                self.game_index = await asyncio.to_thread(self.game_index.updated, games)
+            except Exception:
+                self.logger.exception("Ошибка при обновлении индекса названий")
+
+    async def reply(self, message: types.Message, text: str, priority: int = INTERACTIVE, **kwargs):
+        return await self.sender.send(message.chat.id, lambda: message.answer(text, **kwargs), priority)
+
+    async def reply_photo(self, message: types.Message, priority: int = INTERACTIVE, **kwargs):
+        return await self.sender.send(message.chat.id, lambda: message.answer_photo(**kwargs), priority)
+
+    async def reject_request(self, message: types.Message):
+        await self.reply(message, "Предыдущие запросы ещё выполняются, попробуйте через несколько секунд.")
+
+    async def reply_timeout(self, message: types.Message):
+        await self.reply(message, "Не удалось ответить вовремя, попробуйте ещё раз.",
+                         reply_markup=await self.get_main_keyboard(message.from_user.id))
+
+    async def invalidate(self, events: list):
+        """Сбрасывает записи кэшей, устаревшие после изменений в базе (события из db_sources/cache_invalidation.sql)"""
+        # Друзья всех пользователей с изменившейся библиотекой читаются одним запросом в потоке
+        library = list(dict.fromkeys(event['id'] for event in events if event['kind'] == 'library'))
+        friends = await asyncio.to_thread(self.db_client.get_friend_ids_many, library) if library else {}
+        # Названия изменившихся игр для индекса inline-поиска тоже читаются одним запросом
+        games = list(dict.fromkeys(app_id for event in events if event['kind'] == 'games' for app_id in event['ids']))
+        if games:
+            for app_id in games:
+                await self.cache.delete('game_info', app_id)
+            self.update_game_index(await asyncio.to_thread(self.db_client.get_game_names_many, games))
+        for event in events:
+            kind, key = event['kind'], event.get('id')
+            if kind == 'library':
+                # Новые игры пользователя меняют его рекомендации и обновления всех его друзей
+                await self.cache.delete('recommendations', key)
+                for steam_id in [key] + friends.get(key, []):
+                    await self.cache.delete('friends_updates', steam_id)
+            elif kind == 'recommendations':
+                await self.cache.delete('recommendations', key)
+            elif kind == 'bot_user':
+                self.users.pop(key, None)
+            elif kind == 'reset':
+                # Уведомления за время обрыва соединения потеряны
+                self.cache.clear_local()
+                self.users.clear()
+
+    async def check_steam_id(self, tg_id : int) -> bool:
         if tg_id in self.users and self.users[tg_id] is not None:
             return True
         else:
-            res = self.db_client.get_steam_id(tg_id)
+            res = await asyncio.to_thread(self.db_client.get_steam_id, tg_id)
             self.users[tg_id] = res
             return  res is not None
         
     #Keyboard layout
-    def get_main_keyboard(self, tg_id : int):
-        if self.check_steam_id(tg_id):
+    async def get_main_keyboard(self, tg_id : int):
+        if await self.check_steam_id(tg_id):
             keyboard = ReplyKeyboardMarkup(
                 keyboard=[
                     [KeyboardButton(text="Помощь"), KeyboardButton(text="Добавить профиль")],
@@ -88,67 +270,72 @@ class TelegramBot:
     #/start
     async def cmd_start(self, message: types.Message):
         user_id = message.from_user.id
-        self.db_client.add_telegram_user(user_id)
-        await message.answer(
+        await asyncio.to_thread(self.db_client.add_telegram_user, user_id)
+        await self.reply(message,
             f"👋 Привет!\n"
             f"Я Steam Game Recommender Bot, помогу тебе следить за новыми играми и интересами твоих друзей.\n"
             f"Используй /help для списка команд или воспользуйся клавиатурой команд.",
-            reply_markup = self.get_main_keyboard(message.from_user.id)
+            reply_markup = await self.get_main_keyboard(message.from_user.id)
         )
 
     #/add_id
     async def cmd_add_id(self, message: types.Message, state: FSMContext):
         await state.set_state(States.id_waiting)  # ВКЛЮЧИЛИ флаг
-        await message.answer(
+        await self.reply(message,
             "Введите steam id:", 
             reply_markup=ReplyKeyboardRemove())
 
     async def cmd_get_id(self, message: types.Message, state: FSMContext):
         if not is_valid_steamid64(message.text):
-            await message.answer("Неверный формат, попробуйте ещё раз.")
+            await self.reply(message, "Неверный формат, попробуйте ещё раз.")
             return
         steam_id = int(message.text)
         steam_ids = await self.api_client.get_user_friends(steam_id)
-        ids_data = await self.api_client.get_player_summaries(steam_ids + [steam_id]) 
-        self.db_client.add_steam_users(ids_data)
-        self.db_client.add_steam_friends(steam_id, steam_ids)
-        await message.answer(
+        async for ids_data in self.api_client.iter_player_summaries(steam_ids + [steam_id]):
+            await asyncio.to_thread(self.db_client.add_steam_users, ids_data)
+        await asyncio.to_thread(self.db_client.add_steam_friends, steam_id, steam_ids)
+        await self.reply(message,
             f"Id {steam_id} установлен, данные обновляются",
-            reply_markup = self.get_main_keyboard(message.from_user.id)
+            reply_markup = await self.get_main_keyboard(message.from_user.id)
         )
-        for id in steam_ids + [steam_id]:
-            data = await self.api_client.get_user_owned_games(id)
-            to_ignore = []
-            for app in data:
-                if self.db_client.get_game_info(app['appid']) is None:
-                    game = await self.api_client.get_game_info(int(app['appid']))
-                    if game != (None,None):
-                        self.db_client.add_game(game)
-                    else:
-                        to_ignore.append(app['appid'])
-                    await asyncio.sleep(1)
-            await asyncio.sleep(1)
-            data = [item for item in data if item['appid'] not in to_ignore]
-            self.db_client.add_user_games(id, data)
+        accounts = steam_ids + [steam_id]
+        remaining = len(accounts)
+        INGESTION_QUEUE.inc(remaining)
+        try:
+            for id in accounts:
+                data = await self.api_client.get_user_owned_games(id)
+                app_ids = [app['appid'] for app in data]
+                existing = await asyncio.to_thread(self.db_client.get_existing_game_ids, app_ids)
+                missing = [app_id for app_id in app_ids if app_id not in existing]
+                ignored = await asyncio.to_thread(self.db_client.get_ignored_apps, missing)
+                games, unresolved = await self.api_client.get_games_info(
+                    [app_id for app_id in missing if app_id not in ignored]
+                )
+                await asyncio.to_thread(self.db_client.add_games, games)
+                self.index_games(games)
+                await asyncio.to_thread(self.db_client.ignore_apps, unresolved)
+                # Игры без данных в магазине и с временной ошибкой Steam не попадают в user_games
+                to_ignore = set(missing) - {game.steam_app_id for game in games}
+                await asyncio.sleep(1)
+                data = [item for item in data if item['appid'] not in to_ignore]
+                await asyncio.to_thread(self.db_client.add_user_games, id, data)
+                remaining -= 1
+                INGESTION_QUEUE.dec()
+        finally:
+            INGESTION_QUEUE.dec(remaining)
 
         await state.clear()
-        self.db_client.update(
-            attributes=['steam_id'],
-            table='bot_users',
-            data=[str(steam_id)],
-            id_column='tg_id',
-            id=message.from_user.id
-        )
-        await message.answer(
+        await asyncio.to_thread(self.db_client.link_steam_id, message.from_user.id, steam_id)
+        await self.reply(message,
             f"Данные обновлены, расширенный функционал доступен",
-            reply_markup = self.get_main_keyboard(message.from_user.id)
+            reply_markup = await self.get_main_keyboard(message.from_user.id)
         )
 
 
     async def cmd_get_game_id(self, message: types.Message, state: FSMContext):
         await state.set_state(States.info_game_id_waiting)  # ВКЛЮЧИЛИ флаг
-        await message.answer(
-            "Введите id игры:", 
+        await self.reply(message,
+            "Введите id или название игры:", 
             reply_markup=ReplyKeyboardRemove())
 
     #/help
@@ -167,46 +354,59 @@ class TelegramBot:
 
 <b>Или используй кнопки внизу!</b>
         """
-        await message.answer(
+        await self.reply(message,
             help_text, 
             parse_mode="HTML",
-            reply_markup=self.get_main_keyboard(message.from_user.id)
+            reply_markup=await self.get_main_keyboard(message.from_user.id)
             )
 
     #/trends 
     async def cmd_trends(self, message: types.Message):
         answer_text = await self.format_trends_for_telegram()
         print(answer_text)
-        await message.answer( 
+        await self.reply(message,
             answer_text,
             parse_mode='HTML',
-            reply_markup=self.get_main_keyboard(message.from_user.id)
+            reply_markup=await self.get_main_keyboard(message.from_user.id)
         )
 
     #/recommend
     async def cmd_recommend(self, message: types.Message):
-        self.check_steam_id(message.from_user.id)
-        recomendations = self.db_client.get_recommendations(self.users[message.from_user.id])
+        await self.check_steam_id(message.from_user.id)
+        steam_id = self.users[message.from_user.id]
+        try:
+            recomendations = await self.load_expensive(
+                'recommendations', steam_id, self.db_client.get_recommendations, steam_id
+            )
+        except Overloaded:
+            await self.reply(message, OVERLOADED_TEXT, reply_markup=await self.get_main_keyboard(message.from_user.id))
+            return
         answer_text = "<b>Рекомендации на основе ваших игр:</b>\n"
         for i, recomendations in enumerate(recomendations):
             answer_text += f"{i+1}. <code>{recomendations[0]}</code> - {recomendations[1]}\n"
-        await message.answer( 
+        await self.reply(message,
             answer_text,
             parse_mode='HTML',
-            reply_markup=self.get_main_keyboard(message.from_user.id)
+            reply_markup=await self.get_main_keyboard(message.from_user.id)
         )
 
     #/similar
     async def cmd_similar(self, message: types.Message, state: FSMContext):
         await state.set_state(States.similar_game_id_waiting)
-        await message.answer(
-            "Введите id игры:", 
+        await self.reply(message,
+            "Введите id или название игры:", 
             reply_markup=ReplyKeyboardRemove())
 
     async def cmd_similar_get(self, message: types.Message, state: FSMContext):
         try:
-            app_id = int(message.text)
-            similar = self.db_client.get_similar_games(app_id)
+            app_id = await self.resolve_app_id(message)
+            if app_id is None:
+                return
+            try:
+                similar = await self.load_expensive('similar_games', app_id, self.db_client.get_similar_games, app_id)
+            except Overloaded:
+                await self.reply(message, OVERLOADED_TEXT)
+                return
 
             if len(similar) > 0:
                 answer_text = f"<b>Игры похожие на <code>{app_id}</code>:</b>\n"
@@ -214,70 +414,188 @@ class TelegramBot:
                     answer_text += f"{i+1}. <code>{id}</code> - {name}\n"
             else:
                 answer_text = "Не удалось подобрать похожие игры\n"
-            await message.answer( 
+            await self.reply(message,
                 answer_text,
                 parse_mode='HTML',
-                reply_markup=self.get_main_keyboard(message.from_user.id)
+                reply_markup=await self.get_main_keyboard(message.from_user.id)
             )
             await state.clear()
+        except DeadlineExceeded:
+            raise
         except Exception:
-            await message.answer(
+            await self.reply(message,
                 f"Не удалось получить информацию об игре, возможно игры с таким id не существует.",
-                reply_markup = self.get_main_keyboard(message.from_user.id)
+                reply_markup = await self.get_main_keyboard(message.from_user.id)
             )
             raise
     
     #/friends_updates
     async def cmd_friends_updtaes(self, message: types.Message):
-        top_updates = self.db_client.get_friends_updates(self.users[message.from_user.id])
+        steam_id = self.users[message.from_user.id]
+        try:
+            top_updates = await self.load_expensive(
+                'friends_updates', steam_id, self.db_client.get_friends_updates, steam_id
+            )
+        except Overloaded:
+            await self.reply(message, OVERLOADED_TEXT, reply_markup=await self.get_main_keyboard(message.from_user.id))
+            return
         answer_text = "<b>Что недавно добавляли себе ваши друзья:</b>\n"
         for i, top_updates in enumerate(top_updates):
             answer_text += f"{i+1}. <code>{top_updates[0]}</code> - {top_updates[1]}\n"
-        await message.answer( 
+        await self.reply(message,
             answer_text,
             parse_mode='HTML',
-            reply_markup=self.get_main_keyboard(message.from_user.id)
+            reply_markup=await self.get_main_keyboard(message.from_user.id)
         )
     
     async def cmd_show_game_info(self, message: types.Message, state: FSMContext):        
         try:
-            app_id = int(message.text)
+            app_id = await self.resolve_app_id(message)
+            if app_id is None:
+                return
 
-            in_base = self.db_client.get_game_info(app_id)
+            in_base = await self.get_game_info(app_id)
 
             if in_base is None:
-                game_data = (await self.api_client.get_game_info(app_id))
-                self.db_client.add_game(game_data)
+                if await asyncio.to_thread(self.db_client.get_ignored_apps, [app_id]):
+                    raise ValueError(f"Для приложения {app_id} нет данных в Steam Store")
+                game = await self.api_client.get_game_info(app_id)
+                if game is None:
+                    await asyncio.to_thread(self.db_client.ignore_apps, [app_id])
+                    raise ValueError(f"Для приложения {app_id} нет данных в Steam Store")
+                await asyncio.to_thread(self.db_client.add_game, game)
+                self.index_games([game])
 
-                game_data = game_data[1]
-                caption = f"<b>{game_data['name']}</b>\n\n{game_data.get('short_description', '')}"
-                image_url = game_data.get('header_image')
+                caption = f"<b>{game.name}</b>\n\n{game.short_description or ''}"
+                image_url = game.header_image_url
+                file_id = None
             else:
                 caption = f"<b>{in_base[0]}</b>\n\n{in_base[1]}"
                 image_url = in_base[2]
+                file_id = in_base[3]
                 print("success db check")
             
             if image_url:
-                await message.answer_photo(
-                    photo=image_url, 
-                    caption=caption,
-                    parse_mode='HTML',
-                    reply_markup = self.get_main_keyboard(message.from_user.id)
-                )
+                await self.send_game_photo(message, app_id, image_url, file_id, caption)
             else:
-                await message.answer(
+                await self.reply(message,
                     caption, 
                     parse_mode='HTML',
-                    reply_markup = self.get_main_keyboard(message.from_user.id)
+                    reply_markup = await self.get_main_keyboard(message.from_user.id)
                 )
             await state.clear()
+        except DeadlineExceeded:
+            raise
         except Exception:
-            await message.answer(
+            await self.reply(message,
                 f"Не удалось получить информацию об игре, возможно игры с таким id не существует.",
-                reply_markup = self.get_main_keyboard(message.from_user.id)
+                reply_markup = await self.get_main_keyboard(message.from_user.id)
             )
             raise
 
+    async def inline_search(self, inline_query: types.InlineQuery):
+        """Inline-режим (@бот название): поиск идёт по индексу в памяти, без запросов к базе"""
+        results = [
+            InlineQueryResultArticle(
+                id=str(app_id),
+                title=name,
+                description=f"id {app_id}",
+                thumbnail_url=HEADER_IMAGE_URL.format(app_id=app_id),
+                input_message_content=InputTextMessageContent(
+                    message_text=f"<code>{app_id}</code> - {html.escape(name)}",
+                    parse_mode='HTML'
+                )
+            )
+            for app_id, name in self.game_index.search(inline_query.query)
+        ]
+        await inline_query.answer(results, cache_time=self.inline_cache_time, is_personal=False)
+
+    async def resolve_app_id(self, message: types.Message) -> int | None:
+        """Возвращает id игры из сообщения: число используется как есть, иначе игра ищется по названию.
+        Если игру не удалось определить однозначно, отправляет варианты и возвращает None (состояние сохраняется)"""
+        text = message.text.strip()
+        if text.isdigit():
+            return int(text)
+
+        found = await asyncio.to_thread(self.db_client.search_games, text)
+        if len(found) == 1 or (found and found[0][1].lower() == text.lower()):
+            return found[0][0]
+
+        if found:
+            answer_text = "<b>Найдено несколько игр, введите id или уточните название:</b>\n"
+            for i, (id, name, _) in enumerate(found):
+                answer_text += f"{i+1}. <code>{id}</code> - {html.escape(name)}\n"
+        else:
+            answer_text = "Игра с таким названием не найдена, попробуйте ещё раз или введите id игры."
+        await self.reply(message, answer_text, parse_mode='HTML')
+        return None
+
+    async def send_game_photo(self, message: types.Message, app_id: int, image_url: str, file_id: str | None,
+                              caption: str):
+        """Отправляет обложку игры по file_id Telegram, если она уже загружалась, иначе по URL"""
+        cached = self.file_ids.get(app_id)
+        if cached is not None and cached[0] == image_url:
+            file_id = cached[1]
+        params = dict(
+            caption=caption,
+            parse_mode='HTML',
+            reply_markup=await self.get_main_keyboard(message.from_user.id)
+        )
+        if file_id is not None:
+            try:
+                sent = await self.reply_photo(message, photo=file_id, **params)
+            except TelegramBadRequest as e:
+                self.logger.warning("file_id обложки %s отклонён Telegram: %s", app_id, e)
+                self.file_ids.pop(app_id, None)
+            else:
+                # file_id из базы запоминается, чтобы следующие отправки не зависели от кэша game_info
+                self.file_ids[app_id] = (image_url, file_id)
+                return sent
+
+        sent = await self.reply_photo(message, photo=image_url, **params)
+        if sent is not None and sent.photo:
+            await self.remember_file_id(app_id, image_url, sent.photo[-1].file_id)
+        return sent
+
+    async def load_expensive(self, namespace: str, key, func, *args):
+        """Результат тяжёлого запроса func(*args): из кэша, иначе из базы через AdmissionController.
+        Пока база перегружена, отдаётся устаревшая копия из кэша, а если её нет - Overloaded"""
+        value = await self.cache.get(namespace, key)
+        if value is not None:
+            return value
+        if self.admission.saturated:
+            value = await self.cache.get_stale(namespace, key)
+            if value is not None:
+                ADMISSION_DECISIONS.inc(command=namespace, decision='stale')
+                return value
+        try:
+            value = await self.admission.run(namespace, func, *args)
+        except Overloaded:
+            value = await self.cache.get_stale(namespace, key)
+            if value is None:
+                raise
+            ADMISSION_DECISIONS.inc(command=namespace, decision='stale')
+            return value
+        if value is not None:
+            await self.cache.set(namespace, key, value, keep_stale=True)
+        return value
+
+    async def get_game_info(self, app_id: int) -> list | None:
+        """Название, описание, обложка и file_id игры из кэша или из базы"""
+        async def load():
+            return await asyncio.to_thread(self.db_client.get_game_info, app_id)
+        return await self.cache.get_or_load('game_info', app_id, load)
+
+    async def remember_file_id(self, app_id: int, image_url: str, file_id: str):
+        self.file_ids[app_id] = (image_url, file_id)
+        try:
+            await asyncio.to_thread(self.db_client.set_game_file_id, app_id, file_id)
+        except psycopg2.Error as e:
+            # Без сохранённого file_id бот просто продолжит отправлять обложку по URL
+            self.logger.warning("Не удалось сохранить file_id обложки %s: %s", app_id, e)
+        # Остальные обработчики получат запись с новым file_id из базы
+        await self.cache.delete('game_info', app_id)
+
     async def format_trends_for_telegram(self) -> str:
         """Форматирует данные для отправки в Telegram"""
         games_data = await self.api_client.get_featured_games_summary()
@@ -0,0 +1,235 @@
+import json
+import logging
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, NamedTuple
+
+from sources.metrics import CACHE_REQUESTS
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import redis.asyncio as redis_asyncio
+except ImportError:
+    redis_asyncio = None
+
+logger = logging.getLogger(__name__)
+
+# Значение по умолчанию для записей L1: дольше процесс не доверяет своей копии, даже если TTL пространства больше,
+# чтобы изменения, сделанные другими обработчиками через L2, доходили до него за ограниченное время
+DEFAULT_L1_TTL = 60
+
+
+class Serializer(NamedTuple):
+    """Преобразование значений в байты для общего кэша L2 и обратно"""
+    dumps: Callable[[Any], bytes]
+    loads: Callable[[bytes], Any]
+
+
+def _json_dumps(value: Any) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(value)
+    return json.dumps(value, ensure_ascii=False).encode('utf-8')
+
+
+SERIALIZERS = {
+    # JSON переносим между процессами и версиями кода, но кортежи читаются обратно списками.
+    # Форматов, исполняющих код при чтении (pickle), здесь нет: писать в общий Redis может не только бот
+    'json': Serializer(_json_dumps, orjson.loads if orjson is not None else json.loads),
+}
+
+
+class LocalBackend:
+    """Общий кэш L2 в памяти процесса: заменяет Redis в тестах и при запуске одного обработчика"""
+
+    def __init__(self, clock: Callable[[], float] = time.monotonic):
+        self.clock = clock
+        # ключ -> (момент истечения, значение)
+        self.data: Dict[str, tuple[float, bytes]] = {}
+
+    async def get(self, key: str) -> bytes | None:
+        item = self.data.get(key)
+        if item is None:
+            return None
+        if item[0] <= self.clock():
+            del self.data[key]
+            return None
+        return item[1]
+
+    async def set(self, key: str, value: bytes, ttl: float):
+        self.data[key] = (self.clock() + ttl, value)
+
+    async def delete(self, key: str):
+        self.data.pop(key, None)
+
+    async def close(self):
+        self.data.clear()
+
+
+class RedisBackend:
+    """Общий кэш L2 в Redis (или совместимом сервере: KeyDB, Valkey, Dragonfly)"""
+
+    def __init__(self, url: str):
+        if redis_asyncio is None:
+            raise RuntimeError("Для CACHE_REDIS_URL нужен пакет redis")
+        self.client = redis_asyncio.Redis.from_url(url)
+
+    async def get(self, key: str) -> bytes | None:
+        return await self.client.get(key)
+
+    async def set(self, key: str, value: bytes, ttl: float):
+        await self.client.set(key, value, px=max(1, int(ttl * 1000)))
+
+    async def delete(self, key: str):
+        await self.client.delete(key)
+
+    async def close(self):
+        await self.client.aclose()
+
+
+class TwoTierCache:
+    """Двухуровневый кэш: L1 - LRU в памяти процесса, L2 - общий для всех обработчиков бэкенд.
+
+    Ключи группируются по пространствам имён (namespace), у каждого свой TTL. Промах L1 проверяется в L2
+    и при попадании копируется в L1. Ошибки L2 не ломают запросы: они считаются промахом.
+    Обращения считаются в метрике cache_requests_total{namespace, tier, result}.
+    Значения, записанные с keep_stale, дополнительно хранятся в L2 stale_ttl секунд и не удаляются delete():
+    их отдаёт get_stale, когда свежий результат получить нельзя (база перегружена).
+    """
+
+    def __init__(self, backend=None, l1_size: int = 1024, ttls: Dict[str, float] = None, default_ttl: float = 300,
+                 l1_ttl: float = DEFAULT_L1_TTL, serializer: Serializer = SERIALIZERS['json'], prefix: str = 'steambot',
+                 stale_ttl: float = 0, clock: Callable[[], float] = time.monotonic):
+        self.backend = backend if backend is not None else LocalBackend(clock)
+        self.l1_size = l1_size
+        self.ttls = dict(ttls or {})
+        self.default_ttl = default_ttl
+        self.l1_ttl = l1_ttl
+        self.serializer = serializer
+        self.prefix = prefix
+        # Сколько хранится устаревшая копия значений, записанных с keep_stale (только в L2)
+        self.stale_ttl = stale_ttl
+        self.clock = clock
+        # (namespace, key) -> (момент истечения, значение)
+        self.l1: OrderedDict = OrderedDict()
+
+    def __len__(self):
+        return len(self.l1)
+
+    def ttl(self, namespace: str) -> float:
+        return self.ttls.get(namespace, self.default_ttl)
+
+    def _l2_key(self, namespace: str, key) -> str:
+        return f"{self.prefix}:{namespace}:{key}"
+
+    def _l1_get(self, namespace: str, key):
+        item = self.l1.get((namespace, key))
+        if item is None:
+            return None
+        if item[0] <= self.clock():
+            del self.l1[(namespace, key)]
+            return None
+        self.l1.move_to_end((namespace, key))
+        return item
+
+    def _l1_set(self, namespace: str, key, value, ttl: float):
+        self.l1[(namespace, key)] = (self.clock() + min(ttl, self.l1_ttl), value)
+        self.l1.move_to_end((namespace, key))
+        while len(self.l1) > self.l1_size:
+            self.l1.popitem(last=False)
+
+    async def get(self, namespace: str, key, default=None):
+        item = self._l1_get(namespace, key)
+        if item is not None:
+            CACHE_REQUESTS.inc(namespace=namespace, tier='l1', result='hit')
+            return item[1]
+        CACHE_REQUESTS.inc(namespace=namespace, tier='l1', result='miss')
+        try:
+            raw = await self.backend.get(self._l2_key(namespace, key))
+        except Exception as e:
+            logger.warning("Кэш L2 недоступен при чтении %s:%s: %s", namespace, key, e)
+            raw = None
+        if raw is None:
+            CACHE_REQUESTS.inc(namespace=namespace, tier='l2', result='miss')
+            return default
+        CACHE_REQUESTS.inc(namespace=namespace, tier='l2', result='hit')
+        value = self.serializer.loads(raw)
+        self._l1_set(namespace, key, value, self.ttl(namespace))
+        return value
+
+    async def set(self, namespace: str, key, value, ttl: float = None, keep_stale: bool = False):
+        ttl = self.ttl(namespace) if ttl is None else ttl
+        self._l1_set(namespace, key, value, ttl)
+        try:
+            raw = self.serializer.dumps(value)
+            await self.backend.set(self._l2_key(namespace, key), raw, ttl)
+            if keep_stale and self.stale_ttl > 0:
+                await self.backend.set(self._l2_key('stale:' + namespace, key), raw, self.stale_ttl)
+        except Exception as e:
+            logger.warning("Кэш L2 недоступен при записи %s:%s: %s", namespace, key, e)
+
+    async def get_stale(self, namespace: str, key):
+        """Последнее значение, записанное с keep_stale, даже если оно уже удалено или истекло в основном кэше"""
+        try:
+            raw = await self.backend.get(self._l2_key('stale:' + namespace, key))
+        except Exception as e:
+            logger.warning("Кэш L2 недоступен при чтении %s:%s: %s", namespace, key, e)
+            raw = None
+        CACHE_REQUESTS.inc(namespace=namespace, tier='stale', result='miss' if raw is None else 'hit')
+        return None if raw is None else self.serializer.loads(raw)
+
+    async def delete(self, namespace: str, key):
+        self.l1.pop((namespace, key), None)
+        try:
+            await self.backend.delete(self._l2_key(namespace, key))
+        except Exception as e:
+            logger.warning("Кэш L2 недоступен при удалении %s:%s: %s", namespace, key, e)
+
+    def clear_local(self):
+        """Сбрасывает L1 этого процесса (L2 общий и не меняется)"""
+        self.l1.clear()
+
+    async def get_or_load(self, namespace: str, key, loader: Callable[[], Awaitable[Any]]):
+        """Значение из кэша, а при промахе - результат loader(), который сохраняется в кэш (кроме None)"""
+        value = await self.get(namespace, key)
+        if value is None:
+            value = await loader()
+            if value is not None:
+                await self.set(namespace, key, value)
+        return value
+
+    async def close(self):
+        self.l1.clear()
+        await self.backend.close()
+
+
+def parse_ttls(value: str) -> Dict[str, float]:
+    """'game_info=3600,trends=600' -> {'game_info': 3600.0, 'trends': 600.0}"""
+    ttls = {}
+    for item in value.split(','):
+        if item.strip():
+            namespace, ttl = item.split('=')
+            ttls[namespace.strip()] = float(ttl)
+    return ttls
+
+
+def create_cache() -> TwoTierCache:
+    """Кэш по настройкам из окружения; без CACHE_REDIS_URL уровень L2 хранится в памяти процесса"""
+    url = os.getenv('CACHE_REDIS_URL')
+    serializer = os.getenv('CACHE_SERIALIZER', 'json')
+    if serializer not in SERIALIZERS:
+        raise ValueError(f"Неизвестный формат CACHE_SERIALIZER: {serializer}, доступны: {', '.join(SERIALIZERS)}")
+    backend = RedisBackend(url) if url else LocalBackend()
+    return TwoTierCache(
+        backend=backend,
+        l1_size=int(os.getenv('CACHE_L1_SIZE', 1024)),
+        ttls=parse_ttls(os.getenv('CACHE_TTLS', '')),
+        default_ttl=float(os.getenv('CACHE_DEFAULT_TTL', 300)),
+        l1_ttl=float(os.getenv('CACHE_L1_TTL', DEFAULT_L1_TTL)),
+        serializer=SERIALIZERS[serializer],
+        stale_ttl=float(os.getenv('CACHE_STALE_TTL', 86400)),
+    )
@@ -0,0 +1,137 @@
+import asyncio
+import json
+import logging
+from typing import Awaitable, Callable, Dict, List, Set
+
+import psycopg2
+from psycopg2.extensions import ISOLATION_LEVEL_AUTOCOMMIT
+
+from sources.metrics import CACHE_INVALIDATIONS
+
+logger = logging.getLogger(__name__)
+
+# Канал, в который пишут триггеры из db_sources/cache_invalidation.sql
+CHANNEL = 'cache_invalidation'
+
+# Событие, которое получает обработчик после переподключения: уведомления за время обрыва потеряны,
+# поэтому нужно сбросить все локальные кэши
+RESET = {'kind': 'reset'}
+
+
+class InvalidationListener:
+    """Слушает NOTIFY cache_invalidation на одной или нескольких базах и передаёт события обработчику.
+
+    Каждой базе (основной и шардам) нужно своё соединение в режиме autocommit: LISTEN работает только на основном
+    сервере, реплики уведомлений не получают. Подключение и LISTEN выполняются в потоке (asyncio.to_thread),
+    а уведомления читаются через loop.add_reader без отдельных потоков.
+    События, пришедшие пачкой, передаются обработчику одним списком без повторов, поэтому синхронизация библиотеки
+    из сотен игр (по уведомлению на каждую вставку) сбрасывает кэш один раз.
+    При обрыве соединение переоткрывается через reconnect_delay секунд, а обработчик получает событие RESET.
+    """
+
+    def __init__(self, connect: List[Callable[[], 'psycopg2.extensions.connection']],
+                 handler: Callable[[List[Dict]], Awaitable[None]], reconnect_delay: float = 5,
+                 kinds: List[Set[str] | None] = None):
+        self.connect = connect
+        # Виды уведомлений, принимаемые от каждой базы (None - все), остальные отбрасываются
+        self.kinds = kinds or [None] * len(connect)
+        self.handler = handler
+        self.reconnect_delay = reconnect_delay
+        self.queue: asyncio.Queue = asyncio.Queue()
+        self.connections = [None] * len(connect)
+        # Дескрипторы запоминаются при подключении: у оборванного соединения fileno() уже недоступен
+        self.fds = [None] * len(connect)
+        self.reconnect_tasks = set()
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        for index in range(len(self.connect)):
+            await self._listen(loop, index, first=True)
+        try:
+            while True:
+                events = [await self.queue.get()]
+                while not self.queue.empty():
+                    events.append(self.queue.get_nowait())
+                try:
+                    await self.handler(unique_events(events))
+                except Exception:
+                    logger.exception("Ошибка при сбросе кэша по событиям %s", events)
+        finally:
+            for task in self.reconnect_tasks:
+                task.cancel()
+            for index in range(len(self.connect)):
+                self._close(loop, index)
+
+    def _open(self, index: int) -> 'psycopg2.extensions.connection':
+        """Подключается к базе и подписывается на канал; блокирует поток, поэтому вызывается через to_thread"""
+        connection = self.connect[index]()
+        try:
+            connection.set_isolation_level(ISOLATION_LEVEL_AUTOCOMMIT)
+            with connection.cursor() as cursor:
+                cursor.execute(f"LISTEN {CHANNEL}")
+        except psycopg2.Error:
+            connection.close()
+            raise
+        return connection
+
+    async def _listen(self, loop: asyncio.AbstractEventLoop, index: int, first: bool = False):
+        while True:
+            try:
+                # Подключение к недоступной базе ждёт таймаута TCP, поэтому не выполняется в event loop
+                connection = await asyncio.to_thread(self._open, index)
+                break
+            except psycopg2.OperationalError as e:
+                logger.warning("Не удалось подписаться на %s: %s", CHANNEL, e)
+                await asyncio.sleep(self.reconnect_delay)
+        self.connections[index] = connection
+        self.fds[index] = connection.fileno()
+        loop.add_reader(self.fds[index], self._on_readable, loop, index)
+        if not first:
+            self.queue.put_nowait(RESET)
+
+    def _on_readable(self, loop: asyncio.AbstractEventLoop, index: int):
+        connection = self.connections[index]
+        try:
+            connection.poll()
+        except (psycopg2.OperationalError, psycopg2.InterfaceError) as e:
+            logger.warning("Соединение подписки на %s оборвалось: %s", CHANNEL, e)
+            self._close(loop, index)
+            task = loop.create_task(self._reconnect(loop, index))
+            self.reconnect_tasks.add(task)
+            task.add_done_callback(self.reconnect_tasks.discard)
+            return
+        while connection.notifies:
+            notify = connection.notifies.pop(0)
+            try:
+                event = json.loads(notify.payload)
+            except ValueError:
+                logger.warning("Некорректное уведомление %s: %s", CHANNEL, notify.payload)
+                continue
+            if self.kinds[index] is not None and event.get('kind') not in self.kinds[index]:
+                continue
+            CACHE_INVALIDATIONS.inc(kind=event.get('kind', 'unknown'))
+            self.queue.put_nowait(event)
+
+    async def _reconnect(self, loop: asyncio.AbstractEventLoop, index: int):
+        await asyncio.sleep(self.reconnect_delay)
+        await self._listen(loop, index)
+
+    def _close(self, loop: asyncio.AbstractEventLoop, index: int):
+        connection = self.connections[index]
+        if connection is None:
+            return
+        self.connections[index] = None
+        loop.remove_reader(self.fds[index])
+        connection.close()
+
+
+def unique_events(events: List[Dict]) -> List[Dict]:
+    """События без повторов в порядке первого появления"""
+    seen = set()
+    result = []
+    for event in events:
+        key = json.dumps(event, sort_keys=True)
+        if key not in seen:
+            seen.add(key)
+            result.append(event)
+    return result
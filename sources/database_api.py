@@ -1,27 +1,86 @@
-import json
-from typing import Dict, List
-import psycopg2
+import os
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, Iterator, List, Set
 from sources.database_client import PgsqlClient
+from sources.models import GameRecord
+
+# Причина, по которой приложение попадает в ignored_apps
+NO_STORE_DATA = 'no_store_data'
+
+# Загрузка каталога: данные уже известной игры обновляются, пустые значения не затирают сохранённые
+GAME_CONFLICT = ['steam_app_id']
+GAME_UPDATES = {
+    column: f'COALESCE(EXCLUDED.{column}, games.{column})' for column in GameRecord.COLUMNS if column != 'steam_app_id'
+}
+
+# Столбцы строк соседей игр, которые пишет sources/item_neighbors_job.py
+GAME_NEIGHBOR_COLUMNS = ['game_id', 'neighbor_id', 'score']
+
+# Загрузка библиотеки: повторно синхронизированная игра обновляет время игры и момент добавления
+USER_GAME_COLUMNS = ['user_id', 'game_id', 'playtime_total']
+USER_GAME_CONFLICT = ['user_id', 'game_id']
+USER_GAME_UPDATES = {
+    'playtime_total': 'COALESCE(EXCLUDED.playtime_total, user_games.playtime_total)',
+    'added_at': 'CURRENT_TIMESTAMP'
+}
+
+
+def user_game_rows(user_id: int, games_info: List) -> List[list]:
+    """Строки user_games из ответа GetOwnedGames; повтор игры оставляет последнюю строку, иначе ON CONFLICT
+    обновил бы одну строку дважды за запрос"""
+    rows = {item['appid']: [user_id, item['appid'], item['playtime_forever']] for item in games_info}
+    return list(rows.values())
+
+
+def game_rows(games: List[GameRecord]) -> List[tuple]:
+    """Строки games для add_games; повтор игры оставляет последнюю строку, иначе ON CONFLICT
+    обновил бы одну строку дважды за запрос"""
+    return list({game.steam_app_id: game.as_row() for game in games}.values())
 
-from sources.utils import parse_steam_date
 
 class PgsqlApiClient(PgsqlClient):
     def __init__(self, env : str = None):
         super().__init__(env)
+        self.ignored_app_ttl = timedelta(days=float(os.getenv('IGNORED_APP_TTL_DAYS', 30)))
+        # Предрассчитанные рекомендации старше этого срока не используются, они считаются на лету
+        self.recommendations_max_age_hours = int(os.getenv('RECOMMENDATIONS_MAX_AGE_HOURS', 36))
+        # Способ расчёта /recommend: 'profile' - по жанрам библиотеки, 'cf' - по соседям игр из game_neighbors
+        self.recommendations_mode = os.getenv('RECOMMENDATIONS_MODE', 'profile')
 
     
     def get_game_info(self, id : int) -> tuple | None: 
-        params = [
-            'name',
-            'short_description',
-            'header_image_url'
-        ]
-        result = self.select(params, "games", f"steam_app_id = {id}")
+        result = self.execute_prepared('game_info', (id,))
+
+        return (result[0] if len(result) != 0 else None)
 
-        return (result[0][0] if len(result[0]) != 0 else None)
+    def set_game_file_id(self, app_id: int, file_id: str):
+        """Сохраняет file_id обложки игры, полученный от Telegram после первой отправки"""
+        self.update(['telegram_file_id'], 'games', [file_id], 'steam_app_id', app_id)
+
+    def get_existing_game_ids(self, app_ids: Iterable[int]) -> Set[int]:
+        """Возвращает id приложений, которые уже есть в таблице games"""
+        app_ids = [int(app_id) for app_id in app_ids]
+        if not app_ids:
+            return set()
+        return {row[0] for row in self.execute_prepared('existing_games', (app_ids,))}
+
+    def get_ignored_apps(self, app_ids: Iterable[int]) -> Set[int]:
+        """Возвращает id приложений, для которых Steam Store не отдаёт данных и срок проверки не истёк"""
+        app_ids = [int(app_id) for app_id in app_ids]
+        if not app_ids:
+            return set()
+        return {row[0] for row in self.execute_prepared('ignored_apps', (app_ids,))}
+
+    def ignore_apps(self, app_ids: Iterable[int], reason: str = NO_STORE_DATA):
+        expires_at = datetime.now() + self.ignored_app_ttl
+        self.insert_many(
+            ['steam_app_id', 'reason', 'expires_at'],
+            'ignored_apps',
+            [[app_id, reason, expires_at] for app_id in app_ids]
+        )
 
     def add_telegram_user(self, tg_id: int) -> bool:
-        result = self.select(['tg_id'], 'bot_users', f"tg_id = {tg_id}")
+        result = self.select(['tg_id'], 'bot_users', {'tg_id': tg_id})
         
         if len(result[0]) > 0:
             return False
@@ -29,133 +88,148 @@ class PgsqlApiClient(PgsqlClient):
         self.insert(['tg_id', 'steam_id'], 'bot_users', [tg_id, None])
         return True
     
-    def add_game(client, game_data : tuple[int, Dict]):        
-        appid = game_data[0]
-        game = game_data[1]
-        release_date = game.get('release_date') 
-        if release_date is not None: 
-            release_date =parse_steam_date(release_date.get('date'))
-        
-        # Теги как JSON
-        tags = json.dumps(game.get('tags', {}))
-        
-        # Категории и жанры как массивы
-        categories = [ i['description'] for i in game.get('categories', [])]
-        genres = [ i['description'] for i in game.get('genres', [])]
-        
-
-        columns = [
-            'steam_app_id', 'name', 'release_date', 'required_age',
-            'short_description', 'header_image_url', 'categories',
-            'genres', 'positive', 'negative', 'estimated_owners',
-            'average_playtime_forever', 'average_playtime_2weeks',
-            'median_playtime_forever', 'median_playtime_2weeks', 'tags'
-        ]
-        data = [
-            appid,
-            game.get('name'),
-            release_date,
-            game.get('required_age', 0),
-            game.get('short_description'),
-            game.get('header_image'),
-            categories,
-            genres,
-            game.get('positive', 0),
-            game.get('negative', 0),
-            game.get('estimated_owners', ''),
-            game.get('average_playtime_forever', 0),
-            game.get('average_playtime_2weeks', 0),
-            game.get('median_playtime_forever', 0),
-            game.get('median_playtime_2weeks', 0),
-            tags
-        ]
+    def add_game(self, game : GameRecord):
+        self.add_games([game])
 
-        client.insert(columns, 'games', data)
+    def add_games(self, games : List[GameRecord]):
+        self.upsert_many(GameRecord.COLUMNS, 'games', game_rows(games), GAME_CONFLICT, GAME_UPDATES)
             
+    def get_game_names(self) -> List[tuple]:
+        """Все игры в виде (steam_app_id, name, positive) для построения индекса названий"""
+        return self.select(['steam_app_id', 'name', 'positive'], 'games')[0]
+
+    def get_game_names_many(self, app_ids: List[int]) -> List[tuple]:
+        """(steam_app_id, name, positive) нескольких игр одним запросом"""
+        return self.call_function('get_game_names_many', ['steam_app_id', 'name', 'positive'], (list(app_ids),))
+
     def get_steam_id(self, tg_id : int) -> int | None:
-        result  = self.select(['steam_id'], 'bot_users', f"tg_id = {tg_id}")
-        if result[0] is not None and len(result[0]) > 0:
-            steam_id = result[0][0][0]  
+        result = self.execute_prepared('steam_id', (tg_id,))
+        if len(result) > 0:
+            steam_id = result[0][0]
             if steam_id is not None:
                 return int(steam_id)
         return None
 
+    def link_steam_id(self, tg_id: int, steam_id: int):
+        """Привязывает Steam id к пользователю бота"""
+        self.update(['steam_id'], 'bot_users', [steam_id], 'tg_id', tg_id)
+
     def add_steam_friends(self, id : int, ids : List[int]):
         for item in ids:
             self.insert(['user1', 'user2'], 'friends', [min(id, item), max(id,item)])
+        self.pin_to_primary(id)
 
     def add_steam_users(self, data : List[Dict]):
-        for item in data:
-            self.insert(
-                ['steam_user_id', 'username', 'profile_url', 'avatarmedium_url'],
-                'steam_users', 
-                [item['steamid'], item['personaname'], item['profileurl'], item['avatarmedium']]
-            )
+        self.insert_many(
+            ['steam_user_id', 'username', 'profile_url', 'avatarmedium_url'],
+            'steam_users',
+            [[item['steamid'], item['personaname'], item['profileurl'], item['avatarmedium']] for item in data]
+        )
 
     def add_user_games(self, user_id : int, games_info : List):
-        for item in games_info:
-            self.insert(
-                ['user_id', 'game_id', 'playtime_total'],
-                'user_games', 
-                [user_id, item['appid'], item['playtime_forever']]
-            )
+        # Одним INSERT ... ON CONFLICT DO UPDATE: триггеры friend_feed на вставку и на обновление срабатывают
+        # по одному разу на всю библиотеку, а не на каждую игру
+        self.upsert_many(
+            USER_GAME_COLUMNS, 'user_games', user_game_rows(user_id, games_info), USER_GAME_CONFLICT, USER_GAME_UPDATES
+        )
+        self.pin_to_primary(user_id)
+
+    def get_friend_ids(self, steam_id: int) -> List[int]:
+        return [row[0] for row in self.call_function('get_friend_ids', ['friend_id'], (steam_id,), pin_key=steam_id)]
+
+    def get_friend_ids_many(self, steam_ids: List[int]) -> Dict[int, List[int]]:
+        """Друзья нескольких пользователей одним запросом: Steam id -> Steam id друзей"""
+        friends = {steam_id: [] for steam_id in steam_ids}
+        for user_id, friend_id in self.call_function('get_friend_ids_many', ['user_id', 'friend_id'], (steam_ids,)):
+            friends[user_id].append(friend_id)
+        return friends
+
+    def invalidation_sources(self) -> List:
+        """Функции подключения к базам, изменения в которых сбрасывают кэши (LISTEN cache_invalidation)"""
+        return [self.get_connection]
+
+    def invalidation_kinds(self) -> List[Set[str] | None]:
+        """Виды уведомлений, принимаемые от каждой базы из invalidation_sources (None - все)"""
+        return [None]
 
     def get_friends_updates(self, user_id : int) -> List[tuple[int, str]]:
-        try:
-            if self.connection is None:
-                self.connection = self.get_connection()
-            with self.connection.cursor() as cursor:
-                cursor.execute("""
-                    SELECT game_id, game_name 
-                    FROM get_top_new_friend_games(%s, %s, %s)
-                """, (user_id, 5, 14))
-                result = cursor.fetchall()
-                self.connection.commit()
-                return result
-        except psycopg2.Error:
-            try:
-                self.connection.rollback()
-            except psycopg2.Error:
-                self.connection = None
-                raise
-            raise
+        return self.call_function(
+            'get_top_new_friend_games', ['game_id', 'game_name'], (user_id, 5, 14), pin_key=user_id
+        )
+
+    def compact_friend_feed(self) -> tuple[int, int]:
+        """Удаляет из friend_feed вышедшие за окно записи и пересчитывает частично устаревшие,
+        возвращает (удалено, пересчитано)"""
+        return tuple(self.call_function('compact_friend_feed', ['deleted', 'recomputed'], (), readonly=False)[0])
+
+    def iter_friends_digest(self, limit: int = 5, days_ago: int = 14, partitions: int = 1,
+                            partition: int = 0) -> Iterator[tuple]:
+        """Строки (tg_id, game_id, game_name, friends_count) дайджеста для всех пользователей части partition,
+        упорядоченные по tg_id; читаются потоком, не загружая результат целиком"""
+        return self.stream_function(
+            'get_friends_digest', ['tg_id', 'game_id', 'game_name', 'friends_count'],
+            (limit, days_ago, partitions, partition)
+        )
+
+    def log_digest(self, rows: Iterable[tuple[int, int]]):
+        """Отмечает игры (tg_id, game_id) как отправленные пользователям, чтобы не повторять их в следующих
+        дайджестах; все строки записываются одним запросом"""
+        self.insert_many(['tg_id', 'game_id'], 'digest_log', list(rows))
+
+    def search_games(self, query: str, limit: int = 5) -> List[tuple]:
+        """Нечёткий поиск игр по названию (pg_trgm), лучшие совпадения первыми"""
+        return self.call_function('search_games', ['app_id', 'game_name', 'score'], (query, limit))
 
     def get_similar_games(self, app_id: int, limit: int = 5) -> List[tuple]:
-        try:
-            if self.connection is None:
-                self.connection = self.get_connection()
-            with self.connection.cursor() as cursor:
-                cursor.execute("""
-                    SELECT app_id, game_name 
-                    FROM find_similar_games(%s, %s)
-                """, (app_id, limit))
-                result = cursor.fetchall()
-                self.connection.commit()
-                return result
-        except psycopg2.Error:
-            try:
-                self.connection.rollback()
-            except psycopg2.Error:
-                self.connection = None
-                raise
-            raise
+        return self.call_function('find_similar_games', ['app_id', 'game_name'], (app_id, limit))
     
-    def get_recommendations(self, steam_user_id: int, limit: int = 5) -> List[tuple]:
-        try:
-            if self.connection is None:
-                self.connection = self.get_connection()
-            with self.connection.cursor() as cursor:
-                cursor.execute("""
-                    SELECT app_id, game_name 
-                    FROM recommend_by_user_profile(%s, %s)
-                """, (steam_user_id, limit))
-                result = cursor.fetchall()
-                self.connection.commit()
-                return result
-        except psycopg2.Error:
-            try:
-                self.connection.rollback()
-            except psycopg2.Error:
-                self.connection = None
-                raise
-            raise
+    def get_recommendations(self, steam_user_id: int, limit: int = 5, mode: str = None) -> List[tuple]:
+        """Рекомендации из user_recommendations, а для пользователей без свежего расчёта - расчёт на лету.
+        В режиме 'cf' - соседи игр из библиотеки пользователя (game_neighbors) одним запросом"""
+        function, params = self._recommendations_call(steam_user_id, limit, mode)
+        return self.call_function(function, ['app_id', 'game_name'], params, pin_key=steam_user_id)
+
+    def _recommendations_call(self, steam_user_id: int, limit: int, mode: str = None) -> tuple[str, tuple]:
+        mode = mode or self.recommendations_mode
+        if mode == 'cf':
+            return 'get_neighbor_recommendations', (steam_user_id, limit)
+        if mode == 'profile':
+            return 'get_user_recommendations', (steam_user_id, limit, self.recommendations_max_age_hours)
+        raise ValueError(f"Неизвестный режим рекомендаций: {mode}")
+
+    def get_linked_steam_ids(self) -> List[int]:
+        """Steam id, привязанные к пользователям бота"""
+        rows = self.select(['steam_id'], 'bot_users')[0]
+        return sorted({steam_id for steam_id, in rows if steam_id is not None})
+
+    def iter_library_pairs(self) -> Iterator[tuple[int, int]]:
+        """Все пары (user_id, game_id) из user_games, читаются потоком"""
+        return self.stream_function('get_library_pairs', ['user_id', 'game_id'], (), itersize=10000)
+
+    def neighbor_databases(self) -> List[PgsqlClient]:
+        """Базы, в которых хранится копия game_neighbors"""
+        return [self]
+
+    def replace_game_neighbors(self, blocks: Iterable[List[tuple]]) -> int:
+        """Заменяет все строки game_neighbors, возвращает число сохранённых.
+        Блоки строк (game_id, neighbor_id, score) пишутся в game_neighbors_staging по мере получения, поэтому
+        в памяти только один блок; в game_neighbors расчёт переносится одной короткой транзакцией"""
+        databases = self.neighbor_databases()
+        for database in databases:
+            database.call_function('reset_game_neighbors_staging', ['reset_game_neighbors_staging'], (), readonly=False)
+        for rows in blocks:
+            for database in databases:
+                database.insert_many(GAME_NEIGHBOR_COLUMNS, 'game_neighbors_staging', rows)
+        stored = [
+            database.call_function('swap_game_neighbors', ['swap_game_neighbors'], (), readonly=False)[0][0]
+            for database in databases
+        ]
+        return stored[0]
+
+    def refresh_recommendations(self, steam_user_ids: List[int], limit: int = 20) -> int:
+        """Пересчитывает и сохраняет рекомендации пользователей одной транзакцией, возвращает их число"""
+        result = self.call_function(
+            'refresh_user_recommendations', ['refresh_user_recommendations'],
+            (list(steam_user_ids), limit), readonly=False
+        )
+        return result[0][0]
@@ -1,10 +1,115 @@
 import os
+import json
+import time
+import random
+import logging
+import threading
+import weakref
+from datetime import datetime
+from typing import Callable, Iterator
 from dotenv import load_dotenv
 import psycopg2
+from psycopg2.extensions import QueryCanceledError
 from psycopg2.extras import execute_values
 
+from sources.deadline import DeadlineExceeded, current_deadline
+from sources.metrics import (
+    DB_QUERY_LATENCY, DB_REPLICA_ERRORS, DB_REPLICA_LAG, DB_SERVER_QUERIES, DB_SLOW_QUERIES, DB_STATEMENT_TIMEOUTS
+)
+from sources.queries import (
+    PREPARED_STATEMENTS, PreparedStatement, build_select, build_insert, build_insert_many, build_upsert_many,
+    build_update, build_delete, build_execute, build_function_call
+)
+
+logger = logging.getLogger(__name__)
+
+# Ошибки, после которых реплика считается недоступной и запрос повторяется на основном сервере
+REPLICA_ERRORS = (psycopg2.OperationalError, psycopg2.InterfaceError)
+
+# Отставание реплики в секундах: 0, если всё полученное WAL уже применено (иначе время последней применённой
+# транзакции росло бы и на простаивающем основном сервере)
+REPLICA_LAG_QUERY = """
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() THEN 0
+        WHEN pg_last_wal_receive_lsn() IS NOT DISTINCT FROM pg_last_wal_replay_lsn() THEN 0
+        ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+    END
+"""
+
+
+class ConnectionPool:
+    """Соединения с одним сервером PostgreSQL для запросов из разных потоков.
+
+    Запрос берёт свободное соединение на время выполнения и возвращает его, поэтому одновременно выполняется
+    до size запросов, а остальные потоки ждут освобождения соединения. Соединения открываются по мере надобности.
+    psycopg2.pool.ThreadedConnectionPool при исчерпании не ждёт, а бросает PoolError, поэтому пул свой.
+    """
+
+    def __init__(self, connect: Callable[[], 'psycopg2.extensions.connection'], size: int):
+        self.connect = connect
+        self.size = size
+        self.idle = []
+        self.opened = 0
+        self.condition = threading.Condition()
+
+    def acquire(self):
+        with self.condition:
+            while not self.idle and self.opened >= self.size:
+                self.condition.wait()
+            if self.idle:
+                return self.idle.pop()
+            self.opened += 1
+        try:
+            return self.connect()
+        except BaseException:
+            with self.condition:
+                self.opened -= 1
+                self.condition.notify()
+            raise
+
+    def release(self, connection, broken: bool = False):
+        """Возвращает соединение в пул; сломанное (не удалось откатить транзакцию) закрывается"""
+        with self.condition:
+            if broken:
+                self.opened -= 1
+            else:
+                self.idle.append(connection)
+            self.condition.notify()
+        if broken:
+            _close_quietly(connection)
+
+    def close(self):
+        """Закрывает свободные соединения; занятые закроются, когда их вернут как сломанные"""
+        with self.condition:
+            idle, self.idle = self.idle, []
+            self.opened -= len(idle)
+            self.condition.notify_all()
+        for connection in idle:
+            _close_quietly(connection)
+
+
+def _close_quietly(connection):
+    try:
+        connection.close()
+    except psycopg2.Error:
+        pass
+
+
+class Replica:
+    """Реплика только для чтения: DSN, пул соединений, момент, до которого она исключена из ротации,
+    и результат последней активной проверки (healthy, отставание lag в секундах)"""
+
+    def __init__(self, name: str, dsn: str, pool_size: int = 4):
+        self.name = name
+        self.dsn = dsn
+        self.pool = ConnectionPool(lambda: psycopg2.connect(dsn), pool_size)
+        self.down_until = 0.0
+        self.healthy = True
+        self.lag = 0.0
+
+
 class PgsqlClient:
-    def __init__(self, env : str = None):
+    def __init__(self, env : str = None, dsn : str = None):
         if env is not None:
             load_dotenv(env)
         self.db_host = os.getenv('DB_HOST', 'localhost')
@@ -12,9 +117,47 @@ class PgsqlClient:
         self.db_base = os.getenv('DB_NAME')
         self.db_user = os.getenv('DB_USER')
         self.db_pass = os.getenv('DB_PASSWORD')
-        self.connection = None
- 
+        self.slow_query_ms = float(os.getenv('DB_SLOW_QUERY_MS', 500))
+        self.explain_sample_rate = float(os.getenv('DB_EXPLAIN_SAMPLE_RATE', 0))
+        self.explain_log = os.getenv('DB_EXPLAIN_LOG', 'slow_query_plans.jsonl')
+        # EXPLAIN ANALYZE повторно выполняет медленный запрос, поэтому ограничен своим statement_timeout
+        self.explain_timeout_ms = int(os.getenv('DB_EXPLAIN_TIMEOUT_MS', 5000))
+        # DSN основного сервера (если задан, заменяет DB_HOST/DB_PORT/...) и реплик через запятую.
+        # Клиент с явно переданным dsn (например, шард) работает без реплик
+        self.db_dsn = dsn or os.getenv('DB_DSN')
+        # Соединений с каждым сервером: столько запросов клиента может выполняться одновременно из разных потоков
+        pool_size = int(os.getenv('DB_POOL_SIZE', 4))
+        self.replicas = [] if dsn else [
+            Replica(f'replica-{i}', replica_dsn.strip(), pool_size)
+            for i, replica_dsn in enumerate(filter(str.strip, os.getenv('DB_REPLICA_DSNS', '').split(',')), 1)
+        ]
+        self.replica_retry_seconds = float(os.getenv('DB_REPLICA_RETRY_SECONDS', 30))
+        # Период активной проверки реплик (0 - только пассивная: реплика возвращается в ротацию по таймеру)
+        # и отставание, при котором реплика исключается из ротации
+        self.replica_probe_seconds = float(os.getenv('DB_REPLICA_PROBE_SECONDS', 0))
+        self.replica_max_lag_seconds = float(os.getenv('DB_REPLICA_MAX_LAG_SECONDS', 30))
+        self.read_your_writes_seconds = float(os.getenv('DB_READ_YOUR_WRITES_SECONDS', 30))
+        self.replica_index = 0
+        # Ключи (обычно Steam id), чтения по которым временно идут на основной сервер: ключ -> срок
+        self.pinned = {}
+        # Каждый запрос выполняется на своём соединении из пула, поэтому запросы из потоков (AdmissionController,
+        # asyncio.to_thread в обработчиках) идут параллельно; get_connection вызывается при открытии соединения
+        self.pool = ConnectionPool(lambda: self.get_connection(), pool_size)
+        # Имена prepared statements, уже подготовленных на каждом соединении
+        self.prepared = weakref.WeakKeyDictionary()
+        # Защищает состояние маршрутизации (очередь реплик и pinned), которое меняют запросы из разных потоков
+        self.routing_lock = threading.Lock()
+
+    def resize_pool(self, size: int):
+        """Увеличивает пулы соединений основного сервера и реплик до size, если они меньше"""
+        for pool in [self.pool] + [replica.pool for replica in self.replicas]:
+            with pool.condition:
+                pool.size = max(pool.size, size)
+                pool.condition.notify_all()
+
     def get_connection(self):
+        if self.db_dsn:
+            return psycopg2.connect(self.db_dsn)
         return psycopg2.connect(
             host = self.db_host,
             port = self.db_port,
@@ -23,72 +166,290 @@ class PgsqlClient:
             password = self.db_pass
         )
 
-    def select(self, attributes: list[str], table: str, where : str = None) -> tuple:
+    def _execute(self, operation: str, target: str, query: str, params = None, fetch: bool = False,
+                 readonly: bool = False, batch: bool = False, replica: bool = False,
+                 prepare: PreparedStatement = None) -> tuple | None:
+        """Выполняет запрос и замеряет время выполнения.
+
+        Запись выполняется в отдельной транзакции, чтение - в режиме autocommit без BEGIN/COMMIT.
+        При batch=True params - список строк, которые подставляются в VALUES %s через execute_values.
+        При replica=True чтение уходит на следующую доступную реплику, а если реплик нет или соединение
+        с ней оборвалось - на основной сервер.
+        При prepare запрос выполняется после PREPARE этого statement, если он ещё не подготовлен на соединении.
+        Внутри команды с бюджетом времени (sources.deadline) запрос ограничивается SET LOCAL statement_timeout
+        по оставшемуся времени, а отменённый по таймауту запрос завершается DeadlineExceeded.
+        """
         try:
-            if self.connection is None:
-                self.connection = self.get_connection()
-            with self.connection.cursor() as cursor:
-                query = f"SELECT {', '.join(attributes)} FROM {table}"
-                if where is not None:
-                    query += " WHERE " + where
-                cursor.execute(query)
-                result = (cursor.fetchall(), cursor.description)
-                self.connection.commit()
-                return result
-        except psycopg2.Error:
-            try:
-                self.connection.rollback()
-            except psycopg2.Error:
-                self.connection = None
+            server = self._next_replica() if replica else None
+            if server is not None:
+                try:
+                    return self._run(server, operation, target, query, params, fetch, True, batch, prepare)
+                except REPLICA_ERRORS as e:
+                    if isinstance(e, QueryCanceledError):
+                        raise
+                    self._mark_down(server, e)
+            return self._run(None, operation, target, query, params, fetch, readonly, batch, prepare)
+        except QueryCanceledError as e:
+            if current_deadline.get() is None:
                 raise
-            raise
-    
-    def insert(self, attributes: list[str], table: str, data: list):
+            DB_STATEMENT_TIMEOUTS.inc(operation=operation, target=target)
+            raise DeadlineExceeded(f"Запрос {operation} {target} прерван по бюджету времени команды") from e
+
+    def _run(self, server: Replica | None, operation: str, target: str, query: str, params, fetch: bool,
+             readonly: bool, batch: bool, prepare: PreparedStatement = None) -> tuple | None:
+        """Выполняет запрос на реплике server или на основном сервере (server=None) на свободном соединении пула"""
+        deadline = current_deadline.get()
+        if deadline is not None:
+            deadline.check()
+        pool = self.pool if server is None else server.pool
+        connection = pool.acquire()
+        broken = False
         try:
-            if self.connection is None:
-                self.connection = self.get_connection()
-            with self.connection.cursor() as cursor:
-                placeholders = ', '.join(['%s'] * len(data))
-                query = f"INSERT INTO {table} ({', '.join(attributes)}) VALUES ({placeholders})"
-                cursor.execute(query, data)
-                self.connection.commit()
+            # SET LOCAL действует только внутри транзакции, поэтому чтение с бюджетом выполняется без autocommit
+            autocommit = readonly and deadline is None
+            if connection.autocommit != autocommit:
+                connection.autocommit = autocommit
+            start = time.perf_counter()
+            if deadline is not None:
+                deadline.attach(connection)
+            try:
+                with connection.cursor() as cursor:
+                    if deadline is not None:
+                        cursor.execute(
+                            "SET LOCAL statement_timeout = %s", (max(1, int(deadline.remaining() * 1000)),)
+                        )
+                    if prepare is not None:
+                        self._prepare(connection, cursor, prepare)
+                    if batch:
+                        # По умолчанию execute_values делит строки на запросы по 100; весь пакет - один запрос,
+                        # чтобы триггеры FOR EACH STATEMENT срабатывали один раз
+                        execute_values(cursor, query, params, page_size=max(len(params), 1))
+                    elif params is None:
+                        cursor.execute(query)
+                    else:
+                        cursor.execute(query, params)
+                    result = (cursor.fetchall(), cursor.description) if fetch else None
+                    if not autocommit:
+                        connection.commit()
+            finally:
+                if deadline is not None:
+                    deadline.detach(connection)
+                duration = time.perf_counter() - start
+                DB_QUERY_LATENCY.observe(duration, operation=operation, target=target)
+                DB_SERVER_QUERIES.inc(server='primary' if server is None else server.name)
+            if duration * 1000 >= self.slow_query_ms:
+                self._log_slow_query(connection, operation, target, query, params, duration, readonly)
+            return result
         except psycopg2.Error:
             try:
-                self.connection.rollback()
+                connection.rollback()
             except psycopg2.Error:
-                self.connection = None
+                broken = True
                 raise
             raise
+        finally:
+            pool.release(connection, broken)
 
-    def update(self, attributes: list[str], table: str, data: list, id_column : str, id : int):
-        try:
-            if self.connection is None:
-                self.connection = self.get_connection()
-            with self.connection.cursor() as cursor:
-                result = [f"{k} = '{v}'" for k, v in zip(attributes, data)]
-                query = f"UPDATE {table} SET {', '.join(result)} WHERE {id_column} = {id}"
-                cursor.execute(query)
-                self.connection.commit()
-        except psycopg2.Error:
+    def _prepare(self, connection, cursor, statement: PreparedStatement):
+        """PREPARE на соединении при первом выполнении statement (prepared statement живёт до закрытия соединения
+        и не отменяется откатом транзакции)"""
+        names = self.prepared.setdefault(connection, set())
+        if statement.name not in names:
+            cursor.execute(f"PREPARE {statement.name} AS {statement.text}")
+            names.add(statement.name)
+
+    def _next_replica(self) -> Replica | None:
+        """Следующая по кругу реплика, не исключённая из ротации после ошибки или проверки"""
+        now = time.monotonic()
+        with self.routing_lock:
+            for _ in range(len(self.replicas)):
+                server = self.replicas[self.replica_index % len(self.replicas)]
+                self.replica_index += 1
+                if server.healthy and server.down_until <= now:
+                    return server
+        return None
+
+    def _mark_down(self, server: Replica, error: Exception):
+        """Исключает реплику из ротации на replica_retry_seconds, после чего к ней пробуют переподключиться.
+        При включённой активной проверке реплика возвращается в ротацию только после успешной проверки"""
+        DB_REPLICA_ERRORS.inc(server=server.name)
+        logger.warning("Реплика %s недоступна, чтение переключено на основной сервер: %s", server.name, error)
+        server.down_until = time.monotonic() + self.replica_retry_seconds
+        if self.replica_probe_seconds > 0:
+            # В ротацию реплику вернёт только успешная активная проверка (probe_replicas)
+            server.healthy = False
+        server.pool.close()
+
+    def probe_replicas(self):
+        """Активная проверка реплик: SELECT с замером отставания на отдельном соединении.
+        Недоступная или отстающая больше replica_max_lag_seconds реплика исключается из ротации,
+        восстановившаяся - возвращается"""
+        for server in self.replicas:
             try:
-                self.connection.rollback()
-            except psycopg2.Error:
-                self.connection = None
-                raise
-            raise
+                connection = psycopg2.connect(server.dsn, connect_timeout=5, options='-c statement_timeout=5000')
+                try:
+                    connection.autocommit = True
+                    with connection.cursor() as cursor:
+                        cursor.execute(REPLICA_LAG_QUERY)
+                        lag = float(cursor.fetchone()[0])
+                finally:
+                    connection.close()
+            except psycopg2.Error as e:
+                if server.healthy:
+                    logger.warning("Реплика %s не прошла проверку: %s", server.name, e)
+                server.healthy = False
+                continue
+            server.lag = lag
+            DB_REPLICA_LAG.set(lag, server=server.name)
+            healthy = lag <= self.replica_max_lag_seconds
+            if healthy != server.healthy:
+                if healthy:
+                    logger.info("Реплика %s возвращена в ротацию, отставание %.1f с", server.name, lag)
+                else:
+                    logger.warning("Реплика %s исключена из ротации: отставание %.1f с", server.name, lag)
+            if healthy:
+                server.down_until = 0.0
+            server.healthy = healthy
 
-    def delete(self, attributes: list[str], table: str):
+    def pin_to_primary(self, key):
+        """Следующие read_your_writes_seconds секунд чтения с этим ключом выполняются на основном сервере,
+        чтобы только что записанные данные не потерялись из-за отставания реплик"""
+        if not self.replicas:
+            return
+        now = time.monotonic()
+        with self.routing_lock:
+            if len(self.pinned) > 10000:
+                self.pinned = {k: until for k, until in self.pinned.items() if until > now}
+            self.pinned[key] = now + self.read_your_writes_seconds
+
+    def _use_replica(self, pin_key) -> bool:
+        if not self.replicas:
+            return False
+        until = self.pinned.get(pin_key)
+        if until is None:
+            return True
+        if until <= time.monotonic():
+            self.pinned.pop(pin_key, None)
+            return True
+        return False
+
+    def _log_slow_query(self, connection, operation: str, target: str, query: str, params, duration: float,
+                        readonly: bool):
+        DB_SLOW_QUERIES.inc(operation=operation, target=target)
+        logger.warning(
+            "Медленный запрос %s %s: %.1f мс\n%s\nПараметры: %.500r",
+            operation, target, duration * 1000, ' '.join(query.split()), params
+        )
+        # EXPLAIN ANALYZE реально исполняет запрос, поэтому план снимается только для чтений: хранимые функции
+        # вызываются и для записи (call_function с readonly=False)
+        if readonly and random.random() < self.explain_sample_rate:
+            self._capture_explain(connection, operation, target, query, params, duration)
+
+    def _capture_explain(self, connection, operation: str, target: str, query: str, params, duration: float):
+        """Сохраняет план EXPLAIN (ANALYZE, BUFFERS) медленного запроса в файл JSON Lines.
+        План снимается в откатываемой транзакции с SET LOCAL statement_timeout, не дольше остатка бюджета команды"""
+        timeout_ms = self.explain_timeout_ms
+        deadline = current_deadline.get()
+        if deadline is not None:
+            timeout_ms = min(timeout_ms, int(deadline.remaining() * 1000))
+            if timeout_ms <= 0:
+                return
         try:
-            if self.connection is None:
-                self.connection = self.get_connection()
-            with self.connection.cursor() as cursor:
-                query = f"DELETE FROM {table} WHERE id IN ({', '.join(attributes)})"
-                cursor.execute(query)
-                self.connection.commit()
-        except psycopg2.Error:
+            if connection.autocommit:
+                connection.autocommit = False
+            with connection.cursor() as cursor:
+                cursor.execute("SET LOCAL statement_timeout = %s", (timeout_ms,))
+                cursor.execute("EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) " + query, params)
+                plan = cursor.fetchone()[0]
+            connection.rollback()
+        except psycopg2.Error as e:
+            logger.warning("Не удалось получить план запроса %s %s: %s", operation, target, e)
+            # Если откат не удался, соединение сломано и следующий запрос на нём завершится ошибкой
             try:
-                self.connection.rollback()
+                connection.rollback()
             except psycopg2.Error:
-                self.connection = None
-                raise
-            raise
+                pass
+            return
+        record = {
+            'time': datetime.now().isoformat(timespec='seconds'),
+            'operation': operation,
+            'target': target,
+            'duration_ms': round(duration * 1000, 3),
+            'query': ' '.join(query.split()),
+            'params': repr(params),
+            'plan': plan
+        }
+        with open(self.explain_log, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(record, ensure_ascii=False, default=str) + '\n')
+
+    def call_function(self, function: str, attributes: list[str], params: tuple, readonly: bool = True,
+                      pin_key = None) -> list[tuple]:
+        """Вызывает хранимую функцию; читающие функции выполняются на репликах, если ключ pin_key
+        не закреплён за основным сервером (pin_to_primary)"""
+        query = build_function_call(function, attributes, params)
+        return self._execute(
+            'function', function, query.text, query.params, fetch=True, readonly=readonly,
+            replica=readonly and self._use_replica(pin_key)
+        )[0]
+
+    def stream_function(self, function: str, attributes: list[str], params: tuple,
+                        itersize: int = 1000) -> Iterator[tuple]:
+        """Построчно читает результат хранимой функции серверным курсором, забирая по itersize строк.
+
+        Курсор открыт внутри транзакции, пока результат не дочитан, поэтому используется отдельное соединение
+        вне пула, чтобы не занимать соединение остальных запросов.
+        """
+        query = build_function_call(function, attributes, params)
+        connection = self.get_connection()
+        start = time.perf_counter()
+        try:
+            with connection.cursor(name=f"stream_{function}") as cursor:
+                cursor.itersize = itersize
+                cursor.execute(query.text, query.params)
+                yield from cursor
+        finally:
+            DB_QUERY_LATENCY.observe(time.perf_counter() - start, operation='stream', target=function)
+            connection.close()
+
+    def execute_prepared(self, name: str, params: tuple) -> list[tuple]:
+        """Выполняет серверный prepared statement, подготавливая его при первом вызове на соединении"""
+        statement = PREPARED_STATEMENTS[name]
+        query = build_execute(statement, params)
+        return self._execute(
+            'prepared', name, query.text, query.params, fetch=True, readonly=True, prepare=statement
+        )[0]
+
+    def select(self, attributes: list[str], table: str, where : dict = None, pin_key = None) -> tuple:
+        query = build_select(attributes, table, where)
+        return self._execute(
+            'select', table, query.text, query.params or None, fetch=True, readonly=True,
+            replica=self._use_replica(pin_key)
+        )
+
+    def insert(self, attributes: list[str], table: str, data: list):
+        query = build_insert(attributes, table, data)
+        self._execute('insert', table, query.text, query.params)
+
+    def insert_many(self, attributes: list[str], table: str, rows: list[list]):
+        """Вставляет все строки одним запросом в одной транзакции"""
+        if not rows:
+            return
+        query = build_insert_many(attributes, table, rows)
+        self._execute('insert', table, query.text, query.params, batch=True)
+
+    def upsert_many(self, attributes: list[str], table: str, rows: list[list], conflict: list[str],
+                    assignments: dict[str, str]):
+        """Вставляет строки одним запросом, а конфликтующие по conflict обновляет выражениями assignments.
+        Триггеры FOR EACH STATEMENT на INSERT и UPDATE срабатывают по одному разу на весь запрос"""
+        if not rows:
+            return
+        query = build_upsert_many(attributes, table, rows, conflict, assignments)
+        self._execute('insert', table, query.text, query.params, batch=True)
+
+    def update(self, attributes: list[str], table: str, data: list, id_column : str, id : int):
+        query = build_update(attributes, table, data, {id_column: id})
+        self._execute('update', table, query.text, query.params)
+
+    def delete(self, attributes: list, table: str):
+        query = build_delete(table, attributes)
+        self._execute('delete', table, query.text, query.params)
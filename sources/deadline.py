@@ -0,0 +1,83 @@
+import contextvars
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable
+
+logger = logging.getLogger(__name__)
+
+
+class DeadlineExceeded(Exception):
+    """Бюджет времени команды исчерпан до завершения запроса к базе или Steam"""
+
+
+class Deadline:
+    """Момент, к которому команда должна завершиться, и запросы к базе, которые выполняются в её рамках.
+
+    Объект общий для корутины обработчика и потоков, в которых она выполняет запросы (contextvars копируются
+    в asyncio.to_thread), поэтому cancel() из цикла событий прерывает запрос, выполняющийся в другом потоке.
+    """
+
+    def __init__(self, seconds: float, clock: Callable[[], float] = time.monotonic):
+        self.clock = clock
+        self.expires = clock() + seconds
+        self.cancelled = False
+        self.connections = set()
+        self.lock = threading.Lock()
+
+    def remaining(self) -> float:
+        return self.expires - self.clock()
+
+    def check(self):
+        if self.cancelled or self.remaining() <= 0:
+            raise DeadlineExceeded("Бюджет времени команды исчерпан")
+
+    def attach(self, connection):
+        """Регистрирует соединение, на котором начинается запрос команды; после отмены запрос не начинается"""
+        with self.lock:
+            if self.cancelled:
+                raise DeadlineExceeded("Бюджет времени команды исчерпан")
+            self.connections.add(connection)
+
+    def detach(self, connection):
+        with self.lock:
+            self.connections.discard(connection)
+
+    def cancel(self):
+        """Отменяет запросы к базе, которые ещё выполняются (pg_cancel_backend через connection.cancel).
+
+        Отмена выполняется под блокировкой: detach ждёт её завершения, поэтому соединение не вернётся в пул и не
+        начнёт запрос другой команды, пока ему отправляется отмена.
+        """
+        with self.lock:
+            self.cancelled = True
+            for connection in self.connections:
+                try:
+                    connection.cancel()
+                except Exception as e:
+                    logger.warning("Не удалось отменить запрос к базе: %s", e)
+
+
+current_deadline: contextvars.ContextVar[Deadline | None] = contextvars.ContextVar('current_deadline', default=None)
+
+
+@contextmanager
+def deadline(seconds: float):
+    """Устанавливает бюджет времени для кода внутри блока; вложенный бюджет не может быть больше внешнего"""
+    outer = current_deadline.get()
+    if outer is not None and outer.remaining() <= seconds:
+        yield outer
+        return
+    value = Deadline(seconds)
+    token = current_deadline.set(value)
+    try:
+        yield value
+    finally:
+        current_deadline.reset(token)
+
+
+def remaining() -> float | None:
+    """Сколько секунд осталось у текущей команды, None - если бюджет не задан"""
+    value = current_deadline.get()
+    return None if value is None else value.remaining()
@@ -0,0 +1,94 @@
+import asyncio
+import html
+import logging
+from functools import partial
+from itertools import groupby
+from operator import itemgetter
+from typing import List
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramAPIError, TelegramForbiddenError
+
+from sources.database_api import PgsqlApiClient
+from sources.metrics import DIGEST_MESSAGES
+from sources.send_queue import BULK, SendScheduler
+
+logger = logging.getLogger(__name__)
+
+
+def format_digest(games: List[tuple]) -> str:
+    """Текст дайджеста по строкам (tg_id, game_id, game_name, friends_count)"""
+    lines = ["<b>Что недавно добавляли себе ваши друзья:</b>"]
+    for i, (_, game_id, name, friends_count) in enumerate(games, 1):
+        lines.append(f"{i}. <code>{game_id}</code> - {html.escape(name)} (друзей: {friends_count})")
+    return "\n".join(lines)
+
+
+class FriendsDigest:
+    """Периодическая рассылка обновлений друзей всем пользователям бота с привязанным Steam id.
+
+    Дайджест для всех пользователей части partitions считается одним запросом (get_friends_digest) и читается
+    в отдельном потоке целиком, так что курсор и его транзакция закрываются до начала рассылки; число частей
+    ограничивает объём строк в памяти. Строки группируются по tg_id, сообщения уходят через общую очередь отправки
+    с низким приоритетом, а отправленные игры после рассылки части записываются в digest_log одним запросом
+    и в следующие дайджесты не попадают.
+    """
+
+    def __init__(self, bot: Bot, db_client: PgsqlApiClient, sender: SendScheduler, limit: int = 5,
+                 days_ago: int = 14, partitions: int = 1, concurrency: int = 32):
+        self.bot = bot
+        self.db_client = db_client
+        self.sender = sender
+        self.limit = limit
+        self.days_ago = days_ago
+        self.partitions = partitions
+        # Сколько сообщений одновременно ожидают отправки в очереди
+        self.concurrency = concurrency
+
+    async def run_once(self) -> int:
+        """Рассылает дайджест и возвращает число доставленных сообщений"""
+        semaphore = asyncio.Semaphore(self.concurrency)
+        sent = 0
+        for partition in range(self.partitions):
+            rows = await asyncio.to_thread(self._read_partition, partition)
+            tasks = []
+            for tg_id, games in groupby(rows, key=itemgetter(0)):
+                await semaphore.acquire()
+                tasks.append(asyncio.create_task(self._deliver(semaphore, tg_id, list(games))))
+            results = await asyncio.gather(*tasks)
+            delivered = [(tg_id, game_id) for games in results for tg_id, game_id, _, _ in games]
+            if delivered:
+                await asyncio.to_thread(self.db_client.log_digest, delivered)
+            sent += sum(1 for games in results if games)
+        return sent
+
+    def _read_partition(self, partition: int) -> List[tuple]:
+        return list(self.db_client.iter_friends_digest(self.limit, self.days_ago, self.partitions, partition))
+
+    async def _deliver(self, semaphore: asyncio.Semaphore, tg_id: int, games: List[tuple]) -> List[tuple]:
+        """Отправляет дайджест и возвращает доставленные строки (пустой список, если отправить не удалось)"""
+        try:
+            await self.sender.send(
+                tg_id, partial(self.bot.send_message, tg_id, format_digest(games), parse_mode='HTML'), BULK
+            )
+        except TelegramForbiddenError:
+            # Пользователь заблокировал бота
+            DIGEST_MESSAGES.inc(status='forbidden')
+            return []
+        except TelegramAPIError as e:
+            DIGEST_MESSAGES.inc(status='error')
+            logger.warning("Не удалось отправить дайджест пользователю %s: %s", tg_id, e)
+            return []
+        finally:
+            semaphore.release()
+        DIGEST_MESSAGES.inc(status='sent')
+        return games
+
+    async def run_forever(self, interval: float):
+        while True:
+            try:
+                sent = await self.run_once()
+                logger.info("Дайджест обновлений друзей отправлен %s пользователям", sent)
+            except Exception:
+                logger.exception("Ошибка при рассылке дайджеста обновлений друзей")
+            await asyncio.sleep(interval)
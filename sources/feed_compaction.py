@@ -0,0 +1,54 @@
+# Уплотнение ленты обновлений друзей (friend_feed): записи, все друзья которых добавили игру раньше окна ленты,
+# удаляются, а записи, где окно покинула только часть друзей, пересчитываются по user_games.
+# Триггеры только добавляют вклад друзей, поэтому без уплотнения число друзей и время игры в ленте со временем
+# завышаются, а таблица растёт.
+#
+# Запуск (из корня репозитория):
+#   python -m sources.feed_compaction
+#   python -m sources.feed_compaction --every-hours 1   # уплотнение раз в час
+import argparse
+import logging
+import time
+
+from dotenv import load_dotenv
+
+from sources.sharding import create_db_client
+
+logger = logging.getLogger(__name__)
+
+
+def run() -> tuple[int, int]:
+    """Уплотняет ленту на всех базах, возвращает (удалено, пересчитано)"""
+    start = time.perf_counter()
+    deleted, recomputed = create_db_client().compact_friend_feed()
+    logger.info(
+        "Лента друзей уплотнена за %.1f с: удалено %s, пересчитано %s записей",
+        time.perf_counter() - start, deleted, recomputed
+    )
+    return deleted, recomputed
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Уплотнение ленты обновлений друзей")
+    parser.add_argument("--every-hours", type=float, default=0, help="повторять раз в N часов (0 - один запуск)")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    logging.basicConfig(level=logging.INFO)
+    load_dotenv("params.env")
+    args = parse_args(argv)
+    while True:
+        try:
+            run()
+        except Exception:
+            if not args.every_hours:
+                raise
+            logger.exception("Ошибка при уплотнении ленты друзей")
+        if not args.every_hours:
+            break
+        time.sleep(args.every_hours * 3600)
+
+
+if __name__ == "__main__":
+    main()
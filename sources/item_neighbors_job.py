@@ -0,0 +1,121 @@
+# Пересчёт соседей игр для рекомендаций в режиме 'cf' (RECOMMENDATIONS_MODE=cf).
+# Из user_games строится разреженная бинарная матрица «пользователь × игра»; близость двух игр - косинус между их
+# столбцами, то есть число общих владельцев, делённое на корень из произведения чисел владельцев.
+# Матрица совместного владения X^T X считается блоками по chunk_size игр, поэтому в памяти одновременно только
+# одна полоса результата, а для каждой игры сохраняются k самых близких соседей (таблица game_neighbors).
+#
+# Запуск (из корня репозитория):
+#   python -m sources.item_neighbors_job --neighbors 20
+#   python -m sources.item_neighbors_job --every-hours 24   # пересчёт раз в сутки
+import argparse
+import logging
+import time
+from typing import Iterable, Iterator, List, Tuple
+
+import numpy as np
+from dotenv import load_dotenv
+from scipy import sparse
+
+from sources.sharding import create_db_client
+
+logger = logging.getLogger(__name__)
+
+
+def build_matrix(pairs: Iterable[Tuple[int, int]]) -> Tuple[sparse.csr_matrix, np.ndarray]:
+    """Бинарная матрица «пользователь × игра» и Steam id игр, соответствующие её столбцам"""
+    users = []
+    games = []
+    for user_id, game_id in pairs:
+        users.append(user_id)
+        games.append(game_id)
+    user_ids, rows = np.unique(np.array(users, dtype=np.int64), return_inverse=True)
+    game_ids, columns = np.unique(np.array(games, dtype=np.int64), return_inverse=True)
+    matrix = sparse.csr_matrix(
+        (np.ones(len(rows), dtype=np.float32), (rows, columns)), shape=(len(user_ids), len(game_ids))
+    )
+    # Повторяющиеся пары при сборке складываются, владение учитывается один раз
+    matrix.data[:] = 1
+    return matrix, game_ids
+
+
+def top_neighbors(matrix: sparse.csr_matrix, k: int = 20, chunk_size: int = 1000,
+                  min_common: int = 2) -> Iterator[Tuple[int, np.ndarray, np.ndarray]]:
+    """Для каждого столбца - (столбец, столбцы k ближайших соседей, их близости) по убыванию близости.
+    Пары игр, у которых меньше min_common общих владельцев, не учитываются: их близость определяется случайностью"""
+    items = matrix.T.tocsr()
+    norms = np.sqrt(np.asarray(items.sum(axis=1), dtype=np.float64).ravel())
+    for start in range(0, items.shape[0], chunk_size):
+        block = (items[start:start + chunk_size] @ matrix).tocsr()
+        for offset in range(block.shape[0]):
+            item = start + offset
+            row = slice(block.indptr[offset], block.indptr[offset + 1])
+            columns = block.indices[row]
+            common = block.data[row]
+            keep = (columns != item) & (common >= min_common)
+            columns, common = columns[keep], common[keep]
+            if not len(columns):
+                continue
+            scores = common / (norms[item] * norms[columns])
+            if len(scores) > k:
+                best = np.argpartition(-scores, k - 1)[:k]
+                columns, scores = columns[best], scores[best]
+            order = np.lexsort((columns, -scores))
+            yield item, columns[order], scores[order]
+
+
+def neighbor_blocks(neighbors: Iterable[Tuple[int, np.ndarray, np.ndarray]], game_ids: np.ndarray,
+                    block_size: int) -> Iterator[List[Tuple[int, int, float]]]:
+    """Строки (game_id, neighbor_id, score) блоками не меньше block_size строк (последний - сколько осталось)"""
+    rows = []
+    for item, columns, scores in neighbors:
+        rows.extend(zip([int(game_ids[item])] * len(columns), game_ids[columns].tolist(), scores.tolist()))
+        if len(rows) >= block_size:
+            yield rows
+            rows = []
+    if rows:
+        yield rows
+
+
+def run(k: int = 20, chunk_size: int = 1000, min_common: int = 2) -> int:
+    """Пересчитывает соседей всех игр, возвращает число сохранённых пар"""
+    db_client = create_db_client()
+    start = time.perf_counter()
+    matrix, game_ids = build_matrix(db_client.iter_library_pairs())
+    # Соседи записываются в базу блоками по мере расчёта, а не собираются целиком
+    stored = db_client.replace_game_neighbors(
+        neighbor_blocks(top_neighbors(matrix, k, chunk_size, min_common), game_ids, chunk_size * k)
+    )
+    logger.info(
+        "Соседи пересчитаны для %s игр по %s пользователям за %.1f с, сохранено %s пар",
+        matrix.shape[1], matrix.shape[0], time.perf_counter() - start, stored
+    )
+    return stored
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Пересчёт соседей игр для рекомендаций по совместному владению")
+    parser.add_argument("--neighbors", type=int, default=20, help="число сохраняемых соседей на игру")
+    parser.add_argument("--chunk-size", type=int, default=1000, help="игр в одном блоке умножения матриц")
+    parser.add_argument("--min-common", type=int, default=2, help="минимальное число общих владельцев пары игр")
+    parser.add_argument("--every-hours", type=float, default=0, help="повторять раз в N часов (0 - один запуск)")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    logging.basicConfig(level=logging.INFO)
+    load_dotenv("params.env")
+    args = parse_args(argv)
+    while True:
+        try:
+            run(args.neighbors, args.chunk_size, args.min_common)
+        except Exception:
+            if not args.every_hours:
+                raise
+            logger.exception("Ошибка при пересчёте соседей игр")
+        if not args.every_hours:
+            break
+        time.sleep(args.every_hours * 3600)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,258 @@
+import threading
+import time
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, List, Tuple
+
+from aiohttp import web
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names: Iterable[str], values: Iterable, extra: str = None) -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra is not None:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric(ABC):
+    """Базовый класс метрики с набором меток"""
+    type = 'untyped'
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = (), registry=None):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        (REGISTRY if registry is None else registry).register(self)
+
+    def _key(self, labels: Dict) -> Tuple:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"Метрика {self.name} ожидает метки {self.labelnames}, получены {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    @abstractmethod
+    def samples(self) -> List[Tuple[str, str, float]]:
+        """Строки экспозиции: (имя, метки, значение)"""
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type}"]
+        for name, labels, value in self.samples():
+            lines.append(f"{name}{labels} {_format_value(value)}")
+        return '\n'.join(lines)
+
+
+class Counter(Metric):
+    type = 'counter'
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values: Dict[Tuple, float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    def samples(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        return [(f"{self.name}_total", _format_labels(self.labelnames, key), value) for key, value in items]
+
+
+class Gauge(Metric):
+    type = 'gauge'
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values: Dict[Tuple, float] = {}
+        self._functions: Dict[Tuple, Callable[[], float]] = {}
+
+    def set(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+    def set_function(self, function: Callable[[], float], **labels):
+        """Значение вычисляется при каждом чтении метрики (размеры кэшей, состояние соединений)"""
+        key = self._key(labels)
+        with self._lock:
+            self._functions[key] = function
+
+    def value(self, **labels) -> float:
+        key = self._key(labels)
+        if key in self._functions:
+            return self._functions[key]()
+        return self._values.get(key, 0)
+
+    def samples(self):
+        with self._lock:
+            values = dict(self._values)
+            functions = dict(self._functions)
+        for key, function in functions.items():
+            values[key] = function()
+        return [(self.name, _format_labels(self.labelnames, key), value) for key, value in sorted(values.items())]
+
+
+class Histogram(Metric):
+    type = 'histogram'
+
+    def __init__(self, *args, buckets: Iterable[float] = DEFAULT_BUCKETS, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.buckets = tuple(sorted(buckets)) + (float('inf'),)
+        self._counts: Dict[Tuple, List[int]] = {}
+        self._sums: Dict[Tuple, float] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            counts = self._counts.setdefault(key, [0] * len(self.buckets))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+            self._sums[key] = self._sums.get(key, 0.0) + value
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def count(self, **labels) -> int:
+        counts = self._counts.get(self._key(labels))
+        return counts[-1] if counts else 0
+
+    def samples(self):
+        result = []
+        with self._lock:
+            items = sorted((key, list(counts), self._sums[key]) for key, counts in self._counts.items())
+        for key, counts, total in items:
+            for bound, count in zip(self.buckets, counts):
+                labels = _format_labels(self.labelnames, key, f'le="{_format_value(bound)}"')
+                result.append((f"{self.name}_bucket", labels, count))
+            labels = _format_labels(self.labelnames, key)
+            result.append((f"{self.name}_sum", labels, total))
+            result.append((f"{self.name}_count", labels, counts[-1]))
+        return result
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: Dict[str, Metric] = {}
+
+    def register(self, metric: Metric):
+        if metric.name in self._metrics:
+            raise ValueError(f"Метрика {metric.name} уже зарегистрирована")
+        self._metrics[metric.name] = metric
+
+    def render(self) -> str:
+        return '\n'.join(metric.render() for metric in self._metrics.values()) + '\n'
+
+
+REGISTRY = Registry()
+
+HANDLER_LATENCY = Histogram(
+    'bot_handler_duration_seconds', 'Время выполнения обработчиков команд бота', ['handler']
+)
+HANDLER_ERRORS = Counter(
+    'bot_handler_errors', 'Число исключений в обработчиках команд бота', ['handler']
+)
+REQUESTS_COALESCED = Counter(
+    'bot_requests_coalesced', 'Число повторных запросов, объединённых с таким же выполняющимся запросом пользователя',
+    ['handler']
+)
+REQUESTS_REJECTED = Counter(
+    'bot_requests_rejected', 'Число запросов, отклонённых из-за лимита одновременных тяжёлых команд пользователя',
+    ['handler']
+)
+ADMISSION_IN_FLIGHT = Gauge('admission_in_flight', 'Число тяжёлых запросов к базе, выполняющихся сейчас')
+ADMISSION_WAITING = Gauge('admission_waiting', 'Число тяжёлых запросов к базе, ожидающих свободного слота')
+ADMISSION_QUEUE_DELAY = Histogram(
+    'admission_queue_delay_seconds', 'Время ожидания свободного слота для тяжёлого запроса к базе', ['command']
+)
+ADMISSION_DECISIONS = Counter(
+    'admission_decisions', 'Решения по тяжёлым запросам к базе: admitted, rejected или stale (отдан устаревший кэш)',
+    ['command', 'decision']
+)
+DB_QUERY_LATENCY = Histogram(
+    'db_query_duration_seconds', 'Время выполнения SQL-запросов и хранимых функций', ['operation', 'target']
+)
+DB_SLOW_QUERIES = Counter(
+    'db_slow_queries', 'Число запросов дольше порога DB_SLOW_QUERY_MS', ['operation', 'target']
+)
+STEAM_REQUEST_LATENCY = Histogram(
+    'steam_request_duration_seconds', 'Время выполнения запросов к Steam API', ['endpoint']
+)
+STEAM_REQUESTS = Counter(
+    'steam_requests', 'Число запросов к Steam API по кодам ответа', ['endpoint', 'status']
+)
+DB_STATEMENT_TIMEOUTS = Counter(
+    'db_statement_timeouts', 'Число запросов, прерванных statement_timeout по бюджету времени команды',
+    ['operation', 'target']
+)
+HANDLER_TIMEOUTS = Counter(
+    'bot_handler_timeouts', 'Число команд, не уложившихся в бюджет времени', ['handler']
+)
+DB_SERVER_QUERIES = Counter('db_server_queries', 'Число запросов к PostgreSQL по серверам', ['server'])
+DB_REPLICA_ERRORS = Counter(
+    'db_replica_errors', 'Число переключений чтения с реплики на основной сервер из-за ошибок соединения', ['server']
+)
+DB_REPLICA_LAG = Gauge(
+    'db_replica_lag_seconds', 'Отставание реплики по последней активной проверке (DB_REPLICA_PROBE_SECONDS)', ['server']
+)
+CACHE_REQUESTS = Counter(
+    'cache_requests',
+    'Обращения к кэшам по пространствам имён, уровням (l1, l2, stale - последнее значение при перегрузке базы, '
+    'disk - дисковый кэш ответов Steam) и результату',
+    ['namespace', 'tier', 'result']
+)
+CACHE_INVALIDATIONS = Counter(
+    'cache_invalidations', 'Число полученных уведомлений о сбросе кэша (LISTEN cache_invalidation) по типам', ['kind']
+)
+CACHE_SIZE = Gauge('cache_entries', 'Число записей во внутренних кэшах', ['cache'])
+DB_CONNECTIONS = Gauge('db_connections', 'Открытые соединения с PostgreSQL', ['target'])
+INGESTION_QUEUE = Gauge('ingestion_queue_depth', 'Число аккаунтов Steam, ожидающих загрузки библиотеки')
+TELEGRAM_SEND_QUEUE = Gauge('telegram_send_queue_depth', 'Число сообщений, ожидающих отправки в Telegram')
+TELEGRAM_SEND_LATENCY = Histogram(
+    'telegram_send_duration_seconds', 'Время от постановки сообщения в очередь до ответа Telegram', ['priority']
+)
+TELEGRAM_RETRY_AFTER = Counter('telegram_retry_after', 'Число ответов 429 (flood control) от Telegram Bot API')
+DIGEST_MESSAGES = Counter('digest_messages', 'Число сообщений дайджеста обновлений друзей по результату отправки', ['status'])
+
+
+async def metrics_handler(request: web.Request) -> web.Response:
+    return web.Response(text=REGISTRY.render(), content_type='text/plain', charset='utf-8')
+
+
+async def start_metrics_server(port: int, host: str = '0.0.0.0') -> web.AppRunner:
+    """Поднимает HTTP-сервер с метриками в текстовом формате Prometheus на /metrics"""
+    app = web.Application()
+    app.router.add_get('/metrics', metrics_handler)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    return runner
@@ -0,0 +1,126 @@
+import asyncio
+import time
+from typing import Any, Awaitable, Callable, Dict, Iterable
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject
+
+from sources.deadline import DeadlineExceeded, deadline
+from sources.metrics import HANDLER_LATENCY, HANDLER_ERRORS, HANDLER_TIMEOUTS, REQUESTS_COALESCED, REQUESTS_REJECTED
+
+
+def handler_name(data: Dict[str, Any]) -> str:
+    handler = data.get('handler')
+    callback = getattr(handler, 'callback', None)
+    return getattr(callback, '__name__', 'unknown')
+
+
+class MetricsMiddleware(BaseMiddleware):
+    """Замеряет время выполнения каждого обработчика и считает исключения"""
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        name = handler_name(data)
+        start = time.perf_counter()
+        try:
+            return await handler(event, data)
+        except Exception:
+            HANDLER_ERRORS.inc(handler=name)
+            raise
+        finally:
+            HANDLER_LATENCY.observe(time.perf_counter() - start, handler=name)
+
+
+class RequestLimitMiddleware(BaseMiddleware):
+    """Ограничивает тяжёлые команды (обработчики из expensive) для каждого пользователя.
+
+    Повтор запроса, который уже выполняется (тот же пользователь, обработчик и текст), не запускает обработчик
+    ещё раз: он дожидается первого и завершается без ответа - пользователь получит один ответ на все нажатия.
+    Разных тяжёлых запросов одновременно выполняется не больше max_concurrent, на остальные вызывается on_reject.
+    """
+
+    def __init__(self, expensive: Iterable[str], max_concurrent: int = 2,
+                 on_reject: Callable[[TelegramObject], Awaitable[Any]] = None):
+        self.expensive = set(expensive)
+        self.max_concurrent = max_concurrent
+        self.on_reject = on_reject
+        # (user_id, обработчик, текст) -> событие завершения выполняющегося запроса
+        self.in_flight: Dict[tuple, asyncio.Event] = {}
+        # user_id -> число выполняющихся тяжёлых запросов
+        self.running: Dict[int, int] = {}
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        name = handler_name(data)
+        if name not in self.expensive:
+            return await handler(event, data)
+        user = data.get('event_from_user') or getattr(event, 'from_user', None)
+        user_id = user.id if user is not None else None
+        key = (user_id, name, getattr(event, 'text', None))
+
+        pending = self.in_flight.get(key)
+        if pending is not None:
+            REQUESTS_COALESCED.inc(handler=name)
+            await pending.wait()
+            return None
+        if self.running.get(user_id, 0) >= self.max_concurrent:
+            REQUESTS_REJECTED.inc(handler=name)
+            if self.on_reject is not None:
+                await self.on_reject(event)
+            return None
+
+        done = asyncio.Event()
+        self.in_flight[key] = done
+        self.running[user_id] = self.running.get(user_id, 0) + 1
+        try:
+            return await handler(event, data)
+        finally:
+            done.set()
+            del self.in_flight[key]
+            self.running[user_id] -= 1
+            if not self.running[user_id]:
+                del self.running[user_id]
+
+
+class DeadlineMiddleware(BaseMiddleware):
+    """Ограничивает время выполнения команд бюджетами budgets (имя обработчика -> секунды, 0 - без ограничения).
+
+    Бюджет передаётся запросам к базе и Steam через sources.deadline. Если команда не уложилась в него, обработчик
+    отменяется, ещё выполняющиеся запросы к базе прерываются, а пользователю отправляется on_timeout.
+    """
+
+    def __init__(self, budgets: Dict[str, float], default: float = 0,
+                 on_timeout: Callable[[TelegramObject], Awaitable[Any]] = None):
+        self.budgets = budgets
+        self.default = default
+        self.on_timeout = on_timeout
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        name = handler_name(data)
+        seconds = self.budgets.get(name, self.default)
+        if not seconds:
+            return await handler(event, data)
+        with deadline(seconds) as budget:
+            try:
+                async with asyncio.timeout(budget.remaining()):
+                    return await handler(event, data)
+            except (TimeoutError, DeadlineExceeded):
+                budget.cancel()
+        # Ответ о таймауте отправляется уже вне бюджета команды
+        HANDLER_TIMEOUTS.inc(handler=name)
+        if self.on_timeout is not None:
+            await self.on_timeout(event)
+        return None
@@ -0,0 +1,114 @@
+import json
+from typing import Dict, List
+
+from sources.utils import parse_steam_date
+
+try:
+    import orjson
+
+    def dump_json(value) -> str:
+        return orjson.dumps(value).decode()
+except ImportError:
+    def dump_json(value) -> str:
+        return json.dumps(value)
+
+
+class GameRecord:
+    """Строка таблицы games; поля совпадают с колонками таблицы и идут в том же порядке"""
+    __slots__ = (
+        'steam_app_id', 'name', 'release_date', 'required_age',
+        'short_description', 'header_image_url', 'categories',
+        'genres', 'positive', 'negative', 'estimated_owners',
+        'average_playtime_forever', 'average_playtime_2weeks',
+        'median_playtime_forever', 'median_playtime_2weeks', 'tags'
+    )
+    COLUMNS = list(__slots__)
+
+    def __init__(self, steam_app_id: int, name: str, release_date=None, required_age: int = 0,
+                 short_description: str = None, header_image_url: str = None,
+                 categories: List[str] = None, genres: List[str] = None,
+                 positive: int = 0, negative: int = 0, estimated_owners: str = '',
+                 average_playtime_forever: int = 0, average_playtime_2weeks: int = 0,
+                 median_playtime_forever: int = 0, median_playtime_2weeks: int = 0,
+                 tags: Dict[str, int] = None):
+        self.steam_app_id = steam_app_id
+        self.name = name
+        self.release_date = release_date
+        self.required_age = required_age
+        self.short_description = short_description
+        self.header_image_url = header_image_url
+        self.categories = categories if categories is not None else []
+        self.genres = genres if genres is not None else []
+        self.positive = positive
+        self.negative = negative
+        self.estimated_owners = estimated_owners
+        self.average_playtime_forever = average_playtime_forever
+        self.average_playtime_2weeks = average_playtime_2weeks
+        self.median_playtime_forever = median_playtime_forever
+        self.median_playtime_2weeks = median_playtime_2weeks
+        self.tags = tags if tags is not None else {}
+
+    @classmethod
+    def from_appdetails(cls, app_id: int, data: Dict) -> 'GameRecord':
+        """Из поля data ответа appdetails (категории и жанры - списки {'description': ...})"""
+        get = data.get
+        release_date = get('release_date')
+        return cls(
+            int(app_id),
+            get('name'),
+            parse_steam_date(release_date.get('date')) if release_date else None,
+            get('required_age', 0),
+            get('short_description'),
+            get('header_image'),
+            [item['description'] for item in get('categories', ())],
+            [item['description'] for item in get('genres', ())],
+            get('positive', 0),
+            get('negative', 0),
+            get('estimated_owners', ''),
+            get('average_playtime_forever', 0),
+            get('average_playtime_2weeks', 0),
+            get('median_playtime_forever', 0),
+            get('median_playtime_2weeks', 0),
+            get('tags', {})
+        )
+
+    @classmethod
+    def from_catalog(cls, app_id: int, game: Dict) -> 'GameRecord':
+        """Из записи дампа каталога games.json (категории и жанры - списки строк, дата - строка)"""
+        get = game.get
+        return cls(
+            int(app_id),
+            get('name'),
+            parse_steam_date(get('release_date')),
+            get('required_age', 0),
+            get('short_description'),
+            get('header_image'),
+            get('categories', []),
+            get('genres', []),
+            get('positive', 0),
+            get('negative', 0),
+            get('estimated_owners', ''),
+            get('average_playtime_forever', 0),
+            get('average_playtime_2weeks', 0),
+            get('median_playtime_forever', 0),
+            get('median_playtime_2weeks', 0),
+            get('tags', {})
+        )
+
+    def as_row(self) -> tuple:
+        """Значения в порядке COLUMNS; теги сериализуются в JSON для колонки jsonb"""
+        return (
+            self.steam_app_id, self.name, self.release_date, self.required_age,
+            self.short_description, self.header_image_url, self.categories,
+            self.genres, self.positive, self.negative, self.estimated_owners,
+            self.average_playtime_forever, self.average_playtime_2weeks,
+            self.median_playtime_forever, self.median_playtime_2weeks, dump_json(self.tags)
+        )
+
+    def __eq__(self, other):
+        if not isinstance(other, GameRecord):
+            return NotImplemented
+        return all(getattr(self, field) == getattr(other, field) for field in self.__slots__)
+
+    def __repr__(self):
+        return f"GameRecord(steam_app_id={self.steam_app_id!r}, name={self.name!r})"
@@ -0,0 +1,91 @@
+from typing import Any, Dict, Iterable, NamedTuple, Sequence
+
+
+class Query(NamedTuple):
+    """SQL-текст с плейсхолдерами %s и значениями, которые передаются драйверу отдельно"""
+    text: str
+    params: Sequence
+
+
+class PreparedStatement(NamedTuple):
+    """Серверный prepared statement: текст с плейсхолдерами $1..$n"""
+    name: str
+    text: str
+
+
+# Горячие точечные запросы, план которых PostgreSQL кэширует на уровне соединения
+PREPARED_STATEMENTS = {
+    statement.name: statement for statement in (
+        PreparedStatement(
+            'game_info',
+            "SELECT name, short_description, header_image_url, telegram_file_id FROM games WHERE steam_app_id = $1"
+        ),
+        PreparedStatement(
+            'steam_id',
+            "SELECT steam_id FROM bot_users WHERE tg_id = $1"
+        ),
+        PreparedStatement(
+            'existing_games',
+            "SELECT steam_app_id FROM games WHERE steam_app_id = ANY($1)"
+        ),
+        PreparedStatement(
+            'ignored_apps',
+            "SELECT steam_app_id FROM ignored_apps WHERE steam_app_id = ANY($1) AND expires_at > now()"
+        ),
+    )
+}
+
+
+def _placeholders(count: int) -> str:
+    return ', '.join(['%s'] * count)
+
+
+def _conditions(where: Dict[str, Any]) -> str:
+    return ' AND '.join(f"{column} = %s" for column in where)
+
+
+def build_select(attributes: Iterable[str], table: str, where: Dict[str, Any] = None) -> Query:
+    text = f"SELECT {', '.join(attributes)} FROM {table}"
+    if not where:
+        return Query(text, ())
+    return Query(f"{text} WHERE {_conditions(where)}", tuple(where.values()))
+
+
+def build_insert(attributes: Sequence[str], table: str, data: Sequence) -> Query:
+    return Query(f"INSERT INTO {table} ({', '.join(attributes)}) VALUES ({_placeholders(len(data))})", data)
+
+
+def build_insert_many(attributes: Sequence[str], table: str, rows: Sequence[Sequence]) -> Query:
+    """Многострочная вставка: единственный %s раскрывается в список VALUES через execute_values"""
+    return Query(f"INSERT INTO {table} ({', '.join(attributes)}) VALUES %s", rows)
+
+
+def build_upsert_many(attributes: Sequence[str], table: str, rows: Sequence[Sequence], conflict: Sequence[str],
+                      assignments: Dict[str, str]) -> Query:
+    """Многострочная вставка, которая обновляет уже существующие строки (ON CONFLICT ... DO UPDATE).
+    assignments - выражения SQL для обновляемых столбцов, новые значения доступны как EXCLUDED.<столбец>"""
+    updates = ', '.join(f"{column} = {expression}" for column, expression in assignments.items())
+    return Query(
+        f"{build_insert_many(attributes, table, rows).text} ON CONFLICT ({', '.join(conflict)}) DO UPDATE SET {updates}",
+        rows
+    )
+
+
+def build_update(attributes: Sequence[str], table: str, data: Sequence, where: Dict[str, Any]) -> Query:
+    assignments = ', '.join(f"{column} = %s" for column in attributes)
+    return Query(
+        f"UPDATE {table} SET {assignments} WHERE {_conditions(where)}",
+        tuple(data) + tuple(where.values())
+    )
+
+
+def build_delete(table: str, ids: Iterable, id_column: str = 'id') -> Query:
+    return Query(f"DELETE FROM {table} WHERE {id_column} = ANY(%s)", (list(ids),))
+
+
+def build_function_call(function: str, attributes: Iterable[str], params: Sequence) -> Query:
+    return Query(f"SELECT {', '.join(attributes)} FROM {function}({_placeholders(len(params))})", tuple(params))
+
+
+def build_execute(statement: PreparedStatement, params: Sequence) -> Query:
+    return Query(f"EXECUTE {statement.name} ({_placeholders(len(params))})", tuple(params))
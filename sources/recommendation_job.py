@@ -0,0 +1,80 @@
+# Пакетный пересчёт рекомендаций для всех пользователей бота с привязанным Steam id.
+# Пользователи делятся на пачки, пачки обрабатываются параллельно в отдельных процессах (у каждого своё соединение
+# с PostgreSQL), результат сохраняется в user_recommendations, откуда его отдаёт get_recommendations.
+#
+# Запуск (из корня репозитория):
+#   python -m sources.recommendation_job --workers 4
+#   python -m sources.recommendation_job --every-hours 24   # пересчёт раз в сутки
+import argparse
+import logging
+import time
+from multiprocessing import Pool
+from typing import Iterator, List
+
+from dotenv import load_dotenv
+
+from sources.sharding import create_db_client
+
+logger = logging.getLogger(__name__)
+
+# Соединение процесса-обработчика, создаётся один раз при его запуске
+_db_client = None
+
+
+def init_worker():
+    global _db_client
+    _db_client = create_db_client()
+
+
+def refresh_chunk(args: tuple) -> int:
+    steam_ids, limit = args
+    return _db_client.refresh_recommendations(steam_ids, limit)
+
+
+def chunks(items: List[int], size: int) -> Iterator[List[int]]:
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def run(workers: int = 4, chunk_size: int = 50, limit: int = 20) -> int:
+    """Пересчитывает рекомендации всех привязанных пользователей, возвращает их число"""
+    steam_ids = create_db_client().get_linked_steam_ids()
+    tasks = [(chunk, limit) for chunk in chunks(steam_ids, chunk_size)]
+    start = time.perf_counter()
+    refreshed = 0
+    with Pool(workers, initializer=init_worker) as pool:
+        for count in pool.imap_unordered(refresh_chunk, tasks):
+            refreshed += count
+    logger.info(
+        "Рекомендации пересчитаны для %s пользователей за %.1f с", refreshed, time.perf_counter() - start
+    )
+    return refreshed
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Пересчёт рекомендаций для всех пользователей бота")
+    parser.add_argument("--workers", type=int, default=4, help="число процессов")
+    parser.add_argument("--chunk-size", type=int, default=50, help="пользователей в одной пачке")
+    parser.add_argument("--limit", type=int, default=20, help="число сохраняемых рекомендаций на пользователя")
+    parser.add_argument("--every-hours", type=float, default=0, help="повторять раз в N часов (0 - один запуск)")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    logging.basicConfig(level=logging.INFO)
+    load_dotenv("params.env")
+    args = parse_args(argv)
+    while True:
+        try:
+            run(args.workers, args.chunk_size, args.limit)
+        except Exception:
+            if not args.every_hours:
+                raise
+            logger.exception("Ошибка при пересчёте рекомендаций")
+        if not args.every_hours:
+            break
+        time.sleep(args.every_hours * 3600)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Callable, Dict
+
+from sources.cache import parse_ttls
+
+logger = logging.getLogger(__name__)
+
+# Сколько хранить ответы по умолчанию: библиотеки и профили меняются чаще, чем данные магазина
+DEFAULT_TTLS = {
+    'appdetails': 7 * 86400,
+    'GetItems': 7 * 86400,
+    'GetTagList': 7 * 86400,
+    'GetStoreCategories': 7 * 86400,
+    'GetOwnedGames': 6 * 3600,
+    'GetPlayerSummaries': 86400,
+    'GetFriendList': 6 * 3600,
+    'featuredcategories': 600,
+}
+
+
+class ResponseCache:
+    """Постоянный кэш тел ответов Steam в SQLite, ключ - эндпоинт и параметры запроса.
+
+    Срок хранения задаётся по эндпоинтам (эндпоинты без TTL не кэшируются), общий объём ограничен max_bytes:
+    при превышении удаляются записи, к которым дольше всего не обращались.
+    В режиме replay сроки не проверяются, а промах означает, что записанного ответа нет и сеть не используется.
+    Методы блокируют поток на время работы с диском, поэтому асинхронный код вызывает их через asyncio.to_thread;
+    у кэша одно собственное соединение, обращения к нему из разных потоков выполняются по очереди под lock.
+    """
+
+    def __init__(self, path: str, ttls: Dict[str, float] = None, max_bytes: int = 256 * 1024 * 1024,
+                 replay: bool = False, clock: Callable[[], float] = time.time):
+        self.path = path
+        self.ttls = dict(DEFAULT_TTLS if ttls is None else ttls)
+        self.max_bytes = max_bytes
+        self.replay = replay
+        self.clock = clock
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute(
+            """CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                endpoint TEXT NOT NULL,
+                body BLOB NOT NULL,
+                size INTEGER NOT NULL,
+                stored_at REAL NOT NULL,
+                accessed_at REAL NOT NULL
+            )"""
+        )
+        self.connection.execute("CREATE INDEX IF NOT EXISTS responses_accessed_at ON responses (accessed_at)")
+        self.connection.commit()
+        self.total_bytes = self.connection.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+
+    def __len__(self):
+        with self.lock:
+            return self.connection.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+
+    def caches(self, endpoint: str) -> bool:
+        return self.replay or self.ttls.get(endpoint, 0) > 0
+
+    def get(self, endpoint: str, key: str) -> bytes | None:
+        with self.lock:
+            return self._get(endpoint, key)
+
+    def _get(self, endpoint: str, key: str) -> bytes | None:
+        row = self.connection.execute(
+            "SELECT body, stored_at FROM responses WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None:
+            return None
+        body, stored_at = row
+        now = self.clock()
+        if not self.replay and stored_at + self.ttls.get(endpoint, 0) <= now:
+            self._delete(key)
+            return None
+        if not self.replay:
+            self.connection.execute("UPDATE responses SET accessed_at = ? WHERE key = ?", (now, key))
+            self.connection.commit()
+        return body
+
+    def put(self, endpoint: str, key: str, body: bytes):
+        if self.replay or len(body) > self.max_bytes:
+            return
+        with self.lock:
+            self._put(endpoint, key, body)
+
+    def _put(self, endpoint: str, key: str, body: bytes):
+        now = self.clock()
+        previous = self.connection.execute("SELECT size FROM responses WHERE key = ?", (key,)).fetchone()
+        self.connection.execute(
+            "INSERT OR REPLACE INTO responses (key, endpoint, body, size, stored_at, accessed_at) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (key, endpoint, body, len(body), now, now)
+        )
+        self.total_bytes += len(body) - (previous[0] if previous else 0)
+        self._evict()
+        self.connection.commit()
+
+    def _delete(self, key: str):
+        row = self.connection.execute("DELETE FROM responses WHERE key = ? RETURNING size", (key,)).fetchone()
+        if row is not None:
+            self.total_bytes -= row[0]
+        self.connection.commit()
+
+    def _evict(self):
+        """Удаляет давно не использованные записи, пока объём больше max_bytes"""
+        if self.total_bytes <= self.max_bytes:
+            return
+        excess = self.total_bytes - self.max_bytes
+        keys = []
+        for key, size in self.connection.execute("SELECT key, size FROM responses ORDER BY accessed_at"):
+            keys.append((key,))
+            excess -= size
+            self.total_bytes -= size
+            if excess <= 0:
+                break
+        self.connection.executemany("DELETE FROM responses WHERE key = ?", keys)
+        logger.info("Из кэша ответов Steam удалено %s записей", len(keys))
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
+
+
+def create_response_cache() -> ResponseCache | None:
+    """Кэш ответов по настройкам из окружения, None - если STEAM_RESPONSE_CACHE не задан"""
+    path = os.getenv('STEAM_RESPONSE_CACHE')
+    if not path:
+        return None
+    ttls = os.getenv('STEAM_RESPONSE_CACHE_TTLS')
+    return ResponseCache(
+        path,
+        ttls=parse_ttls(ttls) if ttls else None,
+        max_bytes=int(float(os.getenv('STEAM_RESPONSE_CACHE_MAX_MB', 256)) * 1024 * 1024),
+        replay=os.getenv('STEAM_RESPONSE_REPLAY', '0') == '1',
+    )
@@ -0,0 +1,167 @@
+import heapq
+import re
+from bisect import bisect_left, bisect_right
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+# Telegram принимает не более 50 результатов на один inline-запрос
+MAX_RESULTS = 50
+# Диапазоны длиннее этого числа ключей не ранжируются на каждое нажатие клавиши: лучшие игры
+# для таких префиксов считаются заранее при построении индекса
+MAX_SCAN = 20000
+
+WORD_RE = re.compile(r'\w+')
+
+
+def normalize(text: str) -> str:
+    """Нижний регистр, знаки препинания заменяются пробелами: 'Counter-Strike: GO' -> 'counter strike go'"""
+    return ' '.join(WORD_RE.findall(text.lower()))
+
+
+class GameNameIndex:
+    """Префиксный индекс названий игр в памяти.
+
+    Ключи - хвосты нормализованного названия, начинающиеся с каждого слова ('the witcher 3', 'witcher 3', '3'),
+    хранятся в отсортированном списке, поэтому поиск по префиксу любого слова - это bisect и просмотр подряд идущих ключей.
+    Построенный индекс не меняется: изменения собираются в новый экземпляр (updated), который подменяет старый.
+    """
+
+    def __init__(self):
+        self.keys: List[str] = []
+        self.ids: List[int] = []
+        # app_id -> (название, число положительных отзывов, нормализованное название)
+        self.games = {}
+        # Префикс, ключей с которым больше MAX_SCAN -> MAX_RESULTS лучших игр по rank
+        self.top: Dict[str, List[int]] = {}
+
+    def __len__(self):
+        return len(self.games)
+
+    @staticmethod
+    def _suffixes(normalized: str) -> List[str]:
+        words = normalized.split(' ')
+        return [' '.join(words[i:]) for i in range(len(words))]
+
+    def build(self, games: Iterable[Tuple[int, str, int]]):
+        """Строит индекс заново по строкам (steam_app_id, name, positive)"""
+        self.games = {}
+        entries = []
+        for app_id, name, positive in games:
+            normalized = normalize(name or '')
+            if not normalized:
+                continue
+            self.games[app_id] = (name, positive or 0, normalized)
+            entries.extend((key, app_id) for key in self._suffixes(normalized))
+        entries.sort()
+        self.keys = [key for key, _ in entries]
+        self.ids = [app_id for _, app_id in entries]
+        self._build_top()
+
+    def updated(self, games: Iterable[Tuple[int, str, int]]) -> 'GameNameIndex':
+        """Новый индекс с добавленными или обновлёнными играми (steam_app_id, name, positive).
+
+        Текущий индекс не меняется, поэтому новый можно строить в потоке, пока по текущему идёт поиск.
+        Ключи переименованных и новых игр сливаются с остальными за один проход без полной сортировки.
+        """
+        index = GameNameIndex()
+        index.games = dict(self.games)
+        changed, renamed = set(), {}
+        for app_id, name, positive in games:
+            normalized = normalize(name or '')
+            if not normalized:
+                continue
+            previous = index.games.get(app_id)
+            index.games[app_id] = (name, positive or 0, normalized)
+            changed.add(app_id)
+            if previous is None or previous[2] != normalized:
+                renamed[app_id] = normalized
+        if renamed:
+            added = sorted(
+                (key, app_id) for app_id, normalized in renamed.items() for key in self._suffixes(normalized)
+            )
+            kept = ((key, app_id) for key, app_id in zip(self.keys, self.ids) if app_id not in renamed)
+            entries = list(heapq.merge(kept, added))
+            index.keys = [key for key, _ in entries]
+            index.ids = [app_id for _, app_id in entries]
+        else:
+            # Изменилась только популярность: списки ключей не меняются и общие у обоих индексов
+            index.keys, index.ids = self.keys, self.ids
+        index._build_top(self, changed)
+        return index
+
+    def _range(self, prefix: str, start: int = 0) -> Tuple[int, int]:
+        start = bisect_left(self.keys, prefix, start)
+        # Все ключи с префиксом prefix идут подряд и меньше prefix + максимальный символ
+        return start, bisect_left(self.keys, prefix + '\U0010ffff', start)
+
+    def _rank(self, prefix: str):
+        games = self.games
+
+        def rank(app_id: int) -> tuple:
+            name, positive, normalized = games[app_id]
+            group = 0 if normalized == prefix else 1 if normalized.startswith(prefix) else 2
+            return group, -positive, len(normalized), app_id
+
+        return rank
+
+    def _ranked(self, prefix: str, start: int, end: int, limit: int) -> List[int]:
+        return heapq.nsmallest(limit, set(self.ids[start:end]), key=self._rank(prefix))
+
+    def _build_top(self, previous: Optional['GameNameIndex'] = None, changed: Set[int] = frozenset()):
+        """Ранжирует заранее диапазоны префиксов, ключей с которыми больше MAX_SCAN.
+
+        У частого префикса частые и все его начала, поэтому они ищутся по уровням: префиксы длины n + 1
+        перебираются только внутри диапазонов частых префиксов длины n.
+        """
+        self.top = {}
+        ranges = [('', 0, len(self.keys))]
+        while ranges:
+            heavy = []
+            for parent, start, end in ranges:
+                position = start
+                while position < end:
+                    prefix = self.keys[position][:len(parent) + 1]
+                    if prefix == parent:
+                        # Ключ, равный самому префиксу, короче следующего уровня
+                        position = bisect_right(self.keys, prefix, position, end)
+                        continue
+                    _, stop = self._range(prefix, position)
+                    if stop - position > MAX_SCAN:
+                        heavy.append((prefix, position, stop))
+                        top = self._updated_top(prefix, previous, changed)
+                        self.top[prefix] = top if top is not None else self._ranked(prefix, position, stop, MAX_RESULTS)
+                    position = stop
+            ranges = heavy
+
+    def _updated_top(self, prefix: str, previous: 'GameNameIndex', changed: Set[int]) -> Optional[List[int]]:
+        """Лучшие игры префикса из лучших игр прежнего индекса и изменившихся игр, без просмотра диапазона.
+
+        Неизменившиеся игры вне прежнего списка не лучше его игр, пока ни одна из них не опустилась в рейтинге;
+        иначе (и для нового частого префикса) возвращает None, и диапазон ранжируется заново.
+        """
+        if previous is None or prefix not in previous.top:
+            return None
+        old_rank, rank = previous._rank(prefix), self._rank(prefix)
+        top = previous.top[prefix]
+        if any(app_id in changed and rank(app_id) > old_rank(app_id) for app_id in top):
+            return None
+        matched = [
+            app_id for app_id in changed
+            if any(key.startswith(prefix) for key in self._suffixes(self.games[app_id][2]))
+        ]
+        return heapq.nsmallest(MAX_RESULTS, set(top).union(matched), key=rank)
+
+    def search(self, query: str, limit: int = MAX_RESULTS) -> List[Tuple[int, str]]:
+        """Игры, в названии которых есть слово с префиксом query.
+
+        Сначала точное совпадение, затем названия, начинающиеся с query, затем совпадения с середины названия;
+        внутри группы - по числу положительных отзывов и длине названия.
+        """
+        prefix = normalize(query)
+        if not prefix:
+            return []
+        start, end = self._range(prefix)
+        if end - start > MAX_SCAN and limit <= MAX_RESULTS:
+            found = self.top[prefix][:limit]
+        else:
+            found = self._ranked(prefix, start, end, limit)
+        return [(app_id, self.games[app_id][0]) for app_id in found]
@@ -0,0 +1,179 @@
+import asyncio
+import itertools
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Set
+
+from aiogram.exceptions import TelegramRetryAfter
+
+from sources.metrics import TELEGRAM_RETRY_AFTER, TELEGRAM_SEND_LATENCY
+
+logger = logging.getLogger(__name__)
+
+# Приоритеты отправки: ответы на команды пользователя уходят раньше массовых рассылок
+INTERACTIVE = 0
+BULK = 1
+
+# Сколько ведер чатов хранить, прежде чем удалять ведра простаивающих чатов
+MAX_CHAT_BUCKETS = 10000
+
+
+class TokenBucket:
+    """Ведро токенов: пополняется со скоростью rate токенов в секунду, вмещает не более capacity"""
+
+    def __init__(self, rate: float, capacity: float, clock: Callable[[], float] = time.monotonic):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.clock = clock
+        self.updated = clock()
+
+    def _refill(self):
+        now = self.clock()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self) -> float:
+        """Через сколько секунд появится токен, 0 - если он есть сейчас"""
+        self._refill()
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def take(self):
+        self._refill()
+        self.tokens -= 1
+
+    def is_full(self) -> bool:
+        self._refill()
+        return self.tokens >= self.capacity
+
+
+class SendScheduler:
+    """Общая очередь исходящих вызовов Telegram Bot API.
+
+    Ограничивает общую частоту отправки (global_rate в секунду) и частоту для каждого чата (chat_rate),
+    задания с меньшим priority отправляются раньше, внутри приоритета - в порядке постановки.
+    Если лимит чата исчерпан, задание откладывается, не задерживая отправку в другие чаты.
+    В один чат одновременно отправляется не больше одного задания: пока задание чата ждёт лимита или отправляется,
+    остальные задания этого чата ждут в стороне, поэтому сообщения приходят в порядке постановки.
+    При ответе 429 (TelegramRetryAfter) вся отправка приостанавливается на retry_after секунд, а задание повторяется.
+    Обработчики запускаются при первой отправке, чтобы планировщик можно было создать вне event loop.
+    """
+
+    def __init__(self, global_rate: float = 30, global_burst: float = 5, chat_rate: float = 1,
+                 chat_burst: float = 3, workers: int = 4, max_retries: int = 3,
+                 clock: Callable[[], float] = time.monotonic):
+        self.global_bucket = TokenBucket(global_rate, global_burst, clock)
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.chat_buckets: Dict[Hashable, TokenBucket] = {}
+        # Чаты, задание которых сейчас ждёт лимита чата или отправляется, и отложенные до его завершения задания
+        self.busy_chats: Set[Hashable] = set()
+        self.parked: Dict[Hashable, List[tuple]] = {}
+        self.workers = workers
+        self.max_retries = max_retries
+        self.clock = clock
+        self.queue = asyncio.PriorityQueue()
+        self.counter = itertools.count()
+        self.paused_until = 0.0
+        # Задания, которые ещё не отправлены (в очереди или отложены из-за лимита чата)
+        self.pending = 0
+        self.tasks: List[asyncio.Task] = []
+
+    async def send(self, chat_id: Hashable, call: Callable[[], Awaitable[Any]], priority: int = INTERACTIVE) -> Any:
+        """Ставит вызов Bot API в очередь и возвращает его результат (или исключение).
+
+        call - функция без аргументов, создающая запрос, например lambda: message.answer(text)
+        """
+        self._start_workers()
+        future = asyncio.get_running_loop().create_future()
+        self.pending += 1
+        self.queue.put_nowait((priority, next(self.counter), chat_id, call, future, 0, self.clock()))
+        return await future
+
+    def _start_workers(self):
+        self.tasks = [task for task in self.tasks if not task.done()]
+        for _ in range(self.workers - len(self.tasks)):
+            self.tasks.append(asyncio.create_task(self._worker()))
+
+    def _chat_bucket(self, chat_id: Hashable) -> TokenBucket:
+        bucket = self.chat_buckets.get(chat_id)
+        if bucket is None:
+            if len(self.chat_buckets) >= MAX_CHAT_BUCKETS:
+                self.chat_buckets = {
+                    key: value for key, value in self.chat_buckets.items() if not value.is_full()
+                }
+            bucket = self.chat_buckets[chat_id] = TokenBucket(self.chat_rate, self.chat_burst, self.clock)
+        return bucket
+
+    async def _worker(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            item = await self.queue.get()
+            priority, number, chat_id, call, future, attempt, queued_at = item
+            if future.done():
+                self.pending -= 1
+                continue
+
+            if chat_id in self.busy_chats:
+                self.parked.setdefault(chat_id, []).append(item)
+                continue
+            self.busy_chats.add(chat_id)
+
+            chat_bucket = self._chat_bucket(chat_id)
+            wait = chat_bucket.delay()
+            if wait > 0:
+                loop.call_later(wait, self._release_chat, chat_id, item)
+                continue
+
+            try:
+                pause = self.paused_until - self.clock()
+                if pause > 0:
+                    await asyncio.sleep(pause)
+                wait = self.global_bucket.delay()
+                while wait > 0:
+                    await asyncio.sleep(wait)
+                    wait = self.global_bucket.delay()
+                self.global_bucket.take()
+                chat_bucket.take()
+
+                try:
+                    result = await call()
+                except TelegramRetryAfter as e:
+                    TELEGRAM_RETRY_AFTER.inc()
+                    logger.warning("Telegram ограничил частоту отправки, пауза %s с", e.retry_after)
+                    self.paused_until = max(self.paused_until, self.clock() + e.retry_after)
+                    if attempt < self.max_retries:
+                        self.queue.put_nowait((priority, number, chat_id, call, future, attempt + 1, queued_at))
+                        continue
+                    self._finish(future, queued_at, priority, exception=e)
+                except Exception as e:
+                    self._finish(future, queued_at, priority, exception=e)
+                else:
+                    self._finish(future, queued_at, priority, result=result)
+            finally:
+                self._release_chat(chat_id)
+
+    def _release_chat(self, chat_id: Hashable, item: tuple = None):
+        """Освобождает чат и возвращает в очередь его отложенные задания; порядок между ними восстановит
+        приоритетная очередь по (priority, номер постановки)"""
+        self.busy_chats.discard(chat_id)
+        if item is not None:
+            self.queue.put_nowait(item)
+        for parked in self.parked.pop(chat_id, []):
+            self.queue.put_nowait(parked)
+
+    def _finish(self, future: asyncio.Future, queued_at: float, priority: int, result=None, exception=None):
+        self.pending -= 1
+        TELEGRAM_SEND_LATENCY.observe(self.clock() - queued_at, priority='interactive' if priority == INTERACTIVE else 'bulk')
+        if future.done():
+            return
+        if exception is not None:
+            future.set_exception(exception)
+        else:
+            future.set_result(result)
+
+    async def close(self):
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        self.tasks = []
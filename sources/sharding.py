@@ -0,0 +1,216 @@
+# Шардированный режим хранения данных пользователей Steam.
+# steam_users, user_games и friends распределяются по нескольким базам по хэшу Steam id, games копируется на все шарды,
+# а таблицы бота (bot_users, ignored_apps, digest_log) остаются в основной базе.
+# Режим включается переменной DB_SHARD_DSNS (DSN шардов через запятую), без неё используется обычный PgsqlApiClient.
+import os
+import zlib
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, Iterator, List, Set
+from dotenv import load_dotenv
+
+from sources.database_api import (
+    GAME_CONFLICT, GAME_UPDATES, USER_GAME_COLUMNS, USER_GAME_CONFLICT, USER_GAME_UPDATES, PgsqlApiClient, game_rows,
+    user_game_rows
+)
+from sources.database_client import PgsqlClient
+from sources.models import GameRecord
+
+STEAM_USER_COLUMNS = ['steam_user_id', 'username', 'profile_url', 'avatarmedium_url']
+
+# Уведомления об изменениях, которые приходят с шардов; игры отслеживаются по основной базе
+SHARD_INVALIDATION_KINDS = {'library', 'recommendations'}
+
+
+def shard_index(steam_id: int, shards: int) -> int:
+    """Номер шарда для Steam id: crc32 от id, чтобы соседние id распределялись равномерно"""
+    return zlib.crc32(int(steam_id).to_bytes(8, 'big')) % shards
+
+
+class ShardedPgsqlApiClient(PgsqlApiClient):
+    """PgsqlApiClient, который хранит данные пользователей Steam на шардах.
+
+    Связь друзей записывается на шарды обоих пользователей (вместе с записью steam_users без профиля, чтобы
+    выполнялись внешние ключи), поэтому список друзей читается с одного шарда. Лента обновлений друзей
+    (friend_feed) пополняется на шарде друга, когда в его библиотеке появляются игры, поэтому её части читаются
+    параллельно со всех шардов (get_friend_feed_partial) и объединяются здесь.
+    """
+
+    def __init__(self, env: str = None, shard_dsns: List[str] = None):
+        super().__init__(env)
+        if shard_dsns is None:
+            shard_dsns = [dsn.strip() for dsn in os.getenv('DB_SHARD_DSNS', '').split(',') if dsn.strip()]
+        if not shard_dsns:
+            raise ValueError("Не заданы DSN шардов (DB_SHARD_DSNS)")
+        self.shards = [PgsqlClient(dsn=dsn) for dsn in shard_dsns]
+        # Каждый шард в параллельном запросе выполняется в своём потоке на соединении из пула шарда
+        self.executor = ThreadPoolExecutor(max_workers=len(self.shards), thread_name_prefix='shard')
+
+    def resize_pool(self, size: int):
+        super().resize_pool(size)
+        for shard in self.shards:
+            shard.resize_pool(size)
+
+    def shard_for(self, steam_id: int) -> PgsqlClient:
+        return self.shards[shard_index(steam_id, len(self.shards))]
+
+    def _group_by_shard(self, steam_ids: Iterable[int]) -> Dict[int, List[int]]:
+        groups = defaultdict(list)
+        for steam_id in steam_ids:
+            groups[shard_index(steam_id, len(self.shards))].append(steam_id)
+        return groups
+
+    def add_games(self, games: List[GameRecord]):
+        super().add_games(games)
+        rows = game_rows(games)
+        for shard in self.shards:
+            shard.upsert_many(GameRecord.COLUMNS, 'games', rows, GAME_CONFLICT, GAME_UPDATES)
+
+    def add_steam_users(self, data: List[Dict]):
+        rows = defaultdict(list)
+        for item in data:
+            rows[shard_index(item['steamid'], len(self.shards))].append(
+                [item['steamid'], item['personaname'], item['profileurl'], item['avatarmedium']]
+            )
+        for index, shard_rows in rows.items():
+            self.shards[index].insert_many(STEAM_USER_COLUMNS, 'steam_users', shard_rows)
+
+    def add_steam_friends(self, id: int, ids: List[int]):
+        edges = defaultdict(list)
+        users = defaultdict(set)
+        for item in ids:
+            edge = [min(id, item), max(id, item)]
+            for index in {shard_index(id, len(self.shards)), shard_index(item, len(self.shards))}:
+                edges[index].append(edge)
+                users[index].update(edge)
+        for index, shard_edges in edges.items():
+            shard = self.shards[index]
+            # Пользователи с других шардов - записи без профиля (upsert_steam_user не затирает существующий)
+            shard.insert_many(['steam_user_id'], 'steam_users', [[user] for user in sorted(users[index])])
+            shard.insert_many(['user1', 'user2'], 'friends', shard_edges)
+        self.pin_to_primary(id)
+
+    def add_user_games(self, user_id: int, games_info: List):
+        self.shard_for(user_id).upsert_many(
+            USER_GAME_COLUMNS, 'user_games', user_game_rows(user_id, games_info), USER_GAME_CONFLICT, USER_GAME_UPDATES
+        )
+        self.pin_to_primary(user_id)
+
+    def link_steam_id(self, tg_id: int, steam_id: int):
+        # bot_users ссылается на steam_users основной базы, поэтому профиль привязанного пользователя копируется туда
+        rows = self.shard_for(steam_id).select(STEAM_USER_COLUMNS, 'steam_users', {'steam_user_id': steam_id})[0]
+        self.insert_many(STEAM_USER_COLUMNS, 'steam_users', rows or [[steam_id, None, None, None]])
+        super().link_steam_id(tg_id, steam_id)
+
+    def get_friend_ids(self, steam_id: int) -> List[int]:
+        return [
+            row[0] for row in self.shard_for(steam_id).call_function('get_friend_ids', ['friend_id'], (steam_id,))
+        ]
+
+    def get_friend_ids_many(self, steam_ids: List[int]) -> Dict[int, List[int]]:
+        groups = self._group_by_shard(steam_ids)
+        friends = {steam_id: [] for steam_id in steam_ids}
+        partials = self.executor.map(
+            lambda index: self.shards[index].call_function(
+                'get_friend_ids_many', ['user_id', 'friend_id'], (groups[index],)
+            ),
+            groups
+        )
+        for rows in partials:
+            for user_id, friend_id in rows:
+                friends[user_id].append(friend_id)
+        return friends
+
+    def invalidation_sources(self) -> List:
+        # Библиотеки и рекомендации меняются на шардах, игры и пользователи бота - в основной базе
+        return super().invalidation_sources() + [shard.get_connection for shard in self.shards]
+
+    def invalidation_kinds(self) -> List[Set[str] | None]:
+        # Копии games на шардах уведомляют о тех же играх, что и основная база
+        return super().invalidation_kinds() + [SHARD_INVALIDATION_KINDS] * len(self.shards)
+
+    def _friend_games(self, user_id: int, days_ago: int = 14) -> List[tuple]:
+        """Недавние игры друзей, которых нет у пользователя: (game_id, game_name, friends_count),
+        в порядке get_top_new_friend_games"""
+        home = self.shard_for(user_id)
+        owned = {row[0] for row in home.select(['game_id'], 'user_games', {'user_id': user_id})[0]}
+        partials = self.executor.map(
+            lambda shard: shard.call_function(
+                'get_friend_feed_partial', ['game_id', 'game_name', 'friends_count', 'playtime', 'last_added'],
+                (user_id, days_ago)
+            ),
+            self.shards
+        )
+        merged = {}
+        for rows in partials:
+            for game_id, name, friends_count, playtime, last_added in rows:
+                if game_id in owned:
+                    continue
+                if game_id in merged:
+                    _, count, total, latest = merged[game_id]
+                    merged[game_id] = (name, count + friends_count, total + playtime, max(latest, last_added))
+                else:
+                    merged[game_id] = (name, friends_count, playtime, last_added)
+        ranked = sorted(
+            merged.items(), key=lambda item: (-item[1][1], -item[1][2], -item[1][3].timestamp(), item[0])
+        )
+        return [(game_id, name, count) for game_id, (name, count, _, _) in ranked]
+
+    def get_friends_updates(self, user_id: int) -> List[tuple[int, str]]:
+        return [(game_id, name) for game_id, name, _ in self._friend_games(user_id)[:5]]
+
+    def compact_friend_feed(self) -> tuple[int, int]:
+        deleted = recomputed = 0
+        for shard in self.shards:
+            rows = shard.call_function('compact_friend_feed', ['deleted', 'recomputed'], (), readonly=False)
+            deleted += rows[0][0]
+            recomputed += rows[0][1]
+        return deleted, recomputed
+
+    def iter_friends_digest(self, limit: int = 5, days_ago: int = 14, partitions: int = 1,
+                            partition: int = 0) -> Iterator[tuple]:
+        """Дайджест по пользователям бота: обновления друзей каждого из них собираются с шардов.
+        Вызывается из потока (FriendsDigest читает часть целиком), журнал отправленных игр читается один раз"""
+        linked = sorted(self.select(['tg_id', 'steam_id'], 'bot_users')[0])
+        sent = defaultdict(set)
+        for tg_id, game_id in self.select(['tg_id', 'game_id'], 'digest_log')[0]:
+            if tg_id % partitions == partition:
+                sent[tg_id].add(game_id)
+        for tg_id, steam_id in linked:
+            if steam_id is None or tg_id % partitions != partition:
+                continue
+            games = [game for game in self._friend_games(steam_id, days_ago) if game[0] not in sent[tg_id]]
+            for game_id, name, friends_count in games[:limit]:
+                yield tg_id, game_id, name, friends_count
+
+    def get_recommendations(self, steam_user_id: int, limit: int = 5, mode: str = None) -> List[tuple]:
+        function, params = self._recommendations_call(steam_user_id, limit, mode)
+        return self.shard_for(steam_user_id).call_function(function, ['app_id', 'game_name'], params)
+
+    def iter_library_pairs(self) -> Iterator[tuple[int, int]]:
+        # Библиотека каждого пользователя хранится только на его шарде, поэтому пары не повторяются
+        for shard in self.shards:
+            yield from shard.stream_function('get_library_pairs', ['user_id', 'game_id'], (), itersize=10000)
+
+    def neighbor_databases(self) -> List[PgsqlClient]:
+        # Соседи нужны запросу рекомендаций рядом с user_games, поэтому копируются на все шарды, как games
+        return super().neighbor_databases() + self.shards
+
+    def refresh_recommendations(self, steam_user_ids: List[int], limit: int = 20) -> int:
+        refreshed = 0
+        for index, ids in self._group_by_shard(steam_user_ids).items():
+            result = self.shards[index].call_function(
+                'refresh_user_recommendations', ['refresh_user_recommendations'], (ids, limit), readonly=False
+            )
+            refreshed += result[0][0]
+        return refreshed
+
+
+def create_db_client(env: str = None) -> PgsqlApiClient:
+    """Клиент базы данных: шардированный, если заданы DB_SHARD_DSNS, иначе обычный"""
+    if env is not None:
+        # Переменные нужны до выбора класса, поэтому файл загружается здесь, а не только в PgsqlClient
+        load_dotenv(env)
+    if os.getenv('DB_SHARD_DSNS', '').strip():
+        return ShardedPgsqlApiClient(env)
+    return PgsqlApiClient(env)
@@ -1,19 +1,134 @@
+import json
+import time
+import asyncio
 import aiohttp
-from typing import Dict, List, Optional, Set
+from datetime import datetime, timezone
+from typing import AsyncIterator, Callable, Dict, List, Optional, Set
+
+from sources.deadline import DeadlineExceeded, remaining
+from sources.metrics import CACHE_REQUESTS, STEAM_REQUEST_LATENCY, STEAM_REQUESTS
+from sources.models import GameRecord
+
+try:
+    import orjson
+    DEFAULT_JSON_LOADS = orjson.loads
+except ImportError:
+    DEFAULT_JSON_LOADS = json.loads
+
+# GetPlayerSummaries принимает не более 100 steamid за один запрос
+PLAYER_SUMMARIES_CHUNK = 100
+# Группы полей appdetails, из которых add_game берёт данные; без фильтра приходят скриншоты, видео и т.п.
+APPDETAILS_FILTERS = 'basic,release_date,categories,genres'
+# Число приложений в одном запросе IStoreBrowseService/GetItems
+STORE_ITEMS_CHUNK = 50
+STORE_ASSETS_URL = "https://shared.akamai.steamstatic.com/store_item_assets/"
+# Обложка приложения по id без запроса к Steam (используется как миниатюра в inline-режиме)
+HEADER_IMAGE_URL = STORE_ASSETS_URL + "steam/apps/{app_id}/header.jpg"
+# Жанры Steam Store; GetItems не возвращает жанры отдельно, они совпадают с одноимёнными тегами
+STORE_GENRES = {
+    'Action', 'Adventure', 'Casual', 'Early Access', 'Free to Play', 'Indie', 'Massively Multiplayer',
+    'Racing', 'RPG', 'Simulation', 'Sports', 'Strategy'
+}
+
+class SteamAPIError(Exception):
+    """Временная ошибка Steam API (лимит запросов, недоступность сервиса)"""
+    def __init__(self, endpoint: str, status: int):
+        super().__init__(f"Steam API {endpoint} вернул статус {status}")
+        self.endpoint = endpoint
+        self.status = status
 
 class SteamAPIClient:
-    def __init__(self, api_key: str):
+    def __init__(self, api_key: str, max_concurrency: int = 4, json_loads: Callable = None):
         self.api_key = api_key
+        # Декодер JSON для всех ответов Steam (по умолчанию orjson, если установлен)
+        self.json_loads = json_loads or DEFAULT_JSON_LOADS
         self.base_url = "https://api.steampowered.com"
+        self.store_url = "https://store.steampowered.com/api"
         self.session: Optional[aiohttp.ClientSession] = None
+        # Ограничение числа одновременных запросов к Steam
+        self.semaphore = asyncio.Semaphore(max_concurrency)
+        # Пауза между запросами appdetails, у которого жёсткий лимит запросов
+        self.appdetails_delay = 1
+        self.tag_names: Dict[int, str] | None = None
+        self.category_names: Dict[int, str] | None = None
+        # Общий кэш ответов (TwoTierCache), None - без кэширования
+        self.cache = None
+        # Постоянный кэш тел ответов на диске (ResponseCache), None - без него
+        self.response_cache = None
+        # Предельное время одного запроса в секундах (таймаут сессии), внутри команды - не больше её бюджета
+        self.request_timeout = 30.0
         
     async def __aenter__(self):
-        self.session = aiohttp.ClientSession()
+        self.session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=self.request_timeout))
         return self
         
     async def __aexit__(self, exc_type, exc_val, exc_tb):
         if self.session:
             await self.session.close()
+
+    async def _get_json(self, endpoint: str, url: str, params: Dict, session: aiohttp.ClientSession = None,
+                        raise_for_status: bool = False, cache_namespace: str = None) -> Dict | None:
+        """Выполняет GET-запрос и возвращает JSON ответа или None, если статус не 200.
+        При raise_for_status=True вместо None выбрасывается SteamAPIError.
+        С cache_namespace успешные ответы сохраняются в self.cache и повторно не запрашиваются"""
+        if cache_namespace is None or self.cache is None:
+            return await self._fetch_json(endpoint, url, params, session, raise_for_status)
+        return await self.cache.get_or_load(
+            cache_namespace, self._cache_key(endpoint, params),
+            lambda: self._fetch_json(endpoint, url, params, session, raise_for_status)
+        )
+
+    @staticmethod
+    def _cache_key(endpoint: str, params: Dict) -> str:
+        # Ключ API в ключ кэша не входит, чтобы ответы были общими для всех обработчиков
+        return endpoint + '?' + '&'.join(f"{name}={value}" for name, value in sorted(params.items()) if name != 'key')
+
+    async def _fetch_json(self, endpoint: str, url: str, params: Dict, session: aiohttp.ClientSession = None,
+                          raise_for_status: bool = False) -> Dict | None:
+        key = None
+        if self.response_cache is not None and self.response_cache.caches(endpoint):
+            key = self._cache_key(endpoint, params)
+            body = await asyncio.to_thread(self.response_cache.get, endpoint, key)
+            CACHE_REQUESTS.inc(namespace=endpoint, tier='disk', result='miss' if body is None else 'hit')
+            if body is not None:
+                return self.json_loads(body)
+            if self.response_cache.replay:
+                # Воспроизведение без сети: ответа нет в записи, как если бы Steam его не вернул
+                if raise_for_status:
+                    raise SteamAPIError(endpoint, 0)
+                return None
+        session = session or self.session
+        # Внутри команды с бюджетом времени запрос ограничивается оставшимся временем, иначе - таймаутом сессии
+        budget = remaining()
+        kwargs = {}
+        if budget is not None:
+            if budget <= 0:
+                raise DeadlineExceeded(f"Бюджет времени исчерпан до запроса {endpoint}")
+            kwargs['timeout'] = aiohttp.ClientTimeout(total=min(budget, self.request_timeout))
+        status = 'error'
+        start = time.perf_counter()
+        try:
+            async with self.semaphore, session.get(url, params=params, **kwargs) as response:
+                status = response.status
+                if response.status == 200:
+                    if key is None:
+                        return await response.json(loads=self.json_loads)
+                    body = await response.read()
+                    await asyncio.to_thread(self.response_cache.put, endpoint, key, body)
+                    return self.json_loads(body)
+                if raise_for_status:
+                    raise SteamAPIError(endpoint, response.status)
+                return None
+        except asyncio.TimeoutError:
+            status = 'timeout'
+            if budget is not None and budget <= self.request_timeout:
+                raise DeadlineExceeded(f"Запрос {endpoint} не уложился в бюджет времени команды")
+            if raise_for_status:
+                raise SteamAPIError(endpoint, 0)
+            return None
+        finally:
+            STEAM_REQUEST_LATENCY.observe(time.perf_counter() - start, endpoint=endpoint)
+            STEAM_REQUESTS.inc(endpoint=endpoint, status=status)
             
     async def get_user_friends(self, steam_id: int) -> List[Dict]:
         """Получает список друзей пользователя"""
@@ -24,11 +139,10 @@ class SteamAPIClient:
             'relationship': 'friend'
         }
         
-        async with self.session.get(url, params=params) as response:
-            if response.status == 200:
-                data = await response.json()
-                return [ int(i['steamid']) for i in data.get('friendslist', {}).get('friends', [])]
-            return []
+        data = await self._get_json('GetFriendList', url, params)
+        if data is not None:
+            return [ int(i['steamid']) for i in data.get('friendslist', {}).get('friends', [])]
+        return []
     
     async def get_user_owned_games(self, steam_id: int) -> Dict:
         """Получает список игр пользователя с временем игры"""
@@ -39,113 +153,257 @@ class SteamAPIClient:
             'include_played_free_games': 1,
         }
         
-        async with self.session.get(url, params=params) as response:
-            if response.status == 200:
-                data = await response.json()
-                return data.get('response', {}).get('games',{})
-            return {}
+        data = await self._get_json('GetOwnedGames', url, params)
+        if data is not None:
+            return data.get('response', {}).get('games',{})
+        return {}
     
-    async def get_player_summaries(self, steam_ids: List[int]) -> List[Dict]:
-        """Получает информацию о пользователях"""
-        if not steam_ids:
-            return []
-            
+    async def _get_player_summaries_chunk(self, steam_ids: List[int]) -> List[Dict]:
         url = f"{self.base_url}/ISteamUser/GetPlayerSummaries/v2/"
         params = {
             'key': self.api_key,
             'steamids': ','.join([str(id) for id in steam_ids])
         }
         
-        async with self.session.get(url, params=params) as response:
-            if response.status == 200:
-                data = await response.json()
-                return data.get('response', {}).get('players', [])
-            return []
+        data = await self._get_json('GetPlayerSummaries', url, params)
+        if data is not None:
+            return data.get('response', {}).get('players', [])
+        return []
+
+    async def iter_player_summaries(self, steam_ids: List[int]) -> AsyncIterator[List[Dict]]:
+        """Запрашивает информацию о пользователях пачками по 100 id параллельно
+        и отдаёт пачки по мере получения ответов"""
+        steam_ids = list(dict.fromkeys(steam_ids))
+        tasks = [
+            asyncio.create_task(self._get_player_summaries_chunk(steam_ids[i:i + PLAYER_SUMMARIES_CHUNK]))
+            for i in range(0, len(steam_ids), PLAYER_SUMMARIES_CHUNK)
+        ]
+        try:
+            for task in asyncio.as_completed(tasks):
+                players = await task
+                if players:
+                    yield players
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def get_player_summaries(self, steam_ids: List[int]) -> List[Dict]:
+        """Получает информацию о пользователях"""
+        result = []
+        async for players in self.iter_player_summaries(steam_ids):
+            result.extend(players)
+        return result
     
-    async def get_game_info(self, app_id : int) -> tuple[int, Dict]:
-        """Получает информацию об играх из Steam Store"""
+    async def get_game_info(self, app_id : int) -> GameRecord | None:
+        """Получает информацию об играх из Steam Store.
+        None - в магазине нет данных о приложении, SteamAPIError - временная ошибка"""
 
-        result = (None, None)
-        url = f"https://store.steampowered.com/api/appdetails"
+        url = f"{self.store_url}/appdetails"
         params = {
             'appids': app_id,
             'cc': 'us',  # Для обхода региональных ограничений
-            'l': 'english'
+            'l': 'english',
+            'filters': APPDETAILS_FILTERS
         }
         
-        async with self.session.get(url, params=params) as response:
-            if response.status == 200:
-                data = await response.json()
-                if str(app_id) in data:
-                    app_data = data[str(app_id)]
-                    if app_data.get('success', False):
-                        result = (app_id, app_data.get('data', {}))        
+        data = await self._get_json('appdetails', url, params, raise_for_status=True, cache_namespace='steam_appdetails')
+        if data is not None and str(app_id) in data:
+            app_data = data[str(app_id)]
+            if app_data.get('success', False):
+                return GameRecord.from_appdetails(app_id, app_data.get('data', {}))
         
-        return result
+        return None
     
+    async def _load_store_dictionaries(self):
+        """Загружает названия тегов и категорий магазина (один раз на клиент)"""
+        if self.tag_names is None:
+            data = await self._get_json(
+                'GetTagList', f"{self.base_url}/IStoreService/GetTagList/v1/",
+                {'key': self.api_key, 'language': 'english'}
+            )
+            if data is not None:
+                self.tag_names = {tag['tagid']: tag['name'] for tag in data.get('response', {}).get('tags', [])}
+        if self.category_names is None:
+            data = await self._get_json(
+                'GetStoreCategories', f"{self.base_url}/IStoreBrowseService/GetStoreCategories/v1/",
+                {'key': self.api_key, 'language': 'english'}
+            )
+            if data is not None:
+                self.category_names = {
+                    category['categoryid']: category['display_name']
+                    for category in data.get('response', {}).get('categories', [])
+                }
+
+    def _normalize_store_item(self, item: Dict) -> Dict | None:
+        """Приводит элемент GetItems к формату appdetails, чтобы собрать GameRecord тем же преобразованием"""
+        if item.get('success') != 1 or not item.get('name'):
+            return None
+        tag_names = self.tag_names or {}
+        category_names = self.category_names or {}
+
+        tags = {
+            tag_names[tag['tagid']]: tag.get('weight', 0)
+            for tag in item.get('tags', []) if tag.get('tagid') in tag_names
+        }
+        category_ids = [
+            category_id
+            for ids in item.get('categories', {}).values() if isinstance(ids, list)
+            for category_id in ids
+        ]
+        game = {
+            'name': item['name'],
+            'required_age': item.get('game_rating', {}).get('required_age', 0),
+            'short_description': item.get('basic_info', {}).get('short_description'),
+            'categories': [
+                {'description': category_names[i]} for i in dict.fromkeys(category_ids) if i in category_names
+            ],
+            'genres': [{'description': tag} for tag in tags if tag in STORE_GENRES],
+            'tags': tags
+        }
+
+        assets = item.get('assets', {})
+        if assets.get('asset_url_format') and assets.get('header'):
+            game['header_image'] = STORE_ASSETS_URL + assets['asset_url_format'].replace('${FILENAME}', assets['header'])
+
+        release = item.get('release', {}).get('steam_release_date')
+        if release:
+            date = datetime.fromtimestamp(release, timezone.utc).strftime('%b %d, %Y')
+            game['release_date'] = {'date': date}
+
+        reviews = item.get('reviews', {}).get('summary_filtered')
+        if reviews:
+            count = reviews.get('review_count', 0)
+            game['positive'] = round(count * reviews.get('percent_positive', 0) / 100)
+            game['negative'] = count - game['positive']
+        return game
+
+    async def _get_store_items(self, app_ids: List[int]) -> Dict[int, GameRecord]:
+        url = f"{self.base_url}/IStoreBrowseService/GetItems/v1/"
+        request = {
+            'ids': [{'appid': app_id} for app_id in app_ids],
+            'context': {'language': 'english', 'country_code': 'US'},
+            'data_request': {
+                'include_basic_info': True,
+                'include_assets': True,
+                'include_release': True,
+                'include_categories': True,
+                'include_reviews': True,
+                'include_ratings': True,
+                'include_tag_count': 20
+            }
+        }
+        data = await self._get_json('GetItems', url, {'key': self.api_key, 'input_json': json.dumps(request)})
+        if data is None:
+            return {}
+
+        result = {}
+        for item in data.get('response', {}).get('store_items', []):
+            game = self._normalize_store_item(item)
+            if game is not None:
+                app_id = item.get('appid', item.get('id'))
+                result[app_id] = GameRecord.from_appdetails(app_id, game)
+        return result
+
+    async def get_games_info(self, app_ids: List[int]) -> tuple[List[GameRecord], List[int]]:
+        """Получает информацию о нескольких играх пачками через IStoreBrowseService/GetItems.
+
+        Приложения, которые не удалось получить пачкой, запрашиваются через appdetails.
+        Возвращает найденные игры и id приложений без данных в магазине;
+        приложения с временной ошибкой не попадают ни в один из списков.
+        """
+        app_ids = list(dict.fromkeys(int(app_id) for app_id in app_ids))
+        if not app_ids:
+            return [], []
+
+        found = {}
+        await self._load_store_dictionaries()
+        # Без названий тегов пачка не даст тегов и жанров, поэтому идём сразу в appdetails
+        if self.tag_names is not None:
+            chunks = await asyncio.gather(*[
+                self._get_store_items(app_ids[i:i + STORE_ITEMS_CHUNK])
+                for i in range(0, len(app_ids), STORE_ITEMS_CHUNK)
+            ])
+            for chunk in chunks:
+                found.update(chunk)
+
+        games = [found[app_id] for app_id in app_ids if app_id in found]
+        missing = []
+        for app_id in app_ids:
+            if app_id in found:
+                continue
+            try:
+                game = await self.get_game_info(app_id)
+            except SteamAPIError:
+                continue
+            finally:
+                await asyncio.sleep(self.appdetails_delay)
+            if game is not None:
+                games.append(game)
+            else:
+                missing.append(app_id)
+        return games, missing
+
     async def get_featured_games_summary(self) -> Dict[str, List[Dict]]:
-        self.base_url = "https://store.steampowered.com/api/featuredcategories"
+        url = f"{self.store_url}/featuredcategories"
         async with aiohttp.ClientSession() as session:
-            async with session.get(
-                self.base_url, 
-                params={'cc': 'us', 'l': 'english'}
-            ) as response:
-                data = await response.json()
-                
-                result = {
-                    'top_sellers': [],
-                    'new_releases': [],
-                    'coming_soon': []
-                }
-                
-                seen_game_ids = set()
-                
-                # Вспомогательная функция для добавления игры
-                def add_game(category: str, game: dict, is_coming_soon: bool = False):
-                    game_id = game.get('id')
-                    
-                    # Пропускаем если игра уже была добавлена в любую категорию
-                    if game_id in seen_game_ids:
-                        return False
-                    
-                    seen_game_ids.add(game_id)
-                    
-                    game_data = {
-                        'id': game_id,
-                        'name': game.get('name')
-                    }
-                    
-                    if is_coming_soon:
-                        game_data['release_date'] = game.get('release_date', 'Coming Soon')
-                    else:
-                        game_data['price'] = game.get('final_price', 0)
-                        if not is_coming_soon and 'discount_percent' in game:
-                            game_data['discount'] = game.get('discount_percent', 0)
+            data = await self._get_json(
+                'featuredcategories', url, {'cc': 'us', 'l': 'english'}, session, cache_namespace='trends'
+            ) or {}
+        
+        result = {
+            'top_sellers': [],
+            'new_releases': [],
+            'coming_soon': []
+        }
+        
+        seen_game_ids = set()
+        
+        # Вспомогательная функция для добавления игры
+        def add_game(category: str, game: dict, is_coming_soon: bool = False):
+            game_id = game.get('id')
+            
+            # Пропускаем если игра уже была добавлена в любую категорию
+            if game_id in seen_game_ids:
+                return False
+            
+            seen_game_ids.add(game_id)
+            
+            game_data = {
+                'id': game_id,
+                'name': game.get('name')
+            }
+            
+            if is_coming_soon:
+                game_data['release_date'] = game.get('release_date', 'Coming Soon')
+            else:
+                game_data['price'] = game.get('final_price', 0)
+                if not is_coming_soon and 'discount_percent' in game:
+                    game_data['discount'] = game.get('discount_percent', 0)
+            
+            result[category].append(game_data)
+            return True
+        
+        all_games_by_category = {}
+        
+        if 'top_sellers' in data:
+            all_games_by_category['top_sellers'] = data['top_sellers'].get('items', [])
+        
+        if 'new_releases' in data:
+            all_games_by_category['new_releases'] = data['new_releases'].get('items', [])
+        
+        if 'coming_soon' in data:
+            all_games_by_category['coming_soon'] = data['coming_soon'].get('items', [])
+        
+        for category in ['top_sellers', 'new_releases', 'coming_soon']:
+            if category in all_games_by_category:
+                games_added = 0
+                for game in all_games_by_category[category]:
+                    if games_added >= 5:
+                        break
                     
-                    result[category].append(game_data)
-                    return True
-                
-                all_games_by_category = {}
-                
-                if 'top_sellers' in data:
-                    all_games_by_category['top_sellers'] = data['top_sellers'].get('items', [])
-                
-                if 'new_releases' in data:
-                    all_games_by_category['new_releases'] = data['new_releases'].get('items', [])
-                
-                if 'coming_soon' in data:
-                    all_games_by_category['coming_soon'] = data['coming_soon'].get('items', [])
-                
-                for category in ['top_sellers', 'new_releases', 'coming_soon']:
-                    if category in all_games_by_category:
-                        games_added = 0
-                        for game in all_games_by_category[category]:
-                            if games_added >= 5:
-                                break
-                            
-                            is_coming_soon = (category == 'coming_soon')
-                            if add_game(category, game, is_coming_soon):
-                                games_added += 1
-                
-                return result
-    
+                    is_coming_soon = (category == 'coming_soon')
+                    if add_game(category, game, is_coming_soon):
+                        games_added += 1
+        
+        return result
+
@@ -1,7 +1,7 @@
 import pytest
 import psycopg2
 import os
-from unittest.mock import AsyncMock
+from unittest.mock import AsyncMock, Mock
 
 @pytest.fixture(scope="session")
 def db_config():
@@ -19,11 +19,14 @@ def clean_database(db_config):
     
     with conn.cursor() as cursor:
         tables = [
+            'digest_log',
+            'user_recommendations',
             'user_games',
             'friends', 
             'bot_users',
             'steam_users',
-            'games'
+            'games',
+            'ignored_apps'
         ]
         
         for table in tables:
@@ -45,7 +48,9 @@ def mock_telegram_api():
     mock_message = AsyncMock()
     mock_message.from_user.id = 123456789
     mock_message.answer = AsyncMock()
-    mock_message.answer_photo = AsyncMock()
+    mock_message.answer_photo = AsyncMock(
+        return_value=Mock(photo=[Mock(file_id='photo-thumb-id'), Mock(file_id='photo-file-id')])
+    )
     
     mock_state = AsyncMock()
     mock_state.set_state = AsyncMock()
@@ -5,11 +5,14 @@
 # 4. Похожее + ID игры (нет похожего)
 # 5. Информация по игре (есть в БД)
 # 6. Информация по игре (нет в БД)
+# 7. Inline-поиск игры по названию
+# 8. Дайджест обновлений друзей
 
 import pytest
-from unittest.mock import AsyncMock, patch
+from unittest.mock import AsyncMock, Mock, patch
 
 from sources.bot import TelegramBot
+from sources.models import GameRecord
 from sources.utils import States
 
 class TestIntegrationScenario:
@@ -64,6 +67,7 @@ class TestIntegrationScenario:
             }
         }
         
+        self.dead_app_id = 111
         self.new_game_id = 1245620
         self.new_game_data = {
             'name': 'Elden Ring',
@@ -81,7 +85,7 @@ class TestIntegrationScenario:
         
         mock_steam.get_user_friends.return_value = self.friend_ids
         
-        mock_steam.get_player_summaries.return_value = [
+        players = [
             {
                 'steamid': str(self.test_steam_id),
                 'personaname': 'Main Test User',
@@ -102,13 +106,19 @@ class TestIntegrationScenario:
             }
         ]
         
+        async def iter_player_summaries(steam_ids):
+            yield players
+        
+        mock_steam.iter_player_summaries = Mock(side_effect=iter_player_summaries)
+        
         owned_games_sequence = [
             [
                 {'appid': 730, 'playtime_forever': 150, 'name': 'CS:GO'},
                 {'appid': 292030, 'playtime_forever': 200, 'name': 'The Witcher 3'}
             ],
             [
-                {'appid': 730, 'playtime_forever': 100, 'name': 'CS:GO'}
+                {'appid': 730, 'playtime_forever': 100, 'name': 'CS:GO'},
+                {'appid': self.dead_app_id, 'playtime_forever': 10, 'name': 'Delisted'}
             ],
             [
                 {'appid': 292030, 'playtime_forever': 300, 'name': 'The Witcher 3'}
@@ -118,16 +128,25 @@ class TestIntegrationScenario:
         
         def game_info_side_effect(app_id):
             if app_id == 730:  # CS:GO
-                return (730, self.games_in_db[730])
+                return GameRecord.from_appdetails(730, self.games_in_db[730])
             elif app_id == 292030:  # The Witcher 3
-                return (292030, self.games_in_db[292030])
+                return GameRecord.from_appdetails(292030, self.games_in_db[292030])
             elif app_id == self.new_game_id:  # Elden Ring
-                return (self.new_game_id, self.new_game_data)
+                return GameRecord.from_appdetails(self.new_game_id, self.new_game_data)
             else:
-                return (None, None)
+                return None
         
         mock_steam.get_game_info.side_effect = game_info_side_effect
         
+        async def games_info_side_effect(app_ids):
+            games = [game_info_side_effect(app_id) for app_id in app_ids]
+            return (
+                [game for game in games if game is not None],
+                [app_id for app_id, game in zip(app_ids, games) if game is None]
+            )
+        
+        mock_steam.get_games_info.side_effect = games_info_side_effect
+        
         return mock_steam
     
     @pytest.mark.asyncio
@@ -147,6 +166,7 @@ class TestIntegrationScenario:
                 'DB_NAME': 'steam_bot_dev',
                 'DB_USER': 'postgres',
                 'DB_PASSWORD': '',
+                'TELEGRAM_CHAT_RATE': '100',
             }.get(key, default)), patch('sources.bot.SteamAPIClient'):
                     
             bot = TelegramBot()
@@ -156,7 +176,7 @@ class TestIntegrationScenario:
             bot.db_client.db_base = self.test_db_config['dbname']
             bot.db_client.db_user = self.test_db_config['user']
             bot.db_client.db_pass = self.test_db_config['password']
-            bot.db_client.connection = None 
+            bot.db_client.pool.close()
             
             mock_steam = self.create_mock_steam_api()
             bot.api_client = mock_steam
@@ -194,7 +214,7 @@ class TestIntegrationScenario:
                 await bot.cmd_get_id(mock_message, mock_state)
                 
                 mock_steam.get_user_friends.assert_called_once_with(self.test_steam_id)
-                mock_steam.get_player_summaries.assert_called_once()
+                mock_steam.iter_player_summaries.assert_called_once()
                 
                 assert mock_steam.get_user_owned_games.call_count == 3
                 
@@ -203,6 +223,8 @@ class TestIntegrationScenario:
                         cursor.execute("SELECT COUNT(*) FROM games")
                         game_count = cursor.fetchone()[0]
                         assert game_count >= 2  # CS:GO и Witcher 3
+                        cursor.execute("SELECT steam_app_id FROM ignored_apps")
+                        assert cursor.fetchall() == [(self.dead_app_id,)]
                 
                 print("+ Steam профиль добавлен, данные загружены в PostgreSQL")
             
@@ -313,7 +335,41 @@ class TestIntegrationScenario:
             mock_message.answer_photo.assert_called_once()
             photo_args = mock_message.answer_photo.call_args
             assert "Counter-Strike" in photo_args[1]['caption'] or "Global Offensive" in photo_args[1]['caption'] or "730" in photo_args[1]['caption']
+            assert photo_args[1]['photo'] == self.games_in_db[730]['header_image']
             
+            # Повторный запрос отправляет обложку по сохранённому file_id
+            with bot.db_client.get_connection() as conn:
+                with conn.cursor() as cursor:
+                    cursor.execute("SELECT telegram_file_id FROM games WHERE steam_app_id = 730")
+                    assert cursor.fetchone()[0] == 'photo-file-id'
+            
+            bot.file_ids.clear()
+            mock_message.answer_photo.reset_mock()
+            await bot.cmd_show_game_info(mock_message, mock_state)
+            assert mock_message.answer_photo.call_args[1]['photo'] == 'photo-file-id'
+            
+            # Смена обложки сбрасывает file_id
+            with bot.db_client.get_connection() as conn:
+                with conn.cursor() as cursor:
+                    cursor.execute("UPDATE games SET header_image_url = 'https://example.com/new.jpg' WHERE steam_app_id = 730")
+                    conn.commit()
+                    cursor.execute("SELECT telegram_file_id FROM games WHERE steam_app_id = 730")
+                    assert cursor.fetchone()[0] is None
+            # Изменение в обход бота видно после истечения TTL кэша game_info, здесь запись сбрасывается сразу
+            await bot.cache.delete('game_info', 730)
+            
+            mock_message.answer_photo.reset_mock()
+            await bot.cmd_show_game_info(mock_message, mock_state)
+            assert mock_message.answer_photo.call_args[1]['photo'] == 'https://example.com/new.jpg'
+            mock_message.answer_photo.reset_mock()
+
+            # Поиск игры по названию вместо id
+            mock_message.text = "witcher 3"
+            await bot.cmd_show_game_info(mock_message, mock_state)
+            mock_steam.get_game_info.assert_not_called()
+            assert "The Witcher 3" in mock_message.answer_photo.call_args[1]['caption']
+            mock_message.answer_photo.reset_mock()
+
             print("+ Информация об игре получена из PostgreSQL (без вызова API)")
             
             # 5: Информация по игре (нет в бд)
@@ -332,7 +388,7 @@ class TestIntegrationScenario:
 
             def game_info_side_effect(app_id):
                 if app_id == new_game_id:
-                    return (new_game_id, {
+                    return GameRecord.from_appdetails(new_game_id, {
                         'name': 'Test Game',
                         'short_description': 'Тестовая игра',
                         'header_image': 'https://example.com/supernew.jpg',
@@ -345,7 +401,7 @@ class TestIntegrationScenario:
                         'categories': [{'description': 'Single-player'}],
                         'genres': [{'description': 'Test'}]
                     })
-                return mock_steam.get_game_info.side_effect(app_id)  # или (None, None)
+                return mock_steam.get_game_info.side_effect(app_id)  # или None
 
             mock_steam.get_game_info.side_effect = game_info_side_effect
             mock_steam.get_game_info.reset_mock()
@@ -371,3 +427,54 @@ class TestIntegrationScenario:
                     assert "Test Game" in result[0]
             
             print("+ Информация об игре получена из Steam API и сохранена в PostgreSQL")
+
+            # 6: Inline-поиск по индексу названий
+            print("\n[7] Inline-поиск игры по названию")
+
+            # Игра, добавленная на прошлом шаге, попадает в индекс после его перестроения в потоке
+            await bot.game_index_task
+            assert bot.game_index.search('test game') == [(new_game_id, 'Test Game')]
+
+            bot.load_game_index()
+            inline_query = Mock(query='witch', answer=AsyncMock())
+            await bot.inline_search(inline_query)
+
+            results = inline_query.answer.call_args.args[0]
+            assert [result.id for result in results] == ['292030']
+            assert results[0].title == 'The Witcher 3: Wild Hunt'
+            assert inline_query.answer.call_args.kwargs['cache_time'] == bot.inline_cache_time
+
+            print("+ Inline-поиск выполнен по индексу в памяти")
+
+            # 7: Дайджест обновлений друзей для всех пользователей
+            print("\n[8] Дайджест обновлений друзей")
+
+            # Друг недавно добавил игру, которой нет у пользователя
+            with bot.db_client.get_connection() as conn:
+                with conn.cursor() as cursor:
+                    cursor.execute(
+                        "INSERT INTO user_games (user_id, game_id, playtime_total) VALUES (%s, %s, %s)",
+                        (self.friend_ids[0], new_game_id, 30)
+                    )
+                    conn.commit()
+
+            bot.digest.bot = Mock(send_message=AsyncMock())
+            sent = await bot.digest.run_once()
+
+            assert sent == 1
+            send_args = bot.digest.bot.send_message.call_args
+            assert send_args.args[0] == mock_message.from_user.id
+            assert "Test Game" in send_args.args[1]
+
+            with bot.db_client.get_connection() as conn:
+                with conn.cursor() as cursor:
+                    cursor.execute("SELECT tg_id, game_id FROM digest_log")
+                    assert (mock_message.from_user.id, new_game_id) in cursor.fetchall()
+
+            # Повторная рассылка не присылает уже отправленные игры
+            bot.digest.bot.send_message.reset_mock()
+            sent = await bot.digest.run_once()
+            sent_texts = [c.args[1] for c in bot.digest.bot.send_message.call_args_list]
+            assert not any("Test Game" in text for text in sent_texts)
+
+            print("+ Дайджест отправлен и записан в digest_log")
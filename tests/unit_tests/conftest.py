@@ -24,10 +24,12 @@ def mock_client():
         client = PgsqlApiClient(env='test.env')
         client.select = Mock()
         client.insert = Mock()
+        client.insert_many = Mock()
+        client.upsert_many = Mock()
         client.update = Mock()
         client.delete = Mock()
+        client.execute_prepared = Mock()
         client.get_connection = Mock()
-        client.connection = None
         yield client
 
 @pytest.fixture
@@ -75,5 +77,5 @@ def pgsql_client_with_mocks(mock_connection):
         }.get(key, default)
         
         client = PgsqlClient("test.env")
-        client.connection = mock_connection
+        client.get_connection = Mock(return_value=mock_connection)
         return client
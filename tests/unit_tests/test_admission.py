@@ -0,0 +1,119 @@
+import asyncio
+import threading
+
+import pytest
+
+from sources.admission import AdmissionController, Overloaded
+from sources.metrics import ADMISSION_DECISIONS, ADMISSION_QUEUE_DELAY
+
+
+class Blocker:
+    """Функция для запуска в потоке, которая ждёт, пока тест её отпустит"""
+
+    def __init__(self):
+        self.release = threading.Event()
+        self.calls = 0
+
+    def __call__(self, value):
+        self.calls += 1
+        self.release.wait(5)
+        return value
+
+
+class TestAdmissionController:
+    @pytest.mark.asyncio
+    async def test_runs_function_in_thread(self):
+        controller = AdmissionController()
+        before = ADMISSION_QUEUE_DELAY.count(command='test_run')
+
+        result = await controller.run('test_run', lambda value: (value, threading.current_thread().name), 5)
+
+        assert result[0] == 5
+        assert result[1] != threading.current_thread().name
+        assert controller.in_flight == 0
+        assert ADMISSION_QUEUE_DELAY.count(command='test_run') == before + 1
+
+    @pytest.mark.asyncio
+    async def test_waits_for_free_slot(self):
+        controller = AdmissionController(max_in_flight=1, max_queue_delay=5)
+        blocker = Blocker()
+
+        first = asyncio.create_task(controller.run('test_wait', blocker, 1))
+        await asyncio.sleep(0.01)
+        second = asyncio.create_task(controller.run('test_wait', lambda value: value, 2))
+        await asyncio.sleep(0.01)
+        assert controller.saturated
+        assert controller.waiting == 1
+
+        blocker.release.set()
+
+        assert await asyncio.gather(first, second) == [1, 2]
+        assert controller.in_flight == 0 and controller.waiting == 0
+
+    @pytest.mark.asyncio
+    async def test_rejected_after_queue_delay(self):
+        controller = AdmissionController(max_in_flight=1, max_queue_delay=0.01)
+        blocker = Blocker()
+        before = ADMISSION_DECISIONS.value(command='test_delay', decision='rejected')
+
+        first = asyncio.create_task(controller.run('test_delay', blocker, 1))
+        await asyncio.sleep(0.01)
+        with pytest.raises(Overloaded):
+            await controller.run('test_delay', blocker, 2)
+        blocker.release.set()
+        await first
+
+        assert blocker.calls == 1
+        assert controller.in_flight == 0 and controller.waiting == 0
+        assert ADMISSION_DECISIONS.value(command='test_delay', decision='rejected') == before + 1
+
+    @pytest.mark.asyncio
+    async def test_rejected_when_queue_full(self):
+        controller = AdmissionController(max_in_flight=1, max_queue=1, max_queue_delay=5)
+        blocker = Blocker()
+
+        first = asyncio.create_task(controller.run('test_queue', blocker, 1))
+        await asyncio.sleep(0.01)
+        queued = asyncio.create_task(controller.run('test_queue', blocker, 2))
+        await asyncio.sleep(0.01)
+        with pytest.raises(Overloaded):
+            await controller.run('test_queue', blocker, 3)
+        blocker.release.set()
+
+        assert await asyncio.gather(first, queued) == [1, 2]
+
+    @pytest.mark.asyncio
+    async def test_cancelled_waiter_does_not_leak_slot(self):
+        controller = AdmissionController(max_in_flight=1, max_queue_delay=5)
+        blocker = Blocker()
+
+        first = asyncio.create_task(controller.run('test_cancel', blocker, 1))
+        await asyncio.sleep(0.01)
+        waiting = asyncio.create_task(controller.run('test_cancel', blocker, 2))
+        await asyncio.sleep(0.01)
+        waiting.cancel()
+        await asyncio.gather(waiting, return_exceptions=True)
+        blocker.release.set()
+        await first
+
+        assert controller.in_flight == 0
+        assert await controller.run('test_cancel', blocker, 3) == 3
+
+    @pytest.mark.asyncio
+    async def test_cancelled_command_keeps_slot_until_thread_returns(self):
+        controller = AdmissionController(max_in_flight=1, max_queue_delay=5)
+        blocker = Blocker()
+
+        running = asyncio.create_task(controller.run('test_abandon', blocker, 1))
+        await asyncio.sleep(0.01)
+        running.cancel()
+        await asyncio.gather(running, return_exceptions=True)
+
+        # Поток ещё выполняет запрос, поэтому слот занят
+        assert controller.in_flight == 1
+        blocker.release.set()
+        for _ in range(100):
+            if controller.in_flight == 0:
+                break
+            await asyncio.sleep(0.01)
+        assert controller.in_flight == 0
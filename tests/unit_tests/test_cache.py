@@ -0,0 +1,178 @@
+import pytest
+from unittest.mock import AsyncMock, patch
+
+from sources.cache import SERIALIZERS, LocalBackend, TwoTierCache, create_cache, parse_ttls
+from sources.metrics import CACHE_REQUESTS
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+@pytest.fixture
+def cache(clock):
+    return TwoTierCache(
+        backend=LocalBackend(clock), l1_size=2, ttls={'trends': 10}, default_ttl=100, l1_ttl=5, clock=clock
+    )
+
+
+class TestTwoTierCache:
+    @pytest.mark.asyncio
+    async def test_set_then_get_from_l1(self, cache):
+        before = CACHE_REQUESTS.value(namespace='game_info', tier='l1', result='hit')
+        await cache.set('game_info', 730, ['Counter-Strike 2', 'Shooter'])
+        
+        assert await cache.get('game_info', 730) == ['Counter-Strike 2', 'Shooter']
+        assert CACHE_REQUESTS.value(namespace='game_info', tier='l1', result='hit') == before + 1
+
+    @pytest.mark.asyncio
+    async def test_l2_shared_between_processes(self, clock):
+        backend = LocalBackend(clock)
+        first = TwoTierCache(backend=backend, clock=clock)
+        second = TwoTierCache(backend=backend, clock=clock)
+        before = CACHE_REQUESTS.value(namespace='game_info', tier='l2', result='hit')
+        
+        await first.set('game_info', 730, {'name': 'Counter-Strike 2'})
+        
+        assert await second.get('game_info', 730) == {'name': 'Counter-Strike 2'}
+        assert CACHE_REQUESTS.value(namespace='game_info', tier='l2', result='hit') == before + 1
+        # Значение из L2 копируется в L1
+        assert len(second) == 1
+
+    @pytest.mark.asyncio
+    async def test_l1_entry_expires_before_l2(self, cache, clock):
+        await cache.set('game_info', 730, 'value')
+        clock.now = 6
+        
+        assert cache._l1_get('game_info', 730) is None
+        assert await cache.get('game_info', 730) == 'value'
+
+    @pytest.mark.asyncio
+    async def test_ttl_per_namespace(self, cache, clock):
+        await cache.set('trends', 'featured', 'top')
+        await cache.set('game_info', 730, 'value')
+        clock.now = 11
+        
+        assert await cache.get('trends', 'featured') is None
+        assert await cache.get('game_info', 730) == 'value'
+
+    @pytest.mark.asyncio
+    async def test_l1_evicts_least_recently_used(self, cache):
+        await cache.set('game_info', 1, 'a')
+        await cache.set('game_info', 2, 'b')
+        await cache.get('game_info', 1)
+        await cache.set('game_info', 3, 'c')
+        
+        assert list(cache.l1) == [('game_info', 1), ('game_info', 3)]
+
+    @pytest.mark.asyncio
+    async def test_delete_removes_both_tiers(self, cache):
+        await cache.set('game_info', 730, 'value')
+        await cache.delete('game_info', 730)
+        
+        assert await cache.get('game_info', 730, default='missing') == 'missing'
+
+    @pytest.mark.asyncio
+    async def test_l2_errors_are_misses(self, clock, caplog):
+        backend = AsyncMock()
+        backend.get.side_effect = ConnectionError('redis is down')
+        backend.set.side_effect = ConnectionError('redis is down')
+        cache = TwoTierCache(backend=backend, clock=clock)
+        
+        await cache.set('game_info', 730, 'value')
+        assert await cache.get('game_info', 730) == 'value'
+        assert await cache.get('game_info', 570) is None
+        assert "Кэш L2 недоступен" in caplog.text
+
+    @pytest.mark.asyncio
+    async def test_get_or_load(self, cache):
+        loader = AsyncMock(return_value={'name': 'Dota 2'})
+        
+        assert await cache.get_or_load('game_info', 570, loader) == {'name': 'Dota 2'}
+        assert await cache.get_or_load('game_info', 570, loader) == {'name': 'Dota 2'}
+        loader.assert_awaited_once()
+
+    @pytest.mark.asyncio
+    async def test_get_or_load_does_not_cache_none(self, cache):
+        loader = AsyncMock(return_value=None)
+        
+        await cache.get_or_load('game_info', 1, loader)
+        await cache.get_or_load('game_info', 1, loader)
+        
+        assert loader.await_count == 2
+
+    @pytest.mark.asyncio
+    @pytest.mark.parametrize('name', ['json'])
+    async def test_serializers_round_trip(self, clock, name):
+        backend = LocalBackend(clock)
+        writer = TwoTierCache(backend=backend, serializer=SERIALIZERS[name], clock=clock)
+        reader = TwoTierCache(backend=backend, serializer=SERIALIZERS[name], clock=clock)
+        
+        await writer.set('steam_appdetails', 'key', {'730': {'success': True, 'data': {'name': 'CS2'}}})
+        
+        assert await reader.get('steam_appdetails', 'key') == {'730': {'success': True, 'data': {'name': 'CS2'}}}
+        assert list(backend.data) == ['steambot:steam_appdetails:key']
+
+
+class TestConfiguration:
+    def test_parse_ttls(self):
+        assert parse_ttls('game_info=3600, trends=600') == {'game_info': 3600.0, 'trends': 600.0}
+        assert parse_ttls('') == {}
+
+    def test_create_cache_from_env(self, monkeypatch):
+        monkeypatch.delenv('CACHE_REDIS_URL', raising=False)
+        monkeypatch.setenv('CACHE_TTLS', 'trends=60')
+        monkeypatch.setenv('CACHE_SERIALIZER', 'json')
+        
+        cache = create_cache()
+        
+        assert isinstance(cache.backend, LocalBackend)
+        assert cache.ttl('trends') == 60
+        assert cache.serializer is SERIALIZERS['json']
+
+    def test_pickle_serializer_rejected(self, monkeypatch):
+        monkeypatch.delenv('CACHE_REDIS_URL', raising=False)
+        monkeypatch.setenv('CACHE_SERIALIZER', 'pickle')
+        
+        assert 'pickle' not in SERIALIZERS
+        with pytest.raises(ValueError):
+            create_cache()
+
+    def test_redis_url_requires_package(self, monkeypatch):
+        monkeypatch.setenv('CACHE_REDIS_URL', 'redis://localhost:6379/0')
+        
+        with patch('sources.cache.redis_asyncio', None), pytest.raises(RuntimeError):
+            create_cache()
+
+
+class TestStaleCopies:
+    @pytest.mark.asyncio
+    async def test_stale_copy_survives_delete_and_expiry(self, clock):
+        cache = TwoTierCache(backend=LocalBackend(clock), default_ttl=10, stale_ttl=1000, clock=clock)
+        await cache.set('recommendations', 1, [[730, 'CS']], keep_stale=True)
+
+        await cache.delete('recommendations', 1)
+        clock.now = 500
+
+        assert await cache.get('recommendations', 1) is None
+        assert await cache.get_stale('recommendations', 1) == [[730, 'CS']]
+
+        clock.now = 1001
+        assert await cache.get_stale('recommendations', 1) is None
+
+    @pytest.mark.asyncio
+    async def test_no_stale_copy_by_default(self, cache):
+        await cache.set('recommendations', 1, [1], keep_stale=True)
+        await cache.set('friends_updates', 1, [2])
+
+        assert await cache.get_stale('recommendations', 1) is None
+        assert await cache.get_stale('friends_updates', 1) is None
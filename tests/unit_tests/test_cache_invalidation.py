@@ -0,0 +1,212 @@
+import asyncio
+import json
+import socket
+import threading
+from types import SimpleNamespace
+from unittest.mock import AsyncMock
+
+import psycopg2
+import pytest
+
+from sources.cache_invalidation import RESET, InvalidationListener, unique_events
+from sources.metrics import CACHE_INVALIDATIONS
+
+
+class FakeConnection:
+    """Соединение psycopg2 с LISTEN: уведомления приходят через socketpair, чтобы работал loop.add_reader"""
+
+    def __init__(self):
+        self.reader, self.writer = socket.socketpair()
+        self.reader.setblocking(False)
+        self.notifies = []
+        self.pending = []
+        self.executed = []
+        self.closed = False
+        self.broken = False
+
+    def set_isolation_level(self, level):
+        self.isolation_level = level
+
+    def cursor(self):
+        connection = self
+
+        class Cursor:
+            def __enter__(self):
+                return self
+
+            def __exit__(self, *args):
+                return False
+
+            def execute(self, query):
+                connection.executed.append(query)
+        return Cursor()
+
+    def fileno(self):
+        return self.reader.fileno()
+
+    def send(self, *events):
+        self.pending.extend(SimpleNamespace(payload=event if isinstance(event, str) else json.dumps(event))
+                            for event in events)
+        self.writer.send(b'x')
+
+    def poll(self):
+        if self.broken:
+            raise psycopg2.OperationalError("server closed the connection unexpectedly")
+        try:
+            self.reader.recv(1024)
+        except BlockingIOError:
+            pass
+        self.notifies.extend(self.pending)
+        self.pending = []
+
+    def close(self):
+        self.closed = True
+        self.reader.close()
+        self.writer.close()
+
+
+class FailingListenConnection(FakeConnection):
+    def cursor(self):
+        raise psycopg2.OperationalError("server closed the connection unexpectedly")
+
+
+class TestUniqueEvents:
+    def test_duplicates_removed_in_order(self):
+        events = [{'kind': 'library', 'id': 1}, {'kind': 'game', 'id': 2}, {'id': 1, 'kind': 'library'}]
+        
+        assert unique_events(events) == [{'kind': 'library', 'id': 1}, {'kind': 'game', 'id': 2}]
+
+
+class TestInvalidationListener:
+    async def start(self, connections, reconnect_delay=0):
+        received = []
+
+        async def handler(events):
+            received.append(events)
+        factories = [lambda connection=connection: connection for connection in connections]
+        listener = InvalidationListener(factories, handler, reconnect_delay=reconnect_delay)
+        task = asyncio.create_task(listener.run())
+        await asyncio.sleep(0.01)
+        return listener, task, received
+
+    @pytest.mark.asyncio
+    async def test_listens_and_delivers_batch_without_duplicates(self):
+        connection = FakeConnection()
+        listener, task, received = await self.start([connection])
+        before = CACHE_INVALIDATIONS.value(kind='library')
+        
+        connection.send({'kind': 'library', 'id': 1}, {'kind': 'library', 'id': 1}, {'kind': 'game', 'id': 730})
+        await asyncio.sleep(0.01)
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        
+        assert connection.executed == ['LISTEN cache_invalidation']
+        assert received == [[{'kind': 'library', 'id': 1}, {'kind': 'game', 'id': 730}]]
+        assert CACHE_INVALIDATIONS.value(kind='library') == before + 2
+        assert connection.closed
+
+    @pytest.mark.asyncio
+    async def test_connects_outside_event_loop(self):
+        connection = FakeConnection()
+        threads = []
+
+        def connect():
+            threads.append(threading.get_ident())
+            return connection
+        listener = InvalidationListener([connect], AsyncMock())
+        task = asyncio.create_task(listener.run())
+        await asyncio.sleep(0.01)
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        
+        assert threads and threads[0] != threading.get_ident()
+        assert connection.executed == ['LISTEN cache_invalidation']
+
+    @pytest.mark.asyncio
+    async def test_connection_closed_when_listen_fails(self):
+        connection = FailingListenConnection()
+        listener = InvalidationListener([lambda: connection], AsyncMock(), reconnect_delay=10)
+        task = asyncio.create_task(listener.run())
+        await asyncio.sleep(0.01)
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        
+        assert connection.closed
+        assert listener.connections == [None]
+
+    @pytest.mark.asyncio
+    async def test_kinds_filtered_per_source(self):
+        main, shard = FakeConnection(), FakeConnection()
+        received = []
+
+        async def handler(events):
+            received.append(events)
+        listener = InvalidationListener([lambda: main, lambda: shard], handler, kinds=[None, {'library'}])
+        task = asyncio.create_task(listener.run())
+        await asyncio.sleep(0.01)
+        
+        shard.send({'kind': 'games', 'ids': [730]}, {'kind': 'library', 'id': 1})
+        await asyncio.sleep(0.01)
+        main.send({'kind': 'games', 'ids': [730]})
+        await asyncio.sleep(0.01)
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        
+        assert received == [[{'kind': 'library', 'id': 1}], [{'kind': 'games', 'ids': [730]}]]
+
+    @pytest.mark.asyncio
+    async def test_invalid_payload_skipped(self):
+        connection = FakeConnection()
+        listener, task, received = await self.start([connection])
+        
+        connection.send('not json', {'kind': 'bot_user', 'id': 5})
+        await asyncio.sleep(0.01)
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        
+        assert received == [[{'kind': 'bot_user', 'id': 5}]]
+
+    @pytest.mark.asyncio
+    async def test_reconnect_sends_reset(self):
+        first, second = FakeConnection(), FakeConnection()
+        connections = iter([first, second])
+        received = []
+
+        async def handler(events):
+            received.append(events)
+        listener = InvalidationListener([lambda: next(connections)], handler, reconnect_delay=0)
+        task = asyncio.create_task(listener.run())
+        await asyncio.sleep(0.01)
+        
+        first.broken = True
+        first.writer.send(b'x')
+        await asyncio.sleep(0.01)
+        second.send({'kind': 'game', 'id': 1})
+        await asyncio.sleep(0.01)
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        
+        assert first.closed
+        assert received == [[RESET], [{'kind': 'game', 'id': 1}]]
+
+    @pytest.mark.asyncio
+    async def test_handler_error_does_not_stop_listener(self):
+        connection = FakeConnection()
+        calls = []
+
+        async def handler(events):
+            calls.append(events)
+            if len(calls) == 1:
+                raise RuntimeError("boom")
+        listener = InvalidationListener([lambda: connection], handler)
+        task = asyncio.create_task(listener.run())
+        await asyncio.sleep(0.01)
+        
+        connection.send({'kind': 'game', 'id': 1})
+        await asyncio.sleep(0.01)
+        connection.send({'kind': 'game', 'id': 2})
+        await asyncio.sleep(0.01)
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        
+        assert calls == [[{'kind': 'game', 'id': 1}], [{'kind': 'game', 'id': 2}]]
@@ -1,30 +1,24 @@
 import pytest
 import json
-from unittest.mock import Mock, patch
+from datetime import datetime, timedelta
+from unittest.mock import Mock, call, patch
 from psycopg2 import Error as Psycopg2Error
 
-from sources.database_api import PgsqlApiClient
+from sources.database_api import GAME_UPDATES, USER_GAME_UPDATES, PgsqlApiClient
+from sources.models import GameRecord
 from sources.utils import parse_steam_date
 
 class TestPgsqlApiClient:
     def test_get_game_info_success(self, mock_client):
-        expected_result = (
-            [('Test Game', 'Short description', 'example')],
-            [('name',), ('short_description',), ('header_image_url',)]
-        )
-        mock_client.select.return_value = expected_result
+        mock_client.execute_prepared.return_value = [('Test Game', 'Short description', 'example')]
         
         result = mock_client.get_game_info(730)
         
-        mock_client.select.assert_called_once_with(
-            ['name', 'short_description', 'header_image_url'],
-            "games",
-            "steam_app_id = 730"
-        )
+        mock_client.execute_prepared.assert_called_once_with('game_info', (730,))
         assert result == ('Test Game', 'Short description', 'example')
 
     def test_get_game_info_not_found(self, mock_client):
-        mock_client.select.return_value = ([], [])
+        mock_client.execute_prepared.return_value = []
         
         result = mock_client.get_game_info(999999)
         
@@ -36,16 +30,24 @@ class TestPgsqlApiClient:
         result = mock_client.add_telegram_user(123456789)
         
         assert result is True
-        mock_client.select.assert_called_once_with(['tg_id'], 'bot_users', "tg_id = 123456789")
+        mock_client.select.assert_called_once_with(['tg_id'], 'bot_users', {'tg_id': 123456789})
         mock_client.insert.assert_called_once_with(['tg_id', 'steam_id'], 'bot_users', [123456789, None])
 
+    def test_get_game_names(self, mock_client):
+        mock_client.select.return_value = ([(730, 'Counter-Strike 2', 100)], [('steam_app_id',), ('name',), ('positive',)])
+
+        result = mock_client.get_game_names()
+
+        mock_client.select.assert_called_once_with(['steam_app_id', 'name', 'positive'], 'games')
+        assert result == [(730, 'Counter-Strike 2', 100)]
+
     def test_add_telegram_user_exists(self, mock_client):
         mock_client.select.return_value = ([(123456789,)], [('tg_id',)])
         
         result = mock_client.add_telegram_user(123456789)
         
         assert result is False
-        mock_client.select.assert_called_once_with(['tg_id'], 'bot_users', "tg_id = 123456789")
+        mock_client.select.assert_called_once_with(['tg_id'], 'bot_users', {'tg_id': 123456789})
         mock_client.insert.assert_not_called()
 
     def test_add_game(self, mock_client):
@@ -70,14 +72,15 @@ class TestPgsqlApiClient:
             }
         )
         
-        PgsqlApiClient.add_game(mock_client, game_data)
+        PgsqlApiClient.add_game(mock_client, GameRecord.from_appdetails(*game_data))
         
         expected_categories = ['Multi-player']
         expected_genres = ['Action']
-        expected_tags = json.dumps({'Action': True, 'FPS': True})
         expected_release_date = parse_steam_date('Aug 21, 2012')
         
-        mock_client.insert.assert_called_once_with(
+        data = mock_client.upsert_many.call_args[0][2][0]
+        assert json.loads(data[-1]) == {'Action': True, 'FPS': True}
+        mock_client.upsert_many.assert_called_once_with(
             [
                 'steam_app_id', 'name', 'release_date', 'required_age',
                 'short_description', 'header_image_url', 'categories',
@@ -86,7 +89,7 @@ class TestPgsqlApiClient:
                 'median_playtime_forever', 'median_playtime_2weeks', 'tags'
             ],
             'games',
-            [
+            [(
                 730,
                 'Counter-Strike: Global Offensive',
                 expected_release_date,
@@ -102,29 +105,59 @@ class TestPgsqlApiClient:
                 10,
                 50,
                 5,
-                expected_tags
-            ]
+                data[-1]
+            )],
+            ['steam_app_id'],
+            GAME_UPDATES
+        )
+
+    def test_add_games_bulk(self, mock_client):
+        games = [GameRecord(730, 'CS'), GameRecord(570, 'Dota 2', tags={'MOBA': 1})]
+        
+        PgsqlApiClient.add_games(mock_client, games)
+        
+        mock_client.insert.assert_not_called()
+        columns, table, rows, conflict, updates = mock_client.upsert_many.call_args[0]
+        assert columns == GameRecord.COLUMNS
+        assert table == 'games'
+        assert [row[:2] for row in rows] == [(730, 'CS'), (570, 'Dota 2')]
+        assert json.loads(rows[1][-1]) == {'MOBA': 1}
+        assert conflict == ['steam_app_id']
+        assert updates['name'] == 'COALESCE(EXCLUDED.name, games.name)'
+        assert 'steam_app_id' not in updates
+
+    def test_add_games_keeps_last_duplicate(self, mock_client):
+        PgsqlApiClient.add_games(mock_client, [GameRecord(730, 'CS'), GameRecord(730, 'Counter-Strike 2')])
+        
+        assert [row[:2] for row in mock_client.upsert_many.call_args[0][2]] == [(730, 'Counter-Strike 2')]
+
+    def test_get_game_names_many(self, mock_client):
+        mock_client.call_function = Mock(return_value=[(730, 'CS', 10)])
+        
+        assert mock_client.get_game_names_many((730,)) == [(730, 'CS', 10)]
+        mock_client.call_function.assert_called_once_with(
+            'get_game_names_many', ['steam_app_id', 'name', 'positive'], ([730],)
         )
 
     def test_get_steam_id_found(self, mock_client):
-        mock_client.select.return_value = ([(76561197960265729,)], [('steam_id',)])
+        mock_client.execute_prepared.return_value = [(76561197960265729,)]
         
         # Act
         result = mock_client.get_steam_id(123456789)
         
         # Assert
         assert result == 76561197960265729
-        mock_client.select.assert_called_once_with(['steam_id'], 'bot_users', "tg_id = 123456789")
+        mock_client.execute_prepared.assert_called_once_with('steam_id', (123456789,))
 
     def test_get_steam_id_not_found(self, mock_client):
-        mock_client.select.return_value = ([(None,)], [('steam_id',)])
+        mock_client.execute_prepared.return_value = [(None,)]
         
         result = mock_client.get_steam_id(123456789)
         
         assert result is None
 
     def test_get_steam_id_no_result(self, mock_client):
-        mock_client.select.return_value = ([], [('steam_id',)])
+        mock_client.execute_prepared.return_value = []
         
         result = mock_client.get_steam_id(123456789)
         
@@ -148,6 +181,56 @@ class TestPgsqlApiClient:
             [min(user_id, friend_ids[1]), max(user_id, friend_ids[1])]
         )
 
+    def test_link_steam_id(self, mock_client):
+        mock_client.link_steam_id(123, 76561197960265728)
+        
+        mock_client.update.assert_called_once_with(['steam_id'], 'bot_users', [76561197960265728], 'tg_id', 123)
+
+    def test_add_steam_friends_pins_user_to_primary(self, mock_client):
+        mock_client.pin_to_primary = Mock()
+        
+        mock_client.add_steam_friends(76561197960265728, [76561197960265729])
+        
+        mock_client.pin_to_primary.assert_called_once_with(76561197960265728)
+
+    def test_set_game_file_id(self, mock_client):
+        mock_client.set_game_file_id(730, 'AgACAgIAAxkBAAI')
+        
+        mock_client.update.assert_called_once_with(
+            ['telegram_file_id'], 'games', ['AgACAgIAAxkBAAI'], 'steam_app_id', 730
+        )
+
+    def test_get_existing_game_ids(self, mock_client):
+        mock_client.execute_prepared.return_value = [(730,)]
+        
+        result = mock_client.get_existing_game_ids([730, 570])
+        
+        assert result == {730}
+        mock_client.execute_prepared.assert_called_once_with('existing_games', ([730, 570],))
+
+    def test_get_ignored_apps(self, mock_client):
+        mock_client.execute_prepared.return_value = [(10,), (30,)]
+        
+        result = mock_client.get_ignored_apps([10, 20, 30])
+        
+        assert result == {10, 30}
+        mock_client.execute_prepared.assert_called_once_with('ignored_apps', ([10, 20, 30],))
+
+    def test_get_ignored_apps_empty(self, mock_client):
+        assert mock_client.get_ignored_apps([]) == set()
+        mock_client.execute_prepared.assert_not_called()
+
+    def test_ignore_apps(self, mock_client):
+        mock_client.ignored_app_ttl = timedelta(days=7)
+        
+        mock_client.ignore_apps([10, 20])
+        
+        columns, table, rows = mock_client.insert_many.call_args[0]
+        assert columns == ['steam_app_id', 'reason', 'expires_at']
+        assert table == 'ignored_apps'
+        assert [row[:2] for row in rows] == [[10, 'no_store_data'], [20, 'no_store_data']]
+        assert rows[0][2] - datetime.now() > timedelta(days=6)
+
     def test_add_steam_users(self, mock_client):
         steam_users = [
             {
@@ -166,11 +249,14 @@ class TestPgsqlApiClient:
         
         mock_client.add_steam_users(steam_users)
         
-        assert mock_client.insert.call_count == 2
-        mock_client.insert.assert_any_call(
+        mock_client.insert.assert_not_called()
+        mock_client.insert_many.assert_called_once_with(
             ['steam_user_id', 'username', 'profile_url', 'avatarmedium_url'],
             'steam_users',
-            ['76561197960265728', 'User1', 'http://steamcommunity.com/id/user1', 'http://example.com/avatar1.jpg']
+            [
+                ['76561197960265728', 'User1', 'http://steamcommunity.com/id/user1', 'http://example.com/avatar1.jpg'],
+                ['76561197960265729', 'User2', 'http://steamcommunity.com/id/user2', 'http://example.com/avatar2.jpg']
+            ]
         )
 
     def test_add_user_games(self, mock_client):
@@ -182,11 +268,47 @@ class TestPgsqlApiClient:
         
         mock_client.add_user_games(user_id, games_info)
         
-        assert mock_client.insert.call_count == 2
-        mock_client.insert.assert_any_call(
+        mock_client.insert.assert_not_called()
+        mock_client.upsert_many.assert_called_once_with(
             ['user_id', 'game_id', 'playtime_total'],
             'user_games',
-            [user_id, 730, 1000]
+            [[user_id, 730, 1000], [user_id, 570, 500]],
+            ['user_id', 'game_id'],
+            USER_GAME_UPDATES
+        )
+
+    def test_add_user_games_keeps_last_duplicate(self, mock_client):
+        user_id = 76561197960265728
+        
+        mock_client.add_user_games(user_id, [
+            {'appid': 730, 'playtime_forever': 10},
+            {'appid': 570, 'playtime_forever': 5},
+            {'appid': 730, 'playtime_forever': 20}
+        ])
+        
+        assert mock_client.upsert_many.call_args[0][2] == [[user_id, 730, 20], [user_id, 570, 5]]
+
+    def test_add_user_games_pins_user_to_primary(self, mock_client):
+        mock_client.pin_to_primary = Mock()
+        
+        mock_client.add_user_games(76561197960265728, [{'appid': 730, 'playtime_forever': 1000}])
+        
+        mock_client.pin_to_primary.assert_called_once_with(76561197960265728)
+
+    def test_get_friend_ids(self, mock_client):
+        mock_client.call_function = Mock(return_value=[(1,), (2,)])
+        
+        assert mock_client.get_friend_ids(76561197960265728) == [1, 2]
+        mock_client.call_function.assert_called_once_with(
+            'get_friend_ids', ['friend_id'], (76561197960265728,), pin_key=76561197960265728
+        )
+
+    def test_get_friend_ids_many(self, mock_client):
+        mock_client.call_function = Mock(return_value=[(1, 10), (1, 11), (2, 10)])
+        
+        assert mock_client.get_friend_ids_many([1, 2, 3]) == {1: [10, 11], 2: [10], 3: []}
+        mock_client.call_function.assert_called_once_with(
+            'get_friend_ids_many', ['user_id', 'friend_id'], ([1, 2, 3],)
         )
 
     def test_get_friends_updates_success(self, mock_client, mock_connection_cursor):
@@ -207,12 +329,14 @@ class TestPgsqlApiClient:
         assert "FROM get_top_new_friend_games" in sql_query
         assert params == (76561197960265728, 5, 14)
         
-        mock_connection.commit.assert_called_once()
+        mock_connection.commit.assert_not_called()
+        assert mock_connection.autocommit is True
         assert result == [(730, 'Counter-Strike: Global Offensive'), (570, 'Dota 2')]
 
     def test_get_friends_updates_with_existing_connection(self, mock_client, mock_connection_cursor):
         mock_connection, mock_cursor = mock_connection_cursor
-        mock_client.connection = mock_connection
+        mock_client.pool.idle.append(mock_connection)
+        mock_client.pool.opened = 1
         mock_cursor.fetchall.return_value = [(730, 'Counter-Strike: Global Offensive')]
         
         result = mock_client.get_friends_updates(76561197960265728)
@@ -242,15 +366,13 @@ class TestPgsqlApiClient:
         mock_connection.cursor = Mock(return_value=mock_cursor)
         mock_connection.rollback = Mock()  # rollback успешен
         
-        mock_client.connection = mock_connection
         mock_client.get_connection = Mock(return_value=mock_connection)
         
         with pytest.raises(Psycopg2Error):
             mock_client.get_friends_updates(76561197960265728)
         
         mock_connection.rollback.assert_called_once()
-        assert mock_client.connection is not None
-        assert mock_client.connection == mock_connection
+        assert mock_client.pool.idle == [mock_connection]
 
     def test_get_friends_updates_error_with_rollback_error(self, mock_client):
         mock_connection = Mock()
@@ -263,7 +385,6 @@ class TestPgsqlApiClient:
         mock_connection.cursor = Mock(return_value=mock_cursor)
         mock_connection.rollback = Mock(side_effect=Psycopg2Error("Rollback error"))
         
-        mock_client.connection = mock_connection
         mock_client.get_connection = Mock(return_value=mock_connection)
         
         with pytest.raises(Psycopg2Error):
@@ -271,7 +392,8 @@ class TestPgsqlApiClient:
         
         mock_connection.rollback.assert_called_once()
 
-        assert mock_client.connection is None
+        assert mock_client.pool.idle == []
+        assert mock_client.pool.opened == 0
 
     def test_get_similar_games_success(self, mock_client, mock_connection_cursor):
         mock_connection, mock_cursor = mock_connection_cursor
@@ -290,7 +412,8 @@ class TestPgsqlApiClient:
         assert "FROM find_similar_games" in sql_query
         assert params == (730, 5)
         
-        mock_connection.commit.assert_called_once()
+        mock_connection.commit.assert_not_called()
+        assert mock_connection.autocommit is True
         assert result == [(570, 'Dota 2'), (440, 'Team Fortress 2')]
 
     def test_get_similar_games_default_limit(self, mock_client, mock_connection_cursor):
@@ -312,6 +435,55 @@ class TestPgsqlApiClient:
         
         assert result == [(570, 'Dota 2')]
 
+    def test_iter_friends_digest(self, mock_client):
+        mock_client.stream_function = Mock(return_value=iter([(1, 730, 'Counter-Strike 2', 2)]))
+
+        result = mock_client.iter_friends_digest(limit=3, partitions=4, partition=1)
+
+        mock_client.stream_function.assert_called_once_with(
+            'get_friends_digest', ['tg_id', 'game_id', 'game_name', 'friends_count'], (3, 14, 4, 1)
+        )
+        assert list(result) == [(1, 730, 'Counter-Strike 2', 2)]
+
+    def test_log_digest(self, mock_client):
+        mock_client.log_digest([(123, 730), (123, 570), (456, 730)])
+
+        mock_client.insert_many.assert_called_once_with(
+            ['tg_id', 'game_id'], 'digest_log', [(123, 730), (123, 570), (456, 730)]
+        )
+
+    def test_search_games_success(self, mock_client, mock_connection_cursor):
+        mock_connection, mock_cursor = mock_connection_cursor
+        mock_client.get_connection.return_value = mock_connection
+        mock_cursor.fetchall.return_value = [(292030, 'The Witcher 3: Wild Hunt', 0.8)]
+
+        result = mock_client.search_games('witcher 3')
+
+        mock_cursor.execute.assert_called_once()
+
+        call_args = mock_cursor.execute.call_args
+        sql_query = call_args[0][0]
+        params = call_args[0][1]
+
+        assert "SELECT app_id, game_name, score" in sql_query
+        assert "FROM search_games" in sql_query
+        assert params == ('witcher 3', 5)
+
+        mock_connection.commit.assert_not_called()
+        assert mock_connection.autocommit is True
+        assert result == [(292030, 'The Witcher 3: Wild Hunt', 0.8)]
+
+    def test_search_games_custom_limit(self, mock_client, mock_connection_cursor):
+        mock_connection, mock_cursor = mock_connection_cursor
+        mock_client.get_connection.return_value = mock_connection
+        mock_cursor.fetchall.return_value = []
+
+        result = mock_client.search_games('unknown game', 10)
+
+        params = mock_cursor.execute.call_args[0][1]
+        assert params == ('unknown game', 10)
+        assert result == []
+
     def test_get_recommendations_success(self, mock_client, mock_connection_cursor):
         mock_connection, mock_cursor = mock_connection_cursor
         mock_client.get_connection.return_value = mock_connection
@@ -330,10 +502,11 @@ class TestPgsqlApiClient:
         params = call_args[0][1]
         
         assert "SELECT app_id, game_name" in sql_query
-        assert "FROM recommend_by_user_profile" in sql_query
-        assert params == (76561197960265728, 3)
+        assert "FROM get_user_recommendations" in sql_query
+        assert params == (76561197960265728, 3, 36)
         
-        mock_connection.commit.assert_called_once()
+        mock_connection.commit.assert_not_called()
+        assert mock_connection.autocommit is True
         assert result == [
             (730, 'Counter-Strike: Global Offensive'),
             (570, 'Dota 2'),
@@ -354,11 +527,95 @@ class TestPgsqlApiClient:
         params = call_args[0][1]
         
         assert "SELECT app_id, game_name" in sql_query
-        assert "FROM recommend_by_user_profile" in sql_query
-        assert params == (76561197960265728, 5)
+        assert "FROM get_user_recommendations" in sql_query
+        assert params == (76561197960265728, 5, 36)
         
         assert result == [(730, 'Counter-Strike: Global Offensive')]
 
+    def test_get_recommendations_max_age_from_env(self, mock_client, mock_connection_cursor):
+        mock_connection, mock_cursor = mock_connection_cursor
+        mock_client.get_connection.return_value = mock_connection
+        mock_cursor.fetchall.return_value = []
+        mock_client.recommendations_max_age_hours = 12
+
+        mock_client.get_recommendations(76561197960265728)
+
+        assert mock_cursor.execute.call_args[0][1] == (76561197960265728, 5, 12)
+
+    def test_get_linked_steam_ids(self, mock_client):
+        mock_client.select.return_value = ([(3,), (None,), (1,), (3,)], [('steam_id',)])
+
+        result = mock_client.get_linked_steam_ids()
+
+        mock_client.select.assert_called_once_with(['steam_id'], 'bot_users')
+        assert result == [1, 3]
+
+    def test_refresh_recommendations(self, mock_client, mock_connection_cursor):
+        mock_connection, mock_cursor = mock_connection_cursor
+        mock_client.get_connection.return_value = mock_connection
+        mock_cursor.fetchall.return_value = [(2,)]
+
+        result = mock_client.refresh_recommendations((1, 2), 10)
+
+        sql_query, params = mock_cursor.execute.call_args[0]
+        assert "FROM refresh_user_recommendations(%s, %s)" in sql_query
+        assert params == ([1, 2], 10)
+        mock_connection.commit.assert_called_once()
+        assert result == 2
+
+    def test_get_recommendations_cf_mode(self, mock_client, mock_connection_cursor):
+        mock_connection, mock_cursor = mock_connection_cursor
+        mock_client.get_connection.return_value = mock_connection
+        mock_cursor.fetchall.return_value = [(570, 'Dota 2')]
+
+        result = mock_client.get_recommendations(76561197960265728, 3, mode='cf')
+
+        sql_query, params = mock_cursor.execute.call_args[0]
+        assert "FROM get_neighbor_recommendations(%s, %s)" in sql_query
+        assert params == (76561197960265728, 3)
+        assert result == [(570, 'Dota 2')]
+
+    def test_get_recommendations_mode_from_env(self, mock_client, mock_connection_cursor):
+        mock_connection, mock_cursor = mock_connection_cursor
+        mock_client.get_connection.return_value = mock_connection
+        mock_cursor.fetchall.return_value = []
+        mock_client.recommendations_mode = 'cf'
+
+        mock_client.get_recommendations(76561197960265728)
+
+        assert "FROM get_neighbor_recommendations" in mock_cursor.execute.call_args[0][0]
+
+    def test_get_recommendations_unknown_mode(self, mock_client):
+        with pytest.raises(ValueError):
+            mock_client.get_recommendations(76561197960265728, mode='random')
+
+    def test_replace_game_neighbors(self, mock_client):
+        mock_client.call_function = Mock(side_effect=[[('',)], [(2,)]])
+        blocks = [[(730, 570, 0.5)], [(570, 730, 0.5)]]
+
+        result = mock_client.replace_game_neighbors(iter(blocks))
+
+        assert [c[0][0] for c in mock_client.call_function.call_args_list] == [
+            'reset_game_neighbors_staging', 'swap_game_neighbors'
+        ]
+        assert mock_client.insert_many.call_args_list == [
+            call(['game_id', 'neighbor_id', 'score'], 'game_neighbors_staging', block) for block in blocks
+        ]
+        assert result == 2
+
+    def test_compact_friend_feed(self, mock_client, mock_connection_cursor):
+        mock_connection, mock_cursor = mock_connection_cursor
+        mock_client.get_connection.return_value = mock_connection
+        mock_cursor.fetchall.return_value = [(3, 2)]
+
+        result = mock_client.compact_friend_feed()
+
+        sql_query, params = mock_cursor.execute.call_args[0]
+        assert "SELECT deleted, recomputed FROM compact_friend_feed()" in sql_query
+        assert params == ()
+        mock_connection.commit.assert_called_once()
+        assert result == (3, 2)
+
     def test_error_handling_in_select_methods(self, mock_client):
         test_cases = [
             ('get_friends_updates', (76561197960265728,)),
@@ -377,7 +634,6 @@ class TestPgsqlApiClient:
             mock_connection.cursor = Mock(return_value=mock_cursor)
             mock_connection.rollback = Mock()  # rollback успешен
             
-            mock_client.connection = mock_connection
             mock_client.get_connection = Mock(return_value=mock_connection)
             
             with pytest.raises(Psycopg2Error):
@@ -386,10 +642,9 @@ class TestPgsqlApiClient:
             
             mock_connection.rollback.assert_called_once()
             
-            assert mock_client.connection is not None
-            assert mock_client.connection == mock_connection
+            assert mock_client.pool.idle == [mock_connection]
             
-            mock_client.connection = None
+            mock_client.pool.close()
 
     def test_error_handling_with_rollback_error(self, mock_client):
         """Тест обработки ошибок когда rollback тоже падает"""
@@ -410,7 +665,6 @@ class TestPgsqlApiClient:
             mock_connection.cursor = Mock(return_value=mock_cursor)
             mock_connection.rollback = Mock(side_effect=Psycopg2Error("Rollback error"))
             
-            mock_client.connection = mock_connection
             mock_client.get_connection = Mock(return_value=mock_connection)
             
             with pytest.raises(Psycopg2Error):
@@ -419,9 +673,8 @@ class TestPgsqlApiClient:
             
             mock_connection.rollback.assert_called_once()
             
-            assert mock_client.connection is None
-            
-            mock_client.connection = None
+            assert mock_client.pool.idle == []
+            assert mock_client.pool.opened == 0
 
     def test_add_game_with_missing_fields(self, mock_client):
         game_data = (
@@ -435,10 +688,10 @@ class TestPgsqlApiClient:
             }
         )
         
-        PgsqlApiClient.add_game(mock_client, game_data)
+        PgsqlApiClient.add_game(mock_client, GameRecord.from_appdetails(*game_data))
         
-        mock_client.insert.assert_called_once()
-        call_args = mock_client.insert.call_args[0]
+        mock_client.upsert_many.assert_called_once()
+        call_args = mock_client.upsert_many.call_args[0]
         assert call_args[0] == [
             'steam_app_id', 'name', 'release_date', 'required_age',
             'short_description', 'header_image_url', 'categories',
@@ -446,7 +699,7 @@ class TestPgsqlApiClient:
             'average_playtime_forever', 'average_playtime_2weeks',
             'median_playtime_forever', 'median_playtime_2weeks', 'tags'
         ]
-        data = call_args[2]
+        data = call_args[2][0]
         assert data[3] == 0  # required_age
         assert data[4] is None  # short_description
         assert data[5] is None  # header_image_url
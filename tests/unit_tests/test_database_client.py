@@ -1,8 +1,13 @@
+import json
+import threading
 import pytest
 import psycopg2
 from unittest.mock import Mock, patch, MagicMock
 
-from sources.database_client import PgsqlClient
+from psycopg2.extensions import QueryCanceledError
+
+from sources.database_client import ConnectionPool, PgsqlClient
+from sources.deadline import DeadlineExceeded, deadline
 
 class TestPgsqlClientInitialization:  
     def test_init_loads_env_file(self):
@@ -26,7 +31,7 @@ class TestPgsqlClientInitialization:
             assert client.db_base == 'test_db'
             assert client.db_user == 'test_user'
             assert client.db_pass == 'test_pass'
-            assert client.connection is None
+            assert client.pool.opened == 0
     
     def test_init_with_defaults(self):
         with patch('sources.database_client.load_dotenv') as mock_load_dotenv, \
@@ -79,7 +84,7 @@ class TestGetConnection:
 
 
 class TestSelectMethod:    
-    def test_select_basic_query(self, pgsql_client_with_mocks, mock_cursor):
+    def test_select_basic_query(self, pgsql_client_with_mocks, mock_connection, mock_cursor):
         mock_cursor.fetchall.return_value = [('row1', 'data1'), ('row2', 'data2')]
         mock_cursor.description = [('col1',), ('col2',)]
         
@@ -90,7 +95,8 @@ class TestSelectMethod:
         
         assert result == ([('row1', 'data1'), ('row2', 'data2')], [('col1',), ('col2',)])
         mock_cursor.execute.assert_called_once_with("SELECT col1, col2 FROM users")
-        pgsql_client_with_mocks.connection.commit.assert_called_once()
+        mock_connection.commit.assert_not_called()
+        assert mock_connection.autocommit is True
     
     def test_select_with_where_clause(self, pgsql_client_with_mocks, mock_cursor):
         mock_cursor.fetchall.return_value = [('user1',)]
@@ -99,10 +105,10 @@ class TestSelectMethod:
         result = pgsql_client_with_mocks.select(
             attributes=['username'],
             table='users',
-            where='id = 123'
+            where={'id': 123}
         )
         
-        mock_cursor.execute.assert_called_once_with("SELECT username FROM users WHERE id = 123")
+        mock_cursor.execute.assert_called_once_with("SELECT username FROM users WHERE id = %s", (123,))
         assert result == ([('user1',)], [('username',)])
     
     def test_select_with_complex_where(self, pgsql_client_with_mocks, mock_cursor):
@@ -112,11 +118,11 @@ class TestSelectMethod:
         pgsql_client_with_mocks.select(
             attributes=['*'],
             table='games',
-            where="release_date > '2023-01-01' AND price < 50"
+            where={'name': 'Dota 2', 'required_age': 0}
         )
         
-        expected_query = "SELECT * FROM games WHERE release_date > '2023-01-01' AND price < 50"
-        mock_cursor.execute.assert_called_once_with(expected_query)
+        expected_query = "SELECT * FROM games WHERE name = %s AND required_age = %s"
+        mock_cursor.execute.assert_called_once_with(expected_query, ('Dota 2', 0))
     
     def test_select_empty_result(self, pgsql_client_with_mocks, mock_cursor):
         mock_cursor.fetchall.return_value = []
@@ -125,11 +131,11 @@ class TestSelectMethod:
         result = pgsql_client_with_mocks.select(
             attributes=['id', 'name'],
             table='games',
-            where='id = 999'
+            where={'id': 999}
         )
         
         assert result == ([], [])
-        mock_cursor.execute.assert_called_once_with("SELECT id, name FROM games WHERE id = 999")
+        mock_cursor.execute.assert_called_once_with("SELECT id, name FROM games WHERE id = %s", (999,))
     
     def test_select_creates_connection_if_none(self, mock_connection, mock_cursor):
         with patch('sources.database_client.load_dotenv'), \
@@ -143,29 +149,30 @@ class TestSelectMethod:
                 result = client.select(['data'], 'test_table')
                 
                 mock_get_conn.assert_called_once()
-                assert client.connection == mock_connection
+                assert client.pool.idle == [mock_connection]
                 assert result == ([('test',)], [('data',)])
     
-    def test_select_with_psycopg2_error(self, pgsql_client_with_mocks, mock_cursor):
+    def test_select_with_psycopg2_error(self, pgsql_client_with_mocks, mock_connection, mock_cursor):
         mock_cursor.execute.side_effect = psycopg2.Error("SQL error")
         
         with pytest.raises(psycopg2.Error):
             pgsql_client_with_mocks.select(['col'], 'table')
         
-        pgsql_client_with_mocks.connection.rollback.assert_called_once()
+        mock_connection.rollback.assert_called_once()
     
-    def test_select_with_psycopg2_error_and_rollback_fails(self, pgsql_client_with_mocks, mock_cursor):
+    def test_select_with_psycopg2_error_and_rollback_fails(self, pgsql_client_with_mocks, mock_connection, mock_cursor):
         mock_cursor.execute.side_effect = psycopg2.Error("SQL error")
-        pgsql_client_with_mocks.connection.rollback.side_effect = psycopg2.Error("Rollback failed")
+        mock_connection.rollback.side_effect = psycopg2.Error("Rollback failed")
         
         with pytest.raises(psycopg2.Error):
             pgsql_client_with_mocks.select(['col'], 'table')
         
-        assert pgsql_client_with_mocks.connection is None
+        mock_connection.close.assert_called_once()
+        assert pgsql_client_with_mocks.pool.opened == 0
 
 
 class TestInsertMethod:
-    def test_insert_basic(self, pgsql_client_with_mocks, mock_cursor):
+    def test_insert_basic(self, pgsql_client_with_mocks, mock_connection, mock_cursor):
         pgsql_client_with_mocks.insert(
             attributes=['username', 'email'],
             table='users',
@@ -174,7 +181,7 @@ class TestInsertMethod:
         
         expected_query = "INSERT INTO users (username, email) VALUES (%s, %s)"
         mock_cursor.execute.assert_called_once_with(expected_query, ['john_doe', 'john@example.com'])
-        pgsql_client_with_mocks.connection.commit.assert_called_once()
+        mock_connection.commit.assert_called_once()
     
     def test_insert_multiple_values(self, pgsql_client_with_mocks, mock_cursor):
         pgsql_client_with_mocks.insert(
@@ -198,19 +205,49 @@ class TestInsertMethod:
                 client.insert(['col'], 'table', ['value'])
                 
                 mock_get_conn.assert_called_once()
-                assert client.connection == mock_connection
+                assert client.pool.idle == [mock_connection]
     
-    def test_insert_with_psycopg2_error(self, pgsql_client_with_mocks, mock_cursor):
+    def test_insert_with_psycopg2_error(self, pgsql_client_with_mocks, mock_connection, mock_cursor):
         mock_cursor.execute.side_effect = psycopg2.Error("Duplicate key")
         
         with pytest.raises(psycopg2.Error):
             pgsql_client_with_mocks.insert(['col'], 'table', ['value'])
         
-        pgsql_client_with_mocks.connection.rollback.assert_called_once()
+        mock_connection.rollback.assert_called_once()
+
 
+class TestInsertManyMethod:
+    def test_insert_many_single_statement(self, pgsql_client_with_mocks, mock_connection, mock_cursor):
+        rows = [[1, 'a'], [2, 'b']]
+        
+        with patch('sources.database_client.execute_values') as mock_execute_values:
+            pgsql_client_with_mocks.insert_many(['id', 'name'], 'users', rows)
+        
+        mock_execute_values.assert_called_once_with(
+            mock_cursor, "INSERT INTO users (id, name) VALUES %s", rows, page_size=2
+        )
+        mock_connection.commit.assert_called_once()
+    
+    def test_insert_many_empty_rows(self, pgsql_client_with_mocks, mock_connection, mock_cursor):
+        pgsql_client_with_mocks.insert_many(['id'], 'users', [])
+        
+        mock_cursor.execute.assert_not_called()
+        mock_connection.commit.assert_not_called()
+
+    def test_upsert_many_single_statement(self, pgsql_client_with_mocks, mock_connection, mock_cursor):
+        rows = [[1, 'a']]
+        
+        with patch('sources.database_client.execute_values') as mock_execute_values:
+            pgsql_client_with_mocks.upsert_many(['id', 'name'], 'users', rows, ['id'], {'name': 'EXCLUDED.name'})
+        
+        mock_execute_values.assert_called_once_with(
+            mock_cursor, "INSERT INTO users (id, name) VALUES %s ON CONFLICT (id) DO UPDATE SET name = EXCLUDED.name", rows,
+            page_size=1
+        )
+        mock_connection.commit.assert_called_once()
 
 class TestUpdateMethod:
-    def test_update_basic(self, pgsql_client_with_mocks, mock_cursor):
+    def test_update_basic(self, pgsql_client_with_mocks, mock_connection, mock_cursor):
         pgsql_client_with_mocks.update(
             attributes=['username', 'email'],
             table='users',
@@ -219,9 +256,9 @@ class TestUpdateMethod:
             id=123
         )
         
-        expected_query = "UPDATE users SET username = 'new_username', email = 'example' WHERE user_id = 123"
-        mock_cursor.execute.assert_called_once_with(expected_query)
-        pgsql_client_with_mocks.connection.commit.assert_called_once()
+        expected_query = "UPDATE users SET username = %s, email = %s WHERE user_id = %s"
+        mock_cursor.execute.assert_called_once_with(expected_query, ('new_username', 'example', 123))
+        mock_connection.commit.assert_called_once()
     
     def test_update_single_field(self, pgsql_client_with_mocks, mock_cursor):
         pgsql_client_with_mocks.update(
@@ -232,8 +269,8 @@ class TestUpdateMethod:
             id=456
         )
         
-        expected_query = "UPDATE users SET last_login = '2024-01-15 10:30:00' WHERE id = 456"
-        mock_cursor.execute.assert_called_once_with(expected_query)
+        expected_query = "UPDATE users SET last_login = %s WHERE id = %s"
+        mock_cursor.execute.assert_called_once_with(expected_query, ('2024-01-15 10:30:00', 456))
     
     def test_update_with_numeric_id(self, pgsql_client_with_mocks, mock_cursor):
         pgsql_client_with_mocks.update(
@@ -246,8 +283,9 @@ class TestUpdateMethod:
         
         mock_cursor.execute.assert_called_once()
         call_args = mock_cursor.execute.call_args
-        assert "playtime = '150'" in call_args[0][0]
-        assert "WHERE game_id = 789" in call_args[0][0]
+        assert "playtime = %s" in call_args[0][0]
+        assert "WHERE game_id = %s" in call_args[0][0]
+        assert call_args[0][1] == (150, 789)
     
     def test_update_creates_connection_if_none(self, mock_connection):
         with patch('sources.database_client.load_dotenv'), \
@@ -259,34 +297,34 @@ class TestUpdateMethod:
                 client.update(['col'], 'table', ['value'], 'id', 1)
                 
                 mock_get_conn.assert_called_once()
-                assert client.connection == mock_connection
+                assert client.pool.idle == [mock_connection]
 
 
 class TestDeleteMethod:
     """Тесты метода delete"""
     
-    def test_delete_basic(self, pgsql_client_with_mocks, mock_cursor):
+    def test_delete_basic(self, pgsql_client_with_mocks, mock_connection, mock_cursor):
         pgsql_client_with_mocks.delete(
-            attributes=['1', '2', '3'],
+            attributes=[1, 2, 3],
             table='temp_data'
         )
         
-        expected_query = "DELETE FROM temp_data WHERE id IN (1, 2, 3)"
-        mock_cursor.execute.assert_called_once_with(expected_query)
-        pgsql_client_with_mocks.connection.commit.assert_called_once()
+        expected_query = "DELETE FROM temp_data WHERE id = ANY(%s)"
+        mock_cursor.execute.assert_called_once_with(expected_query, ([1, 2, 3],))
+        mock_connection.commit.assert_called_once()
     
     def test_delete_single_id(self, pgsql_client_with_mocks, mock_cursor):
         pgsql_client_with_mocks.delete(
-            attributes=['999'],
+            attributes=[999],
             table='logs'
         )
         
-        expected_query = "DELETE FROM logs WHERE id IN (999)"
-        mock_cursor.execute.assert_called_once_with(expected_query)
+        expected_query = "DELETE FROM logs WHERE id = ANY(%s)"
+        mock_cursor.execute.assert_called_once_with(expected_query, ([999],))
 
 
 class TestErrorHandling:    
-    def test_all_methods_rollback_on_error(self, pgsql_client_with_mocks, mock_cursor):
+    def test_all_methods_rollback_on_error(self, pgsql_client_with_mocks, mock_connection, mock_cursor):
         mock_cursor.execute.side_effect = psycopg2.Error("Test error")
         
         methods_to_test = [
@@ -297,36 +335,47 @@ class TestErrorHandling:
         ]
         
         for method_name, args in methods_to_test:
-            pgsql_client_with_mocks.connection.rollback.reset_mock()
+            mock_connection.rollback.reset_mock()
             
             with pytest.raises(psycopg2.Error):
                 method = getattr(pgsql_client_with_mocks, method_name)
                 method(*args)
             
-            pgsql_client_with_mocks.connection.rollback.assert_called_once()
+            mock_connection.rollback.assert_called_once()
     
-    def test_rollback_failure_sets_connection_to_none(self, pgsql_client_with_mocks, mock_cursor):
+    def test_rollback_failure_sets_connection_to_none(self, pgsql_client_with_mocks, mock_connection, mock_cursor):
         mock_cursor.execute.side_effect = psycopg2.Error("SQL error")
-        pgsql_client_with_mocks.connection.rollback.side_effect = psycopg2.Error("Rollback failed")
+        mock_connection.rollback.side_effect = psycopg2.Error("Rollback failed")
         
         with pytest.raises(psycopg2.Error):
             pgsql_client_with_mocks.select(['col'], 'table')
         
-        assert pgsql_client_with_mocks.connection is None
+        mock_connection.close.assert_called_once()
+        assert pgsql_client_with_mocks.pool.opened == 0
 
 
 class TestSQLInjectionSafety:
     def test_select_sql_injection_attempt(self, pgsql_client_with_mocks, mock_cursor):
-        dangerous_where = "id = 1; DROP TABLE users; --"
+        dangerous_value = "1; DROP TABLE users; --"
         
         pgsql_client_with_mocks.select(
             attributes=['*'],
             table='users',
-            where=dangerous_where
+            where={'id': dangerous_value}
         )
         
         call_args = mock_cursor.execute.call_args
-        assert "DROP TABLE" in call_args[0][0]
+        assert "DROP TABLE" not in call_args[0][0]
+        assert call_args[0][1] == (dangerous_value,)
+    
+    def test_update_uses_parameterized_query(self, pgsql_client_with_mocks, mock_cursor):
+        dangerous_value = "x'; DROP TABLE users; --"
+        
+        pgsql_client_with_mocks.update(['username'], 'users', [dangerous_value], 'id', 1)
+        
+        call_args = mock_cursor.execute.call_args
+        assert "DROP TABLE" not in call_args[0][0]
+        assert call_args[0][1] == (dangerous_value, 1)
     
     def test_insert_uses_parameterized_query(self, pgsql_client_with_mocks, mock_cursor):
         dangerous_data = ["test'; DROP TABLE users; --", "hacker@example.com"]
@@ -340,3 +389,478 @@ class TestSQLInjectionSafety:
         call_args = mock_cursor.execute.call_args
         assert '%s' in call_args[0][0]  
         assert call_args[0][1] == dangerous_data
+
+
+class TestExecutePrepared:
+    def test_prepares_once_per_connection(self, pgsql_client_with_mocks, mock_cursor):
+        mock_cursor.fetchall.return_value = [(76561198000000000,)]
+        
+        pgsql_client_with_mocks.execute_prepared('steam_id', (123,))
+        result = pgsql_client_with_mocks.execute_prepared('steam_id', (456,))
+        
+        assert result == [(76561198000000000,)]
+        queries = [c[0][0] for c in mock_cursor.execute.call_args_list]
+        assert queries == [
+            "PREPARE steam_id AS SELECT steam_id FROM bot_users WHERE tg_id = $1",
+            "EXECUTE steam_id (%s)",
+            "EXECUTE steam_id (%s)"
+        ]
+        assert mock_cursor.execute.call_args_list[-1][0][1] == (456,)
+    
+    def test_prepares_again_on_new_connection(self, pgsql_client_with_mocks, mock_cursor, mock_connection):
+        mock_cursor.fetchall.return_value = []
+        pgsql_client_with_mocks.execute_prepared('game_info', (10,))
+        
+        new_connection = Mock()
+        new_connection.cursor.return_value = mock_cursor
+        pgsql_client_with_mocks.pool.close()
+        pgsql_client_with_mocks.get_connection.return_value = new_connection
+        pgsql_client_with_mocks.execute_prepared('game_info', (10,))
+        
+        queries = [c[0][0] for c in mock_cursor.execute.call_args_list]
+        assert sum(q.startswith('PREPARE game_info') for q in queries) == 2
+
+class TestConnectionPool:
+    @staticmethod
+    def connection(cursor):
+        connection = MagicMock()
+        connection.cursor.return_value.__enter__.return_value = cursor
+        return connection
+
+    def test_concurrent_queries_use_separate_connections(self, pgsql_client_with_mocks):
+        started = threading.Barrier(2, timeout=5)
+        cursor = Mock()
+        # Оба запроса должны выполняться одновременно, иначе барьер не дождётся второго потока
+        cursor.execute.side_effect = lambda *args: started.wait()
+        cursor.fetchall.return_value = []
+        connections = [self.connection(cursor), self.connection(cursor)]
+        pgsql_client_with_mocks.get_connection = Mock(side_effect=connections)
+        
+        threads = [
+            threading.Thread(target=pgsql_client_with_mocks.select, args=(['steam_app_id'], 'games'))
+            for _ in range(2)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(5)
+        
+        assert cursor.execute.call_count == 2
+        assert sorted(map(id, pgsql_client_with_mocks.pool.idle)) == sorted(map(id, connections))
+
+    def test_connection_reused(self, pgsql_client_with_mocks, mock_cursor):
+        mock_cursor.fetchall.return_value = []
+        pgsql_client_with_mocks.select(['steam_app_id'], 'games')
+        pgsql_client_with_mocks.select(['steam_app_id'], 'games')
+        
+        pgsql_client_with_mocks.get_connection.assert_called_once()
+        assert pgsql_client_with_mocks.pool.opened == 1
+
+    def test_acquire_waits_for_release_when_exhausted(self):
+        pool = ConnectionPool(Mock(side_effect=[Mock(), Mock()]), size=1)
+        first = pool.acquire()
+        acquired = []
+        waiter = threading.Thread(target=lambda: acquired.append(pool.acquire()))
+        waiter.start()
+        waiter.join(0.1)
+        assert acquired == []
+        
+        pool.release(first)
+        waiter.join(5)
+        
+        assert acquired == [first]
+        pool.connect.assert_called_once()
+
+    def test_broken_connection_replaced(self):
+        broken, fresh = Mock(), Mock()
+        pool = ConnectionPool(Mock(side_effect=[broken, fresh]), size=1)
+        pool.release(pool.acquire(), broken=True)
+        
+        assert pool.acquire() is fresh
+        broken.close.assert_called_once()
+        assert pool.opened == 1
+
+    def test_failed_connect_frees_slot(self):
+        fresh = Mock()
+        pool = ConnectionPool(Mock(side_effect=[psycopg2.OperationalError('refused'), fresh]), size=1)
+        with pytest.raises(psycopg2.OperationalError):
+            pool.acquire()
+        
+        assert pool.acquire() is fresh
+
+    def test_resize_pool_only_grows(self, pgsql_client_with_mocks):
+        pgsql_client_with_mocks.resize_pool(10)
+        pgsql_client_with_mocks.resize_pool(2)
+        
+        assert pgsql_client_with_mocks.pool.size == 10
+
+class TestStreamFunction:
+    def test_streams_rows_with_named_cursor(self, pgsql_client_with_mocks, mock_connection):
+        stream_cursor = MagicMock()
+        stream_cursor.__enter__.return_value = stream_cursor
+        stream_cursor.__iter__.return_value = iter([(1, 730), (1, 570), (2, 730)])
+        stream_connection = Mock()
+        stream_connection.cursor.return_value = stream_cursor
+        pgsql_client_with_mocks.get_connection = Mock(return_value=stream_connection)
+        
+        rows = pgsql_client_with_mocks.stream_function('get_friends_digest', ['tg_id', 'game_id'], (5, 14), itersize=50)
+        stream_connection.cursor.assert_not_called()
+        
+        assert list(rows) == [(1, 730), (1, 570), (2, 730)]
+        stream_connection.cursor.assert_called_once_with(name='stream_get_friends_digest')
+        assert stream_cursor.itersize == 50
+        stream_cursor.execute.assert_called_once_with("SELECT tg_id, game_id FROM get_friends_digest(%s, %s)", (5, 14))
+        stream_connection.close.assert_called_once()
+        # Основное соединение не используется
+        mock_connection.cursor.assert_not_called()
+    
+    def test_connection_closed_when_stream_abandoned(self, pgsql_client_with_mocks):
+        stream_cursor = MagicMock()
+        stream_cursor.__enter__.return_value = stream_cursor
+        stream_cursor.__iter__.return_value = iter([(1,), (2,)])
+        stream_connection = Mock()
+        stream_connection.cursor.return_value = stream_cursor
+        pgsql_client_with_mocks.get_connection = Mock(return_value=stream_connection)
+        
+        rows = pgsql_client_with_mocks.stream_function('get_friends_digest', ['tg_id'], ())
+        assert next(rows) == (1,)
+        rows.close()
+        
+        stream_connection.close.assert_called_once()
+
+class TestSlowQueryLog:
+    def test_fast_query_not_logged(self, pgsql_client_with_mocks, mock_cursor, caplog):
+        mock_cursor.fetchall.return_value = []
+        
+        with caplog.at_level('WARNING', logger='sources.database_client'):
+            pgsql_client_with_mocks.select(['col'], 'games')
+        
+        assert "Медленный запрос" not in caplog.text
+    
+    def test_slow_query_logged_with_params(self, pgsql_client_with_mocks, mock_cursor, caplog):
+        pgsql_client_with_mocks.slow_query_ms = 0
+        
+        with caplog.at_level('WARNING', logger='sources.database_client'):
+            pgsql_client_with_mocks.insert(['name'], 'games', ['Dota 2'])
+        
+        assert "Медленный запрос insert games" in caplog.text
+        assert "Dota 2" in caplog.text
+    
+    def test_explain_captured_for_sampled_select(self, pgsql_client_with_mocks, mock_connection, mock_cursor, tmp_path):
+        pgsql_client_with_mocks.slow_query_ms = 0
+        pgsql_client_with_mocks.explain_sample_rate = 1
+        pgsql_client_with_mocks.explain_log = str(tmp_path / 'plans.jsonl')
+        mock_cursor.fetchall.return_value = [(570, 'Dota 2')]
+        mock_cursor.fetchone.return_value = ([{'Plan': {'Node Type': 'Function Scan'}}],)
+        
+        result = pgsql_client_with_mocks.call_function('find_similar_games', ['app_id', 'game_name'], (730, 5))
+        
+        assert result == [(570, 'Dota 2')]
+        _, set_timeout, explain = mock_cursor.execute.call_args_list
+        assert set_timeout[0] == ("SET LOCAL statement_timeout = %s", (5000,))
+        assert explain[0][0].startswith("EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON)")
+        assert explain[0][1] == (730, 5)
+        # SET LOCAL действует только в транзакции, которая затем откатывается
+        assert mock_connection.autocommit is False
+        mock_connection.rollback.assert_called_once()
+        
+        records = [json.loads(line) for line in open(tmp_path / 'plans.jsonl', encoding='utf-8')]
+        assert len(records) == 1
+        assert records[0]['target'] == 'find_similar_games'
+        assert records[0]['plan'] == [{'Plan': {'Node Type': 'Function Scan'}}]
+    
+    def test_explain_skipped_for_writes(self, pgsql_client_with_mocks, mock_cursor, tmp_path):
+        pgsql_client_with_mocks.slow_query_ms = 0
+        pgsql_client_with_mocks.explain_sample_rate = 1
+        pgsql_client_with_mocks.explain_log = str(tmp_path / 'plans.jsonl')
+        
+        pgsql_client_with_mocks.insert(['name'], 'games', ['Dota 2'])
+        
+        mock_cursor.execute.assert_called_once()
+        assert not (tmp_path / 'plans.jsonl').exists()
+    
+    def test_explain_skipped_for_writing_functions(self, pgsql_client_with_mocks, mock_cursor, tmp_path):
+        pgsql_client_with_mocks.slow_query_ms = 0
+        pgsql_client_with_mocks.explain_sample_rate = 1
+        pgsql_client_with_mocks.explain_log = str(tmp_path / 'plans.jsonl')
+        mock_cursor.fetchall.return_value = [(3, 1)]
+        
+        pgsql_client_with_mocks.call_function('compact_friend_feed', ['deleted', 'recomputed'], (), readonly=False)
+        
+        mock_cursor.execute.assert_called_once()
+        assert not (tmp_path / 'plans.jsonl').exists()
+
+    def test_explain_limited_by_command_budget(self, pgsql_client_with_mocks, mock_cursor, tmp_path):
+        pgsql_client_with_mocks.slow_query_ms = 0
+        pgsql_client_with_mocks.explain_sample_rate = 1
+        pgsql_client_with_mocks.explain_log = str(tmp_path / 'plans.jsonl')
+        mock_cursor.fetchall.return_value = []
+        mock_cursor.fetchone.return_value = ([],)
+        
+        with deadline(1):
+            pgsql_client_with_mocks.call_function('find_similar_games', ['app_id'], (730, 5))
+        
+        explain_timeout = mock_cursor.execute.call_args_list[2][0][1][0]
+        assert 900 <= explain_timeout <= 1000
+
+    def test_explain_failure_does_not_break_query(self, pgsql_client_with_mocks, mock_cursor, tmp_path):
+        pgsql_client_with_mocks.slow_query_ms = 0
+        pgsql_client_with_mocks.explain_sample_rate = 1
+        pgsql_client_with_mocks.explain_log = str(tmp_path / 'plans.jsonl')
+        mock_cursor.fetchall.return_value = [('row',)]
+        mock_cursor.description = [('col',)]
+        mock_cursor.execute.side_effect = [None, psycopg2.Error("permission denied")]
+        
+        result = pgsql_client_with_mocks.select(['col'], 'games')
+        
+        assert result == ([('row',)], [('col',)])
+        assert not (tmp_path / 'plans.jsonl').exists()
+
+class TestReplicaRouting:
+    @pytest.fixture
+    def replica_client(self, mock_connection):
+        with patch('sources.database_client.load_dotenv'), \
+             patch('sources.database_client.os.getenv') as mock_getenv:
+            mock_getenv.side_effect = lambda key, default=None: {
+                'DB_NAME': 'test_db',
+                'DB_REPLICA_DSNS': 'host=replica1 dbname=test_db, host=replica2 dbname=test_db',
+                'DB_REPLICA_RETRY_SECONDS': '30',
+                'DB_READ_YOUR_WRITES_SECONDS': '30'
+            }.get(key, default)
+            client = PgsqlClient("test.env")
+        client.get_connection = Mock(return_value=mock_connection)
+        for replica in client.replicas:
+            replica.pool.connect = Mock(return_value=MagicMock())
+        return client
+
+    @staticmethod
+    def replica_queries(replica):
+        cursor = replica.pool.connect.return_value.cursor.return_value.__enter__.return_value
+        return [c[0][0] for c in cursor.execute.call_args_list]
+
+    def test_replicas_parsed_from_env(self, replica_client):
+        assert [(r.name, r.dsn) for r in replica_client.replicas] == [
+            ('replica-1', 'host=replica1 dbname=test_db'),
+            ('replica-2', 'host=replica2 dbname=test_db')
+        ]
+
+    def test_no_replicas_by_default(self, pgsql_client_with_mocks, mock_cursor):
+        mock_cursor.fetchall.return_value = []
+        pgsql_client_with_mocks.select(['id'], 'games')
+        
+        assert pgsql_client_with_mocks.replicas == []
+        mock_cursor.execute.assert_called_once()
+
+    def test_reads_round_robin_over_replicas(self, replica_client, mock_cursor):
+        for _ in range(4):
+            replica_client.select(['steam_app_id'], 'games')
+        
+        first, second = replica_client.replicas
+        assert len(self.replica_queries(first)) == 2
+        assert len(self.replica_queries(second)) == 2
+        mock_cursor.execute.assert_not_called()
+
+    def test_writes_and_prepared_go_to_primary(self, replica_client, mock_cursor):
+        mock_cursor.fetchall.return_value = []
+        replica_client.insert(['tg_id'], 'bot_users', [1])
+        replica_client.call_function('refresh_user_recommendations', ['count'], ([1], 20), readonly=False)
+        replica_client.execute_prepared('steam_id', (1,))
+        
+        assert mock_cursor.execute.call_count == 4
+        for replica in replica_client.replicas:
+            assert self.replica_queries(replica) == []
+
+    def test_failed_replica_falls_back_to_primary(self, replica_client, mock_cursor):
+        from sources.metrics import DB_REPLICA_ERRORS
+        first, second = replica_client.replicas
+        broken = first.pool.connect.return_value
+        broken.cursor.return_value.__enter__.return_value.execute.side_effect = psycopg2.OperationalError('down')
+        broken.rollback.side_effect = psycopg2.InterfaceError('closed')
+        mock_cursor.fetchall.return_value = [(730,)]
+        before = DB_REPLICA_ERRORS.value(server='replica-1')
+        
+        result = replica_client.select(['steam_app_id'], 'games')
+        
+        assert result[0] == [(730,)]
+        mock_cursor.execute.assert_called_once()
+        broken.close.assert_called_once()
+        assert first.pool.opened == 0
+        assert first.down_until > 0
+        assert DB_REPLICA_ERRORS.value(server='replica-1') == before + 1
+        # Пока реплика исключена из ротации, чтения идут на оставшуюся
+        replica_client.select(['steam_app_id'], 'games')
+        replica_client.select(['steam_app_id'], 'games')
+        assert len(self.replica_queries(second)) == 2
+
+    def test_replica_retried_after_cooldown(self, replica_client):
+        first, second = replica_client.replicas
+        first.down_until = 100.0
+        
+        with patch('sources.database_client.time.monotonic', return_value=50.0):
+            assert replica_client._next_replica() is second
+            assert replica_client._next_replica() is second
+        with patch('sources.database_client.time.monotonic', return_value=150.0):
+            assert {replica_client._next_replica(), replica_client._next_replica()} == {first, second}
+
+    @staticmethod
+    def probe_connection(lag=None, error=None):
+        connection = MagicMock()
+        cursor = connection.cursor.return_value.__enter__.return_value
+        if error is not None:
+            cursor.execute.side_effect = error
+        cursor.fetchone.return_value = (lag,)
+        return connection
+
+    def test_probe_excludes_lagging_replica(self, replica_client):
+        from sources.metrics import DB_REPLICA_LAG
+        first, second = replica_client.replicas
+        connections = [self.probe_connection(lag=120.0), self.probe_connection(lag=0.5)]
+        
+        with patch('sources.database_client.psycopg2.connect', side_effect=connections) as connect:
+            replica_client.probe_replicas()
+        
+        assert connect.call_args_list[0][0] == (first.dsn,)
+        assert connect.call_args_list[0][1]['connect_timeout'] == 5
+        assert not first.healthy and second.healthy
+        assert DB_REPLICA_LAG.value(server='replica-1') == 120.0
+        assert replica_client._next_replica() is second
+        assert replica_client._next_replica() is second
+        for connection in connections:
+            connection.close.assert_called_once()
+
+    def test_failed_replica_returns_only_after_probe(self, replica_client, mock_cursor):
+        replica_client.replica_probe_seconds = 10
+        first, second = replica_client.replicas
+        replica_client._mark_down(first, psycopg2.OperationalError('down'))
+        
+        # Срок исключения прошёл, но без успешной проверки реплика в ротацию не возвращается
+        with patch('sources.database_client.time.monotonic', return_value=first.down_until + 1):
+            assert {replica_client._next_replica(), replica_client._next_replica()} == {second}
+        
+        connections = [
+            self.probe_connection(error=psycopg2.OperationalError('refused')), self.probe_connection(lag=0.0)
+        ]
+        with patch('sources.database_client.psycopg2.connect', side_effect=connections):
+            replica_client.probe_replicas()
+        assert not first.healthy
+        
+        with patch('sources.database_client.psycopg2.connect', return_value=self.probe_connection(lag=0.0)):
+            replica_client.probe_replicas()
+        assert first.healthy
+        assert {replica_client._next_replica(), replica_client._next_replica()} == {first, second}
+
+    def test_all_replicas_down_uses_primary(self, replica_client, mock_cursor):
+        for replica in replica_client.replicas:
+            replica.down_until = float('inf')
+        mock_cursor.fetchall.return_value = []
+        
+        replica_client.select(['steam_app_id'], 'games')
+        
+        mock_cursor.execute.assert_called_once()
+
+    def test_pinned_key_reads_from_primary(self, replica_client, mock_cursor):
+        mock_cursor.fetchall.return_value = []
+        replica_client.pin_to_primary(42)
+        
+        replica_client.call_function('get_top_new_friend_games', ['game_id'], (42, 5, 14), pin_key=42)
+        replica_client.call_function('get_top_new_friend_games', ['game_id'], (7, 5, 14), pin_key=7)
+        
+        mock_cursor.execute.assert_called_once()
+        assert mock_cursor.execute.call_args[0][1] == (42, 5, 14)
+
+    def test_pin_expires(self, replica_client, mock_cursor):
+        with patch('sources.database_client.time.monotonic', return_value=0.0):
+            replica_client.pin_to_primary(42)
+        with patch('sources.database_client.time.monotonic', return_value=31.0):
+            replica_client.call_function('get_top_new_friend_games', ['game_id'], (42, 5, 14), pin_key=42)
+        
+        mock_cursor.execute.assert_not_called()
+        assert 42 not in replica_client.pinned
+
+    def test_queries_counted_per_server(self, replica_client, mock_cursor):
+        from sources.metrics import DB_SERVER_QUERIES
+        before = {name: DB_SERVER_QUERIES.value(server=name) for name in ('primary', 'replica-1', 'replica-2')}
+        
+        replica_client.select(['steam_app_id'], 'games')
+        replica_client.select(['steam_app_id'], 'games')
+        replica_client.insert(['tg_id'], 'bot_users', [1])
+        
+        for name in before:
+            assert DB_SERVER_QUERIES.value(server=name) == before[name] + 1
+
+
+class TestDeadlines:
+    def test_read_with_budget_sets_statement_timeout(self, pgsql_client_with_mocks, mock_connection, mock_cursor):
+        mock_connection.autocommit = True
+        mock_cursor.fetchall.return_value = []
+        
+        with deadline(2):
+            pgsql_client_with_mocks.select(['steam_app_id'], 'games')
+        
+        set_timeout, query = mock_cursor.execute.call_args_list
+        assert set_timeout[0][0] == "SET LOCAL statement_timeout = %s"
+        assert 1900 <= set_timeout[0][1][0] <= 2000
+        assert 'SELECT' in query[0][0]
+        assert mock_connection.autocommit is False
+        mock_connection.commit.assert_called_once()
+
+    def test_read_without_budget_uses_autocommit(self, pgsql_client_with_mocks, mock_connection, mock_cursor):
+        mock_connection.autocommit = False
+        mock_cursor.fetchall.return_value = []
+        
+        pgsql_client_with_mocks.select(['steam_app_id'], 'games')
+        
+        mock_cursor.execute.assert_called_once()
+        assert mock_connection.autocommit is True
+
+    def test_expired_budget_skips_query(self, pgsql_client_with_mocks, mock_cursor):
+        with deadline(0):
+            with pytest.raises(DeadlineExceeded):
+                pgsql_client_with_mocks.select(['steam_app_id'], 'games')
+        
+        mock_cursor.execute.assert_not_called()
+
+    def test_statement_timeout_raises_deadline_exceeded(self, pgsql_client_with_mocks, mock_connection, mock_cursor):
+        from sources.metrics import DB_STATEMENT_TIMEOUTS
+        mock_cursor.execute.side_effect = [None, QueryCanceledError("canceling statement due to statement timeout")]
+        before = DB_STATEMENT_TIMEOUTS.value(operation='function', target='find_similar_games')
+        
+        with deadline(2):
+            with pytest.raises(DeadlineExceeded):
+                pgsql_client_with_mocks.call_function('find_similar_games', ['app_id'], (730, 5))
+        
+        mock_connection.rollback.assert_called_once()
+        assert DB_STATEMENT_TIMEOUTS.value(operation='function', target='find_similar_games') == before + 1
+
+    def test_cancel_reaches_running_query(self, pgsql_client_with_mocks, mock_connection, mock_cursor):
+        def execute(query, params=None):
+            if query.startswith('SELECT'):
+                budget.cancel()
+        mock_cursor.execute.side_effect = execute
+        mock_cursor.fetchall.return_value = []
+        
+        with deadline(2) as budget:
+            pgsql_client_with_mocks.select(['steam_app_id'], 'games')
+        
+        mock_connection.cancel.assert_called_once()
+        assert budget.connections == set()
+
+    def test_replica_timeout_does_not_mark_it_down(self, mock_connection):
+        with patch('sources.database_client.load_dotenv'), \
+             patch('sources.database_client.os.getenv') as mock_getenv:
+            mock_getenv.side_effect = lambda key, default=None: {
+                'DB_NAME': 'test_db', 'DB_REPLICA_DSNS': 'host=replica1'
+            }.get(key, default)
+            client = PgsqlClient("test.env")
+        client.get_connection = Mock(return_value=mock_connection)
+        replica = client.replicas[0]
+        replica.pool.connect = Mock(return_value=MagicMock())
+        cursor = replica.pool.connect.return_value.cursor.return_value.__enter__.return_value
+        cursor.execute.side_effect = [None, QueryCanceledError("canceling statement due to statement timeout")]
+        
+        with deadline(2):
+            with pytest.raises(DeadlineExceeded):
+                client.select(['steam_app_id'], 'games')
+        
+        assert replica.down_until == 0.0
+        mock_connection.cursor.assert_not_called()
@@ -0,0 +1,93 @@
+from unittest.mock import Mock
+
+import pytest
+
+from sources.deadline import Deadline, DeadlineExceeded, current_deadline, deadline, remaining
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestDeadline:
+    def test_remaining_and_check(self):
+        clock = FakeClock()
+        budget = Deadline(5, clock)
+        
+        clock.now += 2
+        assert budget.remaining() == 3
+        budget.check()
+        
+        clock.now += 3
+        with pytest.raises(DeadlineExceeded):
+            budget.check()
+
+    def test_cancel_cancels_attached_connections(self):
+        budget = Deadline(5)
+        attached, detached = Mock(), Mock()
+        budget.attach(attached)
+        budget.attach(detached)
+        budget.detach(detached)
+        
+        budget.cancel()
+        
+        attached.cancel.assert_called_once()
+        detached.cancel.assert_not_called()
+        with pytest.raises(DeadlineExceeded):
+            budget.check()
+
+    def test_attach_after_cancel_raises(self):
+        budget = Deadline(5)
+        budget.cancel()
+        
+        with pytest.raises(DeadlineExceeded):
+            budget.attach(Mock())
+        assert budget.connections == set()
+
+    def test_detach_waits_for_running_cancel(self):
+        budget = Deadline(5)
+        connection = Mock()
+        budget.attach(connection)
+        # Пока отмена отправляется, соединение нельзя отвязать и вернуть в пул
+        connection.cancel.side_effect = lambda: detached.append(budget.lock.acquire(blocking=False))
+        detached = []
+        
+        budget.cancel()
+        budget.detach(connection)
+        
+        assert detached == [False]
+        assert budget.connections == set()
+
+    def test_cancel_error_is_logged(self):
+        budget = Deadline(5)
+        connection = Mock()
+        connection.cancel.side_effect = RuntimeError("closed")
+        budget.attach(connection)
+        
+        budget.cancel()
+        
+        assert budget.cancelled
+
+
+class TestDeadlineContext:
+    def test_no_budget_by_default(self):
+        assert remaining() is None
+
+    def test_budget_set_inside_block(self):
+        with deadline(5) as budget:
+            assert current_deadline.get() is budget
+            assert 4.9 < remaining() <= 5
+        assert current_deadline.get() is None
+
+    def test_nested_budget_cannot_extend_outer(self):
+        with deadline(1) as outer:
+            with deadline(10) as inner:
+                assert inner is outer
+            with deadline(0.5) as shorter:
+                assert shorter is not outer
+                assert remaining() <= 0.5
+            assert current_deadline.get() is outer
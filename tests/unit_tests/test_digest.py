@@ -0,0 +1,123 @@
+import pytest
+from unittest.mock import AsyncMock, Mock
+
+from aiogram.exceptions import TelegramBadRequest, TelegramForbiddenError
+
+from sources.digest import FriendsDigest, format_digest
+from sources.metrics import DIGEST_MESSAGES
+from sources.send_queue import BULK
+
+ROWS = [
+    (1, 730, 'Counter-Strike 2', 3),
+    (1, 570, 'Dota 2', 1),
+    (2, 292030, 'The Witcher 3: Wild Hunt', 2),
+]
+
+
+class ImmediateSender:
+    """Очередь отправки без ограничений: сразу выполняет вызов"""
+
+    def __init__(self):
+        self.calls = []
+
+    async def send(self, chat_id, call, priority):
+        self.calls.append((chat_id, priority))
+        return await call()
+
+
+@pytest.fixture
+def digest():
+    db_client = Mock()
+    db_client.iter_friends_digest.side_effect = lambda limit, days_ago, partitions, partition: iter(
+        [row for row in ROWS if row[0] % partitions == partition]
+    )
+    bot = Mock(send_message=AsyncMock())
+    return FriendsDigest(bot, db_client, ImmediateSender())
+
+
+class TestFormatDigest:
+    def test_format_digest(self):
+        text = format_digest([(1, 10, 'Tom & Jerry', 2)])
+
+        assert text.startswith("<b>Что недавно добавляли себе ваши друзья:</b>")
+        assert "1. <code>10</code> - Tom &amp; Jerry (друзей: 2)" in text
+
+
+class TestFriendsDigest:
+    @pytest.mark.asyncio
+    async def test_one_message_per_user(self, digest):
+        sent = await digest.run_once()
+
+        assert sent == 2
+        digest.db_client.iter_friends_digest.assert_called_once_with(5, 14, 1, 0)
+        assert digest.bot.send_message.await_count == 2
+        first = digest.bot.send_message.await_args_list[0]
+        assert first.args[0] == 1
+        assert 'Counter-Strike 2' in first.args[1] and 'Dota 2' in first.args[1]
+        assert first.kwargs['parse_mode'] == 'HTML'
+        assert digest.sender.calls == [(1, BULK), (2, BULK)]
+
+    @pytest.mark.asyncio
+    async def test_sent_games_logged(self, digest):
+        await digest.run_once()
+
+        # Одна запись на часть дайджеста, после отправки всех её сообщений
+        digest.db_client.log_digest.assert_called_once_with([(1, 730), (1, 570), (2, 292030)])
+
+    @pytest.mark.asyncio
+    async def test_partitions(self, digest):
+        digest.partitions = 2
+
+        sent = await digest.run_once()
+
+        assert sent == 2
+        assert [c.args[3] for c in digest.db_client.iter_friends_digest.call_args_list] == [0, 1]
+
+    @pytest.mark.asyncio
+    async def test_blocked_user_not_logged(self, digest):
+        forbidden = TelegramForbiddenError(method=Mock(), message='bot was blocked by the user')
+        digest.bot.send_message.side_effect = [forbidden, None]
+        before = DIGEST_MESSAGES.value(status='forbidden')
+
+        sent = await digest.run_once()
+
+        assert sent == 1
+        digest.db_client.log_digest.assert_called_once_with([(2, 292030)])
+        assert DIGEST_MESSAGES.value(status='forbidden') == before + 1
+
+    @pytest.mark.asyncio
+    async def test_api_error_does_not_stop_digest(self, digest):
+        digest.bot.send_message.side_effect = [TelegramBadRequest(method=Mock(), message='chat not found'), None]
+
+        sent = await digest.run_once()
+
+        assert sent == 1
+        assert digest.bot.send_message.await_count == 2
+
+    @pytest.mark.asyncio
+    async def test_partition_read_before_sending(self, digest):
+        # Строки части читаются в потоке целиком, поэтому курсор закрыт до первой отправки
+        events = []
+        rows = iter(ROWS)
+        def stream(*args):
+            yield from rows
+            events.append('closed')
+        digest.db_client.iter_friends_digest.side_effect = stream
+        digest.bot.send_message.side_effect = lambda *args, **kwargs: events.append('sent')
+
+        await digest.run_once()
+
+        assert events == ['closed', 'sent', 'sent']
+
+    @pytest.mark.asyncio
+    async def test_blocked_partition_not_logged(self, digest):
+        digest.bot.send_message.side_effect = TelegramForbiddenError(method=Mock(), message='blocked')
+
+        assert await digest.run_once() == 0
+        digest.db_client.log_digest.assert_not_called()
+
+    @pytest.mark.asyncio
+    async def test_concurrency_limit(self, digest):
+        digest.concurrency = 1
+
+        assert await digest.run_once() == 2
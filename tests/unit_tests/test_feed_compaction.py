@@ -0,0 +1,33 @@
+import pytest
+from unittest.mock import patch
+
+from sources.feed_compaction import main, parse_args, run
+
+
+class TestRun:
+    def test_run_compacts_feed(self):
+        with patch('sources.feed_compaction.create_db_client') as client_class:
+            client_class.return_value.compact_friend_feed.return_value = (3, 2)
+
+            assert run() == (3, 2)
+
+        client_class.return_value.compact_friend_feed.assert_called_once_with()
+
+    def test_parse_args_defaults(self):
+        assert parse_args([]).every_hours == 0
+
+    def test_single_run_raises_errors(self):
+        with patch('sources.feed_compaction.run', side_effect=RuntimeError("db")), \
+             patch('sources.feed_compaction.load_dotenv'):
+            with pytest.raises(RuntimeError):
+                main([])
+
+    def test_periodic_run_survives_errors(self):
+        with patch('sources.feed_compaction.run', side_effect=[RuntimeError("db"), (0, 0)]) as run_mock, \
+             patch('sources.feed_compaction.load_dotenv'), \
+             patch('sources.feed_compaction.time.sleep', side_effect=[None, KeyboardInterrupt]) as sleep:
+            with pytest.raises(KeyboardInterrupt):
+                main(['--every-hours', '0.5'])
+
+        assert run_mock.call_count == 2
+        sleep.assert_called_with(1800)
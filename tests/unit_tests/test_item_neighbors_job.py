@@ -0,0 +1,81 @@
+import numpy as np
+import pytest
+from unittest.mock import patch
+
+from sources.item_neighbors_job import build_matrix, neighbor_blocks, parse_args, run, top_neighbors
+
+# Игры 10 и 20 есть у трёх пользователей, 30 - у двух из них, 40 - у одного
+PAIRS = [(1, 10), (1, 20), (1, 30), (2, 10), (2, 20), (2, 30), (3, 10), (3, 20), (3, 40)]
+
+
+class TestBuildMatrix:
+    def test_columns_follow_sorted_game_ids(self):
+        matrix, game_ids = build_matrix(PAIRS)
+
+        assert game_ids.tolist() == [10, 20, 30, 40]
+        assert matrix.shape == (3, 4)
+        assert matrix.toarray().tolist() == [[1, 1, 1, 0], [1, 1, 1, 0], [1, 1, 0, 1]]
+
+    def test_duplicate_pairs_counted_once(self):
+        matrix, _ = build_matrix([(1, 10), (1, 10), (2, 10)])
+
+        assert matrix.toarray().tolist() == [[1], [1]]
+
+
+class TestTopNeighbors:
+    def neighbors(self, pairs, **kwargs):
+        matrix, game_ids = build_matrix(pairs)
+        return {
+            int(game_ids[item]): list(zip(game_ids[columns].tolist(), np.round(scores, 4).tolist()))
+            for item, columns, scores in top_neighbors(matrix, **kwargs)
+        }
+
+    def test_cosine_similarity_ordered(self):
+        result = self.neighbors(PAIRS, min_common=1)
+
+        assert result[10] == [(20, 1.0), (30, 0.8165), (40, 0.5774)]
+        assert result[40] == [(10, 0.5774), (20, 0.5774)]
+
+    def test_min_common_drops_rare_pairs(self):
+        result = self.neighbors(PAIRS, min_common=2)
+
+        assert result[10] == [(20, 1.0), (30, 0.8165)]
+        assert 40 not in result
+
+    def test_top_k_limit(self):
+        assert self.neighbors(PAIRS, k=1, min_common=1)[10] == [(20, 1.0)]
+
+    def test_chunking_does_not_change_result(self):
+        assert self.neighbors(PAIRS, chunk_size=1, min_common=1) == self.neighbors(PAIRS, min_common=1)
+
+
+class TestRun:
+    def test_run_stores_neighbors(self):
+        with patch('sources.item_neighbors_job.create_db_client') as client_class:
+            client = client_class.return_value
+            client.iter_library_pairs.return_value = iter(PAIRS)
+            blocks = []
+            client.replace_game_neighbors.side_effect = lambda rows: blocks.extend(rows) or 6
+
+            assert run(k=20, min_common=2) == 6
+
+        rows = [row for block in blocks for row in block]
+        assert [row[:2] for row in rows] == [(10, 20), (10, 30), (20, 10), (20, 30), (30, 10), (30, 20)]
+        assert rows[0][2] == pytest.approx(1.0)
+
+    def test_neighbor_blocks_split_by_size(self):
+        game_ids = np.array([10, 20, 30])
+        neighbors = [
+            (0, np.array([1, 2]), np.array([0.9, 0.5])),
+            (1, np.array([0]), np.array([0.9])),
+            (2, np.array([0]), np.array([0.5])),
+        ]
+
+        blocks = list(neighbor_blocks(neighbors, game_ids, block_size=2))
+
+        assert blocks == [[(10, 20, 0.9), (10, 30, 0.5)], [(20, 10, 0.9), (30, 10, 0.5)]]
+
+    def test_parse_args_defaults(self):
+        args = parse_args([])
+
+        assert (args.neighbors, args.chunk_size, args.min_common, args.every_hours) == (20, 1000, 2, 0)
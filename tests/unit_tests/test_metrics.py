@@ -0,0 +1,116 @@
+import pytest
+import aiohttp
+
+from sources.metrics import Counter, Gauge, Histogram, Metric, Registry, start_metrics_server
+
+@pytest.fixture
+def registry():
+    return Registry()
+
+class TestMetric:
+    def test_subclass_must_define_samples(self, registry):
+        class NoSamples(Metric):
+            pass
+
+        with pytest.raises(TypeError):
+            NoSamples('no_samples', 'No samples', registry=registry)
+        assert registry.render() == '\n'
+
+
+class TestCounter:
+    def test_inc_with_labels(self, registry):
+        counter = Counter('requests', 'Запросы', ['endpoint'], registry=registry)
+
+        counter.inc(endpoint='friends')
+        counter.inc(2, endpoint='friends')
+        counter.inc(endpoint='games')
+
+        assert counter.value(endpoint='friends') == 3
+        assert counter.value(endpoint='games') == 1
+
+    def test_render(self, registry):
+        counter = Counter('requests', 'Запросы', ['endpoint'], registry=registry)
+        counter.inc(endpoint='friends')
+
+        text = registry.render()
+
+        assert '# TYPE requests counter' in text
+        assert 'requests_total{endpoint="friends"} 1' in text
+
+    def test_wrong_labels(self, registry):
+        counter = Counter('requests', 'Запросы', ['endpoint'], registry=registry)
+
+        with pytest.raises(ValueError):
+            counter.inc(status='200')
+
+    def test_duplicate_registration(self, registry):
+        Counter('requests', 'Запросы', registry=registry)
+
+        with pytest.raises(ValueError):
+            Counter('requests', 'Запросы', registry=registry)
+
+class TestGauge:
+    def test_set_inc_dec(self, registry):
+        gauge = Gauge('queue', 'Очередь', registry=registry)
+
+        gauge.set(5)
+        gauge.inc(2)
+        gauge.dec()
+
+        assert gauge.value() == 6
+
+    def test_set_function(self, registry):
+        cache = {1: 'a', 2: 'b'}
+        gauge = Gauge('cache_entries', 'Размер кэша', ['cache'], registry=registry)
+        gauge.set_function(lambda: len(cache), cache='users')
+
+        cache[3] = 'c'
+
+        assert gauge.value(cache='users') == 3
+        assert 'cache_entries{cache="users"} 3' in registry.render()
+
+class TestHistogram:
+    def test_observe_buckets(self, registry):
+        histogram = Histogram('latency', 'Задержка', ['handler'], buckets=(0.1, 1.0), registry=registry)
+
+        histogram.observe(0.05, handler='cmd_help')
+        histogram.observe(0.5, handler='cmd_help')
+        histogram.observe(5, handler='cmd_help')
+
+        text = registry.render()
+        assert 'latency_bucket{handler="cmd_help",le="0.1"} 1' in text
+        assert 'latency_bucket{handler="cmd_help",le="1.0"} 2' in text
+        assert 'latency_bucket{handler="cmd_help",le="+Inf"} 3' in text
+        assert 'latency_sum{handler="cmd_help"} 5.55' in text
+        assert 'latency_count{handler="cmd_help"} 3' in text
+
+    def test_time_context_manager_records_on_error(self, registry):
+        histogram = Histogram('latency', 'Задержка', ['handler'], registry=registry)
+
+        with pytest.raises(RuntimeError):
+            with histogram.time(handler='cmd_trends'):
+                raise RuntimeError()
+
+        assert histogram.count(handler='cmd_trends') == 1
+
+    def test_label_escaping(self, registry):
+        histogram = Histogram('latency', 'Задержка', ['query'], buckets=(1.0,), registry=registry)
+
+        histogram.observe(0.1, query='a "b"\n')
+
+        assert 'query="a \\"b\\"\\n"' in registry.render()
+
+class TestMetricsServer:
+    @pytest.mark.asyncio
+    async def test_metrics_endpoint(self, unused_tcp_port):
+        runner = await start_metrics_server(unused_tcp_port, host='127.0.0.1')
+        try:
+            async with aiohttp.ClientSession() as session:
+                async with session.get(f'http://127.0.0.1:{unused_tcp_port}/metrics') as response:
+                    assert response.status == 200
+                    text = await response.text()
+        finally:
+            await runner.cleanup()
+
+        assert '# TYPE db_query_duration_seconds histogram' in text
+        assert '# TYPE steam_requests counter' in text
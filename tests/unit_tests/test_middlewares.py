@@ -0,0 +1,182 @@
+import asyncio
+import pytest
+from unittest.mock import AsyncMock, Mock
+
+from sources.deadline import DeadlineExceeded, current_deadline, remaining
+from sources.metrics import HANDLER_LATENCY, HANDLER_ERRORS, HANDLER_TIMEOUTS, REQUESTS_COALESCED, REQUESTS_REJECTED
+from sources.middlewares import DeadlineMiddleware, MetricsMiddleware, RequestLimitMiddleware, handler_name
+
+def make_data(name):
+    callback = Mock()
+    callback.__name__ = name
+    return {'handler': Mock(callback=callback)}
+
+class TestHandlerName:
+    def test_handler_name(self):
+        assert handler_name(make_data('cmd_help')) == 'cmd_help'
+
+    def test_handler_name_missing(self):
+        assert handler_name({}) == 'unknown'
+
+class TestMetricsMiddleware:
+    @pytest.mark.asyncio
+    async def test_records_latency(self):
+        middleware = MetricsMiddleware()
+        handler = AsyncMock(return_value='ok')
+        before = HANDLER_LATENCY.count(handler='cmd_metrics_ok')
+
+        result = await middleware(handler, Mock(), make_data('cmd_metrics_ok'))
+
+        assert result == 'ok'
+        assert HANDLER_LATENCY.count(handler='cmd_metrics_ok') == before + 1
+
+    @pytest.mark.asyncio
+    async def test_counts_errors(self):
+        middleware = MetricsMiddleware()
+        handler = AsyncMock(side_effect=ValueError('boom'))
+        before = HANDLER_ERRORS.value(handler='cmd_metrics_error')
+
+        with pytest.raises(ValueError):
+            await middleware(handler, Mock(), make_data('cmd_metrics_error'))
+
+        assert HANDLER_ERRORS.value(handler='cmd_metrics_error') == before + 1
+        assert HANDLER_LATENCY.count(handler='cmd_metrics_error') >= 1
+
+
+def make_message(user_id, text):
+    return Mock(text=text, from_user=Mock(id=user_id))
+
+
+class TestRequestLimitMiddleware:
+    @pytest.mark.asyncio
+    async def test_cheap_handlers_not_limited(self):
+        middleware = RequestLimitMiddleware(['cmd_recommend'], max_concurrent=0)
+        handler = AsyncMock(return_value='ok')
+
+        assert await middleware(handler, make_message(1, '/help'), make_data('cmd_help')) == 'ok'
+
+    @pytest.mark.asyncio
+    async def test_identical_requests_coalesced(self):
+        middleware = RequestLimitMiddleware(['cmd_recommend'])
+        release = asyncio.Event()
+        calls = []
+
+        async def handler(event, data):
+            calls.append(event)
+            await release.wait()
+            return 'done'
+        before = REQUESTS_COALESCED.value(handler='cmd_recommend')
+
+        first = asyncio.create_task(middleware(handler, make_message(1, 'Рекомендации'), make_data('cmd_recommend')))
+        await asyncio.sleep(0)
+        second = asyncio.create_task(middleware(handler, make_message(1, 'Рекомендации'), make_data('cmd_recommend')))
+        await asyncio.sleep(0)
+        release.set()
+
+        assert await first == 'done'
+        assert await second is None
+        assert len(calls) == 1
+        assert REQUESTS_COALESCED.value(handler='cmd_recommend') == before + 1
+        assert middleware.in_flight == {} and middleware.running == {}
+
+    @pytest.mark.asyncio
+    async def test_other_users_not_coalesced(self):
+        middleware = RequestLimitMiddleware(['cmd_recommend'])
+        release = asyncio.Event()
+
+        async def wait(event, data):
+            await release.wait()
+        handler = AsyncMock(side_effect=wait)
+
+        tasks = [
+            asyncio.create_task(middleware(handler, make_message(user_id, 'Рекомендации'), make_data('cmd_recommend')))
+            for user_id in (1, 2)
+        ]
+        await asyncio.sleep(0)
+        release.set()
+        await asyncio.gather(*tasks)
+
+        assert handler.await_count == 2
+
+    @pytest.mark.asyncio
+    async def test_excess_requests_rejected(self):
+        on_reject = AsyncMock()
+        middleware = RequestLimitMiddleware(['cmd_similar_get'], max_concurrent=1, on_reject=on_reject)
+        release = asyncio.Event()
+
+        async def wait(event, data):
+            await release.wait()
+        handler = AsyncMock(side_effect=wait)
+        before = REQUESTS_REJECTED.value(handler='cmd_similar_get')
+
+        first = asyncio.create_task(middleware(handler, make_message(1, '730'), make_data('cmd_similar_get')))
+        await asyncio.sleep(0)
+        rejected = make_message(1, '570')
+        assert await middleware(handler, rejected, make_data('cmd_similar_get')) is None
+        release.set()
+        await first
+
+        on_reject.assert_awaited_once_with(rejected)
+        assert handler.await_count == 1
+        assert REQUESTS_REJECTED.value(handler='cmd_similar_get') == before + 1
+
+    @pytest.mark.asyncio
+    async def test_slot_released_after_error(self):
+        middleware = RequestLimitMiddleware(['cmd_recommend'], max_concurrent=1)
+        handler = AsyncMock(side_effect=ValueError('boom'))
+
+        with pytest.raises(ValueError):
+            await middleware(handler, make_message(1, 'Рекомендации'), make_data('cmd_recommend'))
+
+        handler.side_effect = None
+        handler.return_value = 'ok'
+        assert await middleware(handler, make_message(1, 'Рекомендации'), make_data('cmd_recommend')) == 'ok'
+
+
+class TestDeadlineMiddleware:
+    @pytest.mark.asyncio
+    async def test_without_budget_runs_handler(self):
+        middleware = DeadlineMiddleware({'cmd_recommend': 1})
+        handler = AsyncMock(return_value='ok')
+
+        assert await middleware(handler, make_message(1, '/help'), make_data('cmd_help')) == 'ok'
+
+    @pytest.mark.asyncio
+    async def test_budget_visible_to_handler(self):
+        middleware = DeadlineMiddleware({'cmd_recommend': 3})
+        seen = []
+
+        async def handler(event, data):
+            seen.append(remaining())
+        await middleware(handler, make_message(1, 'Рекомендации'), make_data('cmd_recommend'))
+
+        assert 2.9 < seen[0] <= 3
+        assert remaining() is None
+
+    @pytest.mark.asyncio
+    async def test_slow_handler_cancelled(self):
+        on_timeout = AsyncMock()
+        middleware = DeadlineMiddleware({}, default=0.01, on_timeout=on_timeout)
+        budgets = []
+
+        async def handler(event, data):
+            budgets.append(current_deadline.get())
+            await asyncio.sleep(1)
+        before = HANDLER_TIMEOUTS.value(handler='cmd_slow')
+        message = make_message(1, 'slow')
+
+        assert await middleware(handler, message, make_data('cmd_slow')) is None
+
+        on_timeout.assert_awaited_once_with(message)
+        assert budgets[0].cancelled
+        assert HANDLER_TIMEOUTS.value(handler='cmd_slow') == before + 1
+
+    @pytest.mark.asyncio
+    async def test_deadline_exceeded_from_query(self):
+        on_timeout = AsyncMock()
+        middleware = DeadlineMiddleware({'cmd_similar_get': 5}, on_timeout=on_timeout)
+        handler = AsyncMock(side_effect=DeadlineExceeded('statement timeout'))
+
+        await middleware(handler, make_message(1, '730'), make_data('cmd_similar_get'))
+
+        on_timeout.assert_awaited_once()
@@ -0,0 +1,66 @@
+import json
+import pytest
+from datetime import date
+
+from sources.models import GameRecord
+
+class TestGameRecord:
+    def test_from_appdetails(self):
+        record = GameRecord.from_appdetails('730', {
+            'name': 'Counter-Strike 2',
+            'release_date': {'coming_soon': False, 'date': 'Aug 21, 2012'},
+            'required_age': 0,
+            'short_description': 'Shooter',
+            'header_image': 'https://example.com/header.jpg',
+            'categories': [{'id': 1, 'description': 'Multi-player'}],
+            'genres': [{'id': '1', 'description': 'Action'}],
+            'tags': {'FPS': 90}
+        })
+        
+        assert record.steam_app_id == 730
+        assert record.release_date == date(2012, 8, 21)
+        assert record.header_image_url == 'https://example.com/header.jpg'
+        assert record.categories == ['Multi-player']
+        assert record.genres == ['Action']
+        assert record.tags == {'FPS': 90}
+    
+    def test_from_appdetails_minimal(self):
+        record = GameRecord.from_appdetails(10, {'name': 'Game'})
+        
+        assert record.release_date is None
+        assert record.categories == []
+        assert record.genres == []
+        assert record.positive == 0
+        assert record.estimated_owners == ''
+    
+    def test_from_catalog(self):
+        record = GameRecord.from_catalog('570', {
+            'name': 'Dota 2',
+            'release_date': 'Jul 9, 2013',
+            'header_image': 'https://example.com/dota.jpg',
+            'categories': ['Multi-player'],
+            'genres': ['Strategy'],
+            'positive': 100,
+            'tags': {'MOBA': 50}
+        })
+        
+        assert record.steam_app_id == 570
+        assert record.release_date == date(2013, 7, 9)
+        assert record.categories == ['Multi-player']
+        assert record.genres == ['Strategy']
+        assert record.positive == 100
+    
+    def test_as_row_matches_columns(self):
+        record = GameRecord(730, 'CS', tags={'FPS': 90})
+        row = record.as_row()
+        
+        assert len(row) == len(GameRecord.COLUMNS)
+        assert row[GameRecord.COLUMNS.index('name')] == 'CS'
+        assert json.loads(row[GameRecord.COLUMNS.index('tags')]) == {'FPS': 90}
+    
+    def test_slots(self):
+        record = GameRecord(730, 'CS')
+        
+        assert not hasattr(record, '__dict__')
+        with pytest.raises(AttributeError):
+            record.unknown = 1
@@ -0,0 +1,53 @@
+from sources.queries import (
+    PREPARED_STATEMENTS, build_select, build_insert, build_update, build_delete, build_execute,
+    build_function_call, build_upsert_many
+)
+
+class TestBuilders:
+    def test_build_select_without_where(self):
+        query = build_select(['a', 'b'], 'games')
+        assert query.text == "SELECT a, b FROM games"
+        assert query.params == ()
+
+    def test_build_select_with_where(self):
+        query = build_select(['a'], 'games', {'steam_app_id': 10, 'name': 'x'})
+        assert query.text == "SELECT a FROM games WHERE steam_app_id = %s AND name = %s"
+        assert query.params == (10, 'x')
+
+    def test_build_insert(self):
+        query = build_insert(['a', 'b'], 'games', [1, 'x'])
+        assert query.text == "INSERT INTO games (a, b) VALUES (%s, %s)"
+        assert query.params == [1, 'x']
+
+    def test_build_upsert_many(self):
+        rows = [[1, 10, 5]]
+        query = build_upsert_many(
+            ['user_id', 'game_id', 'playtime_total'], 'user_games', rows, ['user_id', 'game_id'],
+            {'playtime_total': 'EXCLUDED.playtime_total', 'added_at': 'CURRENT_TIMESTAMP'}
+        )
+        assert query.text == (
+            "INSERT INTO user_games (user_id, game_id, playtime_total) VALUES %s "
+            "ON CONFLICT (user_id, game_id) DO UPDATE SET playtime_total = EXCLUDED.playtime_total, "
+            "added_at = CURRENT_TIMESTAMP"
+        )
+        assert query.params == rows
+
+    def test_build_update(self):
+        query = build_update(['steam_id'], 'bot_users', [5], {'tg_id': 7})
+        assert query.text == "UPDATE bot_users SET steam_id = %s WHERE tg_id = %s"
+        assert query.params == (5, 7)
+
+    def test_build_delete(self):
+        query = build_delete('friends', (1, 2), id_column='user_id')
+        assert query.text == "DELETE FROM friends WHERE user_id = ANY(%s)"
+        assert query.params == ([1, 2],)
+
+    def test_build_function_call(self):
+        query = build_function_call('get_friends_digest', ['tg_id', 'game_id'], [5, 14])
+        assert query.text == "SELECT tg_id, game_id FROM get_friends_digest(%s, %s)"
+        assert query.params == (5, 14)
+
+    def test_build_execute(self):
+        query = build_execute(PREPARED_STATEMENTS['game_info'], [10])
+        assert query.text == "EXECUTE game_info (%s)"
+        assert query.params == (10,)
@@ -0,0 +1,56 @@
+import pytest
+from unittest.mock import MagicMock, Mock, patch
+
+from sources import recommendation_job
+from sources.recommendation_job import chunks, parse_args, refresh_chunk, run
+
+
+class TestChunks:
+    @pytest.mark.parametrize("items, size, expected", [
+        ([1, 2, 3, 4, 5], 2, [[1, 2], [3, 4], [5]]),
+        ([1, 2], 5, [[1, 2]]),
+        ([], 3, []),
+    ])
+    def test_chunks(self, items, size, expected):
+        assert list(chunks(items, size)) == expected
+
+
+class TestRefreshChunk:
+    def test_uses_worker_client(self):
+        client = Mock()
+        client.refresh_recommendations.return_value = 2
+
+        with patch.object(recommendation_job, '_db_client', client):
+            assert refresh_chunk(([1, 2], 10)) == 2
+
+        client.refresh_recommendations.assert_called_once_with([1, 2], 10)
+
+    def test_init_worker_creates_client(self):
+        with patch('sources.recommendation_job.create_db_client') as client_class, \
+             patch.object(recommendation_job, '_db_client', None):
+            recommendation_job.init_worker()
+            assert recommendation_job._db_client is client_class.return_value
+
+
+class TestRun:
+    def test_run_splits_users_between_workers(self):
+        pool = MagicMock()
+        pool.__enter__.return_value = pool
+        pool.imap_unordered.side_effect = lambda function, tasks: [len(chunk) for chunk, _ in tasks]
+
+        with patch('sources.recommendation_job.create_db_client') as client_class, \
+             patch('sources.recommendation_job.Pool', return_value=pool) as pool_class:
+            client_class.return_value.get_linked_steam_ids.return_value = [1, 2, 3, 4, 5]
+
+            refreshed = run(workers=3, chunk_size=2, limit=7)
+
+        assert refreshed == 5
+        pool_class.assert_called_once_with(3, initializer=recommendation_job.init_worker)
+        function, tasks = pool.imap_unordered.call_args[0]
+        assert function is refresh_chunk
+        assert tasks == [([1, 2], 7), ([3, 4], 7), ([5], 7)]
+
+    def test_parse_args_defaults(self):
+        args = parse_args([])
+
+        assert (args.workers, args.chunk_size, args.limit, args.every_hours) == (4, 50, 20, 0)
@@ -0,0 +1,159 @@
+import asyncio
+import pytest
+from unittest.mock import AsyncMock, MagicMock
+
+from sources.response_cache import ResponseCache, create_response_cache
+from sources.steam_api_client import SteamAPIClient, SteamAPIError
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+@pytest.fixture
+def cache(tmp_path, clock):
+    cache = ResponseCache(str(tmp_path / 'steam.sqlite'), ttls={'appdetails': 100}, max_bytes=25, clock=clock)
+    yield cache
+    cache.close()
+
+
+class TestResponseCache:
+    def test_put_and_get(self, cache):
+        cache.put('appdetails', 'appdetails?appids=730', b'{"730": {}}')
+        
+        assert cache.get('appdetails', 'appdetails?appids=730') == b'{"730": {}}'
+        assert cache.get('appdetails', 'appdetails?appids=570') is None
+
+    def test_entry_expires(self, cache, clock):
+        cache.put('appdetails', 'key', b'body')
+        clock.now += 100
+        
+        assert cache.get('appdetails', 'key') is None
+        assert len(cache) == 0
+        assert cache.total_bytes == 0
+
+    def test_only_endpoints_with_ttl_are_cached(self, cache):
+        assert cache.caches('appdetails')
+        assert not cache.caches('GetFriendList')
+
+    def test_evicts_least_recently_used(self, cache, clock):
+        cache.put('appdetails', 'a', b'0123456789')
+        clock.now += 1
+        cache.put('appdetails', 'b', b'0123456789')
+        clock.now += 1
+        cache.get('appdetails', 'a')
+        clock.now += 1
+        cache.put('appdetails', 'c', b'0123456789')
+        
+        assert cache.get('appdetails', 'b') is None
+        assert cache.get('appdetails', 'a') is not None
+        assert cache.get('appdetails', 'c') is not None
+        assert cache.total_bytes == 20
+
+    def test_replace_keeps_size_accounting(self, cache):
+        cache.put('appdetails', 'a', b'0123456789')
+        cache.put('appdetails', 'a', b'01234')
+        
+        assert cache.total_bytes == 5
+
+    def test_persists_between_runs(self, tmp_path, clock):
+        path = str(tmp_path / 'steam.sqlite')
+        first = ResponseCache(path, clock=clock)
+        first.put('GetOwnedGames', 'key', b'games')
+        first.close()
+        
+        second = ResponseCache(path, clock=clock)
+        assert second.get('GetOwnedGames', 'key') == b'games'
+        assert second.total_bytes == 5
+        second.close()
+
+    def test_replay_ignores_ttl_and_does_not_write(self, tmp_path, clock):
+        path = str(tmp_path / 'steam.sqlite')
+        recorder = ResponseCache(path, clock=clock)
+        recorder.put('appdetails', 'key', b'body')
+        recorder.close()
+        clock.now += 10 ** 9
+        
+        replay = ResponseCache(path, replay=True, clock=clock)
+        replay.put('appdetails', 'other', b'body')
+        
+        assert replay.get('appdetails', 'key') == b'body'
+        assert replay.get('appdetails', 'other') is None
+        assert replay.caches('GetFriendList')
+        replay.close()
+
+    @pytest.mark.asyncio
+    async def test_used_from_worker_threads(self, tmp_path, clock):
+        cache = ResponseCache(str(tmp_path / 'steam.sqlite'), ttls={'appdetails': 100}, clock=clock)
+        
+        await asyncio.gather(*(
+            asyncio.to_thread(cache.put, 'appdetails', f'key{i}', b'body') for i in range(20)
+        ))
+        
+        assert await asyncio.to_thread(cache.get, 'appdetails', 'key7') == b'body'
+        assert len(cache) == 20
+        assert cache.total_bytes == 80
+        await asyncio.to_thread(cache.close)
+
+    def test_create_from_env(self, monkeypatch, tmp_path):
+        monkeypatch.delenv('STEAM_RESPONSE_CACHE', raising=False)
+        assert create_response_cache() is None
+        
+        monkeypatch.setenv('STEAM_RESPONSE_CACHE', str(tmp_path / 'steam.sqlite'))
+        monkeypatch.setenv('STEAM_RESPONSE_CACHE_TTLS', 'appdetails=60')
+        monkeypatch.setenv('STEAM_RESPONSE_REPLAY', '1')
+        cache = create_response_cache()
+        
+        assert cache.ttls == {'appdetails': 60.0}
+        assert cache.replay
+        cache.close()
+
+
+def steam_session(body: bytes):
+    response = MagicMock()
+    response.status = 200
+    response.read = AsyncMock(return_value=body)
+    context = MagicMock()
+    context.__aenter__ = AsyncMock(return_value=response)
+    context.__aexit__ = AsyncMock(return_value=None)
+    session = MagicMock()
+    session.get.return_value = context
+    return session
+
+
+class TestSteamClientResponseCache:
+    BODY = b'{"730": {"success": true, "data": {"name": "Counter-Strike 2"}}}'
+
+    @pytest.mark.asyncio
+    async def test_response_recorded_and_reused(self, tmp_path):
+        client = SteamAPIClient('secret-key')
+        client.response_cache = ResponseCache(str(tmp_path / 'steam.sqlite'))
+        client.session = steam_session(self.BODY)
+        
+        first = await client.get_game_info(730)
+        second = await client.get_game_info(730)
+        
+        assert first.name == second.name == 'Counter-Strike 2'
+        client.session.get.assert_called_once()
+        client.response_cache.close()
+
+    @pytest.mark.asyncio
+    async def test_replay_miss_does_not_use_network(self, tmp_path):
+        client = SteamAPIClient('secret-key')
+        client.response_cache = ResponseCache(str(tmp_path / 'steam.sqlite'), replay=True)
+        client.session = steam_session(self.BODY)
+        
+        with pytest.raises(SteamAPIError):
+            await client.get_game_info(730)
+        assert await client.get_user_friends(76561197960265728) == []
+        client.session.get.assert_not_called()
+        client.response_cache.close()
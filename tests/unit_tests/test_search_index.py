@@ -0,0 +1,126 @@
+import pytest
+
+from sources import search_index
+from sources.search_index import GameNameIndex, normalize
+
+GAMES = [
+    (730, 'Counter-Strike 2', 7000),
+    (10, 'Counter-Strike', 200),
+    (292030, 'The Witcher 3: Wild Hunt', 600),
+    (20900, 'The Witcher: Enhanced Edition', 50),
+    (570, 'Dota 2', 1500),
+    (1, None, 0),
+]
+
+
+@pytest.fixture
+def index():
+    index = GameNameIndex()
+    index.build(GAMES)
+    return index
+
+
+class TestNormalize:
+    @pytest.mark.parametrize("text, expected", [
+        ('Counter-Strike: Global Offensive', 'counter strike global offensive'),
+        ('  The   Witcher 3 ', 'the witcher 3'),
+        ('Ведьмак 3', 'ведьмак 3'),
+        ('---', ''),
+    ])
+    def test_normalize(self, text, expected):
+        assert normalize(text) == expected
+
+
+class TestGameNameIndex:
+    def test_build_skips_games_without_name(self, index):
+        assert len(index) == 5
+        assert 1 not in index.games
+
+    def test_search_prefix_ranked_by_popularity(self, index):
+        assert index.search('count') == [(730, 'Counter-Strike 2'), (10, 'Counter-Strike')]
+
+    def test_search_exact_match_first(self, index):
+        assert index.search('counter strike')[0] == (10, 'Counter-Strike')
+
+    def test_search_word_inside_name(self, index):
+        result = index.search('witch')
+
+        assert result == [(292030, 'The Witcher 3: Wild Hunt'), (20900, 'The Witcher: Enhanced Edition')]
+
+    def test_search_start_of_name_before_middle(self, index):
+        index = index.updated([(5, 'Witchery', 0)])
+
+        assert index.search('witch')[0] == (5, 'Witchery')
+
+    def test_search_multiple_words(self, index):
+        assert index.search('witcher 3 wild') == [(292030, 'The Witcher 3: Wild Hunt')]
+
+    def test_search_limit(self, index):
+        assert len(index.search('the', limit=1)) == 1
+
+    @pytest.mark.parametrize("query", ['', '   ', 'portal', ':'])
+    def test_search_no_results(self, index, query):
+        assert index.search(query) == []
+
+    def test_updated_adds_new_game(self, index):
+        updated = index.updated([(620, 'Portal 2', 3000)])
+
+        assert updated.search('port') == [(620, 'Portal 2')]
+        assert len(updated) == 6
+
+    def test_updated_keeps_original_index(self, index):
+        keys = list(index.keys)
+        index.updated([(620, 'Portal 2', 3000), (730, 'Counter-Strike: Global Offensive', 7000)])
+
+        assert index.keys == keys
+        assert index.search('port') == []
+        assert index.search('counter strike 2') == [(730, 'Counter-Strike 2')]
+
+    def test_updated_renamed_game_replaces_keys(self, index):
+        updated = index.updated([(730, 'Counter-Strike: Global Offensive', 7000)])
+
+        assert updated.search('global') == [(730, 'Counter-Strike: Global Offensive')]
+        assert updated.search('counter strike 2') == []
+        assert len(updated.keys) == len(updated.ids)
+
+    def test_updated_popularity_shares_keys(self, index):
+        updated = index.updated([(10, 'Counter-Strike', 9000)])
+
+        assert updated.keys is index.keys
+        assert updated.search('counter')[0] == (10, 'Counter-Strike')
+
+    def test_updated_skips_games_without_name(self, index):
+        assert len(index.updated([(2, '', 10), (3, None, 10)])) == 5
+
+    def test_keys_stay_sorted_after_updates(self, index):
+        index = index.updated([(620, 'Portal 2', 3000), (400, 'Portal', 2000), (292030, 'Witcher 3', 600)])
+
+        assert index.keys == sorted(index.keys)
+        assert all(index.games[app_id][2].endswith(key) for key, app_id in zip(index.keys, index.ids))
+
+
+class TestFrequentPrefixes:
+    @pytest.fixture(autouse=True)
+    def small_scan(self, monkeypatch):
+        monkeypatch.setattr(search_index, 'MAX_SCAN', 3)
+        monkeypatch.setattr(search_index, 'MAX_RESULTS', 2)
+
+    @pytest.fixture
+    def index(self):
+        index = GameNameIndex()
+        # Самая популярная игра - в конце диапазона префикса 'a'
+        index.build([(1, 'Aa', 1), (2, 'Ab', 2), (3, 'Ac', 3), (4, 'Ad', 4), (5, 'Az', 100), (6, 'Ba', 50)])
+        return index
+
+    def test_popular_game_at_end_of_range_found(self, index):
+        assert set(index.top) == {'a'}
+        assert index.search('a', limit=2) == [(5, 'Az'), (4, 'Ad')]
+
+    def test_matches_full_ranking_after_updates(self, index):
+        games = [(3, 'Ac', 200), (5, 'Az', 0), (7, 'Ae', 150), (6, 'Ba', 50)]
+        updated = index.updated(games)
+        rebuilt = GameNameIndex()
+        rebuilt.build([(1, 'Aa', 1), (2, 'Ab', 2), (4, 'Ad', 4)] + games)
+
+        assert updated.top == rebuilt.top
+        assert updated.search('a', limit=2) == [(3, 'Ac'), (7, 'Ae')]
@@ -0,0 +1,202 @@
+import asyncio
+import time
+import pytest
+from unittest.mock import AsyncMock, Mock
+
+from aiogram.exceptions import TelegramRetryAfter
+
+from sources.metrics import TELEGRAM_RETRY_AFTER
+from sources.send_queue import BULK, INTERACTIVE, SendScheduler, TokenBucket
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def retry_after(seconds=0):
+    return TelegramRetryAfter(method=Mock(), message='Too Many Requests', retry_after=seconds)
+
+
+class TestTokenBucket:
+    def test_burst_then_delay(self):
+        clock = FakeClock()
+        bucket = TokenBucket(rate=2, capacity=2, clock=clock)
+
+        assert bucket.delay() == 0
+        bucket.take()
+        bucket.take()
+
+        assert bucket.delay() == pytest.approx(0.5)
+        clock.now = 0.25
+        assert bucket.delay() == pytest.approx(0.25)
+        clock.now = 0.5
+        assert bucket.delay() == 0
+
+    def test_refill_is_capped(self):
+        clock = FakeClock()
+        bucket = TokenBucket(rate=1, capacity=3, clock=clock)
+        bucket.take()
+
+        clock.now = 100
+        assert bucket.is_full()
+        assert bucket.tokens == 3
+
+
+class TestSendScheduler:
+    @pytest.mark.asyncio
+    async def test_send_returns_result(self):
+        scheduler = SendScheduler()
+        call = AsyncMock(return_value='sent')
+
+        result = await scheduler.send(1, call)
+
+        assert result == 'sent'
+        call.assert_awaited_once()
+        assert scheduler.pending == 0
+        await scheduler.close()
+
+    @pytest.mark.asyncio
+    async def test_send_propagates_exception(self):
+        scheduler = SendScheduler()
+
+        with pytest.raises(ValueError):
+            await scheduler.send(1, AsyncMock(side_effect=ValueError('bad request')))
+
+        assert scheduler.pending == 0
+        # Обработчик продолжает работать после ошибки
+        assert await scheduler.send(1, AsyncMock(return_value='ok')) == 'ok'
+        await scheduler.close()
+
+    @pytest.mark.asyncio
+    async def test_interactive_before_bulk(self):
+        scheduler = SendScheduler(global_burst=10, chat_burst=10, workers=1)
+        order = []
+        release = asyncio.Event()
+
+        async def first():
+            await release.wait()
+            order.append('first')
+
+        def record(name):
+            async def call():
+                order.append(name)
+            return call
+
+        blocking = asyncio.create_task(scheduler.send(1, first))
+        await asyncio.sleep(0)
+        bulk = asyncio.create_task(scheduler.send(2, record('bulk'), BULK))
+        interactive = asyncio.create_task(scheduler.send(3, record('interactive'), INTERACTIVE))
+        await asyncio.sleep(0)
+        release.set()
+        await asyncio.gather(blocking, bulk, interactive)
+
+        assert order == ['first', 'interactive', 'bulk']
+        await scheduler.close()
+
+    @pytest.mark.asyncio
+    async def test_chat_limit_does_not_block_other_chats(self):
+        scheduler = SendScheduler(global_burst=10, chat_rate=20, chat_burst=1, workers=1)
+        order = []
+
+        def record(name):
+            async def call():
+                order.append(name)
+            return call
+
+        await asyncio.gather(
+            scheduler.send('a', record('a1')),
+            scheduler.send('a', record('a2')),
+            scheduler.send('b', record('b1')),
+        )
+
+        assert order == ['a1', 'b1', 'a2']
+        await scheduler.close()
+
+    @pytest.mark.asyncio
+    async def test_chat_messages_keep_order_across_workers(self):
+        scheduler = SendScheduler(global_burst=10, chat_burst=3, workers=4)
+        order = []
+        release = asyncio.Event()
+
+        def record(name, wait=False):
+            async def call():
+                if wait:
+                    await release.wait()
+                order.append(name)
+            return call
+
+        sends = [
+            asyncio.create_task(scheduler.send('a', record('a1', wait=True))),
+            asyncio.create_task(scheduler.send('a', record('a2'))),
+            asyncio.create_task(scheduler.send('b', record('b1'))),
+            asyncio.create_task(scheduler.send('a', record('a3'))),
+        ]
+        await asyncio.sleep(0.01)
+        # Пока первое сообщение чата a не отправлено, другие чаты не ждут, а остальные сообщения a - ждут
+        assert order == ['b1']
+        release.set()
+        await asyncio.gather(*sends)
+
+        assert order == ['b1', 'a1', 'a2', 'a3']
+        assert scheduler.busy_chats == set()
+        assert scheduler.parked == {}
+        await scheduler.close()
+
+    @pytest.mark.asyncio
+    async def test_global_rate_limit(self):
+        scheduler = SendScheduler(global_rate=50, global_burst=1, chat_burst=10)
+        start = time.monotonic()
+
+        await asyncio.gather(*(scheduler.send(chat_id, AsyncMock()) for chat_id in range(4)))
+
+        # Первое сообщение уходит сразу, остальные три - с интервалом 1/50 с
+        assert time.monotonic() - start >= 0.05
+        await scheduler.close()
+
+    @pytest.mark.asyncio
+    async def test_retry_after_is_retried(self):
+        scheduler = SendScheduler()
+        call = AsyncMock(side_effect=[retry_after(0), 'sent'])
+        before = TELEGRAM_RETRY_AFTER.value()
+
+        result = await scheduler.send(1, call)
+
+        assert result == 'sent'
+        assert call.await_count == 2
+        assert TELEGRAM_RETRY_AFTER.value() == before + 1
+        await scheduler.close()
+
+    @pytest.mark.asyncio
+    async def test_retry_after_pauses_sending(self):
+        scheduler = SendScheduler()
+        await scheduler.send(1, AsyncMock(side_effect=[retry_after(0), 'sent']))
+
+        assert scheduler.paused_until > 0
+        await scheduler.close()
+
+    @pytest.mark.asyncio
+    async def test_retry_after_gives_up(self):
+        scheduler = SendScheduler(max_retries=1)
+        call = AsyncMock(side_effect=retry_after(0))
+
+        with pytest.raises(TelegramRetryAfter):
+            await scheduler.send(1, call)
+
+        assert call.await_count == 2
+        assert scheduler.pending == 0
+        await scheduler.close()
+
+    @pytest.mark.asyncio
+    async def test_workers_started_lazily_and_closed(self):
+        scheduler = SendScheduler(workers=2)
+        assert scheduler.tasks == []
+
+        await scheduler.send(1, AsyncMock())
+        assert len(scheduler.tasks) == 2
+
+        await scheduler.close()
+        assert scheduler.tasks == []
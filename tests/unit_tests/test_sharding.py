@@ -0,0 +1,235 @@
+import pytest
+from datetime import datetime
+from unittest.mock import Mock, patch
+
+from sources.database_api import GAME_CONFLICT, GAME_UPDATES, USER_GAME_CONFLICT, USER_GAME_UPDATES, PgsqlApiClient
+from sources.models import GameRecord
+from sources.sharding import ShardedPgsqlApiClient, create_db_client, shard_index
+
+
+def user_on_shard(index, shards=2, start=76561198000000000):
+    """Первый Steam id начиная со start, который попадает на шард index"""
+    steam_id = start
+    while shard_index(steam_id, shards) != index:
+        steam_id += 1
+    return steam_id
+
+
+@pytest.fixture
+def sharded_client():
+    client = ShardedPgsqlApiClient(env='test.env', shard_dsns=['dbname=shard0', 'dbname=shard1'])
+    client.shards = [Mock(), Mock()]
+    client.insert = Mock()
+    client.insert_many = Mock()
+    client.upsert_many = Mock()
+    client.update = Mock()
+    client.select = Mock()
+    yield client
+    client.executor.shutdown()
+
+
+class TestShardIndex:
+    def test_stable_and_in_range(self):
+        assert shard_index(76561197960265728, 4) == shard_index(76561197960265728, 4)
+        assert all(0 <= shard_index(76561197960265728 + i, 4) < 4 for i in range(100))
+
+    def test_sequential_ids_are_spread(self):
+        counts = [0] * 4
+        for i in range(4000):
+            counts[shard_index(76561197960265728 + i, 4)] += 1
+        assert min(counts) > 800
+
+
+class TestShardedWrites:
+    def test_steam_users_routed_by_id(self, sharded_client):
+        first, second = user_on_shard(0), user_on_shard(1)
+        data = [
+            {'steamid': uid, 'personaname': f'u{uid}', 'profileurl': 'url', 'avatarmedium': 'avatar'}
+            for uid in (first, second)
+        ]
+        
+        sharded_client.add_steam_users(data)
+        
+        sharded_client.shards[0].insert_many.assert_called_once_with(
+            ['steam_user_id', 'username', 'profile_url', 'avatarmedium_url'], 'steam_users',
+            [[first, f'u{first}', 'url', 'avatar']]
+        )
+        assert sharded_client.shards[1].insert_many.call_args[0][2] == [[second, f'u{second}', 'url', 'avatar']]
+        sharded_client.insert_many.assert_not_called()
+
+    def test_friend_edge_stored_on_both_shards(self, sharded_client):
+        user, friend = user_on_shard(0), user_on_shard(1)
+        
+        sharded_client.add_steam_friends(user, [friend])
+        
+        for shard in sharded_client.shards:
+            assert shard.insert_many.call_args_list == [
+                ((['steam_user_id'], 'steam_users', [[min(user, friend)], [max(user, friend)]]),),
+                ((['user1', 'user2'], 'friends', [[min(user, friend), max(user, friend)]]),)
+            ]
+
+    def test_user_games_go_to_home_shard(self, sharded_client):
+        user = user_on_shard(1)
+        
+        sharded_client.add_user_games(user, [{'appid': 730, 'playtime_forever': 10}])
+        
+        sharded_client.shards[1].upsert_many.assert_called_once_with(
+            ['user_id', 'game_id', 'playtime_total'], 'user_games', [[user, 730, 10]],
+            USER_GAME_CONFLICT, USER_GAME_UPDATES
+        )
+        sharded_client.shards[0].upsert_many.assert_not_called()
+
+    def test_games_replicated_to_all_shards(self, sharded_client):
+        games = [GameRecord(730, 'Counter-Strike 2')]
+        
+        sharded_client.add_games(games)
+        
+        sharded_client.upsert_many.assert_called_once()
+        for shard in sharded_client.shards:
+            shard.upsert_many.assert_called_once_with(
+                GameRecord.COLUMNS, 'games', [games[0].as_row()], GAME_CONFLICT, GAME_UPDATES
+            )
+
+    def test_link_copies_profile_to_main_database(self, sharded_client):
+        user = user_on_shard(0)
+        profile = (user, 'name', 'url', 'avatar')
+        sharded_client.shards[0].select.return_value = ([profile], None)
+        
+        sharded_client.link_steam_id(5, user)
+        
+        sharded_client.insert_many.assert_called_once_with(
+            ['steam_user_id', 'username', 'profile_url', 'avatarmedium_url'], 'steam_users', [profile]
+        )
+        sharded_client.update.assert_called_once_with(['steam_id'], 'bot_users', [user], 'tg_id', 5)
+
+
+class TestShardedReads:
+    def test_friends_updates_merged_across_shards(self, sharded_client):
+        user = user_on_shard(0)
+        home, other = sharded_client.shards
+        day = datetime(2024, 1, 10)
+        home.call_function.return_value = [
+            (10, 'Shared', 1, 50, day), (20, 'Owned', 1, 500, day), (30, 'Solo A', 1, 900, day)
+        ]
+        home.select.return_value = ([(20,)], None)
+        other.call_function.return_value = [(10, 'Shared', 1, 70, datetime(2024, 1, 12)), (40, 'Solo B', 1, 5, day)]
+        
+        result = sharded_client.get_friends_updates(user)
+        
+        assert result == [(10, 'Shared'), (30, 'Solo A'), (40, 'Solo B')]
+        for shard in sharded_client.shards:
+            assert shard.call_function.call_args[0][0] == 'get_friend_feed_partial'
+            assert shard.call_function.call_args[0][2] == (user, 14)
+
+    def test_empty_feed(self, sharded_client):
+        for shard in sharded_client.shards:
+            shard.call_function.return_value = []
+            shard.select.return_value = ([], None)
+        
+        assert sharded_client.get_friends_updates(user_on_shard(0)) == []
+
+    def test_digest_skips_already_sent_games(self, sharded_client):
+        sharded_client.select.side_effect = [
+            ([(2, None), (1, 76561198000000000), (3, 76561198000000001)], None), ([(1, 30), (3, 40)], None)
+        ]
+        sharded_client._friend_games = Mock(return_value=[(30, 'Sent', 3), (40, 'New', 1)])
+        
+        rows = list(sharded_client.iter_friends_digest(limit=5))
+        
+        assert rows == [(1, 40, 'New', 1), (3, 30, 'Sent', 3)]
+        # Журнал отправленных игр читается одним запросом, а не по запросу на пользователя
+        assert sharded_client.select.call_count == 2
+
+    def test_recommendations_refreshed_per_shard(self, sharded_client):
+        first, second = user_on_shard(0), user_on_shard(1)
+        for shard in sharded_client.shards:
+            shard.call_function.return_value = [(1,)]
+        
+        assert sharded_client.refresh_recommendations([first, second], 10) == 2
+        assert sharded_client.shards[0].call_function.call_args[0][2] == ([first], 10)
+        assert sharded_client.shards[1].call_function.call_args[0][2] == ([second], 10)
+
+    def test_feed_compacted_on_every_shard(self, sharded_client):
+        sharded_client.shards[0].call_function.return_value = [(3, 1)]
+        sharded_client.shards[1].call_function.return_value = [(2, 4)]
+        
+        assert sharded_client.compact_friend_feed() == (5, 5)
+        for shard in sharded_client.shards:
+            assert shard.call_function.call_args == (
+                ('compact_friend_feed', ['deleted', 'recomputed'], ()), {'readonly': False}
+            )
+
+    def test_cf_recommendations_read_from_home_shard(self, sharded_client):
+        user = user_on_shard(1)
+        sharded_client.shards[1].call_function.return_value = [(570, 'Dota 2')]
+        
+        assert sharded_client.get_recommendations(user, 3, mode='cf') == [(570, 'Dota 2')]
+        assert sharded_client.shards[1].call_function.call_args[0] == (
+            'get_neighbor_recommendations', ['app_id', 'game_name'], (user, 3)
+        )
+        sharded_client.shards[0].call_function.assert_not_called()
+
+    def test_library_pairs_read_from_every_shard(self, sharded_client):
+        sharded_client.shards[0].stream_function.return_value = iter([(1, 10)])
+        sharded_client.shards[1].stream_function.return_value = iter([(2, 10), (2, 20)])
+        
+        assert list(sharded_client.iter_library_pairs()) == [(1, 10), (2, 10), (2, 20)]
+
+    def test_game_neighbors_copied_to_all_shards(self, sharded_client):
+        sharded_client.call_function = Mock(side_effect=[[('',)], [(1,)]])
+        for shard in sharded_client.shards:
+            shard.call_function.side_effect = [[('',)], [(1,)]]
+        
+        assert sharded_client.replace_game_neighbors(iter([[(10, 20, 0.5)]])) == 1
+        
+        for database in [sharded_client] + sharded_client.shards:
+            database.insert_many.assert_called_once_with(
+                ['game_id', 'neighbor_id', 'score'], 'game_neighbors_staging', [(10, 20, 0.5)]
+            )
+            assert database.call_function.call_args[0][0] == 'swap_game_neighbors'
+
+    def test_friend_ids_read_from_home_shard(self, sharded_client):
+        user = user_on_shard(1)
+        sharded_client.shards[1].call_function.return_value = [(1,), (2,)]
+        
+        assert sharded_client.get_friend_ids(user) == [1, 2]
+        sharded_client.shards[0].call_function.assert_not_called()
+
+    def test_get_friend_ids_many_queries_each_shard_once(self, sharded_client):
+        first, second = user_on_shard(0), user_on_shard(1)
+        third = user_on_shard(1, start=second + 1)
+        sharded_client.shards[0].call_function.return_value = [(first, 7)]
+        sharded_client.shards[1].call_function.return_value = [(second, 7), (second, 8)]
+        
+        assert sharded_client.get_friend_ids_many([first, second, third]) == {
+            first: [7], second: [7, 8], third: []
+        }
+        sharded_client.shards[1].call_function.assert_called_once_with(
+            'get_friend_ids_many', ['user_id', 'friend_id'], ([second, third],)
+        )
+
+    def test_invalidation_listens_on_main_database_and_shards(self, sharded_client):
+        sources = sharded_client.invalidation_sources()
+        
+        assert sources == [sharded_client.get_connection] + [shard.get_connection for shard in sharded_client.shards]
+
+    def test_game_notifications_taken_from_main_database_only(self, sharded_client):
+        assert sharded_client.invalidation_kinds() == [None, {'library', 'recommendations'}, {'library', 'recommendations'}]
+
+
+class TestCreateDbClient:
+    def test_plain_client_without_shards(self, monkeypatch):
+        monkeypatch.delenv('DB_SHARD_DSNS', raising=False)
+        
+        client = create_db_client()
+        
+        assert type(client) is PgsqlApiClient
+
+    def test_sharded_client_with_shards(self, monkeypatch):
+        monkeypatch.setenv('DB_SHARD_DSNS', 'dbname=shard0, dbname=shard1')
+        
+        client = create_db_client()
+        
+        assert isinstance(client, ShardedPgsqlApiClient)
+        assert [shard.db_dsn for shard in client.shards] == ['dbname=shard0', 'dbname=shard1']
+        client.executor.shutdown()
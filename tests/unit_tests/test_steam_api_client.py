@@ -1,7 +1,11 @@
+import json
 import pytest
 import aiohttp
 from unittest.mock import AsyncMock, MagicMock, patch
-from sources.steam_api_client import SteamAPIClient
+from sources.cache import TwoTierCache
+from sources.deadline import DeadlineExceeded, deadline
+from sources.models import GameRecord
+from sources.steam_api_client import SteamAPIClient, SteamAPIError
 import asyncio
 
 class TestSteamAPIClient:
@@ -42,7 +46,7 @@ class TestSteamAPIClient:
                 self.status = status
                 self._json_result = None
             
-            async def json(self):
+            async def json(self, **kwargs):
                 if self._json_result is None:
                     return await mock_json()
                 return self._json_result
@@ -85,7 +89,7 @@ class TestSteamAPIClient:
             def __init__(self):
                 self.status = 200
             
-            async def json(self):
+            async def json(self, **kwargs):
                 return {}  # Пустой ответ
             
             async def __aenter__(self):
@@ -119,7 +123,7 @@ class TestSteamAPIClient:
             def __init__(self):
                 self.status = 500 
             
-            async def json(self):
+            async def json(self, **kwargs):
                 return {}
             
             async def __aenter__(self):
@@ -153,7 +157,7 @@ class TestSteamAPIClient:
             def __init__(self):
                 self.status = 200
             
-            async def json(self):
+            async def json(self, **kwargs):
                 return {
                     "response": {
                         "games": [
@@ -198,7 +202,7 @@ class TestSteamAPIClient:
             def __init__(self):
                 self.status = 200
             
-            async def json(self):
+            async def json(self, **kwargs):
                 return {}
             
             async def __aenter__(self):
@@ -232,7 +236,7 @@ class TestSteamAPIClient:
             def __init__(self):
                 self.status = 200
             
-            async def json(self):
+            async def json(self, **kwargs):
                 return {
                     "response": {
                         "players": [
@@ -280,6 +284,63 @@ class TestSteamAPIClient:
         players = await client.get_player_summaries([])
         assert players == []
     
+    @pytest.mark.asyncio
+    async def test_get_player_summaries_chunked(self, api_key):
+        steam_ids = list(range(250)) + [0, 1]
+        client = SteamAPIClient(api_key, max_concurrency=2)
+        mock_session = MagicMock(spec=aiohttp.ClientSession)
+        requested = []
+        active = 0
+        max_active = 0
+        
+        class MockResponseContext:
+            status = 200
+            
+            def __init__(self, ids):
+                self.ids = ids
+            
+            async def json(self, **kwargs):
+                return {"response": {"players": [{"steamid": id} for id in self.ids]}}
+        
+        class MockGetContext:
+            def __init__(self, ids):
+                self.ids = ids
+            
+            async def __aenter__(self):
+                nonlocal active, max_active
+                active += 1
+                max_active = max(max_active, active)
+                await asyncio.sleep(0.01)
+                return MockResponseContext(self.ids)
+            
+            async def __aexit__(self, *args):
+                nonlocal active
+                active -= 1
+        
+        def get(url, params):
+            ids = params['steamids'].split(',')
+            requested.append(ids)
+            return MockGetContext(ids)
+        
+        mock_session.get.side_effect = get
+        client.session = mock_session
+        
+        players = await client.get_player_summaries(steam_ids)
+        
+        assert sorted(len(ids) for ids in requested) == [50, 100, 100]
+        assert max_active <= 2
+        assert sorted(int(player["steamid"]) for player in players) == list(range(250))
+    
+    @pytest.mark.asyncio
+    async def test_iter_player_summaries_skips_failed_chunk(self, api_key):
+        client = SteamAPIClient(api_key)
+        client._get_player_summaries_chunk = AsyncMock(side_effect=[[{"steamid": "1"}], []])
+        
+        chunks = [chunk async for chunk in client.iter_player_summaries(list(range(150)))]
+        
+        assert chunks == [[{"steamid": "1"}]]
+        assert client._get_player_summaries_chunk.call_count == 2
+    
     @pytest.mark.asyncio
     async def test_get_game_info_success(self, api_key):
         app_id = 730
@@ -292,7 +353,7 @@ class TestSteamAPIClient:
             def __init__(self):
                 self.status = 200
             
-            async def json(self):
+            async def json(self, **kwargs):
                 return {
                     "730": {
                         "success": True,
@@ -322,11 +383,12 @@ class TestSteamAPIClient:
         mock_session.get.return_value = MockGetContext()
         client.session = mock_session
         
-        result_id, game_data = await client.get_game_info(app_id)
+        game = await client.get_game_info(app_id)
         
-        assert result_id == 730
-        assert game_data["name"] == "Counter-Strike: Global Offensive"
-        assert game_data["short_description"] == "A competitive shooter"
+        assert game.steam_app_id == 730
+        assert game.name == "Counter-Strike: Global Offensive"
+        assert game.short_description == "A competitive shooter"
+        assert mock_session.get.call_args[1]['params']['filters'] == 'basic,release_date,categories,genres'
     
     @pytest.mark.asyncio
     async def test_get_game_info_not_found(self, api_key):
@@ -340,7 +402,7 @@ class TestSteamAPIClient:
             def __init__(self):
                 self.status = 200
             
-            async def json(self):
+            async def json(self, **kwargs):
                 return {
                     "999999": {
                         "success": False
@@ -363,9 +425,120 @@ class TestSteamAPIClient:
         mock_session.get.return_value = MockGetContext()
         client.session = mock_session
         
-        result_id, game_data = await client.get_game_info(app_id)
-        assert result_id is None
-        assert game_data is None
+        game = await client.get_game_info(app_id)
+        assert game is None
+
+    @pytest.mark.asyncio
+    async def test_get_game_info_rate_limited(self, api_key):
+        client = SteamAPIClient(api_key)
+        
+        mock_session = MagicMock(spec=aiohttp.ClientSession)
+        
+        class MockResponseContext:
+            status = 429
+        
+        class MockGetContext:
+            async def __aenter__(self):
+                return MockResponseContext()
+            
+            async def __aexit__(self, *args):
+                pass
+        
+        mock_session.get.return_value = MockGetContext()
+        client.session = mock_session
+        
+        with pytest.raises(SteamAPIError) as error:
+            await client.get_game_info(730)
+        assert error.value.status == 429
+
+class TestBatchGameInfo:
+    @pytest.fixture
+    def client(self):
+        client = SteamAPIClient("test_api_key")
+        client.appdetails_delay = 0
+        client.tag_names = {19: 'Action', 4182: 'Singleplayer'}
+        client.category_names = {2: 'Single-player'}
+        return client
+    
+    def store_item(self, app_id):
+        return {
+            'appid': app_id,
+            'success': 1,
+            'name': f'Game {app_id}',
+            'basic_info': {'short_description': 'Description'},
+            'tags': [{'tagid': 19, 'weight': 900}, {'tagid': 4182, 'weight': 500}, {'tagid': 7, 'weight': 1}],
+            'categories': {'supported_player_categoryids': [2], 'feature_categoryids': [2, 99]},
+            'assets': {'asset_url_format': f'steam/apps/{app_id}/${{FILENAME}}?t=1', 'header': 'header.jpg'},
+            'release': {'steam_release_date': 1345507200},
+            'reviews': {'summary_filtered': {'review_count': 200, 'percent_positive': 90}},
+            'game_rating': {'required_age': 16}
+        }
+    
+    def test_normalize_store_item(self, client):
+        game = client._normalize_store_item(self.store_item(730))
+        
+        assert game['name'] == 'Game 730'
+        assert game['short_description'] == 'Description'
+        assert game['tags'] == {'Action': 900, 'Singleplayer': 500}
+        assert game['genres'] == [{'description': 'Action'}]
+        assert game['categories'] == [{'description': 'Single-player'}]
+        assert game['header_image'] == \
+            'https://shared.akamai.steamstatic.com/store_item_assets/steam/apps/730/header.jpg?t=1'
+        assert game['release_date'] == {'date': 'Aug 21, 2012'}
+        assert (game['positive'], game['negative']) == (180, 20)
+        assert game['required_age'] == 16
+    
+    def test_normalize_failed_store_item(self, client):
+        assert client._normalize_store_item({'appid': 1, 'success': 2}) is None
+    
+    @pytest.mark.asyncio
+    async def test_get_games_info_batches_and_falls_back(self, client):
+        requested = []
+        
+        async def get_json(endpoint, url, params, session=None, raise_for_status=False):
+            ids = [item['appid'] for item in json.loads(params['input_json'])['ids']]
+            requested.append(ids)
+            return {'response': {'store_items': [
+                self.store_item(app_id) if app_id != 30 else {'appid': 30, 'success': 2} for app_id in ids
+            ]}}
+        
+        client._get_json = get_json
+        client.get_game_info = AsyncMock(return_value=None)
+        
+        games, missing = await client.get_games_info(list(range(10, 1010, 10)))
+        
+        assert [len(ids) for ids in requested] == [50, 50]
+        assert len(games) == 99
+        assert all(isinstance(game, GameRecord) for game in games)
+        assert games[0].tags == {'Action': 900, 'Singleplayer': 500}
+        assert missing == [30]
+        client.get_game_info.assert_called_once_with(30)
+    
+    @pytest.mark.asyncio
+    async def test_get_games_info_skips_transient_errors(self, client):
+        client._get_store_items = AsyncMock(return_value={})
+        client.get_game_info = AsyncMock(side_effect=[SteamAPIError('appdetails', 429), GameRecord(20, 'Game')])
+        
+        games, missing = await client.get_games_info([10, 20])
+        
+        assert games == [GameRecord(20, 'Game')]
+        assert missing == []
+    
+    @pytest.mark.asyncio
+    async def test_get_games_info_without_tag_list(self, client):
+        client.tag_names = None
+        client._load_store_dictionaries = AsyncMock()
+        client._get_store_items = AsyncMock()
+        client.get_game_info = AsyncMock(return_value=GameRecord(10, 'Game'))
+        
+        games, missing = await client.get_games_info([10])
+        
+        client._get_store_items.assert_not_called()
+        assert games == [GameRecord(10, 'Game')]
+    
+    @pytest.mark.asyncio
+    async def test_get_games_info_empty(self, client):
+        assert await client.get_games_info([]) == ([], [])
 
 class TestEdgeCases: 
     @pytest.mark.asyncio
@@ -376,4 +549,102 @@ class TestEdgeCases:
         
         with pytest.raises(AttributeError, match="'NoneType' object has no attribute 'get'"):
             await client.get_user_friends(76561197960265728)
-    
\ No newline at end of file
+    
+
+class TestResponseCache:
+    APPDETAILS = {'730': {'success': True, 'data': {'name': 'Counter-Strike 2', 'short_description': 'Shooter'}}}
+
+    @pytest.mark.asyncio
+    async def test_appdetails_served_from_cache(self):
+        client = SteamAPIClient('secret-key')
+        client.cache = TwoTierCache()
+        client._fetch_json = AsyncMock(return_value=self.APPDETAILS)
+        
+        first = await client.get_game_info(730)
+        second = await client.get_game_info(730)
+        
+        client._fetch_json.assert_awaited_once()
+        assert first.name == second.name == 'Counter-Strike 2'
+        # Ключ API не попадает в ключ общего кэша
+        assert all('secret-key' not in key for key in client.cache.backend.data)
+
+    @pytest.mark.asyncio
+    async def test_failed_response_not_cached(self):
+        client = SteamAPIClient('secret-key')
+        client.cache = TwoTierCache()
+        client._fetch_json = AsyncMock(side_effect=[None, {'coming_soon': {'items': []}}])
+        
+        await client.get_featured_games_summary()
+        await client.get_featured_games_summary()
+        
+        assert client._fetch_json.await_count == 2
+
+    @pytest.mark.asyncio
+    async def test_no_cache_by_default(self):
+        client = SteamAPIClient('secret-key')
+        client._fetch_json = AsyncMock(return_value=self.APPDETAILS)
+        
+        await client.get_game_info(730)
+        await client.get_game_info(730)
+        
+        assert client._fetch_json.await_count == 2
+
+
+class TestRequestDeadline:
+    class OkContext:
+        async def __aenter__(self):
+            response = MagicMock(status=200)
+            response.json = AsyncMock(return_value={'ok': True})
+            return response
+
+        async def __aexit__(self, *args):
+            pass
+
+    class SlowContext:
+        async def __aenter__(self):
+            raise asyncio.TimeoutError()
+
+        async def __aexit__(self, *args):
+            pass
+
+    @pytest.mark.asyncio
+    async def test_budget_limits_request_timeout(self):
+        client = SteamAPIClient('key')
+        client.session = MagicMock()
+        client.session.get.return_value = self.OkContext()
+        
+        with deadline(2):
+            assert await client._fetch_json('GetFriendList', 'url', {}) == {'ok': True}
+        
+        timeout = client.session.get.call_args[1]['timeout']
+        assert 1.9 < timeout.total <= 2
+
+    @pytest.mark.asyncio
+    async def test_no_timeout_override_without_budget(self):
+        client = SteamAPIClient('key')
+        client.session = MagicMock()
+        client.session.get.return_value = self.OkContext()
+        
+        await client._fetch_json('GetFriendList', 'url', {})
+        
+        assert 'timeout' not in client.session.get.call_args[1]
+
+    @pytest.mark.asyncio
+    async def test_budget_timeout_raises_deadline_exceeded(self):
+        client = SteamAPIClient('key')
+        client.session = MagicMock()
+        client.session.get.return_value = self.SlowContext()
+        
+        with deadline(2):
+            with pytest.raises(DeadlineExceeded):
+                await client._fetch_json('appdetails', 'url', {})
+
+    @pytest.mark.asyncio
+    async def test_session_timeout_is_temporary_error(self):
+        client = SteamAPIClient('key')
+        client.session = MagicMock()
+        client.session.get.return_value = self.SlowContext()
+        
+        assert await client._fetch_json('appdetails', 'url', {}) is None
+        with pytest.raises(SteamAPIError):
+            await client._fetch_json('appdetails', 'url', {}, raise_for_status=True)